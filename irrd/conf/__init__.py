@@ -255,6 +255,14 @@ class Configuration:
         if not self._check_is_str(config, "piddir") or not os.path.isdir(config["piddir"]):
             errors.append("Setting piddir is required and must point to an existing directory.")
 
+        if config.get("preload_store_dir"):
+            if not self._check_is_str(config, "preload_store_dir") or not os.path.isdir(
+                config["preload_store_dir"]
+            ):
+                errors.append("Setting preload_store_dir must point to an existing directory, if set.")
+            if config.get("database_readonly"):
+                errors.append("Setting preload_store_dir can not be combined with database_readonly.")
+
         if not self._check_is_str(config, "secret_key") or len(config["secret_key"]) < MIN_SECRET_KEY_LENGTH:
             errors.append(
                 f"Setting secret_key is required and must be at least {MIN_SECRET_KEY_LENGTH} characters."
@@ -263,6 +271,9 @@ class Configuration:
         if not str(config.get("route_object_preference.update_timer", "0")).isnumeric():
             errors.append("Setting route_object_preference.update_timer must be a number.")
 
+        if not str(config.get("server.whois.async_workers", "0")).isnumeric():
+            errors.append("Setting server.whois.async_workers must be a number.")
+
         expected_access_lists = {
             config.get("server.whois.access_list"),
             config.get("server.http.status_access_list"),
@@ -379,10 +390,14 @@ class Configuration:
                 )
 
             nrtm_mirror = details.get("nrtm_host") and details.get("import_serial_source")
-            if details.get("keep_journal") and not (nrtm_mirror or details.get("authoritative")):
+            nrtm4_mirror = details.get("nrtm4_client_notification_file_url")
+            if details.get("keep_journal") and not (
+                nrtm_mirror or nrtm4_mirror or details.get("authoritative")
+            ):
                 errors.append(
                     f"Setting keep_journal for source {name} can not be enabled unless either authoritative "
-                    "is enabled, or all three of nrtm_host, nrtm_port and import_serial_source."
+                    "is enabled, nrtm4_client_notification_file_url is set, or all three of nrtm_host, "
+                    "nrtm_port and import_serial_source."
                 )
             if details.get("nrtm_host") and not details.get("import_serial_source"):
                 errors.append(
@@ -390,26 +405,35 @@ class Configuration:
                     "import_serial_source."
                 )
 
-            if details.get("authoritative") and (details.get("nrtm_host") or details.get("import_source")):
+            if details.get("authoritative") and (
+                details.get("nrtm_host") or details.get("import_source") or nrtm4_mirror
+            ):
                 errors.append(
                     f"Setting authoritative for source {name} can not be enabled when either "
-                    "nrtm_host or import_source are set."
+                    "nrtm_host, import_source or nrtm4_client_notification_file_url are set."
                 )
 
             if config.get("database_readonly") and (
-                details.get("authoritative") or details.get("nrtm_host") or details.get("import_source")
+                details.get("authoritative")
+                or details.get("nrtm_host")
+                or details.get("import_source")
+                or nrtm4_mirror
             ):
                 errors.append(
-                    f"Source {name} can not have authoritative, import_source or nrtm_host set "
-                    "when database_readonly is enabled."
+                    f"Source {name} can not have authoritative, import_source, nrtm_host or "
+                    "nrtm4_client_notification_file_url set when database_readonly is enabled."
                 )
 
+            errors += self._validate_nrtm4(name, details)
+
             number_fields = [
                 "nrtm_port",
                 "import_timer",
                 "export_timer",
                 "route_object_preference",
                 "nrtm_query_serial_range_limit",
+                "nrtm4_server_timer",
+                "nrtm4_client_max_notification_age",
             ]
             for field_name in number_fields:
                 if not str(details.get(field_name, 0)).isnumeric():
@@ -471,6 +495,50 @@ class Configuration:
 
         return errors
 
+    def _validate_nrtm4(self, name: str, details) -> List[str]:
+        """
+        Validate the NRTMv4 server and client settings of a source.
+        """
+        from irrd.mirroring.nrtm4 import load_private_key, load_public_key
+
+        errors = []
+        if bool(details.get("nrtm4_server_private_key")) != bool(details.get("nrtm4_server_local_path")):
+            errors.append(
+                f"Settings nrtm4_server_private_key and nrtm4_server_local_path for source {name} must "
+                "either both be set, or neither."
+            )
+        if details.get("nrtm4_server_local_path") and not details.get("keep_journal"):
+            errors.append(
+                f"Setting nrtm4_server_local_path for source {name} can not be enabled without enabling "
+                "keep_journal."
+            )
+        if details.get("nrtm4_server_private_key"):
+            try:
+                load_private_key(details.get("nrtm4_server_private_key"))
+            except (ValueError, TypeError, AttributeError) as error:
+                errors.append(f"Invalid nrtm4_server_private_key for source {name}: {error}")
+
+        if bool(details.get("nrtm4_client_notification_file_url")) != bool(
+            details.get("nrtm4_client_public_key")
+        ):
+            errors.append(
+                f"Settings nrtm4_client_notification_file_url and nrtm4_client_public_key for source {name} "
+                "must either both be set, or neither."
+            )
+        if details.get("nrtm4_client_notification_file_url") and (
+            details.get("nrtm_host") or details.get("import_source")
+        ):
+            errors.append(
+                f"Setting nrtm4_client_notification_file_url for source {name} can not be enabled when "
+                "either nrtm_host or import_source are set."
+            )
+        if details.get("nrtm4_client_public_key"):
+            try:
+                load_public_key(details.get("nrtm4_client_public_key"))
+            except (ValueError, TypeError, AttributeError) as error:
+                errors.append(f"Invalid nrtm4_client_public_key for source {name}: {error}")
+        return errors
+
     def _check_is_str(self, config, key, required=True):
         if required:
             return config.get(key) and isinstance(config.get(key), str)
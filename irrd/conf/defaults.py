@@ -4,3 +4,5 @@
 DEFAULT_SOURCE_NRTM_PORT = "43"
 DEFAULT_SOURCE_IMPORT_TIMER = 300
 DEFAULT_SOURCE_EXPORT_TIMER = 3600
+DEFAULT_SOURCE_NRTM4_SERVER_TIMER = 60
+DEFAULT_SOURCE_NRTM4_CLIENT_MAX_NOTIFICATION_AGE = 86400
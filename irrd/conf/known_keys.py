@@ -10,6 +10,7 @@ KNOWN_CONFIG_KEYS = DottedDict(
         "database_url": {},
         "database_readonly": {},
         "redis_url": {},
+        "preload_store_dir": {},
         "piddir": {},
         "user": {},
         "group": {},
@@ -29,6 +30,7 @@ KNOWN_CONFIG_KEYS = DottedDict(
                 "port": {},
                 "access_list": {},
                 "max_connections": {},
+                "async_workers": {},
             },
         },
         "route_object_preference": {"update_timer": {}},
@@ -97,6 +99,12 @@ KNOWN_SOURCES_KEYS = {
     "nrtm_access_list",
     "nrtm_access_list_unfiltered",
     "nrtm_query_serial_range_limit",
+    "nrtm4_server_private_key",
+    "nrtm4_server_local_path",
+    "nrtm4_server_timer",
+    "nrtm4_client_notification_file_url",
+    "nrtm4_client_public_key",
+    "nrtm4_client_max_notification_age",
     "strict_import_keycert_objects",
     "rpki_excluded",
     "scopefilter_excluded",
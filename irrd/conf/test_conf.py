@@ -5,6 +5,8 @@ from typing import Dict
 
 import pytest
 import yaml
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 
 from . import (
     ConfigurationError,
@@ -15,6 +17,17 @@ from . import (
 )
 
 
+def ed25519_key_pems():
+    private_key = Ed25519PrivateKey.generate()
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_pem.decode("ascii"), public_pem.decode("ascii")
+
+
 @pytest.fixture()
 def save_yaml_config(tmpdir, monkeypatch):
     def _save(config: Dict, run_init=True):
@@ -55,13 +68,14 @@ class TestConfiguration:
 
     def test_load_valid_reload_valid_config(self, monkeypatch, save_yaml_config, tmpdir, caplog):
         logfile = str(tmpdir + "/logfile.txt")
+        private_pem, public_pem = ed25519_key_pems()
         config = {
             "irrd": {
                 "database_url": "db-url",
                 "redis_url": "redis-url",
                 "piddir": str(tmpdir),
                 "secret_key": "sssssssssssssssssssssssssssssss",
-                "server": {"http": {"url": "https://example.com/"}},
+                "server": {"http": {"url": "https://example.com/"}, "whois": {"async_workers": 4}},
                 "email": {"from": "example@example.com", "smtp": "192.0.2.1"},
                 "route_object_preference": {
                     "update_timer": 10,
@@ -102,6 +116,9 @@ class TestConfiguration:
                         "keep_journal": True,
                         "suspension_enabled": True,
                         "nrtm_query_serial_range_limit": 10,
+                        "nrtm4_server_private_key": private_pem,
+                        "nrtm4_server_local_path": "/tmp",
+                        "nrtm4_server_timer": 30,
                     },
                     "TESTDB2": {
                         "nrtm_host": "192.0.2.1",
@@ -114,6 +131,13 @@ class TestConfiguration:
                         "export_destination_unfiltered": "/tmp",
                         "nrtm_access_list_unfiltered": "valid-list",
                     },
+                    "TESTDB4": {
+                        "nrtm4_client_notification_file_url": (
+                            "https://example.com/update-notification-file.jose"
+                        ),
+                        "nrtm4_client_public_key": public_pem,
+                        "keep_journal": True,
+                    },
                     # RPKI source permitted, rpki.roa_source not set
                     "RPKI": {},
                 },
@@ -240,15 +264,18 @@ class TestConfiguration:
         assert 'Could not find root item "irrd"' in caplog.text
 
     def test_load_invalid_config(self, save_yaml_config, tmpdir):
+        private_pem, public_pem = ed25519_key_pems()
         config = {
             "irrd": {
                 "database_readonly": True,
                 "piddir": str(tmpdir + "/does-not-exist"),
+                "preload_store_dir": str(tmpdir + "/does-not-exist"),
                 "user": "a",
                 "secret_key": "sssssssssssss",
                 "server": {
                     "whois": {
                         "access_list": "doesnotexist",
+                        "async_workers": "not-a-number",
                     },
                     "http": {
                         "url": "💩",
@@ -315,6 +342,22 @@ class TestConfiguration:
                         "nrtm_access_list_unfiltered": "invalid-list",
                         "route_object_preference": "not-a-number",
                     },
+                    "TESTDB4": {
+                        "nrtm4_client_notification_file_url": (
+                            "https://example.com/update-notification-file.jose"
+                        ),
+                        "nrtm_host": "192.0.2.1",
+                        "import_serial_source": "https://example.com/serial",
+                        "nrtm4_server_private_key": public_pem,
+                        "nrtm4_server_timer": "not-a-number",
+                    },
+                    "TESTDB5": {
+                        "nrtm4_client_notification_file_url": (
+                            "https://example.com/update-notification-file.jose"
+                        ),
+                        "nrtm4_client_public_key": "invalid",
+                        "nrtm4_server_local_path": "/tmp",
+                    },
                     # Not permitted, rpki.roa_source is set
                     "RPKI": {},
                     "lowercase": {},
@@ -335,6 +378,8 @@ class TestConfiguration:
         assert "Setting database_url is required." in str(ce.value)
         assert "Setting redis_url is required." in str(ce.value)
         assert "Setting piddir is required and must point to an existing directory." in str(ce.value)
+        assert "Setting preload_store_dir must point to an existing directory, if set." in str(ce.value)
+        assert "Setting preload_store_dir can not be combined with database_readonly." in str(ce.value)
         assert "Setting secret_key is required and must be at least 30 characters." in str(ce.value)
         assert "Setting email.from is required and must be an email address." in str(ce.value)
         assert "Setting email.smtp is required." in str(ce.value)
@@ -369,25 +414,53 @@ class TestConfiguration:
             in str(ce.value)
         )
         assert (
-            "Setting authoritative for source TESTDB2 can not be enabled when either nrtm_host or"
-            " import_source are set."
+            "Setting authoritative for source TESTDB2 can not be enabled when either nrtm_host,"
+            " import_source or nrtm4_client_notification_file_url are set."
+            in str(ce.value)
+        )
+        assert (
+            "Setting authoritative for source TESTDB3 can not be enabled when either nrtm_host,"
+            " import_source or nrtm4_client_notification_file_url are set."
+            in str(ce.value)
+        )
+        assert (
+            "Source TESTDB can not have authoritative, import_source, nrtm_host or"
+            " nrtm4_client_notification_file_url set when database_readonly is enabled."
+            in str(ce.value)
+        )
+        assert (
+            "Source TESTDB3 can not have authoritative, import_source, nrtm_host or"
+            " nrtm4_client_notification_file_url set when database_readonly is enabled."
+            in str(ce.value)
+        )
+        assert (
+            "Settings nrtm4_server_private_key and nrtm4_server_local_path for source TESTDB4 must either"
+            " both be set, or neither."
+            in str(ce.value)
+        )
+        assert "Invalid nrtm4_server_private_key for source TESTDB4" in str(ce.value)
+        assert "Setting nrtm4_server_timer for source TESTDB4 must be a number." in str(ce.value)
+        assert (
+            "Settings nrtm4_client_notification_file_url and nrtm4_client_public_key for source TESTDB4"
+            " must either both be set, or neither."
             in str(ce.value)
         )
         assert (
-            "Setting authoritative for source TESTDB3 can not be enabled when either nrtm_host or"
-            " import_source are set."
+            "Setting nrtm4_client_notification_file_url for source TESTDB4 can not be enabled when either"
+            " nrtm_host or import_source are set."
             in str(ce.value)
         )
         assert (
-            "Source TESTDB can not have authoritative, import_source or nrtm_host set when database_readonly"
-            " is enabled."
+            "Settings nrtm4_server_private_key and nrtm4_server_local_path for source TESTDB5 must either"
+            " both be set, or neither."
             in str(ce.value)
         )
         assert (
-            "Source TESTDB3 can not have authoritative, import_source or nrtm_host set when database_readonly"
-            " is enabled."
+            "Setting nrtm4_server_local_path for source TESTDB5 can not be enabled without enabling"
+            " keep_journal."
             in str(ce.value)
         )
+        assert "Invalid nrtm4_client_public_key for source TESTDB5" in str(ce.value)
         assert "Setting nrtm_port for source TESTDB2 must be a number." in str(ce.value)
         assert "Setting rpki.roa_import_timer must be set to a number." in str(ce.value)
         assert "Setting rpki.notify_invalid_subject must be a string, if defined." in str(ce.value)
@@ -396,6 +469,7 @@ class TestConfiguration:
         assert "Setting export_timer for source TESTDB must be a number." in str(ce.value)
         assert "Setting route_object_preference for source TESTDB3 must be a number." in str(ce.value)
         assert "Setting route_object_preference.update_timer must be a number." in str(ce.value)
+        assert "Setting server.whois.async_workers must be a number." in str(ce.value)
         assert "Setting nrtm_query_serial_range_limit for source TESTDB must be a number." in str(ce.value)
         assert "Invalid source name: lowercase" in str(ce.value)
         assert "Invalid source name: invalid char" in str(ce.value)
@@ -77,7 +77,7 @@ class SourceExportRunner:
             query = query.rpki_status([RPKIStatus.not_found, RPKIStatus.valid])
             query = query.scopefilter_status([ScopeFilterStatus.in_scope])
             query = query.route_preference_status([RoutePreferenceStatus.visible])
-            for obj in self.database_handler.execute_query(query):
+            for obj in self.database_handler.execute_query(query, stream_results=True):
                 object_text = obj["object_text"]
                 if remove_auth_hashes:
                     object_text = remove_auth_hashes_func(object_text)
@@ -1,18 +1,27 @@
+import bz2
+import ftplib
 import gzip
+import hashlib
+import io
 import logging
 import os
 import shutil
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from io import BytesIO
 from tempfile import NamedTemporaryFile
-from typing import IO, Any, Optional, Tuple
+from typing import IO, Any, Dict, Iterator, List, Optional, TextIO, Tuple
 from urllib import request
 from urllib.error import URLError
-from urllib.parse import urlparse
+from urllib.parse import unquote, urljoin, urlparse
 
 import requests
 
 from irrd.conf import RPKI_IRR_PSEUDO_SOURCE, get_setting
-from irrd.conf.defaults import DEFAULT_SOURCE_NRTM_PORT
+from irrd.conf.defaults import (
+    DEFAULT_SOURCE_NRTM4_CLIENT_MAX_NOTIFICATION_AGE,
+    DEFAULT_SOURCE_NRTM_PORT,
+)
 from irrd.routepref.routepref import update_route_preference_status
 from irrd.rpki.importer import ROADataImporter, ROAParserException
 from irrd.rpki.notifications import notify_rpki_invalid_owners
@@ -20,13 +29,84 @@ from irrd.rpki.validators import BulkRouteROAValidator
 from irrd.scopefilter.validators import ScopeFilterValidator
 from irrd.storage.database_handler import DatabaseHandler
 from irrd.storage.event_stream import EventStreamPublisher
+from irrd.storage.models import JournalEntryOrigin
 from irrd.storage.queries import DatabaseStatusQuery
-from irrd.utils.whois_client import whois_query
-
-from .parsers import MirrorFileImportParser, NRTMStreamParser
+from irrd.utils.whois_client import whois_query_stream
+
+from .nrtm4 import (
+    NRTM4Exception,
+    json_seq_records,
+    jws_deserialize_verify,
+    load_public_key,
+    notification_timestamp,
+    validate_file_header,
+    validate_notification,
+)
+from .parsers import (
+    MirrorFileImportParser,
+    MirrorUpdateFileImportParser,
+    NRTM4DeltaParser,
+    NRTMStreamParser,
+)
 
 logger = logging.getLogger(__name__)
 DOWNLOAD_TIMEOUT = 10
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# NRTM updates are committed after this number of operations
+NRTM_COMMIT_BATCH_SIZE = 1000
+
+
+class ChunkIteratorReader(io.RawIOBase):
+    """
+    A readable binary stream over an iterator of bytes chunks,
+    like the iter_content() of a requests response.
+    """
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self.chunks = chunks
+        self.remaining = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.remaining:
+            try:
+                self.remaining = next(self.chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.remaining))
+        buffer[:size] = self.remaining[:size]
+        self.remaining = self.remaining[size:]
+        return size
+
+
+class HashingReader(io.RawIOBase):
+    """
+    A readable binary stream over another binary stream,
+    that calculates the SHA-256 hash of all data read.
+    """
+
+    def __init__(self, source: IO[bytes]) -> None:
+        self.source = source
+        self.sha256 = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.source.read(len(buffer))
+        buffer[: len(data)] = data
+        self.sha256.update(data)
+        return len(data)
+
+    def hexdigest(self) -> str:
+        """
+        Read any remaining data, and return the hash of the entire stream.
+        """
+        for chunk in iter(lambda: self.source.read(DOWNLOAD_CHUNK_SIZE), b""):
+            self.sha256.update(chunk)
+        return self.sha256.hexdigest()
 
 
 class RPSLMirrorImportUpdateRunner:
@@ -34,37 +114,52 @@ class RPSLMirrorImportUpdateRunner:
     This RPSLMirrorImportUpdateRunner is the entry point for updating a single
     database mirror, depending on current state.
 
-    If there is no current mirrored data, will call RPSLMirrorFullImportRunner
-    to run a new import from full export files. Otherwise, will call
-    NRTMImportUpdateStreamRunner to retrieve new updates from NRTM.
+    If the source uses NRTMv4, will call NRTM4ClientRunner. Otherwise,
+    if there is no current mirrored data, or the source does not use NRTM,
+    will call RPSLMirrorFullImportRunner to run a new import from full export
+    files. Otherwise, will call NRTMImportUpdateStreamRunner to retrieve
+    new updates from NRTM.
     """
 
     def __init__(self, source: str) -> None:
         self.source = source
         self.full_import_runner = RPSLMirrorFullImportRunner(source)
         self.update_stream_runner = NRTMImportUpdateStreamRunner(source)
+        self.nrtm4_client_runner = NRTM4ClientRunner(source)
 
     def run(self) -> None:
         self.database_handler = DatabaseHandler()
 
         try:
-            serial_newest_mirror, force_reload = self._status()
+            serial_newest_mirror, force_reload, import_source_state, nrtm4_client_state = self._status()
             nrtm_enabled = bool(get_setting(f"sources.{self.source}.nrtm_host"))
+            nrtm4_enabled = bool(get_setting(f"sources.{self.source}.nrtm4_client_notification_file_url"))
             logger.debug(
                 f"Most recent mirrored serial for {self.source}: {serial_newest_mirror}, "
-                f"force_reload: {force_reload}, nrtm enabled: {nrtm_enabled}"
+                f"force_reload: {force_reload}, nrtm enabled: {nrtm_enabled}, nrtm4 enabled: {nrtm4_enabled}"
             )
-            full_reload = force_reload or not serial_newest_mirror or not nrtm_enabled
-            if full_reload:
-                self.full_import_runner.run(
+            full_reload = False
+            if nrtm4_enabled:
+                full_reload = self.nrtm4_client_runner.run(
+                    database_handler=self.database_handler,
+                    nrtm4_client_state=nrtm4_client_state,
+                    force_reload=force_reload,
+                )
+            elif force_reload or not serial_newest_mirror or not nrtm_enabled:
+                full_reload = self.full_import_runner.run(
                     database_handler=self.database_handler,
                     serial_newest_mirror=serial_newest_mirror,
                     force_reload=force_reload,
+                    import_source_state=import_source_state,
                 )
             else:
                 assert serial_newest_mirror
                 self.update_stream_runner.run(serial_newest_mirror, database_handler=self.database_handler)
 
+            if full_reload and get_setting(f"sources.{self.source}.nrtm4_server_local_path"):
+                # The replaced data is not in the journal, so the NRTMv4
+                # server must start a new session with a new snapshot.
+                self.database_handler.record_nrtm4_server_state(self.source, {})
             self.database_handler.commit()
             if full_reload:
                 event_stream_publisher = EventStreamPublisher()
@@ -88,14 +183,21 @@ class RPSLMirrorImportUpdateRunner:
         finally:
             self.database_handler.close()
 
-    def _status(self) -> Tuple[Optional[int], Optional[bool]]:
+    def _status(
+        self,
+    ) -> Tuple[Optional[int], Optional[bool], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
         query = DatabaseStatusQuery().source(self.source)
         result = self.database_handler.execute_query(query)
         try:
             status = next(result)
-            return status["serial_newest_mirror"], status["force_reload"]
+            return (
+                status["serial_newest_mirror"],
+                status["force_reload"],
+                status["import_source_state"],
+                status["nrtm4_client_state"],
+            )
         except StopIteration:
-            return None, None
+            return None, None, None, None
 
 
 class FileImportRunnerBase:
@@ -166,19 +268,74 @@ class FileImportRunnerBase:
         The file contents are written to the destination parameter,
         which can be a BytesIO() or a regular file.
         """
+        source = self._download_stream(url, url_parsed)
+        try:
+            shutil.copyfileobj(source, destination)
+        finally:
+            source.close()
+
+    def _download_stream(self, url: str, url_parsed) -> IO[bytes]:
+        """
+        Start a download from HTTP(s) or FTP, and return a binary
+        stream from which the file contents can be read as they arrive.
+        """
         if url_parsed.scheme == "ftp":
             try:
-                r = request.urlopen(url, timeout=DOWNLOAD_TIMEOUT)
-                shutil.copyfileobj(r, destination)
+                return request.urlopen(url, timeout=DOWNLOAD_TIMEOUT)
             except URLError as error:
                 raise OSError(f"Failed to download {url}: {str(error)}")
-        elif url_parsed.scheme in ["http", "https"]:
-            r = requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
-            if r.status_code == 200:
-                for chunk in r.iter_content(10240):
-                    destination.write(chunk)
-            else:
-                raise OSError(f"Failed to download {url}: {r.status_code}: {str(r.content)}")
+        r = requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        if r.status_code != 200:
+            raise OSError(f"Failed to download {url}: {r.status_code}: {str(r.content)}")
+        return io.BufferedReader(ChunkIteratorReader(r.iter_content(DOWNLOAD_CHUNK_SIZE)))
+
+    @contextmanager
+    def _open_file_stream(self, url: str, expected_sha256: Optional[str] = None) -> Iterator[TextIO]:
+        """
+        Open a file from either HTTP(s), FTP or local disk as a text stream,
+        without storing it in a temporary file first. Downloaded data
+        can be read as soon as it arrives.
+
+        If the URL ends in .gz or .bz2, the file is decompressed while
+        it is read.
+
+        If expected_sha256 is set, the hash of the file, before decompression,
+        is verified when the caller is done reading, and a ValueError
+        is raised if it does not match.
+        """
+        url_parsed = urlparse(url)
+        source: IO[bytes]
+        if url_parsed.scheme in ["ftp", "http", "https"]:
+            source = self._download_stream(url, url_parsed)
+        elif url_parsed.scheme == "file":
+            source = open(url_parsed.path, "rb")
+        else:
+            raise ValueError(f"Invalid URL: {url} - scheme {url_parsed.scheme} is not supported")
+
+        hashing_reader = None
+        readable: IO[bytes] = source
+        if expected_sha256:
+            hashing_reader = HashingReader(source)
+            readable = io.BufferedReader(hashing_reader)
+
+        decompressed: IO[bytes] = readable
+        if url_parsed.path.endswith(".gz"):
+            logger.debug(f"File {url} is expected to be gzipped, gunzipping while reading")
+            decompressed = gzip.GzipFile(fileobj=readable)
+        elif url_parsed.path.endswith(".bz2"):
+            logger.debug(f"File {url} is expected to be bzip2 compressed, decompressing while reading")
+            decompressed = bz2.BZ2File(readable)
+
+        stream = io.TextIOWrapper(decompressed, encoding="utf-8", errors="backslashreplace")
+        try:
+            yield stream
+            if hashing_reader:
+                file_hash = hashing_reader.hexdigest()
+                if file_hash != expected_sha256:
+                    raise ValueError(f"Hash of {url} is {file_hash}, expected {expected_sha256}")
+        finally:
+            stream.close()
+            source.close()
 
     def _retrieve_file_local(self, path, return_contents=False) -> Tuple[str, bool]:
         if not return_contents:
@@ -195,6 +352,78 @@ class FileImportRunnerBase:
             value = fh.read().strip()
         return value, False
 
+    def _file_fingerprint(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve a fingerprint of a file from HTTP(s), FTP or local disk,
+        without downloading the file, to detect whether it changed.
+        HTTP(s) uses the ETag, Last-Modified and Content-Length headers,
+        FTP the modification time and size, and local files a hash
+        of their contents.
+
+        Returns None if no reliable fingerprint can be retrieved,
+        in which case the file should be considered changed.
+        """
+        url_parsed = urlparse(url)
+        try:
+            if url_parsed.scheme in ["http", "https"]:
+                r = requests.head(url, timeout=DOWNLOAD_TIMEOUT, allow_redirects=True)
+                etag = r.headers.get("ETag")
+                last_modified = r.headers.get("Last-Modified")
+                if r.status_code != 200 or not (etag or last_modified):
+                    return None
+                return {"etag": etag, "last_modified": last_modified, "size": r.headers.get("Content-Length")}
+            if url_parsed.scheme == "ftp":
+                return self._ftp_fingerprint(url_parsed)
+            if url_parsed.scheme == "file":
+                sha256 = hashlib.sha256()
+                with open(url_parsed.path, "rb") as f:
+                    for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                        sha256.update(chunk)
+                return {"sha256": sha256.hexdigest()}
+        except ftplib.all_errors as error:
+            logger.info(f"Unable to retrieve fingerprint of {url}, considering it changed: {error}")
+        return None
+
+    def _ftp_fingerprint(self, url_parsed) -> Dict[str, Any]:
+        ftp = ftplib.FTP(timeout=DOWNLOAD_TIMEOUT)
+        try:
+            ftp.connect(url_parsed.hostname, url_parsed.port or ftplib.FTP_PORT)
+            ftp.login(unquote(url_parsed.username or "anonymous"), unquote(url_parsed.password or ""))
+            # Like urllib, paths are relative to the login directory
+            path = unquote(url_parsed.path).lstrip("/")
+            ftp.voidcmd("TYPE I")
+            size = ftp.size(path)
+            modified = ftp.sendcmd(f"MDTM {path}").split()[-1]
+        finally:
+            ftp.close()
+        return {"modified": modified, "size": size}
+
+    def _file_size(self, url: str, fingerprint: Optional[Dict[str, Any]]) -> Optional[int]:
+        """
+        Return the size of the data in a file, as read from _open_file_stream(),
+        from the fingerprint, or from disk for local files. Returns None if the
+        size is not known, or if the file is compressed, in which case
+        the size of the file does not reflect the size of its data.
+        """
+        url_parsed = urlparse(url)
+        if url_parsed.path.endswith((".gz", ".bz2")):
+            return None
+        if url_parsed.scheme == "file":
+            return os.path.getsize(url_parsed.path)
+        size = fingerprint.get("size") if fingerprint else None
+        return int(size) if size is not None else None
+
+    def _chain_file_streams(self, urls: List[str]) -> Iterator[str]:
+        """
+        Iterate over the lines of multiple files, each opened with
+        _open_file_stream() when the previous one is finished.
+        """
+        for url in urls:
+            with self._open_file_stream(url) as f:
+                yield from f
+            # Ensure the last object of a file is not merged with the next
+            yield "\n"
+
 
 class RPSLMirrorFullImportRunner(FileImportRunnerBase):
     """
@@ -202,8 +431,14 @@ class RPSLMirrorFullImportRunner(FileImportRunnerBase):
     mirrored source. URLs for full export file(s), and the URL for the serial
     they match, are provided in configuration.
 
-    Files are downloaded, gunzipped if needed, and then sent through the
-    MirrorFileImportParser.
+    Files are streamed through the MirrorFileImportParser while they are
+    downloaded, and decompressed on the fly if needed.
+
+    The serial and fingerprints of the files are recorded in the database
+    status. If they are unchanged on the next run, the import is skipped.
+    If they did change, and the source was imported before, the files are
+    processed by MirrorUpdateFileImportParser, which only updates changed
+    objects, rather than replacing all data of the source.
     """
 
     def __init__(self, source: str) -> None:
@@ -214,7 +449,13 @@ class RPSLMirrorFullImportRunner(FileImportRunnerBase):
         database_handler: DatabaseHandler,
         serial_newest_mirror: Optional[int] = None,
         force_reload=False,
-    ):
+        import_source_state: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """
+        Run the import. Returns True if all data of the source was
+        replaced, False if only changed objects were updated,
+        or nothing was imported.
+        """
         import_sources = get_setting(f"sources.{self.source}.import_source")
         if isinstance(import_sources, str):
             import_sources = [import_sources]
@@ -222,7 +463,7 @@ class RPSLMirrorFullImportRunner(FileImportRunnerBase):
 
         if not import_sources:
             logger.info(f"Skipping full RPSL import for {self.source}, import_source not set.")
-            return
+            return False
 
         logger.info(
             f"Running full RPSL import of {self.source} from {import_sources}, serial from"
@@ -242,34 +483,242 @@ class RPSLMirrorFullImportRunner(FileImportRunnerBase):
                     f"Current newest serial seen from mirror for {self.source} is "
                     f"{serial_newest_mirror}, import_serial is {import_serial}, cancelling import."
                 )
-                return
+                return False
+
+        fingerprints = {
+            import_source: self._file_fingerprint(import_source) for import_source in import_sources
+        }
+        state = {"serial": import_serial, "files": fingerprints}
+        if not force_reload and import_source_state:
+            if state == import_source_state and all(fingerprints.values()):
+                logger.info(
+                    f"Files for {self.source} are unchanged since the last import, cancelling import."
+                )
+                return False
+            self._run_update_import(database_handler, import_sources, fingerprints)
+            database_handler.record_import_source_state(self.source, state)
+            if import_serial:
+                database_handler.record_serial_newest_mirror(self.source, import_serial)
+            return False
 
-        database_handler.delete_all_rpsl_objects_with_journal(self.source)
-        import_data = [
-            self._retrieve_file(import_source, return_contents=False) for import_source in import_sources
-        ]
+        database_handler.start_rpsl_staging_load(self.source)
 
         roa_validator = None
         if get_setting("rpki.roa_source"):
             roa_validator = BulkRouteROAValidator(database_handler)
 
         database_handler.disable_journaling()
-        for import_filename, to_delete in import_data:
+        database_handler.enable_bulk_load()
+        for import_source in import_sources:
+            with self._open_file_stream(import_source) as import_file:
+                p = MirrorFileImportParser(
+                    source=self.source,
+                    filename=import_source,
+                    file=import_file,
+                    file_size=self._file_size(import_source, fingerprints[import_source]),
+                    serial=None,
+                    database_handler=database_handler,
+                    roa_validator=roa_validator,
+                )
+                p.run_import()
+
+        database_handler.record_import_source_state(self.source, state)
+        if import_serial:
+            database_handler.record_serial_newest_mirror(self.source, import_serial)
+        return True
+
+    def _run_update_import(
+        self,
+        database_handler: DatabaseHandler,
+        import_sources: List[str],
+        fingerprints: Dict[str, Optional[Dict[str, Any]]],
+    ) -> None:
+        """
+        Process the files as the new state of the source, and update
+        only the objects that were added, changed or deleted.
+        Split files are processed as one file.
+        """
+        file_sizes = [self._file_size(url, fingerprints[url]) for url in import_sources]
+        known_file_sizes = [size for size in file_sizes if size is not None]
+        logger.info(f"Files for {self.source} changed since the last import, updating changed objects")
+        roa_validator = None
+        if get_setting("rpki.roa_source"):
+            roa_validator = BulkRouteROAValidator(database_handler)
+
+        p = MirrorUpdateFileImportParser(
+            source=self.source,
+            filename=", ".join(import_sources),
+            file=self._chain_file_streams(import_sources),
+            file_size=sum(known_file_sizes) if len(known_file_sizes) == len(file_sizes) else None,
+            database_handler=database_handler,
+            roa_validator=roa_validator,
+            origin=JournalEntryOrigin.mirror,
+        )
+        p.run_import()
+
+
+class NRTM4ClientRunner(FileImportRunnerBase):
+    """
+    This runner mirrors a source from an NRTMv4 server. The update
+    notification file is retrieved from nrtm4_client_notification_file_url,
+    and its signature is verified with nrtm4_client_public_key.
+
+    If the source was not mirrored before, force_reload is set, the session
+    changed, or the deltas since the current version are no longer available,
+    all data of the source is replaced with the snapshot. Otherwise, the deltas
+    since the current version are applied in order. Snapshot and delta files
+    are processed while they are downloaded, and their hashes are verified
+    before the changes are committed.
+
+    The session and version are recorded in the database status.
+    Notification files with an older version than the current version in
+    the same session, or older than nrtm4_client_max_notification_age,
+    are ignored, as they may be stale copies from a cache, or replayed.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+
+    def run(
+        self,
+        database_handler: DatabaseHandler,
+        nrtm4_client_state: Optional[Dict[str, Any]] = None,
+        force_reload=False,
+    ) -> bool:
+        """
+        Run the import. Returns True if all data of the source was
+        replaced with the snapshot, False if deltas were applied,
+        or nothing was imported.
+        """
+        notification_url = get_setting(f"sources.{self.source}.nrtm4_client_notification_file_url")
+        public_key = load_public_key(get_setting(f"sources.{self.source}.nrtm4_client_public_key"))
+        with self._open_file_stream(notification_url) as notification_file:
+            notification = jws_deserialize_verify(notification_file.read(), public_key)
+        validate_notification(notification, self.source)
+        session_id = notification["session_id"]
+        version = notification["version"]
+
+        current_version = None
+        if not force_reload and nrtm4_client_state and nrtm4_client_state.get("session_id") == session_id:
+            current_version = nrtm4_client_state.get("version")
+        logger.info(
+            f"NRTMv4 notification file for {self.source} has session {session_id} version {version}, "
+            f"current version is {current_version}"
+        )
+        if current_version == version:
+            return False
+        if current_version is not None and version < current_version:
+            # A stale or replayed notification file must not cause
+            # a reload of an older snapshot
+            self._reject_notification(
+                database_handler,
+                (
+                    f"NRTMv4 notification file for {self.source} has version {version}, which is older "
+                    f"than the current version {current_version}, ignoring notification file"
+                ),
+            )
+            return False
+        max_age = int(
+            get_setting(
+                f"sources.{self.source}.nrtm4_client_max_notification_age",
+                DEFAULT_SOURCE_NRTM4_CLIENT_MAX_NOTIFICATION_AGE,
+            )
+        )
+        timestamp = notification_timestamp(notification)
+        if datetime.now(timezone.utc) - timestamp > timedelta(seconds=max_age):
+            self._reject_notification(
+                database_handler,
+                (
+                    f"NRTMv4 notification file for {self.source} has timestamp {notification['timestamp']}, "
+                    f"which is older than the maximum age of {max_age} seconds, ignoring notification file"
+                ),
+            )
+            return False
+
+        deltas = {delta["version"]: delta for delta in notification.get("deltas", [])}
+        delta_versions = range((current_version or 0) + 1, version + 1)
+        if current_version is not None and delta_versions and all(v in deltas for v in delta_versions):
+            for delta_version in delta_versions:
+                self._apply_delta(database_handler, notification_url, session_id, deltas[delta_version])
+            self._record_state(database_handler, session_id, version)
+            return False
+
+        self._load_snapshot(database_handler, notification_url, session_id, notification["snapshot"])
+        self._record_state(database_handler, session_id, notification["snapshot"]["version"])
+        return True
+
+    def _reject_notification(self, database_handler: DatabaseHandler, msg: str) -> None:
+        logger.error(msg)
+        database_handler.record_mirror_error(self.source, msg)
+
+    def _load_snapshot(
+        self,
+        database_handler: DatabaseHandler,
+        notification_url: str,
+        session_id: str,
+        snapshot: Dict[str, Any],
+    ) -> None:
+        """
+        Replace all data of the source with the snapshot. Deltas after
+        the snapshot version are applied in the next run.
+        """
+        snapshot_url = urljoin(notification_url, snapshot["url"])
+        logger.info(
+            f"Loading NRTMv4 snapshot version {snapshot['version']} for {self.source} from {snapshot_url}"
+        )
+        database_handler.start_rpsl_staging_load(self.source)
+
+        roa_validator = None
+        if get_setting("rpki.roa_source"):
+            roa_validator = BulkRouteROAValidator(database_handler)
+
+        database_handler.disable_journaling()
+        database_handler.enable_bulk_load()
+        with self._open_file_stream(snapshot_url, expected_sha256=snapshot["hash"]) as snapshot_file:
+            records = json_seq_records(snapshot_file)
+            validate_file_header(next(records, {}), "snapshot", self.source, session_id, snapshot["version"])
             p = MirrorFileImportParser(
                 source=self.source,
-                filename=import_filename,
+                filename=snapshot_url,
+                file=self._snapshot_object_lines(records),
                 serial=None,
                 database_handler=database_handler,
                 roa_validator=roa_validator,
             )
-            try:
-                p.run_import()
-            finally:
-                if to_delete:
-                    os.unlink(import_filename)
+            p.run_import()
 
-        if import_serial:
-            database_handler.record_serial_newest_mirror(self.source, import_serial)
+    def _snapshot_object_lines(self, records: Iterator[Dict[str, Any]]) -> Iterator[str]:
+        """
+        Convert the records of a snapshot to lines of RPSL objects,
+        separated by empty lines.
+        """
+        for record in records:
+            if not isinstance(record.get("object"), str):
+                raise NRTM4Exception(f"Invalid record in NRTMv4 snapshot: {record}")
+            # splitlines() is not used, as it also splits on other characters
+            for line in record["object"].split("\n"):
+                yield line + "\n"
+            yield "\n"
+
+    def _apply_delta(
+        self, database_handler: DatabaseHandler, notification_url: str, session_id: str, delta: Dict[str, Any]
+    ) -> None:
+        delta_url = urljoin(notification_url, delta["url"])
+        with self._open_file_stream(delta_url, expected_sha256=delta["hash"]) as delta_file:
+            records = json_seq_records(delta_file)
+            validate_file_header(next(records, {}), "delta", self.source, session_id, delta["version"])
+            parser = NRTM4DeltaParser(self.source, delta["version"], database_handler)
+            record_count = parser.run_import(records)
+        logger.info(
+            f"Applied NRTMv4 delta version {delta['version']} for {self.source} from {delta_url}, "
+            f"{record_count} changes"
+        )
+
+    def _record_state(self, database_handler: DatabaseHandler, session_id: str, version: int) -> None:
+        database_handler.record_nrtm4_client_state(
+            self.source, {"session_id": session_id, "version": version}
+        )
+        database_handler.record_serial_newest_mirror(self.source, version)
 
 
 class ROAImportRunner(FileImportRunnerBase):
@@ -418,6 +867,11 @@ class NRTMImportUpdateStreamRunner:
     """
     This runner attempts to pull updates from an NRTM stream for a specific
     mirrored database.
+
+    Operations are parsed and saved while the NRTM response is received,
+    and committed in batches of NRTM_COMMIT_BATCH_SIZE operations, along
+    with the serial of the last operation. If the stream is interrupted,
+    the next run resumes after the last committed batch.
     """
 
     def __init__(self, source: str) -> None:
@@ -444,9 +898,18 @@ class NRTMImportUpdateStreamRunner:
             f"Retrieving NRTM updates for {self.source} from serial {serial_start} on {nrtm_host}:{nrtm_port}"
         )
         query = f"-g {self.source}:3:{serial_start}-LAST"
-        response = whois_query(nrtm_host, nrtm_port, query, end_markings)
-        logger.debug(f"Received NRTM response for {self.source}: {response.strip()}")
+        response_lines = whois_query_stream(nrtm_host, nrtm_port, query, end_markings)
 
-        stream_parser = NRTMStreamParser(self.source, response, database_handler)
-        for operation in stream_parser.operations:
+        stream_parser = NRTMStreamParser(self.source, None, database_handler)
+        operation_count = 0
+        for operation in stream_parser.parse_stream(response_lines):
             operation.save(database_handler)
+            operation_count += 1
+            if operation_count % NRTM_COMMIT_BATCH_SIZE == 0:
+                database_handler.record_serial_newest_mirror(self.source, operation.serial)
+                database_handler.commit()
+                logger.debug(
+                    f"Committed {operation_count} NRTM operations for {self.source}, up to serial"
+                    f" {operation.serial}"
+                )
+        logger.info(f"Processed {operation_count} NRTM operations for {self.source}")
@@ -0,0 +1,193 @@
+"""
+Shared code for NRTMv4 mirroring. In NRTMv4, a server publishes the
+contents of a source as static files: a snapshot of all objects, deltas
+with the changes between versions, and an update notification file,
+signed with an Ed25519 key, that refers to the current snapshot and deltas.
+Clients retrieve the notification file, verify its signature, and apply
+the deltas, or reload the snapshot.
+
+Snapshot and delta files are JSON text sequences (RFC 7464), of which
+the first record is a header. The notification file is a JWS
+in compact serialization (RFC 7515).
+"""
+import base64
+import binascii
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator
+
+import ujson
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import (
+    Ed25519PrivateKey,
+    Ed25519PublicKey,
+)
+from cryptography.hazmat.primitives.serialization import (
+    load_pem_private_key,
+    load_pem_public_key,
+)
+
+NRTM4_VERSION = 4
+NOTIFICATION_FILENAME = "update-notification-file.jose"
+JSON_SEQ_RECORD_SEPARATOR = "\x1e"
+JWS_HEADER = {"alg": "EdDSA"}
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class NRTM4Exception(Exception):  # noqa: N818
+    pass
+
+
+def load_private_key(pem: str) -> Ed25519PrivateKey:
+    """
+    Load an Ed25519 private key in PEM format.
+    Raises ValueError if the key is invalid or not an Ed25519 key.
+    """
+    key = load_pem_private_key(pem.encode("ascii"), password=None)
+    if not isinstance(key, Ed25519PrivateKey):
+        raise ValueError("key is not an Ed25519 private key")
+    return key
+
+
+def load_public_key(pem: str) -> Ed25519PublicKey:
+    """
+    Load an Ed25519 public key in PEM format.
+    Raises ValueError if the key is invalid or not an Ed25519 key.
+    """
+    key = load_pem_public_key(pem.encode("ascii"))
+    if not isinstance(key, Ed25519PublicKey):
+        raise ValueError("key is not an Ed25519 public key")
+    return key
+
+
+def jws_serialize(payload: Dict[str, Any], private_key: Ed25519PrivateKey) -> str:
+    """
+    Serialize and sign a payload as a JWS in compact serialization.
+    """
+    signing_input = _base64url_encode(ujson.dumps(JWS_HEADER)) + "." + _base64url_encode(ujson.dumps(payload))
+    signature = private_key.sign(signing_input.encode("ascii"))
+    return signing_input + "." + _base64url_encode(signature)
+
+
+def jws_deserialize_verify(serialized: str, public_key: Ed25519PublicKey) -> Dict[str, Any]:
+    """
+    Verify the signature of a JWS in compact serialization, and return
+    the deserialized payload. Raises NRTM4Exception if the JWS is invalid,
+    or the signature is not valid for the public key.
+    """
+    try:
+        header_encoded, payload_encoded, signature_encoded = serialized.strip().split(".")
+        header = ujson.loads(_base64url_decode(header_encoded))
+        if header.get("alg") != JWS_HEADER["alg"]:
+            raise NRTM4Exception(f"Unsupported JWS algorithm: {header.get('alg')}")
+        public_key.verify(
+            _base64url_decode(signature_encoded),
+            f"{header_encoded}.{payload_encoded}".encode("ascii"),
+        )
+        return ujson.loads(_base64url_decode(payload_encoded))
+    except InvalidSignature:
+        raise NRTM4Exception("Invalid signature on JWS")
+    except (ValueError, AttributeError, binascii.Error) as error:
+        raise NRTM4Exception(f"Invalid JWS: {error}")
+
+
+def json_seq_record(record: Dict[str, Any]) -> bytes:
+    """
+    Serialize a single record of a JSON text sequence.
+    The JSON serialization never contains newlines, so that
+    every record is also a single line.
+    """
+    return (JSON_SEQ_RECORD_SEPARATOR + ujson.dumps(record) + "\n").encode("utf-8")
+
+
+def json_seq_records(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Deserialize the records of a JSON text sequence, from an iterable
+    of lines, like a text stream. Raises NRTM4Exception on invalid records.
+    """
+    for line in lines:
+        # Python considers the record separator whitespace, so strip() is not used
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if not line.startswith(JSON_SEQ_RECORD_SEPARATOR):
+            raise NRTM4Exception(f"Invalid record in JSON text sequence, missing record separator: {line}")
+        try:
+            record = ujson.loads(line[1:])
+        except ValueError as error:
+            raise NRTM4Exception(f"Invalid record in JSON text sequence: {error}: {line}")
+        if not isinstance(record, dict):
+            raise NRTM4Exception(f"Invalid record in JSON text sequence, not an object: {line}")
+        yield record
+
+
+def validate_notification(notification: Dict[str, Any], source: str) -> None:
+    """
+    Validate the payload of an update notification file.
+    Raises NRTM4Exception if invalid.
+    """
+
+    def validate_file_reference(file: Any) -> None:
+        if not (
+            isinstance(file, dict)
+            and isinstance(file.get("version"), int)
+            and isinstance(file.get("url"), str)
+            and isinstance(file.get("hash"), str)
+        ):
+            raise NRTM4Exception(f"Invalid file reference in NRTMv4 notification file: {file}")
+
+    if notification.get("nrtm_version") != NRTM4_VERSION or notification.get("type") != "notification":
+        raise NRTM4Exception("Invalid NRTMv4 notification file, unknown NRTM version or type")
+    if notification.get("source") != source:
+        raise NRTM4Exception(
+            f"Invalid NRTMv4 notification file, expected source {source}, found {notification.get('source')}"
+        )
+    if not isinstance(notification.get("session_id"), str) or not isinstance(
+        notification.get("version"), int
+    ):
+        raise NRTM4Exception("Invalid NRTMv4 notification file, invalid session_id or version")
+    try:
+        notification_timestamp(notification)
+    except (TypeError, ValueError):
+        raise NRTM4Exception("Invalid NRTMv4 notification file, invalid timestamp")
+    validate_file_reference(notification.get("snapshot"))
+    if not isinstance(notification.get("deltas", []), list):
+        raise NRTM4Exception("Invalid NRTMv4 notification file, deltas is not a list")
+    for delta in notification.get("deltas", []):
+        validate_file_reference(delta)
+
+
+def notification_timestamp(notification: Dict[str, Any]) -> datetime:
+    """
+    Return the timestamp of an update notification file as a datetime.
+    Raises ValueError or TypeError if invalid.
+    """
+    return datetime.strptime(notification["timestamp"], TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def validate_file_header(header: Dict[str, Any], file_type: str, source: str, session_id: str, version: int):
+    """
+    Validate the header record of a snapshot or delta file, against
+    the values from the notification file. Raises NRTM4Exception if invalid.
+    """
+    expected = {
+        "nrtm_version": NRTM4_VERSION,
+        "type": file_type,
+        "source": source,
+        "session_id": session_id,
+        "version": version,
+    }
+    for key, value in expected.items():
+        if header.get(key) != value:
+            raise NRTM4Exception(
+                f"Invalid NRTMv4 {file_type} file header, expected {key} {value}, found {header.get(key)}"
+            )
+
+
+def _base64url_encode(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _base64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
@@ -0,0 +1,291 @@
+import gzip
+import hashlib
+import itertools
+import logging
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, Dict, Iterable, Optional
+
+from irrd.conf import get_setting
+from irrd.routepref.status import RoutePreferenceStatus
+from irrd.rpki.status import RPKIStatus
+from irrd.scopefilter.status import ScopeFilterStatus
+from irrd.storage.database_handler import DatabaseHandler
+from irrd.storage.models import DatabaseOperation
+from irrd.storage.queries import (
+    DatabaseStatusQuery,
+    RPSLDatabaseJournalQuery,
+    RPSLDatabaseQuery,
+)
+from irrd.utils.text import remove_auth_hashes
+
+from .nrtm4 import (
+    NOTIFICATION_FILENAME,
+    NRTM4_VERSION,
+    TIMESTAMP_FORMAT,
+    json_seq_record,
+    jws_serialize,
+    load_private_key,
+)
+
+NRTM4_PERMISSIONS = 0o644
+# A new snapshot is written after this interval, if there were changes
+SNAPSHOT_INTERVAL = timedelta(hours=4)
+# Deltas are kept for at least this time, if they are older than the snapshot
+DELTA_RETENTION = timedelta(hours=24)
+# Files no longer referenced in the notification file are kept for this
+# time, as clients may have just retrieved the previous notification file
+UNREFERENCED_FILE_RETENTION = timedelta(hours=1)
+SNAPSHOT_FILENAME_PREFIX = "nrtm-snapshot."
+DELTA_FILENAME_PREFIX = "nrtm-delta."
+
+logger = logging.getLogger(__name__)
+
+
+class NRTM4ServerRunner:
+    """
+    This NRTM4ServerRunner generates the NRTMv4 files for a single source,
+    in the nrtm4_server_local_path directory, from which they can be
+    served by any HTTP server.
+
+    On the first run, or when the journal no longer covers the changes since
+    the last run, a new session is started with a snapshot of the source.
+    On later runs, the changes from the journal since the last run are
+    written to a new delta, and periodically, a new snapshot is written.
+    Every run writes a new update notification file, signed with the
+    nrtm4_server_private_key, that refers to the snapshot and deltas.
+
+    The session, version and files are recorded in the database status.
+    The notification file is only written after that is committed,
+    so that it never refers to a version that was not recorded.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+
+    def run(self) -> None:
+        self.database_handler = DatabaseHandler()
+        try:
+            self.path = Path(get_setting(f"sources.{self.source}.nrtm4_server_local_path"))
+            private_key = load_private_key(get_setting(f"sources.{self.source}.nrtm4_server_private_key"))
+            now = datetime.now(timezone.utc)
+            state = self._update(now)
+            self.database_handler.record_nrtm4_server_state(self.source, state)
+            self.database_handler.commit()
+
+            notification = self._notification(state, now)
+            self._write_file(
+                NOTIFICATION_FILENAME, [jws_serialize(notification, private_key).encode("ascii")]
+            )
+            self._remove_unreferenced_files(state, now)
+            logger.info(
+                f"NRTMv4 files for {self.source} updated to version {state['version']} in session "
+                f"{state['session_id']}, stored in {self.path}"
+            )
+        except Exception as exc:
+            logger.error(
+                f"An exception occurred while attempting to update NRTMv4 files for {self.source}: {exc}",
+                exc_info=exc,
+            )
+        finally:
+            self.database_handler.close()
+
+    def _update(self, now: datetime) -> Dict[str, Any]:
+        """
+        Write a new delta and/or snapshot if needed, and return the new state.
+        """
+        query = DatabaseStatusQuery().source(self.source)
+        status = next(self.database_handler.execute_query(query), {})
+        state = status.get("nrtm4_server_state")
+
+        if not self._session_valid(state, status):
+            return self._new_session(status.get("serial_newest_seen"), now)
+        assert state
+
+        serial_start = (state["serial"] or 0) + 1
+        delta = self._write_delta(state["session_id"], state["version"] + 1, serial_start, now)
+        if delta:
+            state["serial"] = delta.pop("serial")
+            state["version"] = delta["version"]
+            state["deltas"].append(delta)
+
+        snapshot_age = now - datetime.fromisoformat(state["snapshot"]["timestamp"])
+        if state["snapshot"]["version"] != state["version"] and snapshot_age >= SNAPSHOT_INTERVAL:
+            # Objects are read after the journal, so the snapshot may contain
+            # changes that are also in later deltas. As deltas contain the full
+            # state of changed objects, applying them again has no effect.
+            state["snapshot"] = self._write_snapshot(state["session_id"], state["version"], now)
+
+        state["deltas"] = [
+            delta
+            for delta in state["deltas"]
+            if delta["version"] > state["snapshot"]["version"]
+            or now - datetime.fromisoformat(delta["timestamp"]) < DELTA_RETENTION
+        ]
+        return state
+
+    def _session_valid(self, state: Optional[Dict[str, Any]], status: Dict[str, Any]) -> bool:
+        """
+        Determine whether the current session can be continued, i.e. all its
+        files exist, and the journal contains all changes since the last version.
+        """
+        if not state:
+            return False
+        filenames = [state["snapshot"]["url"]] + [delta["url"] for delta in state["deltas"]]
+        if not all((self.path / filename).exists() for filename in filenames):
+            logger.info(f"NRTMv4 files for {self.source} are missing, starting a new session")
+            return False
+
+        serial_oldest_journal = status.get("serial_oldest_journal")
+        serial_newest_journal = status.get("serial_newest_journal")
+        if serial_newest_journal is None:
+            return True
+        if state["serial"] is not None and serial_newest_journal < state["serial"]:
+            logger.info(f"Journal for {self.source} was reset, starting a new NRTMv4 session")
+            return False
+        serial_start = (state["serial"] or 0) + 1
+        if serial_newest_journal >= serial_start and serial_oldest_journal > serial_start:
+            logger.info(
+                f"Journal for {self.source} does not contain serial {serial_start}, "
+                "starting a new NRTMv4 session"
+            )
+            return False
+        return True
+
+    def _new_session(self, serial_newest_seen: Optional[int], now: datetime) -> Dict[str, Any]:
+        """
+        Start a new session with a snapshot. The first delta of the
+        session will start after the newest serial seen before the snapshot.
+        """
+        session_id = str(uuid.uuid4())
+        logger.info(f"Starting new NRTMv4 session {session_id} for {self.source}")
+        return {
+            "session_id": session_id,
+            "version": 1,
+            "serial": serial_newest_seen,
+            "snapshot": self._write_snapshot(session_id, 1, now),
+            "deltas": [],
+        }
+
+    def _write_snapshot(self, session_id: str, version: int, now: datetime) -> Dict[str, Any]:
+        query = RPSLDatabaseQuery(column_names=["object_text"]).sources([self.source])
+        query = query.rpki_status([RPKIStatus.not_found, RPKIStatus.valid])
+        query = query.scopefilter_status([ScopeFilterStatus.in_scope])
+        query = query.route_preference_status([RoutePreferenceStatus.visible])
+        objects = self.database_handler.execute_query(query, stream_results=True)
+
+        records = (json_seq_record({"object": remove_auth_hashes(obj["object_text"])}) for obj in objects)
+        filename = f"{SNAPSHOT_FILENAME_PREFIX}{version}.{session_id}.{secrets.token_hex(4)}.json.gz"
+        file_hash = self._write_file(
+            filename, self._with_header("snapshot", session_id, version, records), compress=True
+        )
+        logger.debug(f"Wrote NRTMv4 snapshot for {self.source} version {version} to {filename}")
+        return {"version": version, "url": filename, "hash": file_hash, "timestamp": now.isoformat()}
+
+    def _write_delta(
+        self, session_id: str, version: int, serial_start: int, now: datetime
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Write a delta with the journal entries from serial_start, if there
+        are any. Returns the delta, with the last serial included in it.
+        """
+        query = RPSLDatabaseJournalQuery().sources([self.source]).serial_nrtm_range(serial_start)
+        entries = self.database_handler.execute_query(query, stream_results=True)
+        first_entry = next(entries, None)
+        if not first_entry:
+            return None
+
+        serial = first_entry["serial_nrtm"]
+
+        def records():
+            nonlocal serial
+            for entry in itertools.chain([first_entry], entries):
+                serial = entry["serial_nrtm"]
+                if entry["operation"] == DatabaseOperation.delete:
+                    record = {
+                        "action": "delete",
+                        "object_class": entry["object_class"],
+                        "primary_key": entry["rpsl_pk"],
+                    }
+                else:
+                    record = {"action": "add_modify", "object": remove_auth_hashes(entry["object_text"])}
+                yield json_seq_record(record)
+
+        filename = f"{DELTA_FILENAME_PREFIX}{version}.{session_id}.{secrets.token_hex(4)}.json"
+        file_hash = self._write_file(filename, self._with_header("delta", session_id, version, records()))
+        logger.debug(
+            f"Wrote NRTMv4 delta for {self.source} version {version} to {filename}, "
+            f"journal serials {serial_start}-{serial}"
+        )
+        return {
+            "version": version,
+            "url": filename,
+            "hash": file_hash,
+            "timestamp": now.isoformat(),
+            "serial": serial,
+        }
+
+    def _with_header(self, file_type: str, session_id: str, version: int, records: Iterable[bytes]):
+        yield json_seq_record(
+            {
+                "nrtm_version": NRTM4_VERSION,
+                "type": file_type,
+                "source": self.source,
+                "session_id": session_id,
+                "version": version,
+            }
+        )
+        yield from records
+
+    def _notification(self, state: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        def file_reference(file: Dict[str, Any]) -> Dict[str, Any]:
+            return {"version": file["version"], "url": file["url"], "hash": file["hash"]}
+
+        return {
+            "nrtm_version": NRTM4_VERSION,
+            "timestamp": now.strftime(TIMESTAMP_FORMAT),
+            "type": "notification",
+            "source": self.source,
+            "session_id": state["session_id"],
+            "version": state["version"],
+            "snapshot": file_reference(state["snapshot"]),
+            "deltas": [file_reference(delta) for delta in state["deltas"]],
+        }
+
+    def _write_file(self, filename: str, contents: Iterable[bytes], compress=False) -> str:
+        """
+        Write a file to a temporary file, and then move it in place.
+        Returns the SHA-256 hash of the file.
+        """
+        tmpfile = NamedTemporaryFile(dir=self.path, prefix=".tmp-", delete=False)
+        try:
+            with tmpfile:
+                fh = gzip.GzipFile(fileobj=tmpfile, mode="wb") if compress else tmpfile
+                for chunk in contents:
+                    fh.write(chunk)
+                fh.close()
+            file_hash = hashlib.sha256()
+            with open(tmpfile.name, "rb") as fh:
+                for chunk in iter(lambda: fh.read(64 * 1024), b""):
+                    file_hash.update(chunk)
+            os.chmod(tmpfile.name, NRTM4_PERMISSIONS)
+            os.replace(tmpfile.name, self.path / filename)
+        except BaseException:
+            if os.path.exists(tmpfile.name):
+                os.unlink(tmpfile.name)
+            raise
+        return file_hash.hexdigest()
+
+    def _remove_unreferenced_files(self, state: Dict[str, Any], now: datetime) -> None:
+        referenced = {state["snapshot"]["url"]} | {delta["url"] for delta in state["deltas"]}
+        for path in self.path.iterdir():
+            if not path.name.startswith((SNAPSHOT_FILENAME_PREFIX, DELTA_FILENAME_PREFIX)):
+                continue
+            modified = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+            if path.name not in referenced and now - modified > UNREFERENCED_FILE_RETENTION:
+                logger.debug(f"Removing unreferenced NRTMv4 file {path}")
+                path.unlink()
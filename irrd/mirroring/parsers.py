@@ -1,6 +1,22 @@
 import logging
+import multiprocessing
+import os
 import re
-from typing import List, Optional, Set
+from collections import deque
+from itertools import chain, islice
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 from irrd.conf import get_setting
 from irrd.rpki.validators import BulkRouteROAValidator
@@ -9,9 +25,11 @@ from irrd.rpsl.rpsl_objects import RPSLKeyCert, rpsl_object_from_text
 from irrd.scopefilter.validators import ScopeFilterValidator
 from irrd.storage.database_handler import DatabaseHandler
 from irrd.storage.models import DatabaseOperation, JournalEntryOrigin
+from irrd.utils.misc import chunked_iterable
 from irrd.utils.text import remove_last_modified, split_paragraphs_rpsl
 
 from ..storage.queries import RPSLDatabaseQuery
+from .nrtm4 import NRTM4Exception
 from .nrtm_operation import NRTMOperation
 
 logger = logging.getLogger(__name__)
@@ -22,6 +40,32 @@ nrtm_start_line_re = re.compile(
     ),
     flags=re.MULTILINE,
 )
+# Files of at least this size are parsed in a pool of PARSER_PROCESSES processes,
+# in chunks of PARSER_CHUNK_SIZE objects. For streams of unknown size, the pool
+# is only started after the first PARALLEL_PARSING_MIN_OBJECTS objects.
+PARALLEL_PARSING_MIN_FILE_SIZE = 20 * 1024 * 1024
+PARALLEL_PARSING_MIN_OBJECTS = 20000
+PARSER_PROCESSES = min(os.cpu_count() or 1, 4)
+PARSER_CHUNK_SIZE = 2000
+
+# A parsed object, or the object class if it was unknown
+ParseResult = Tuple[Optional[RPSLObject], Optional[str]]
+
+
+def parse_rpsl_object_text(rpsl_text: str) -> ParseResult:
+    """
+    Parse the text of an RPSL object, without strict validation.
+    Returns the object, or the object class if it is unknown.
+    """
+    try:
+        return rpsl_object_from_text(rpsl_text.strip(), strict_validation=False), None
+    except UnknownRPSLObjectClassException as e:
+        return None, e.rpsl_object_class
+
+
+def parse_rpsl_object_texts(rpsl_texts: Sequence[str]) -> List[ParseResult]:
+    """Parse a chunk of RPSL object texts, run in parser processes."""
+    return [parse_rpsl_object_text(rpsl_text) for rpsl_text in rpsl_texts]
 
 
 class RPSLImportError(Exception):
@@ -53,6 +97,10 @@ class MirrorFileImportParserBase(MirrorParser):
     If direct_error_return is set, run_import() immediately returns
     upon an encountering an error message. It will return an error
     string.
+
+    If file is set, the data is read from this open text stream, or other
+    iterable of lines, e.g. a download in progress, and filename is only
+    used in logs. file_size is the size of the data in file, if known.
     """
 
     obj_parsed = 0  # Total objects found
@@ -68,9 +116,13 @@ class MirrorFileImportParserBase(MirrorParser):
         database_handler: DatabaseHandler,
         direct_error_return: bool = False,
         roa_validator: Optional[BulkRouteROAValidator] = None,
+        file: Optional[Iterable[str]] = None,
+        file_size: Optional[int] = None,
     ) -> None:
         self.source = source
         self.filename = filename
+        self.file = file
+        self.file_size = file_size
         self.database_handler = database_handler
         self.direct_error_return = direct_error_return
         self.roa_validator = roa_validator
@@ -82,71 +134,114 @@ class MirrorFileImportParserBase(MirrorParser):
         self.scopefilter_validator = ScopeFilterValidator()
         super().__init__()
 
-    def _parse_object(self, rpsl_text: str) -> Optional[RPSLObject]:
+    def _parse_paragraphs(self, paragraphs: Iterable[str]) -> Iterator[Tuple[str, Optional[ParseResult]]]:
+        """
+        Yield each paragraph with its parse result. For large files,
+        paragraphs are parsed in chunks in a pool of processes. Otherwise,
+        the parse result is None, and the paragraph is parsed in _parse_object().
+        For streams of which the size is not known, the first
+        PARALLEL_PARSING_MIN_OBJECTS paragraphs are parsed without the pool,
+        and the pool is only started if there are more.
+        Results are always yielded in the order of the file, so that the
+        last object in the file wins if a PK occurs multiple times.
+        """
+        file_size = self.file_size if self.file else os.path.getsize(self.filename)
+        if PARSER_PROCESSES < 2 or (file_size is not None and file_size < PARALLEL_PARSING_MIN_FILE_SIZE):
+            for paragraph in paragraphs:
+                yield paragraph, None
+            return
+
+        paragraphs = iter(paragraphs)
+        if file_size is None:
+            for paragraph in islice(paragraphs, PARALLEL_PARSING_MIN_OBJECTS):
+                yield paragraph, None
+            next_paragraph = next(paragraphs, None)
+            if next_paragraph is None:
+                return
+            paragraphs = chain([next_paragraph], paragraphs)
+
+        logger.debug(f"Parsing {self.filename} for {self.source} in {PARSER_PROCESSES} processes")
+        # Forked processes inherit the configuration
+        with multiprocessing.get_context("fork").Pool(PARSER_PROCESSES) as pool:
+            # Limit the chunks in progress, to limit memory use
+            pending: Deque = deque()
+            for chunk in chunked_iterable(paragraphs, PARSER_CHUNK_SIZE):
+                pending.append((chunk, pool.apply_async(parse_rpsl_object_texts, (chunk,))))
+                if len(pending) >= PARSER_PROCESSES * 2:
+                    chunk, results = pending.popleft()
+                    yield from zip(chunk, results.get())
+            while pending:
+                chunk, results = pending.popleft()
+                yield from zip(chunk, results.get())
+
+    def _parse_object(
+        self, rpsl_text: str, parse_result: Optional[ParseResult] = None
+    ) -> Optional[RPSLObject]:
         """
         Parse and validate a single object and return it.
+        If parse_result is set, it is the result of parse_rpsl_object_text()
+        for rpsl_text, and the text is not parsed again.
         If there is a parsing error, unknown object class, invalid source:
         - if direct_error_return is set, raises an RPSLImportError
         - otherwise, returns None
         """
-        try:
-            self.obj_parsed += 1
-            # If an object turns out to be a key-cert, and strict_import_keycert_objects
-            # is set, parse it again with strict validation to load it in the GPG keychain.
-            obj = rpsl_object_from_text(rpsl_text.strip(), strict_validation=False)
-            if self.strict_validation_key_cert and obj.__class__ == RPSLKeyCert:
-                obj = rpsl_object_from_text(rpsl_text.strip(), strict_validation=True)
-
-            if obj.messages.errors():
-                log_msg = (
-                    f"Parsing errors: {obj.messages.errors()}, original object text follows:\n{rpsl_text}"
-                )
-                if self.direct_error_return:
-                    raise RPSLImportError(log_msg)
-                self.database_handler.record_mirror_error(self.source, log_msg)
-                logger.critical(
-                    f"Parsing errors occurred while importing from file for {self.source}. "
-                    "This object is ignored, causing potential data inconsistencies. A new operation for "
-                    "this update, without errors, will still be processed and cause the inconsistency to "
-                    f"be resolved. Parser error messages: {obj.messages.errors()}; "
-                    f"original object text follows:\n{rpsl_text}"
-                )
-                self.obj_errors += 1
-                return None
+        self.obj_parsed += 1
+        obj, unknown_object_class = parse_result if parse_result else parse_rpsl_object_text(rpsl_text)
 
-            if obj.source() != self.source:
-                msg = f"Invalid source {obj.source()} for object {obj.pk()}, expected {self.source}"
-                if self.direct_error_return:
-                    raise RPSLImportError(msg)
-                logger.critical(msg + ". This object is ignored, causing potential data inconsistencies.")
-                self.database_handler.record_mirror_error(self.source, msg)
-                self.obj_errors += 1
-                return None
-
-            if self.object_class_filter and obj.rpsl_object_class.lower() not in self.object_class_filter:
-                self.obj_ignored_class += 1
-                return None
-
-            if self.roa_validator and obj.is_route and obj.prefix_length and obj.asn_first:
-                obj.rpki_status = self.roa_validator.validate_route(
-                    str(obj.ip_first), obj.prefix_length, obj.asn_first, obj.source()
-                )
-
-            obj.scopefilter_status, _ = self.scopefilter_validator.validate_rpsl_object(obj)
-
-            return obj
-
-        except UnknownRPSLObjectClassException as e:
+        if unknown_object_class is not None:
             # Ignore legacy IRRd artifacts
             # https://github.com/irrdnet/irrd4/issues/232
-            if e.rpsl_object_class.startswith("*xx"):
+            if unknown_object_class.startswith("*xx"):
                 self.obj_parsed -= 1  # This object does not exist to us
                 return None
             if self.direct_error_return:
-                raise RPSLImportError(f"Unknown object class: {e.rpsl_object_class}")
+                raise RPSLImportError(f"Unknown object class: {unknown_object_class}")
             self.obj_unknown += 1
-            self.unknown_object_classes.add(e.rpsl_object_class)
-        return None
+            self.unknown_object_classes.add(unknown_object_class)
+            return None
+        assert obj
+
+        # If an object turns out to be a key-cert, and strict_import_keycert_objects
+        # is set, parse it again with strict validation to load it in the GPG keychain.
+        if self.strict_validation_key_cert and obj.__class__ == RPSLKeyCert:
+            obj = rpsl_object_from_text(rpsl_text.strip(), strict_validation=True)
+
+        if obj.messages.errors():
+            log_msg = f"Parsing errors: {obj.messages.errors()}, original object text follows:\n{rpsl_text}"
+            if self.direct_error_return:
+                raise RPSLImportError(log_msg)
+            self.database_handler.record_mirror_error(self.source, log_msg)
+            logger.critical(
+                f"Parsing errors occurred while importing from file for {self.source}. "
+                "This object is ignored, causing potential data inconsistencies. A new operation for "
+                "this update, without errors, will still be processed and cause the inconsistency to "
+                f"be resolved. Parser error messages: {obj.messages.errors()}; "
+                f"original object text follows:\n{rpsl_text}"
+            )
+            self.obj_errors += 1
+            return None
+
+        if obj.source() != self.source:
+            msg = f"Invalid source {obj.source()} for object {obj.pk()}, expected {self.source}"
+            if self.direct_error_return:
+                raise RPSLImportError(msg)
+            logger.critical(msg + ". This object is ignored, causing potential data inconsistencies.")
+            self.database_handler.record_mirror_error(self.source, msg)
+            self.obj_errors += 1
+            return None
+
+        if self.object_class_filter and obj.rpsl_object_class.lower() not in self.object_class_filter:
+            self.obj_ignored_class += 1
+            return None
+
+        if self.roa_validator and obj.is_route and obj.prefix_length and obj.asn_first:
+            obj.rpki_status = self.roa_validator.validate_route(
+                str(obj.ip_first), obj.prefix_length, obj.asn_first, obj.source()
+            )
+
+        obj.scopefilter_status, _ = self.scopefilter_validator.validate_rpsl_object(obj)
+
+        return obj
 
 
 class MirrorFileImportParser(MirrorFileImportParserBase):
@@ -170,10 +265,10 @@ class MirrorFileImportParser(MirrorFileImportParserBase):
         Run the actual import. If direct_error_return is set, returns an error
         string on encountering the first error. Otherwise, returns None.
         """
-        f = open(self.filename, encoding="utf-8", errors="backslashreplace")
-        for paragraph in split_paragraphs_rpsl(f):
+        f = self.file or open(self.filename, encoding="utf-8", errors="backslashreplace")
+        for paragraph, parse_result in self._parse_paragraphs(split_paragraphs_rpsl(f)):
             try:
-                rpsl_obj = self._parse_object(paragraph)
+                rpsl_obj = self._parse_object(paragraph, parse_result)
             except RPSLImportError as e:
                 if self.direct_error_return:
                     return e.message
@@ -182,7 +277,8 @@ class MirrorFileImportParser(MirrorFileImportParserBase):
                     self.database_handler.upsert_rpsl_object(rpsl_obj, origin=JournalEntryOrigin.mirror)
 
         self.log_report()
-        f.close()
+        if not self.file:
+            f.close()
         if self.serial:
             self.database_handler.record_serial_seen(self.source, self.serial)
 
@@ -217,10 +313,14 @@ class MirrorUpdateFileImportParser(MirrorFileImportParserBase):
     If direct_error_return is set, run_import() immediately returns
     upon an encountering an error message. It will return an error
     string.
+
+    Changes are recorded with the origin given in the origin parameter,
+    by default synthetic_nrtm.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, origin: JournalEntryOrigin = JournalEntryOrigin.synthetic_nrtm, **kwargs):
         super().__init__(*args, **kwargs)
+        self.origin = origin
         logger.debug(f"Starting update import for {self.source} from {self.filename}")
         self.obj_new = 0  # New objects
         self.obj_modified = 0  # Modified objects
@@ -233,17 +333,18 @@ class MirrorUpdateFileImportParser(MirrorFileImportParserBase):
         string on encountering the first error. Otherwise, returns None.
         """
         objs_from_file = []
-        f = open(self.filename, encoding="utf-8", errors="backslashreplace")
-        for paragraph in split_paragraphs_rpsl(f):
+        f = self.file or open(self.filename, encoding="utf-8", errors="backslashreplace")
+        for paragraph, parse_result in self._parse_paragraphs(split_paragraphs_rpsl(f)):
             try:
-                rpsl_obj = self._parse_object(paragraph)
+                rpsl_obj = self._parse_object(paragraph, parse_result)
             except RPSLImportError as e:
                 if self.direct_error_return:
                     return e.message
             else:
                 if rpsl_obj:
                     objs_from_file.append(rpsl_obj)
-        f.close()
+        if not self.file:
+            f.close()
 
         query = RPSLDatabaseQuery(
             ordered_by_sources=False, enable_ordering=False, column_names=["rpsl_pk", "object_class"]
@@ -263,14 +364,14 @@ class MirrorUpdateFileImportParser(MirrorFileImportParserBase):
         self.obj_retained = len(retained_pks)
 
         for (rpsl_pk, object_class), file_obj in filter(lambda i: i[0] in new_pks, file_objs_by_pk.items()):
-            self.database_handler.upsert_rpsl_object(file_obj, JournalEntryOrigin.synthetic_nrtm)
+            self.database_handler.upsert_rpsl_object(file_obj, self.origin)
 
         for rpsl_pk, object_class in deleted_pks:
             self.database_handler.delete_rpsl_object(
                 rpsl_pk=rpsl_pk,
                 source=self.source,
                 object_class=object_class,
-                origin=JournalEntryOrigin.synthetic_nrtm,
+                origin=self.origin,
             )
 
         # This query does not filter on retained_pks. The expectation is that most
@@ -287,7 +388,7 @@ class MirrorUpdateFileImportParser(MirrorFileImportParserBase):
             except KeyError:
                 continue
             if file_obj.render_rpsl_text() != remove_last_modified(row["object_text"]):
-                self.database_handler.upsert_rpsl_object(file_obj, JournalEntryOrigin.synthetic_nrtm)
+                self.database_handler.upsert_rpsl_object(file_obj, self.origin)
                 self.obj_modified += 1
 
         self.log_report()
@@ -320,12 +421,15 @@ class NRTMStreamParser(MirrorParser):
     into individual operations, matched with their serial and
     whether they are an ADD/DEL operation.
 
-    Creating an instance will fill the attributes:
+    Creating an instance with nrtm_data will fill the attributes:
     - first_serial: the first serial found in the data
     - last_serial: the last serial found
     - nrtm_source: the RPSL source recorded in the START header (must be equal to expected source)
     - operations: a list of NRTMOperation objects
 
+    Alternatively, nrtm_data can be None, and the data can be passed
+    to parse_stream(), which yields operations as soon as they are read.
+
     Raises a ValueError for invalid NRTM data.
     """
 
@@ -334,16 +438,23 @@ class NRTMStreamParser(MirrorParser):
     nrtm_source: Optional[str] = None
     _current_op_serial = -1
 
-    def __init__(self, source: str, nrtm_data: str, database_handler: DatabaseHandler) -> None:
+    def __init__(self, source: str, nrtm_data: Optional[str], database_handler: DatabaseHandler) -> None:
         self.source = source
         self.database_handler = database_handler
         self.rpki_aware = bool(get_setting("rpki.roa_source"))
         super().__init__()
         self.operations: List[NRTMOperation] = []
-        self._split_stream(nrtm_data)
+        if nrtm_data is not None:
+            self.operations = list(self.parse_stream(nrtm_data))
 
-    def _split_stream(self, data: str) -> None:
-        """Split a stream into individual operations."""
+    def parse_stream(self, data: Union[str, Iterable[str]]) -> Iterator[NRTMOperation]:
+        """
+        Split a stream, either a string or an iterable of lines,
+        into individual operations, and yield each operation as soon
+        as it is complete.
+        The checks for a complete stream are done after the last operation,
+        so a ValueError may be raised after operations were yielded.
+        """
         paragraphs = split_paragraphs_rpsl(data, strip_comments=False)
         last_comment_seen = ""
 
@@ -353,7 +464,7 @@ class NRTMStreamParser(MirrorParser):
             elif paragraph.startswith("%") or paragraph.startswith("#"):
                 last_comment_seen = paragraph
             elif paragraph.startswith("ADD") or paragraph.startswith("DEL"):
-                self._handle_operation(paragraph, paragraphs)
+                yield self._handle_operation(paragraph, paragraphs)
 
         if self.nrtm_source and last_comment_seen.upper().strip() != f"%END {self.source}":
             msg = (
@@ -419,7 +530,7 @@ class NRTMStreamParser(MirrorParser):
 
         return True
 
-    def _handle_operation(self, current_paragraph: str, paragraphs) -> None:
+    def _handle_operation(self, current_paragraph: str, paragraphs) -> NRTMOperation:
         """Handle a single ADD/DEL operation."""
         if not self.nrtm_source:
             msg = (
@@ -454,7 +565,7 @@ class NRTMStreamParser(MirrorParser):
 
         operation = DatabaseOperation(operation_str)
         object_text = next(paragraphs)
-        nrtm_operation = NRTMOperation(
+        return NRTMOperation(
             self.source,
             operation,
             self._current_op_serial,
@@ -463,4 +574,57 @@ class NRTMStreamParser(MirrorParser):
             self.rpki_aware,
             self.object_class_filter,
         )
-        self.operations.append(nrtm_operation)
+
+
+class NRTM4DeltaParser(MirrorParser):
+    """
+    The NRTMv4 delta parser applies the records of an NRTMv4 delta file,
+    after the header, to the database. Objects of add_modify records are
+    processed like NRTM ADD operations, delete records refer to the object
+    class and primary key of the deleted object.
+    All changes are recorded with the delta version as serial.
+
+    Raises an NRTM4Exception for invalid records.
+    """
+
+    def __init__(self, source: str, version: int, database_handler: DatabaseHandler) -> None:
+        self.source = source
+        self.version = version
+        self.database_handler = database_handler
+        self.rpki_aware = bool(get_setting("rpki.roa_source"))
+        super().__init__()
+
+    def run_import(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Apply the records, and return the number of records applied.
+        """
+        record_count = 0
+        for record in records:
+            action = record.get("action")
+            if action == "add_modify" and isinstance(record.get("object"), str):
+                operation = NRTMOperation(
+                    self.source,
+                    DatabaseOperation.add_or_update,
+                    self.version,
+                    record["object"],
+                    self.strict_validation_key_cert,
+                    self.rpki_aware,
+                    self.object_class_filter,
+                )
+                if not operation.save(self.database_handler):
+                    continue
+            elif action == "delete" and record.get("object_class") and record.get("primary_key"):
+                object_class = str(record["object_class"]).lower()
+                if self.object_class_filter and object_class not in self.object_class_filter:
+                    continue
+                self.database_handler.delete_rpsl_object(
+                    origin=JournalEntryOrigin.mirror,
+                    source=self.source,
+                    rpsl_pk=str(record["primary_key"]),
+                    object_class=object_class,
+                    source_serial=self.version,
+                )
+            else:
+                raise NRTM4Exception(f"Invalid record in NRTMv4 delta version {self.version}: {record}")
+            record_count += 1
+        return record_count
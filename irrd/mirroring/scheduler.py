@@ -9,7 +9,11 @@ from typing import Dict
 from setproctitle import setproctitle
 
 from irrd.conf import RPKI_IRR_PSEUDO_SOURCE, get_setting
-from irrd.conf.defaults import DEFAULT_SOURCE_EXPORT_TIMER, DEFAULT_SOURCE_IMPORT_TIMER
+from irrd.conf.defaults import (
+    DEFAULT_SOURCE_EXPORT_TIMER,
+    DEFAULT_SOURCE_IMPORT_TIMER,
+    DEFAULT_SOURCE_NRTM4_SERVER_TIMER,
+)
 
 from .mirror_runners_export import SourceExportRunner
 from .mirror_runners_import import (
@@ -18,6 +22,7 @@ from .mirror_runners_import import (
     RPSLMirrorImportUpdateRunner,
     ScopeFilterUpdateRunner,
 )
+from .nrtm4_server import NRTM4ServerRunner
 
 logger = logging.getLogger(__name__)
 
@@ -101,9 +106,12 @@ class MirrorScheduler:
                 break
             started_import = False
             started_export = False
+            started_nrtm4_server = False
 
-            is_mirror = get_setting(f"sources.{source}.import_source") or get_setting(
-                f"sources.{source}.nrtm_host"
+            is_mirror = (
+                get_setting(f"sources.{source}.import_source")
+                or get_setting(f"sources.{source}.nrtm_host")
+                or get_setting(f"sources.{source}.nrtm4_client_notification_file_url")
             )
             import_timer = int(get_setting(f"sources.{source}.import_timer", DEFAULT_SOURCE_IMPORT_TIMER))
 
@@ -118,7 +126,13 @@ class MirrorScheduler:
             if runs_export:
                 started_export = self.run_if_relevant(source, SourceExportRunner, export_timer)
 
-            if started_import or started_export:
+            if get_setting(f"sources.{source}.nrtm4_server_local_path"):
+                nrtm4_server_timer = int(
+                    get_setting(f"sources.{source}.nrtm4_server_timer", DEFAULT_SOURCE_NRTM4_SERVER_TIMER)
+                )
+                started_nrtm4_server = self.run_if_relevant(source, NRTM4ServerRunner, nrtm4_server_timer)
+
+            if started_import or started_export or started_nrtm4_server:
                 sources_started += 1
 
     def _check_scopefilter_change(self) -> bool:
@@ -42,7 +42,7 @@ class TestSourceExportRunner:
                 ],
             ]
         )
-        mock_dh.execute_query = lambda q: next(responses)
+        mock_dh.execute_query = lambda q, **kwargs: next(responses)
 
         runner = SourceExportRunner("TEST")
         runner.run()
@@ -111,7 +111,7 @@ class TestSourceExportRunner:
                 ],
             ]
         )
-        mock_dh.execute_query = lambda q: next(responses)
+        mock_dh.execute_query = lambda q, **kwargs: next(responses)
 
         runner = SourceExportRunner("TEST")
         runner.run()
@@ -178,7 +178,7 @@ class TestSourceExportRunner:
                 ],
             ]
         )
-        mock_dh.execute_query = lambda q: next(responses)
+        mock_dh.execute_query = lambda q, **kwargs: next(responses)
 
         runner = SourceExportRunner("TEST")
         runner.run()
@@ -1,19 +1,27 @@
+import bz2
+import gzip
+import hashlib
 from base64 import b64decode
+from datetime import datetime, timedelta, timezone
 from io import BytesIO
-from typing import List
-from unittest.mock import Mock
+from typing import List, Optional
+from unittest.mock import ANY, Mock
 from urllib.error import URLError
 
 import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 
 from irrd.routepref.routepref import update_route_preference_status
 from irrd.rpki.importer import ROAParserException
 from irrd.rpki.validators import BulkRouteROAValidator
 from irrd.scopefilter.validators import ScopeFilterValidator
 from irrd.storage.database_handler import DatabaseHandler
+from irrd.storage.models import JournalEntryOrigin
 from irrd.utils.test_utils import flatten_mock_calls
 
 from ..mirror_runners_import import (
+    NRTM4ClientRunner,
     NRTMImportUpdateStreamRunner,
     ROAImportRunner,
     RoutePreferenceUpdateRunner,
@@ -21,6 +29,7 @@ from ..mirror_runners_import import (
     RPSLMirrorImportUpdateRunner,
     ScopeFilterUpdateRunner,
 )
+from ..nrtm4 import TIMESTAMP_FORMAT, NRTM4Exception, json_seq_record, jws_serialize
 
 
 class TestRPSLMirrorImportUpdateRunner:
@@ -67,7 +76,16 @@ class TestRPSLMirrorImportUpdateRunner:
             lambda source: mock_full_import_runner,
         )
 
-        mock_dh.execute_query = lambda q: iter([{"serial_newest_mirror": 424242, "force_reload": True}])
+        mock_dh.execute_query = lambda q: iter(
+            [
+                {
+                    "serial_newest_mirror": 424242,
+                    "force_reload": True,
+                    "import_source_state": None,
+                    "nrtm4_client_state": None,
+                }
+            ]
+        )
         runner = RPSLMirrorImportUpdateRunner(source="TEST")
         runner.run()
 
@@ -98,7 +116,16 @@ class TestRPSLMirrorImportUpdateRunner:
             lambda source: mock_stream_runner,
         )
 
-        mock_dh.execute_query = lambda q: iter([{"serial_newest_mirror": 424242, "force_reload": False}])
+        mock_dh.execute_query = lambda q: iter(
+            [
+                {
+                    "serial_newest_mirror": 424242,
+                    "force_reload": False,
+                    "import_source_state": None,
+                    "nrtm4_client_state": None,
+                }
+            ]
+        )
         runner = RPSLMirrorImportUpdateRunner(source="TEST")
         runner.run()
 
@@ -109,6 +136,61 @@ class TestRPSLMirrorImportUpdateRunner:
         assert mock_stream_runner.mock_calls[0][0] == "run"
         assert mock_stream_runner.mock_calls[0][1] == (424242,)
 
+    def test_nrtm4_client_call(self, monkeypatch, config_override):
+        config_override(
+            {
+                "sources": {
+                    "TEST": {
+                        "nrtm4_client_notification_file_url": "https://example.com/notification.jose",
+                        "nrtm4_server_local_path": "/tmp",
+                    }
+                }
+            }
+        )
+        mock_dh = Mock()
+        mock_dq = Mock()
+        mock_nrtm4_client_runner = Mock()
+        mock_nrtm4_client_runner.run = Mock(return_value=True)
+        mock_event_stream_publisher = Mock()
+
+        monkeypatch.setattr("irrd.mirroring.mirror_runners_import.DatabaseHandler", lambda: mock_dh)
+        monkeypatch.setattr("irrd.mirroring.mirror_runners_import.DatabaseStatusQuery", lambda: mock_dq)
+        monkeypatch.setattr(
+            "irrd.mirroring.mirror_runners_import.NRTM4ClientRunner",
+            lambda source: mock_nrtm4_client_runner,
+        )
+        monkeypatch.setattr(
+            "irrd.mirroring.mirror_runners_import.EventStreamPublisher", lambda: mock_event_stream_publisher
+        )
+
+        nrtm4_client_state = {"session_id": "session", "version": 2}
+        mock_dh.execute_query = lambda q: iter(
+            [
+                {
+                    "serial_newest_mirror": 2,
+                    "force_reload": False,
+                    "import_source_state": None,
+                    "nrtm4_client_state": nrtm4_client_state,
+                }
+            ]
+        )
+        runner = RPSLMirrorImportUpdateRunner(source="TEST")
+        runner.run()
+
+        mock_nrtm4_client_runner.run.assert_called_once_with(
+            database_handler=mock_dh, nrtm4_client_state=nrtm4_client_state, force_reload=False
+        )
+        # The snapshot replaced all data, so the NRTMv4 server state is reset
+        assert flatten_mock_calls(mock_dh) == [
+            ["record_nrtm4_server_state", ("TEST", {}), {}],
+            ["commit", (), {}],
+            ["close", (), {}],
+        ]
+        assert flatten_mock_calls(mock_event_stream_publisher) == [
+            ["publish_rpsl_full_reload", ("TEST",), {}],
+            ["close", (), {}],
+        ]
+
     def test_io_exception_handling(self, monkeypatch, caplog):
         mock_dh = Mock()
         mock_dq = Mock()
@@ -122,7 +204,16 @@ class TestRPSLMirrorImportUpdateRunner:
         )
         mock_full_import_runner.run = Mock(side_effect=ConnectionResetError("test-error"))
 
-        mock_dh.execute_query = lambda q: iter([{"serial_newest_mirror": 424242, "force_reload": False}])
+        mock_dh.execute_query = lambda q: iter(
+            [
+                {
+                    "serial_newest_mirror": 424242,
+                    "force_reload": False,
+                    "import_source_state": None,
+                    "nrtm4_client_state": None,
+                }
+            ]
+        )
         runner = RPSLMirrorImportUpdateRunner(source="TEST")
         runner.run()
 
@@ -144,7 +235,16 @@ class TestRPSLMirrorImportUpdateRunner:
         )
         mock_full_import_runner.run = Mock(side_effect=Exception("test-error"))
 
-        mock_dh.execute_query = lambda q: iter([{"serial_newest_mirror": 424242, "force_reload": False}])
+        mock_dh.execute_query = lambda q: iter(
+            [
+                {
+                    "serial_newest_mirror": 424242,
+                    "force_reload": False,
+                    "import_source_state": None,
+                    "nrtm4_client_state": None,
+                }
+            ]
+        )
         runner = RPSLMirrorImportUpdateRunner(source="TEST")
         runner.run()
 
@@ -156,6 +256,45 @@ class TestRPSLMirrorImportUpdateRunner:
         assert "Traceback" in caplog.text
 
 
+class MockFTP:
+    def __init__(self, timeout):
+        assert timeout
+
+    def connect(self, host, port):
+        assert host == "host"
+        assert port == 21
+
+    def login(self, user, passwd):
+        assert user == "anonymous"
+
+    def voidcmd(self, cmd):
+        assert cmd == "TYPE I"
+
+    def size(self, path):
+        return len(path)
+
+    def sendcmd(self, cmd):
+        return "213 20230703142108"
+
+    def close(self):
+        pass
+
+
+@pytest.fixture()
+def mock_ftp(monkeypatch):
+    monkeypatch.setattr("irrd.mirroring.mirror_runners_import.ftplib.FTP", MockFTP)
+
+
+FTP_IMPORT_SOURCE_STATE = {
+    "serial": 424242,
+    "files": {
+        "ftp://host/source1.gz": {"modified": "20230703142108", "size": 10},
+        "ftp://host/source2": {"modified": "20230703142108", "size": 7},
+    },
+}
+
+
+@pytest.mark.usefixtures("mock_ftp")
 class TestRPSLMirrorFullImportRunner:
     def test_run_import_ftp(self, monkeypatch, config_override):
         config_override(
@@ -173,6 +312,7 @@ class TestRPSLMirrorFullImportRunner:
         mock_dh = Mock()
         request = Mock()
         MockMirrorFileImportParser.rpsl_data_calls = []
+        MockMirrorFileImportParser.file_size_calls = []
         monkeypatch.setattr(
             "irrd.mirroring.mirror_runners_import.MirrorFileImportParser", MockMirrorFileImportParser
         )
@@ -193,9 +333,13 @@ class TestRPSLMirrorFullImportRunner:
         RPSLMirrorFullImportRunner("TEST").run(mock_dh, serial_newest_mirror=424241)
 
         assert MockMirrorFileImportParser.rpsl_data_calls == ["source1", "source2"]
+        # The size of compressed files is not the size of their data
+        assert MockMirrorFileImportParser.file_size_calls == [None, 7]
         assert flatten_mock_calls(mock_dh) == [
-            ["delete_all_rpsl_objects_with_journal", ("TEST",), {}],
+            ["start_rpsl_staging_load", ("TEST",), {}],
             ["disable_journaling", (), {}],
+            ["enable_bulk_load", (), {}],
+            ["record_import_source_state", ("TEST", FTP_IMPORT_SOURCE_STATE), {}],
             ["record_serial_newest_mirror", ("TEST", 424242), {}],
         ]
         assert mock_bulk_validator_init.mock_calls[0][1][0] == mock_dh
@@ -234,9 +378,12 @@ class TestRPSLMirrorFullImportRunner:
         with open(tmp_import_source1, "wb") as fh:
             # gzipped data, contains 'source1'
             fh.write(b64decode("H4sIAE4CfFsAAyvOLy1KTjUEAE5Fj0oHAAAA"))
-        tmp_import_source2 = tmpdir + "/source2.rpsl"
-        with open(tmp_import_source2, "w") as fh:
-            fh.write("source2")
+        tmp_import_source2 = tmpdir + "/source2.rpsl.bz2"
+        with open(tmp_import_source2, "wb") as fh:
+            fh.write(bz2.compress(b"source2"))
+        tmp_import_source3 = tmpdir + "/source3.rpsl"
+        with open(tmp_import_source3, "w") as fh:
+            fh.write("source3")
         tmp_import_serial = tmpdir + "/serial"
         with open(tmp_import_serial, "w") as fh:
             fh.write("424242")
@@ -249,6 +396,7 @@ class TestRPSLMirrorFullImportRunner:
                         "import_source": [
                             "file://" + str(tmp_import_source1),
                             "file://" + str(tmp_import_source2),
+                            "file://" + str(tmp_import_source3),
                         ],
                         "import_serial_source": "file://" + str(tmp_import_serial),
                     }
@@ -264,13 +412,46 @@ class TestRPSLMirrorFullImportRunner:
 
         RPSLMirrorFullImportRunner("TEST").run(mock_dh)
 
-        assert MockMirrorFileImportParser.rpsl_data_calls == ["source1", "source2"]
+        assert MockMirrorFileImportParser.rpsl_data_calls == ["source1", "source2", "source3"]
         assert flatten_mock_calls(mock_dh) == [
-            ["delete_all_rpsl_objects_with_journal", ("TEST",), {}],
+            ["start_rpsl_staging_load", ("TEST",), {}],
             ["disable_journaling", (), {}],
+            ["enable_bulk_load", (), {}],
+            ["record_import_source_state", ("TEST", ANY), {}],
             ["record_serial_newest_mirror", ("TEST", 424242), {}],
         ]
 
+    def test_run_import_http(self, monkeypatch, config_override):
+        config_override(
+            {
+                "rpki": {"roa_source": None},
+                "sources": {"TEST": {"import_source": "https://host/source1.gz"}},
+            }
+        )
+
+        # gzipped data, contains 'source1', split over multiple chunks
+        data = b64decode("H4sIAE4CfFsAAyvOLy1KTjUEAE5Fj0oHAAAA")
+
+        class MockRequestsSuccess:
+            status_code = 200
+
+            def __init__(self, url, stream, timeout):
+                assert url == "https://host/source1.gz"
+                assert stream
+
+            def iter_content(self, size):
+                return iter([data[:10], b"", data[10:]])
+
+        mock_dh = Mock()
+        MockMirrorFileImportParser.rpsl_data_calls = []
+        monkeypatch.setattr(
+            "irrd.mirroring.mirror_runners_import.MirrorFileImportParser", MockMirrorFileImportParser
+        )
+        monkeypatch.setattr("irrd.mirroring.mirror_runners_import.requests.get", MockRequestsSuccess)
+
+        RPSLMirrorFullImportRunner("TEST").run(mock_dh)
+        assert MockMirrorFileImportParser.rpsl_data_calls == ["source1"]
+
     def test_no_serial_ftp(self, monkeypatch, config_override):
         config_override(
             {
@@ -301,8 +482,10 @@ class TestRPSLMirrorFullImportRunner:
 
         assert MockMirrorFileImportParser.rpsl_data_calls == ["source1", "source2"]
         assert flatten_mock_calls(mock_dh) == [
-            ["delete_all_rpsl_objects_with_journal", ("TEST",), {}],
+            ["start_rpsl_staging_load", ("TEST",), {}],
             ["disable_journaling", (), {}],
+            ["enable_bulk_load", (), {}],
+            ["record_import_source_state", ("TEST", dict(FTP_IMPORT_SOURCE_STATE, serial=None)), {}],
         ]
 
     def test_import_cancelled_serial_too_old(self, monkeypatch, config_override, caplog):
@@ -370,11 +553,110 @@ class TestRPSLMirrorFullImportRunner:
 
         assert MockMirrorFileImportParser.rpsl_data_calls == ["source1", "source2"]
         assert flatten_mock_calls(mock_dh) == [
-            ["delete_all_rpsl_objects_with_journal", ("TEST",), {}],
+            ["start_rpsl_staging_load", ("TEST",), {}],
             ["disable_journaling", (), {}],
+            ["enable_bulk_load", (), {}],
+            ["record_import_source_state", ("TEST", FTP_IMPORT_SOURCE_STATE), {}],
             ["record_serial_newest_mirror", ("TEST", 424242), {}],
         ]
 
+    def test_import_unchanged(self, monkeypatch, config_override, tmpdir, caplog):
+        tmp_import_source = str(tmpdir + "/source1.rpsl")
+        with open(tmp_import_source, "w") as fh:
+            fh.write("source1")
+        config_override(
+            {
+                "rpki": {"roa_source": None},
+                "sources": {"TEST": {"import_source": "file://" + tmp_import_source}},
+            }
+        )
+
+        mock_dh = Mock()
+        MockMirrorFileImportParser.rpsl_data_calls = []
+        MockMirrorFileImportParser.file_size_calls = []
+        monkeypatch.setattr(
+            "irrd.mirroring.mirror_runners_import.MirrorFileImportParser", MockMirrorFileImportParser
+        )
+
+        runner = RPSLMirrorFullImportRunner("TEST")
+        assert runner.run(mock_dh)
+        assert MockMirrorFileImportParser.file_size_calls == [7]
+        import_source_state = mock_dh.record_import_source_state.mock_calls[0][1][1]
+        assert list(import_source_state["files"]["file://" + tmp_import_source].keys()) == ["sha256"]
+
+        mock_dh.reset_mock()
+        MockMirrorFileImportParser.rpsl_data_calls = []
+        assert not runner.run(mock_dh, import_source_state=import_source_state)
+        assert not MockMirrorFileImportParser.rpsl_data_calls
+        assert not mock_dh.mock_calls
+        assert "Files for TEST are unchanged since the last import, cancelling import" in caplog.text
+
+        # If the state is unchanged, but a force reload was requested, the data is replaced
+        assert runner.run(mock_dh, force_reload=True, import_source_state=import_source_state)
+        assert MockMirrorFileImportParser.rpsl_data_calls == ["source1"]
+
+    def test_import_changed_update(self, monkeypatch, config_override, mock_ftp):
+        config_override(
+            {
+                "rpki": {"roa_source": None},
+                "sources": {
+                    "TEST": {
+                        "import_source": ["ftp://host/source1.gz", "ftp://host/source2"],
+                        "import_serial_source": "ftp://host/serial",
+                    }
+                },
+            }
+        )
+
+        mock_dh = Mock()
+        request = Mock()
+        MockMirrorUpdateFileImportParser.rpsl_data_calls = []
+        monkeypatch.setattr(
+            "irrd.mirroring.mirror_runners_import.MirrorUpdateFileImportParser",
+            MockMirrorUpdateFileImportParser,
+        )
+        monkeypatch.setattr("irrd.mirroring.mirror_runners_import.request", request)
+
+        responses = {
+            # gzipped data, contains 'source1'
+            "ftp://host/source1.gz": b64decode("H4sIAE4CfFsAAyvOLy1KTjUEAE5Fj0oHAAAA"),
+            "ftp://host/source2": b"source2",
+            "ftp://host/serial": b"424243",
+        }
+        request.urlopen = lambda url, timeout: MockUrlopenResponse(responses[url])
+        result = RPSLMirrorFullImportRunner("TEST").run(
+            mock_dh, serial_newest_mirror=424242, import_source_state=FTP_IMPORT_SOURCE_STATE
+        )
+
+        # Split files are processed as one file, with only the changed objects updated
+        assert not result
+        assert MockMirrorUpdateFileImportParser.rpsl_data_calls == ["source1\nsource2\n"]
+        assert flatten_mock_calls(mock_dh) == [
+            ["record_import_source_state", ("TEST", dict(FTP_IMPORT_SOURCE_STATE, serial=424243)), {}],
+            ["record_serial_newest_mirror", ("TEST", 424243), {}],
+        ]
+
+    def test_file_fingerprint_http(self, monkeypatch):
+        class MockRequestsHead:
+            status_code = 200
+
+            def __init__(self, url, timeout, allow_redirects):
+                assert url == "https://host/source1.gz"
+                self.headers = headers
+
+        monkeypatch.setattr("irrd.mirroring.mirror_runners_import.requests.head", MockRequestsHead)
+        runner = RPSLMirrorFullImportRunner("TEST")
+
+        headers = {"ETag": '"abc"', "Content-Length": "10"}
+        assert runner._file_fingerprint("https://host/source1.gz") == {
+            "etag": '"abc"',
+            "last_modified": None,
+            "size": "10",
+        }
+        # Without ETag or Last-Modified, changes can not be detected reliably
+        headers = {"Content-Length": "10"}
+        assert runner._file_fingerprint("https://host/source1.gz") is None
+
     def test_missing_source_settings_ftp(self, config_override):
         config_override(
             {
@@ -417,17 +699,292 @@ class MockUrlopenResponse(BytesIO):
 
 class MockMirrorFileImportParser:
     rpsl_data_calls: List[str] = []
+    file_size_calls: List[Optional[int]] = []
 
     def __init__(
-        self, source, filename, serial, database_handler, direct_error_return=False, roa_validator=None
+        self,
+        source,
+        filename,
+        serial,
+        database_handler,
+        direct_error_return=False,
+        roa_validator=None,
+        file=None,
+        file_size=None,
     ):
-        self.filename = filename
+        self.file = file
+        self.file_size_calls.append(file_size)
         assert source == "TEST"
         assert serial is None
 
     def run_import(self):
-        with open(self.filename) as f:
-            self.rpsl_data_calls.append(f.read())
+        self.rpsl_data_calls.append("".join(self.file))
+
+
+class MockMirrorUpdateFileImportParser:
+    rpsl_data_calls: List[str] = []
+
+    def __init__(self, source, filename, database_handler, roa_validator, file, file_size, origin):
+        self.file = file
+        assert source == "TEST"
+        assert filename == "ftp://host/source1.gz, ftp://host/source2"
+        # The size of the data in source1.gz is unknown
+        assert file_size is None
+        assert origin == JournalEntryOrigin.mirror
+
+    def run_import(self):
+        self.rpsl_data_calls.append("".join(self.file))
+
+
+NRTM4_SESSION_ID = "ca128382-78d9-41d1-8927-1ecef15275be"
+
+
+class NRTM4Files:
+    """
+    Writes NRTMv4 notification, snapshot and delta files to a directory,
+    and configures the source to mirror them.
+    """
+
+    def __init__(self, tmpdir, config_override):
+        self.path = str(tmpdir)
+        self.private_key = Ed25519PrivateKey.generate()
+        self.public_pem = (
+            self.private_key.public_key()
+            .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+            .decode("ascii")
+        )
+        self.notification_url = f"file://{self.path}/update-notification-file.jose"
+        config_override(
+            {
+                "rpki": {"roa_source": None},
+                "sources": {
+                    "TEST": {
+                        "nrtm4_client_notification_file_url": self.notification_url,
+                        "nrtm4_client_public_key": self.public_pem,
+                    }
+                },
+            }
+        )
+
+    def write(
+        self,
+        version,
+        snapshot_version,
+        delta_versions,
+        session_id=NRTM4_SESSION_ID,
+        private_key=None,
+        timestamp=None,
+    ):
+        snapshot = self.write_file(
+            f"snapshot.{snapshot_version}.json.gz",
+            "snapshot",
+            session_id,
+            snapshot_version,
+            [{"object": "route: 192.0.2.0/24\norigin: AS65537\nsource: TEST\n"}, {"object": "🦄"}],
+        )
+        deltas = [
+            self.write_file(
+                f"delta.{delta_version}.json",
+                "delta",
+                session_id,
+                delta_version,
+                [{"action": "delete", "object_class": "route", "primary_key": f"{delta_version}"}],
+            )
+            for delta_version in delta_versions
+        ]
+        self.write_notification(version, snapshot, deltas, session_id, private_key, timestamp)
+
+    def write_notification(
+        self, version, snapshot, deltas, session_id=NRTM4_SESSION_ID, private_key=None, timestamp=None
+    ):
+        notification = {
+            "nrtm_version": 4,
+            "timestamp": (timestamp or datetime.now(timezone.utc)).strftime(TIMESTAMP_FORMAT),
+            "type": "notification",
+            "source": "TEST",
+            "session_id": session_id,
+            "version": version,
+            "snapshot": snapshot,
+            "deltas": deltas,
+        }
+        with open(f"{self.path}/update-notification-file.jose", "w") as fh:
+            fh.write(jws_serialize(notification, private_key or self.private_key))
+
+    def write_file(self, filename, file_type, session_id, version, records):
+        header = {
+            "nrtm_version": 4,
+            "type": file_type,
+            "source": "TEST",
+            "session_id": session_id,
+            "version": version,
+        }
+        contents = b"".join(json_seq_record(record) for record in [header] + records)
+        if filename.endswith(".gz"):
+            contents = gzip.compress(contents)
+        with open(f"{self.path}/{filename}", "wb") as fh:
+            fh.write(contents)
+        return {"version": version, "url": filename, "hash": hashlib.sha256(contents).hexdigest()}
+
+
+class TestNRTM4ClientRunner:
+    @pytest.fixture(autouse=True)
+    def mock_parsers(self, monkeypatch):
+        MockMirrorFileImportParser.rpsl_data_calls = []
+        MockNRTM4DeltaParser.calls = []
+        monkeypatch.setattr(
+            "irrd.mirroring.mirror_runners_import.MirrorFileImportParser", MockMirrorFileImportParser
+        )
+        monkeypatch.setattr("irrd.mirroring.mirror_runners_import.NRTM4DeltaParser", MockNRTM4DeltaParser)
+
+    def test_load_snapshot(self, tmpdir, config_override):
+        files = NRTM4Files(tmpdir, config_override)
+        files.write(version=3, snapshot_version=2, delta_versions=[2, 3])
+        mock_dh = Mock()
+
+        # The session is unknown, so the snapshot is loaded
+        assert NRTM4ClientRunner("TEST").run(mock_dh, {"session_id": "other", "version": 3})
+        assert MockMirrorFileImportParser.rpsl_data_calls == [
+            "route: 192.0.2.0/24\norigin: AS65537\nsource: TEST\n\n\n🦄\n\n"
+        ]
+        assert not MockNRTM4DeltaParser.calls
+        assert flatten_mock_calls(mock_dh) == [
+            ["start_rpsl_staging_load", ("TEST",), {}],
+            ["disable_journaling", (), {}],
+            ["enable_bulk_load", (), {}],
+            ["record_nrtm4_client_state", ("TEST", {"session_id": NRTM4_SESSION_ID, "version": 2}), {}],
+            ["record_serial_newest_mirror", ("TEST", 2), {}],
+        ]
+
+        # Delta 2 is no longer available
+        files.write(version=4, snapshot_version=3, delta_versions=[3, 4])
+        mock_dh.reset_mock()
+        state = {"session_id": NRTM4_SESSION_ID, "version": 1}
+        assert NRTM4ClientRunner("TEST").run(mock_dh, state)
+        assert flatten_mock_calls(mock_dh)[-2][1] == ("TEST", {"session_id": NRTM4_SESSION_ID, "version": 3})
+
+        # Reload is forced
+        mock_dh.reset_mock()
+        state = {"session_id": NRTM4_SESSION_ID, "version": 4}
+        assert NRTM4ClientRunner("TEST").run(mock_dh, state, force_reload=True)
+
+    def test_apply_deltas(self, tmpdir, config_override):
+        files = NRTM4Files(tmpdir, config_override)
+        files.write(version=4, snapshot_version=3, delta_versions=[2, 3, 4])
+        mock_dh = Mock()
+
+        state = {"session_id": NRTM4_SESSION_ID, "version": 2}
+        assert not NRTM4ClientRunner("TEST").run(mock_dh, state)
+        assert not MockMirrorFileImportParser.rpsl_data_calls
+        assert MockNRTM4DeltaParser.calls == [
+            (3, [{"action": "delete", "object_class": "route", "primary_key": "3"}]),
+            (4, [{"action": "delete", "object_class": "route", "primary_key": "4"}]),
+        ]
+        assert flatten_mock_calls(mock_dh) == [
+            ["record_nrtm4_client_state", ("TEST", {"session_id": NRTM4_SESSION_ID, "version": 4}), {}],
+            ["record_serial_newest_mirror", ("TEST", 4), {}],
+        ]
+
+        # Already up to date
+        MockNRTM4DeltaParser.calls = []
+        mock_dh.reset_mock()
+        state = {"session_id": NRTM4_SESSION_ID, "version": 4}
+        assert not NRTM4ClientRunner("TEST").run(mock_dh, state)
+        assert not MockNRTM4DeltaParser.calls
+        assert not flatten_mock_calls(mock_dh)
+
+    def test_older_version(self, tmpdir, config_override, caplog):
+        files = NRTM4Files(tmpdir, config_override)
+        files.write(version=4, snapshot_version=3, delta_versions=[3, 4])
+        mock_dh = Mock()
+
+        # A stale or replayed notification file must not reload an older snapshot
+        state = {"session_id": NRTM4_SESSION_ID, "version": 5}
+        assert not NRTM4ClientRunner("TEST").run(mock_dh, state)
+        assert not MockMirrorFileImportParser.rpsl_data_calls
+        assert not MockNRTM4DeltaParser.calls
+        msg = (
+            "NRTMv4 notification file for TEST has version 4, which is older than the current version 5, "
+            "ignoring notification file"
+        )
+        assert flatten_mock_calls(mock_dh) == [["record_mirror_error", ("TEST", msg), {}]]
+        assert msg in caplog.text
+
+    def test_notification_too_old(self, tmpdir, config_override, caplog):
+        files = NRTM4Files(tmpdir, config_override)
+        timestamp = datetime.now(timezone.utc) - timedelta(days=2)
+        files.write(version=4, snapshot_version=3, delta_versions=[3, 4], timestamp=timestamp)
+        mock_dh = Mock()
+
+        state = {"session_id": NRTM4_SESSION_ID, "version": 2}
+        assert not NRTM4ClientRunner("TEST").run(mock_dh, state)
+        assert not MockMirrorFileImportParser.rpsl_data_calls
+        assert not MockNRTM4DeltaParser.calls
+        assert flatten_mock_calls(mock_dh)[0][0] == "record_mirror_error"
+        assert "which is older than the maximum age of 86400 seconds" in caplog.text
+
+        # The maximum age is configurable
+        config_override(
+            {
+                "rpki": {"roa_source": None},
+                "sources": {
+                    "TEST": {
+                        "nrtm4_client_notification_file_url": files.notification_url,
+                        "nrtm4_client_public_key": files.public_pem,
+                        "nrtm4_client_max_notification_age": 3 * 86400,
+                    }
+                },
+            }
+        )
+        mock_dh.reset_mock()
+        assert not NRTM4ClientRunner("TEST").run(mock_dh, state)
+        assert len(MockNRTM4DeltaParser.calls) == 2
+
+    def test_invalid_signature(self, tmpdir, config_override):
+        files = NRTM4Files(tmpdir, config_override)
+        files.write(
+            version=1, snapshot_version=1, delta_versions=[], private_key=Ed25519PrivateKey.generate()
+        )
+        mock_dh = Mock()
+
+        with pytest.raises(NRTM4Exception) as exc:
+            NRTM4ClientRunner("TEST").run(mock_dh, None)
+        assert "Invalid signature on JWS" in str(exc.value)
+        assert not flatten_mock_calls(mock_dh)
+
+    def test_invalid_hash(self, tmpdir, config_override):
+        files = NRTM4Files(tmpdir, config_override)
+        files.write(version=3, snapshot_version=2, delta_versions=[3])
+        with open(f"{tmpdir}/delta.3.json", "ab") as fh:
+            fh.write(json_seq_record({"action": "delete", "object_class": "route", "primary_key": "other"}))
+        mock_dh = Mock()
+
+        with pytest.raises(ValueError) as exc:
+            NRTM4ClientRunner("TEST").run(mock_dh, {"session_id": NRTM4_SESSION_ID, "version": 2})
+        assert f"Hash of file://{tmpdir}/delta.3.json is" in str(exc.value)
+        assert not flatten_mock_calls(mock_dh)
+
+    def test_invalid_header(self, tmpdir, config_override):
+        files = NRTM4Files(tmpdir, config_override)
+        snapshot = files.write_file("snapshot.2.json.gz", "snapshot", NRTM4_SESSION_ID, 2, [])
+        delta = files.write_file("delta.3.json", "delta", "other", 3, [])
+        files.write_notification(3, snapshot, [delta])
+
+        with pytest.raises(NRTM4Exception) as exc:
+            NRTM4ClientRunner("TEST").run(Mock(), {"session_id": NRTM4_SESSION_ID, "version": 2})
+        assert f"expected session_id {NRTM4_SESSION_ID}, found other" in str(exc.value)
+
+
+class MockNRTM4DeltaParser:
+    calls: List = []
+
+    def __init__(self, source, version, database_handler):
+        assert source == "TEST"
+        self.version = version
+
+    def run_import(self, records):
+        records = list(records)
+        self.calls.append((self.version, records))
+        return len(records)
 
 
 class TestROAImportRunner:
@@ -681,18 +1238,28 @@ class TestNRTMImportUpdateStreamRunner:
             }
         )
 
-        def mock_whois_query(host, port, query, end_markings) -> str:
+        def mock_whois_query_stream(host, port, query, end_markings):
             assert host == "192.0.2.1"
             assert port == 43
             assert query == "-g TEST:3:424243-LAST"
             assert "TEST" in end_markings[0]
-            return "response"
+            return iter(["response"])
 
         mock_dh = Mock()
         monkeypatch.setattr("irrd.mirroring.mirror_runners_import.NRTMStreamParser", MockNRTMStreamParser)
-        monkeypatch.setattr("irrd.mirroring.mirror_runners_import.whois_query", mock_whois_query)
+        monkeypatch.setattr(
+            "irrd.mirroring.mirror_runners_import.whois_query_stream", mock_whois_query_stream
+        )
+        monkeypatch.setattr("irrd.mirroring.mirror_runners_import.NRTM_COMMIT_BATCH_SIZE", 2)
 
         NRTMImportUpdateStreamRunner("TEST").run(424242, mock_dh)
+        for operation in MockNRTMStreamParser.operations:
+            operation.save.assert_called_once_with(mock_dh)
+        # Operations are committed in batches, the last batch is committed by the caller
+        assert flatten_mock_calls(mock_dh) == [
+            ["record_serial_newest_mirror", ("TEST", 424244), {}],
+            ["commit", (), {}],
+        ]
 
     def test_missing_source_settings(self, monkeypatch, config_override):
         config_override(
@@ -710,7 +1277,13 @@ class TestNRTMImportUpdateStreamRunner:
 
 
 class MockNRTMStreamParser:
+    operations: List[Mock] = []
+
     def __init__(self, source, response, database_handler):
         assert source == "TEST"
-        assert response == "response"
-        self.operations = [Mock()]
+        assert response is None
+
+    def parse_stream(self, data):
+        assert list(data) == ["response"]
+        MockNRTMStreamParser.operations = [Mock(serial=serial) for serial in range(424243, 424246)]
+        yield from self.operations
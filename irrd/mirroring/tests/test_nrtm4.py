@@ -0,0 +1,150 @@
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+from ..nrtm4 import (
+    NRTM4Exception,
+    json_seq_record,
+    json_seq_records,
+    jws_deserialize_verify,
+    jws_serialize,
+    load_private_key,
+    load_public_key,
+    validate_file_header,
+    validate_notification,
+)
+
+NOTIFICATION = {
+    "nrtm_version": 4,
+    "timestamp": "2023-07-10T09:00:00Z",
+    "type": "notification",
+    "source": "TEST",
+    "session_id": "ca128382-78d9-41d1-8927-1ecef15275be",
+    "version": 2,
+    "snapshot": {"version": 1, "url": "nrtm-snapshot.1.json.gz", "hash": "abc"},
+    "deltas": [{"version": 2, "url": "nrtm-delta.2.json", "hash": "def"}],
+}
+
+
+class TestKeys:
+    def test_load_keys(self):
+        private_key = Ed25519PrivateKey.generate()
+        private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode("ascii")
+        public_pem = (
+            private_key.public_key()
+            .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+            .decode("ascii")
+        )
+
+        loaded_private_key = load_private_key(private_pem)
+        loaded_public_key = load_public_key(public_pem)
+        assert loaded_public_key == private_key.public_key()
+        assert loaded_private_key.public_key() == loaded_public_key
+
+        with pytest.raises(ValueError):
+            load_private_key(public_pem)
+        with pytest.raises(ValueError):
+            load_public_key(private_pem)
+        with pytest.raises(ValueError):
+            load_public_key("invalid")
+
+
+class TestJWS:
+    def test_serialize_verify(self):
+        private_key = Ed25519PrivateKey.generate()
+        serialized = jws_serialize(NOTIFICATION, private_key)
+        assert serialized.count(".") == 2
+        assert jws_deserialize_verify(serialized + "\n", private_key.public_key()) == NOTIFICATION
+
+    def test_invalid_signature(self):
+        private_key = Ed25519PrivateKey.generate()
+        serialized = jws_serialize(NOTIFICATION, private_key)
+
+        with pytest.raises(NRTM4Exception) as exc:
+            jws_deserialize_verify(serialized, Ed25519PrivateKey.generate().public_key())
+        assert "Invalid signature" in str(exc.value)
+
+        header, payload, signature = serialized.split(".")
+        other_payload = jws_serialize(dict(NOTIFICATION, version=3), private_key).split(".")[1]
+        with pytest.raises(NRTM4Exception) as exc:
+            jws_deserialize_verify(f"{header}.{other_payload}.{signature}", private_key.public_key())
+        assert "Invalid signature" in str(exc.value)
+
+    def test_invalid_jws(self):
+        public_key = Ed25519PrivateKey.generate().public_key()
+        with pytest.raises(NRTM4Exception) as exc:
+            jws_deserialize_verify("invalid", public_key)
+        assert "Invalid JWS" in str(exc.value)
+
+        # {"alg":"none"}
+        with pytest.raises(NRTM4Exception) as exc:
+            jws_deserialize_verify("eyJhbGciOiJub25lIn0.e30.", public_key)
+        assert "Unsupported JWS algorithm: none" in str(exc.value)
+
+
+class TestJSONSeq:
+    def test_records(self):
+        records = [{"object": "route: 192.0.2.0/24\n"}, {"object": "  🦄"}]
+        serialized = b"".join(json_seq_record(record) for record in records)
+        assert serialized.startswith(b"\x1e{")
+        lines = serialized.decode("utf-8").split("\n")
+        assert len(lines) == 3
+        assert list(json_seq_records(line + "\n" for line in lines)) == records
+
+    def test_invalid_records(self):
+        with pytest.raises(NRTM4Exception) as exc:
+            list(json_seq_records(['{"object": "text"}\n']))
+        assert "missing record separator" in str(exc.value)
+
+        with pytest.raises(NRTM4Exception) as exc:
+            list(json_seq_records(["\x1e{invalid\n"]))
+        assert "Invalid record in JSON text sequence" in str(exc.value)
+
+        with pytest.raises(NRTM4Exception) as exc:
+            list(json_seq_records(["\x1e[]\n"]))
+        assert "not an object" in str(exc.value)
+
+
+class TestValidation:
+    def test_validate_notification(self):
+        validate_notification(NOTIFICATION, "TEST")
+
+        with pytest.raises(NRTM4Exception) as exc:
+            validate_notification(NOTIFICATION, "OTHER")
+        assert "expected source OTHER, found TEST" in str(exc.value)
+
+        with pytest.raises(NRTM4Exception) as exc:
+            validate_notification(dict(NOTIFICATION, nrtm_version=3), "TEST")
+        assert "unknown NRTM version or type" in str(exc.value)
+
+        with pytest.raises(NRTM4Exception) as exc:
+            validate_notification(dict(NOTIFICATION, version="2"), "TEST")
+        assert "invalid session_id or version" in str(exc.value)
+
+        with pytest.raises(NRTM4Exception) as exc:
+            validate_notification(dict(NOTIFICATION, timestamp="yesterday"), "TEST")
+        assert "invalid timestamp" in str(exc.value)
+
+        with pytest.raises(NRTM4Exception) as exc:
+            validate_notification(dict(NOTIFICATION, deltas=[{"version": 2}]), "TEST")
+        assert "Invalid file reference" in str(exc.value)
+
+    def test_validate_file_header(self):
+        header = {
+            "nrtm_version": 4,
+            "type": "delta",
+            "source": "TEST",
+            "session_id": "session",
+            "version": 2,
+        }
+        validate_file_header(header, "delta", "TEST", "session", 2)
+
+        with pytest.raises(NRTM4Exception) as exc:
+            validate_file_header(header, "snapshot", "TEST", "session", 2)
+        assert "expected type snapshot, found delta" in str(exc.value)
+
+        with pytest.raises(NRTM4Exception) as exc:
+            validate_file_header(header, "delta", "TEST", "session", 3)
+        assert "expected version 3, found 2" in str(exc.value)
@@ -0,0 +1,232 @@
+import gzip
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import Mock
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+from irrd.storage.models import DatabaseOperation
+from irrd.storage.queries import (
+    DatabaseStatusQuery,
+    RPSLDatabaseJournalQuery,
+    RPSLDatabaseQuery,
+)
+
+from ..nrtm4 import NOTIFICATION_FILENAME, json_seq_records, jws_deserialize_verify
+from ..nrtm4_server import NRTM4_PERMISSIONS, NRTM4ServerRunner
+
+OBJECTS = [
+    # The CRYPT-PW hash must not appear in the output
+    {"object_text": "mntner: TEST-MNT\nauth: CRYPT-PW foobar\n"},
+    {"object_text": "route: 192.0.2.0/24\norigin: AS65537\n"},
+]
+JOURNAL = [
+    {
+        "serial_nrtm": 11,
+        "operation": DatabaseOperation.add_or_update,
+        "object_class": "route",
+        "rpsl_pk": "192.0.2.0/24AS65537",
+        "object_text": "route: 192.0.2.0/24\norigin: AS65537\nremarks: 🦄\n",
+    },
+    {
+        "serial_nrtm": 12,
+        "operation": DatabaseOperation.delete,
+        "object_class": "mntner",
+        "rpsl_pk": "TEST-MNT",
+        "object_text": "mntner: TEST-MNT\nauth: CRYPT-PW foobar\n",
+    },
+]
+
+
+class TestNRTM4ServerRunner:
+    def _setup(self, tmpdir, config_override, monkeypatch):
+        self.private_key = Ed25519PrivateKey.generate()
+        private_pem = self.private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode("ascii")
+        config_override(
+            {
+                "sources": {
+                    "TEST": {
+                        "keep_journal": True,
+                        "nrtm4_server_local_path": str(tmpdir),
+                        "nrtm4_server_private_key": private_pem,
+                    }
+                }
+            }
+        )
+        self.mock_dh = Mock()
+        monkeypatch.setattr("irrd.mirroring.nrtm4_server.DatabaseHandler", lambda: self.mock_dh)
+        self.path = Path(tmpdir)
+
+    def _run(self, status, journal=None):
+        """
+        Run the server with a particular database status and journal,
+        and return the recorded state and the verified notification.
+        """
+
+        def execute_query(query, **kwargs):
+            if isinstance(query, DatabaseStatusQuery):
+                return iter([status] if status else [])
+            if isinstance(query, RPSLDatabaseQuery):
+                return iter(OBJECTS)
+            if isinstance(query, RPSLDatabaseJournalQuery):
+                return iter(journal or [])
+
+        self.mock_dh.reset_mock()
+        self.mock_dh.execute_query = execute_query
+        NRTM4ServerRunner("TEST").run()
+
+        assert [call[0] for call in self.mock_dh.mock_calls] == [
+            "record_nrtm4_server_state",
+            "commit",
+            "close",
+        ]
+        state = self.mock_dh.mock_calls[0][1][1]
+        with open(self.path / NOTIFICATION_FILENAME) as fh:
+            notification = jws_deserialize_verify(fh.read(), self.private_key.public_key())
+        return state, notification
+
+    def _read_file(self, file):
+        with open(self.path / file["url"], "rb") as fh:
+            contents = fh.read()
+        assert hashlib.sha256(contents).hexdigest() == file["hash"]
+        assert oct(os.lstat(self.path / file["url"]).st_mode)[-3:] == oct(NRTM4_PERMISSIONS)[-3:]
+        if file["url"].endswith(".gz"):
+            contents = gzip.decompress(contents)
+        return list(json_seq_records(contents.decode("utf-8").split("\n")))
+
+    def test_new_session_delta_snapshot(self, tmpdir, config_override, monkeypatch, freezer):
+        self._setup(tmpdir, config_override, monkeypatch)
+
+        status = {"serial_newest_seen": 10, "serial_oldest_journal": None, "serial_newest_journal": None}
+        state, notification = self._run(status)
+        session_id = state["session_id"]
+        assert state["version"] == 1
+        assert state["serial"] == 10
+        assert state["deltas"] == []
+        assert notification["nrtm_version"] == 4
+        assert notification["type"] == "notification"
+        assert notification["source"] == "TEST"
+        assert notification["session_id"] == session_id
+        assert notification["version"] == 1
+        assert notification["deltas"] == []
+        assert notification["snapshot"]["version"] == 1
+
+        assert self._read_file(notification["snapshot"]) == [
+            {
+                "nrtm_version": 4,
+                "type": "snapshot",
+                "source": "TEST",
+                "session_id": session_id,
+                "version": 1,
+            },
+            {"object": "mntner: TEST-MNT\nauth: CRYPT-PW DummyValue  # Filtered for security\n"},
+            {"object": "route: 192.0.2.0/24\norigin: AS65537\n"},
+        ]
+
+        # No journal entries since the snapshot
+        status = {"serial_oldest_journal": None, "serial_newest_journal": None, "nrtm4_server_state": state}
+        state, notification = self._run(status)
+        assert state["session_id"] == session_id
+        assert state["version"] == 1
+
+        freezer.move_to(datetime.now(timezone.utc) + timedelta(minutes=1))
+        status = {"serial_oldest_journal": 11, "serial_newest_journal": 12, "nrtm4_server_state": state}
+        state, notification = self._run(status, JOURNAL)
+        assert state["session_id"] == session_id
+        assert state["version"] == 2
+        assert state["serial"] == 12
+        assert notification["version"] == 2
+        assert notification["snapshot"]["version"] == 1
+        assert len(notification["deltas"]) == 1
+        assert notification["deltas"][0]["version"] == 2
+
+        assert self._read_file(notification["deltas"][0]) == [
+            {
+                "nrtm_version": 4,
+                "type": "delta",
+                "source": "TEST",
+                "session_id": session_id,
+                "version": 2,
+            },
+            {"action": "add_modify", "object": "route: 192.0.2.0/24\norigin: AS65537\nremarks: 🦄\n"},
+            {"action": "delete", "object_class": "mntner", "primary_key": "TEST-MNT"},
+        ]
+        old_snapshot_filename = notification["snapshot"]["url"]
+
+        # A new snapshot is written after the snapshot interval,
+        # the old snapshot is removed later
+        freezer.move_to(datetime.now(timezone.utc) + timedelta(hours=5))
+        status["nrtm4_server_state"] = state
+        state, notification = self._run(status)
+        assert state["version"] == 2
+        assert notification["snapshot"]["version"] == 2
+        assert len(notification["deltas"]) == 1
+        assert self._read_file(notification["snapshot"])[0]["version"] == 2
+        assert not (self.path / old_snapshot_filename).exists()
+
+        # Deltas before the snapshot are expired after the retention time
+        freezer.move_to(datetime.now(timezone.utc) + timedelta(hours=25))
+        state, notification = self._run(status)
+        assert state["session_id"] == session_id
+        assert notification["deltas"] == []
+        assert sorted(os.listdir(tmpdir)) == sorted([NOTIFICATION_FILENAME, notification["snapshot"]["url"]])
+
+    def test_new_session_journal_not_covering(self, tmpdir, config_override, monkeypatch):
+        self._setup(tmpdir, config_override, monkeypatch)
+
+        state, notification = self._run(None)
+        session_id = state["session_id"]
+        assert state["serial"] is None
+        assert state["deltas"] == []
+
+        status = {"serial_oldest_journal": 1, "serial_newest_journal": 12, "nrtm4_server_state": state}
+        state, notification = self._run(status, JOURNAL)
+        assert state["session_id"] == session_id
+        assert state["serial"] == 12
+
+        # Journal entries 13-14 have expired
+        status = {
+            "serial_newest_seen": 16,
+            "serial_oldest_journal": 15,
+            "serial_newest_journal": 16,
+            "nrtm4_server_state": state,
+        }
+        state, notification = self._run(status)
+        assert state["session_id"] != session_id
+        assert state["version"] == 1
+        assert state["serial"] == 16
+        assert notification["session_id"] == state["session_id"]
+
+        # The journal was reset
+        session_id = state["session_id"]
+        status = {"serial_oldest_journal": 1, "serial_newest_journal": 2, "nrtm4_server_state": state}
+        state, notification = self._run(status)
+        assert state["session_id"] != session_id
+
+        # The snapshot file is missing
+        session_id = state["session_id"]
+        os.unlink(self.path / state["snapshot"]["url"])
+        status = {"serial_oldest_journal": 1, "serial_newest_journal": 2, "nrtm4_server_state": state}
+        state, notification = self._run(status)
+        assert state["session_id"] != session_id
+
+        # Reset after a full reload of the source
+        session_id = state["session_id"]
+        status = {"serial_oldest_journal": 1, "serial_newest_journal": 2, "nrtm4_server_state": {}}
+        state, notification = self._run(status)
+        assert state["session_id"] != session_id
+
+    def test_exception_handling(self, tmpdir, config_override, monkeypatch, caplog):
+        self._setup(tmpdir, config_override, monkeypatch)
+        self.mock_dh.execute_query = Mock(side_effect=Exception("test-error"))
+
+        NRTM4ServerRunner("TEST").run()
+        assert [call[0] for call in self.mock_dh.mock_calls] == ["execute_query", "close"]
+        assert "An exception occurred while attempting to update NRTMv4 files for TEST" in caplog.text
+        assert "test-error" in caplog.text
+        assert not os.listdir(tmpdir)
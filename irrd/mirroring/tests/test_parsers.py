@@ -1,3 +1,5 @@
+import io
+import multiprocessing
 import tempfile
 from unittest.mock import Mock
 
@@ -23,9 +25,11 @@ from irrd.utils.rpsl_samples import (
 )
 from irrd.utils.test_utils import flatten_mock_calls
 
+from ..nrtm4 import NRTM4Exception
 from ..parsers import (
     MirrorFileImportParser,
     MirrorUpdateFileImportParser,
+    NRTM4DeltaParser,
     NRTMStreamParser,
 )
 from .nrtm_samples import (
@@ -51,7 +55,13 @@ def mock_scopefilter(monkeypatch):
 
 class TestMirrorFileImportParser:
     # This test also covers the common parts of MirrorFileImportParserBase
-    def test_parse(self, mock_scopefilter, caplog, tmp_gpg_dir, config_override):
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_parse(self, mock_scopefilter, caplog, tmp_gpg_dir, config_override, monkeypatch, parallel):
+        if parallel:
+            # Small chunks, so that multiple chunks are in progress
+            monkeypatch.setattr("irrd.mirroring.parsers.PARALLEL_PARSING_MIN_FILE_SIZE", 0)
+            monkeypatch.setattr("irrd.mirroring.parsers.PARSER_PROCESSES", 2)
+            monkeypatch.setattr("irrd.mirroring.parsers.PARSER_CHUNK_SIZE", 2)
         config_override(
             {
                 "sources": {
@@ -112,6 +122,44 @@ class TestMirrorFileImportParser:
         key_cert_obj = rpsl_object_from_text(SAMPLE_KEY_CERT, strict_validation=False)
         assert key_cert_obj.verify(KEY_CERT_SIGNED_MESSAGE_VALID)
 
+    @pytest.mark.parametrize(
+        "file_size,min_objects,parallel",
+        [
+            # Size unknown, more objects than PARALLEL_PARSING_MIN_OBJECTS
+            (None, 1, True),
+            # Size unknown, small stream
+            (None, 2, False),
+            # Size known, small file
+            (10, 1, False),
+        ],
+    )
+    def test_parse_stream(
+        self, mock_scopefilter, caplog, config_override, monkeypatch, file_size, min_objects, parallel
+    ):
+        config_override({"sources": {"TEST": {}}})
+        monkeypatch.setattr("irrd.mirroring.parsers.PARSER_PROCESSES", 2)
+        monkeypatch.setattr("irrd.mirroring.parsers.PARALLEL_PARSING_MIN_OBJECTS", min_objects)
+        mock_get_context = Mock(wraps=multiprocessing.get_context)
+        monkeypatch.setattr("irrd.mirroring.parsers.multiprocessing.get_context", mock_get_context)
+        mock_dh = Mock()
+
+        test_input = "\n\n".join([SAMPLE_ROUTE, SAMPLE_ROUTE6])
+        parser = MirrorFileImportParser(
+            source="TEST",
+            filename="https://example.com/test.db.gz",
+            file=io.StringIO(test_input),
+            file_size=file_size,
+            serial=None,
+            database_handler=mock_dh,
+        )
+        parser.run_import()
+        assert mock_get_context.called == parallel
+        assert [call[1][0].pk() for call in mock_dh.mock_calls] == [
+            "192.0.2.0/24AS65537",
+            "2001:DB8::/48AS65537",
+        ]
+        assert "File import for TEST: 2 objects read, 2 objects inserted" in caplog.text
+
     def test_direct_error_return_invalid_source(self, mock_scopefilter, caplog, tmp_gpg_dir, config_override):
         config_override(
             {
@@ -314,6 +362,20 @@ class TestNRTMStreamParser:
         self._assert_valid(parser)
         assert flatten_mock_calls(mock_dh) == [["record_serial_newest_mirror", ("TEST", 11012701), {}]]
 
+    def test_test_parse_nrtm_v3_valid_stream(self):
+        mock_dh = Mock()
+        parser = NRTMStreamParser("TEST", None, mock_dh)
+        lines = iter(SAMPLE_NRTM_V3.splitlines(keepends=True))
+        operations = parser.parse_stream(lines)
+
+        # Operations are yielded before the end of the stream is read
+        parser.operations = [next(operations)]
+        assert parser.operations[0].serial == 11012700
+        assert not mock_dh.mock_calls
+        parser.operations += list(operations)
+        self._assert_valid(parser)
+        assert flatten_mock_calls(mock_dh) == [["record_serial_newest_mirror", ("TEST", 11012701), {}]]
+
     def test_test_parse_nrtm_v1_valid(self, config_override):
         config_override(
             {
@@ -428,3 +490,53 @@ class TestNRTMStreamParser:
         assert parser.operations[1].operation == DatabaseOperation.delete
         assert parser.operations[1].serial == 11012701
         assert parser.operations[1].object_text == "inetnum: 192.0.2.0 - 192.0.2.255\nsource: TEST\n"
+
+
+class TestNRTM4DeltaParser:
+    def test_run_import(self, config_override):
+        config_override(
+            {
+                "rpki": {"roa_source": None},
+                "sources": {"TEST": {"object_class_filter": ["route", "route6"]}},
+            }
+        )
+        mock_dh = Mock()
+        parser = NRTM4DeltaParser("TEST", 3, mock_dh)
+        record_count = parser.run_import(
+            [
+                {"action": "add_modify", "object": SAMPLE_ROUTE},
+                {"action": "delete", "object_class": "route6", "primary_key": "2001:DB8::/48AS65537"},
+                # Filtered by object_class_filter
+                {"action": "delete", "object_class": "mntner", "primary_key": "TEST-MNT"},
+                # Filtered by object_class_filter
+                {"action": "add_modify", "object": SAMPLE_ROLE},
+            ]
+        )
+        assert record_count == 2
+
+        assert mock_dh.mock_calls[0][0] == "upsert_rpsl_object"
+        assert mock_dh.mock_calls[0][1][0].pk() == "192.0.2.0/24AS65537"
+        assert mock_dh.mock_calls[0][1][1] == JournalEntryOrigin.mirror
+        assert mock_dh.mock_calls[0][2] == {"source_serial": 3}
+        assert flatten_mock_calls(mock_dh)[1:] == [
+            [
+                "delete_rpsl_object",
+                (),
+                {
+                    "origin": JournalEntryOrigin.mirror,
+                    "source": "TEST",
+                    "rpsl_pk": "2001:DB8::/48AS65537",
+                    "object_class": "route6",
+                    "source_serial": 3,
+                },
+            ],
+        ]
+
+    def test_invalid_record(self, config_override):
+        config_override({"rpki": {"roa_source": None}})
+        mock_dh = Mock()
+        parser = NRTM4DeltaParser("TEST", 3, mock_dh)
+        with pytest.raises(NRTM4Exception) as exc:
+            parser.run_import([{"action": "delete", "object_class": "route"}])
+        assert "Invalid record in NRTMv4 delta version 3" in str(exc.value)
+        assert not mock_dh.mock_calls
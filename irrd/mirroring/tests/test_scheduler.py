@@ -265,6 +265,36 @@ class TestMirrorScheduler:
 
         assert thread_run_count == 1
 
+    def test_scheduler_runs_nrtm4_server_and_client(self, monkeypatch, config_override):
+        monkeypatch.setattr("irrd.mirroring.scheduler.ScheduledTaskProcess", MockScheduledTaskProcess)
+        global thread_run_count
+        thread_run_count = 0
+
+        config_override(
+            {
+                "sources": {
+                    "TEST": {
+                        "nrtm4_client_notification_file_url": "url",
+                        "nrtm4_server_local_path": "/tmp",
+                        "nrtm4_server_timer": 0,
+                        "import_timer": 0,
+                    }
+                }
+            }
+        )
+
+        monkeypatch.setattr("irrd.mirroring.scheduler.RPSLMirrorImportUpdateRunner", MockRunner)
+        monkeypatch.setattr("irrd.mirroring.scheduler.NRTM4ServerRunner", MockNRTM4ServerRunner)
+        MockRunner.run_sleep = True
+
+        scheduler = MirrorScheduler()
+        scheduler.run()
+        time.sleep(0.5)
+        # Second run will not start the threads, as the current ones are still running
+        scheduler.run()
+
+        assert thread_run_count == 2
+
     def test_scheduler_export_ignores_timer_not_expired(self, monkeypatch, config_override):
         monkeypatch.setattr("irrd.mirroring.scheduler.ScheduledTaskProcess", MockScheduledTaskProcess)
         global thread_run_count
@@ -317,6 +347,12 @@ class MockRunner:
             time.sleep(1.5)
 
 
+class MockNRTM4ServerRunner(MockRunner):
+    # Process names are based on the class name, so a separate class
+    # is needed to run it alongside another MockRunner for the same source
+    pass
+
+
 class MockScheduledTaskProcess(threading.Thread):
     def __init__(self, runner, *args, **kwargs):
         super().__init__(*args, **kwargs)
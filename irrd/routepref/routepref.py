@@ -117,7 +117,7 @@ def build_validator(
 
     if not filter_prefixes:
         q = RPSLDatabaseQuery(column_names=columns, ordered_by_sources=False).object_classes(object_classes)
-        return RoutePreferenceValidator(database_handler.execute_query(q))
+        return RoutePreferenceValidator(database_handler.execute_query(q, stream_results=True))
     else:
         rows = []
         for filter_prefix in filter_prefixes:
@@ -176,7 +176,7 @@ def enrich_pks(database_handler: DatabaseHandler, pks_to_enrich: List[str]):
         "rpsl_pk",
         "source",
         "prefix",
-        "origin",
+        "asn_first",
         "object_class",
         "scopefilter_status",
         "rpki_status",
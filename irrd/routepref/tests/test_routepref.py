@@ -133,7 +133,7 @@ def test_update_route_preference_status(config_override, monkeypatch):
         "rpsl_pk",
         "source",
         "prefix",
-        "origin",
+        "asn_first",
         "object_class",
         "object_text",
         "scopefilter_status",
@@ -189,7 +189,7 @@ class TestBulkRouteROAValidator:
                 ],
             ]
         )
-        mock_dh.execute_query = lambda query: next(mock_query_result)
+        mock_dh.execute_query = lambda query, **kwargs: next(mock_query_result)
 
         roas = [
             # Valid for pk_route_v4_d0_l25 and pk_route_v4_d0_l24
@@ -296,7 +296,7 @@ class TestBulkRouteROAValidator:
                 ],
             ]
         )
-        mock_dh.execute_query = lambda query: next(mock_query_result)
+        mock_dh.execute_query = lambda query, **kwargs: next(mock_query_result)
 
         result = BulkRouteROAValidator(mock_dh).validate_all_routes(sources=["TEST1"])
         new_valid_pks, new_invalid_pks, new_unknown_pks = result
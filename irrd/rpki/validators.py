@@ -92,7 +92,7 @@ class BulkRouteROAValidator:
         q = q.object_classes(["route", "route6"])
         if sources:
             q = q.sources(sources)
-        routes = self.database_handler.execute_query(q)
+        routes = self.database_handler.execute_query(q, stream_results=True)
 
         objs_changed: Dict[RPKIStatus, List[Dict[str, str]]] = defaultdict(list)
 
@@ -168,7 +168,7 @@ class BulkRouteROAValidator:
         """
         Build the tree of all ROAs from the DB.
         """
-        roas = self.database_handler.execute_query(ROADatabaseObjectQuery())
+        roas = self.database_handler.execute_query(ROADatabaseObjectQuery(), stream_results=True)
         for roa in roas:
             first_ip, length = roa["prefix"].split("/")
             ip_version, ip_bin_str = self._ip_to_binary_str(first_ip)
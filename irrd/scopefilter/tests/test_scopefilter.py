@@ -195,7 +195,7 @@ class TestScopeFilterValidator:
                 ],
             ]
         )
-        mock_dh.execute_query = lambda query: next(mock_query_result)
+        mock_dh.execute_query = lambda query, **kwargs: next(mock_query_result)
 
         validator = ScopeFilterValidator()
         result = validator.validate_all_rpsl_objects(mock_dh)
@@ -123,7 +123,7 @@ class ScopeFilterValidator:
 
         q = RPSLDatabaseQuery(column_names=columns, enable_ordering=False)
         q = q.object_classes(["route", "route6", "aut-num"])
-        results = database_handler.execute_query(q)
+        results = database_handler.execute_query(q, stream_results=True)
 
         for result in results:
             current_status = result["scopefilter_status"]
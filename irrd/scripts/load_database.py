@@ -33,8 +33,9 @@ def load(source, filename, serial) -> int:
 
     dh = DatabaseHandler()
     roa_validator = BulkRouteROAValidator(dh)
-    dh.delete_all_rpsl_objects_with_journal(source)
+    dh.start_rpsl_staging_load(source)
     dh.disable_journaling()
+    dh.enable_bulk_load()
     parser = MirrorFileImportParser(
         source=source,
         filename=filename,
@@ -11,41 +11,70 @@ import socket
 import time
 
 
-def main(host, port, count):
+def generate_queries(count):
     queries = [b"!!\n"]
     for i in range(count):
         asn = random.randrange(1, 50000)
         query = f"!gAS{asn}\n".encode("ascii")
         queries.append(query)
     queries.append(b"!q\n")
+    return queries
 
+
+def run_pipelined(host, port, queries):
+    """
+    Send all queries in a single persistent session, without waiting
+    for responses, and return the time until the session was closed.
+    """
     s = socket.socket()
     s.settimeout(600)
     s.connect((host, port))
 
     queries_str = b"".join(queries)
+    start_time = time.perf_counter()
     s.sendall(queries_str)
 
-    start_time = time.perf_counter()
     while 1:
         data = s.recv(1024 * 1024)
         if not data:
             break
 
-    elapsed = time.perf_counter() - start_time
+    return time.perf_counter() - start_time
+
+
+def report(label, count, elapsed):
     time_per_query = elapsed / count * 1000
     qps = int(count / elapsed)
-    print(f"Ran {count} queries in {elapsed}s, time per query {time_per_query} ms, {qps} qps")
+    print(f"{label}: ran {count} queries in {elapsed}s, time per query {time_per_query} ms, {qps} qps")
+    return qps
+
+
+def main(host, port, count, compare=None):
+    queries = generate_queries(count)
+    qps = report(f"{host}:{port}", count, run_pipelined(host, port, queries))
+
+    if compare:
+        compare_host, compare_port = compare.rsplit(":", 1)
+        # The same queries are used, so that the results are comparable
+        compare_qps = report(compare, count, run_pipelined(compare_host, int(compare_port), queries))
+        difference = (qps - compare_qps) / compare_qps * 100
+        print(f"{host}:{port} is {difference:+.1f}% qps compared to {compare}")
 
 
 if __name__ == "__main__":  # pragma: no cover
-    description = """A simple load tester for IRRd. Sends random !g queries."""
+    description = """A simple load tester for IRRd. Sends random !g queries in a pipelined session."""
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument(
         "--count", dest="count", type=int, default=5000, help=f"number of queries to run (default: 5000)"
     )
+    parser.add_argument(
+        "--compare",
+        dest="compare",
+        type=str,
+        help="host:port of a second instance, e.g. running an older version, to compare qps with",
+    )
     parser.add_argument("host", type=str, help="hostname of instance")
     parser.add_argument("port", type=int, help="port of instance")
     args = parser.parse_args()
 
-    main(args.host, args.port, args.count)
+    main(args.host, args.port, args.count, args.compare)
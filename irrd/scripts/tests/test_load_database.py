@@ -19,8 +19,9 @@ def test_load_database_success(capsys, monkeypatch):
 
     assert load("TEST", "test.db", 42) == 0
     assert flatten_mock_calls(mock_dh) == [
-        ["delete_all_rpsl_objects_with_journal", ("TEST",), {}],
+        ["start_rpsl_staging_load", ("TEST",), {}],
         ["disable_journaling", (), {}],
+        ["enable_bulk_load", (), {}],
         ["commit", (), {}],
         ["close", (), {}],
     ]
@@ -44,8 +45,9 @@ def test_load_database_import_error(capsys, monkeypatch, caplog):
 
     assert load("TEST", "test.db", 42) == 1
     assert flatten_mock_calls(mock_dh) == [
-        ["delete_all_rpsl_objects_with_journal", ("TEST",), {}],
+        ["start_rpsl_staging_load", ("TEST",), {}],
         ["disable_journaling", (), {}],
+        ["enable_bulk_load", (), {}],
         ["rollback", (), {}],
         ["close", (), {}],
     ]
@@ -38,7 +38,7 @@ def resolve_rpsl_object_type(obj: Dict[str, str], *_) -> str:
 
 
 @ariadne.convert_kwargs_to_snake_case
-def resolve_rpsl_objects(_, info: GraphQLResolveInfo, **kwargs):
+async def resolve_rpsl_objects(_, info: GraphQLResolveInfo, **kwargs):
     """
     Resolve a `rpslObjects` query. This query has a considerable
     number of parameters, each of which is applied to an RPSL
@@ -115,37 +115,37 @@ def resolve_rpsl_objects(_, info: GraphQLResolveInfo, **kwargs):
         if ip_filter in kwargs:
             getattr(query, ip_filter)(IP(kwargs[ip_filter]))
 
-    return _rpsl_db_query_to_graphql_out(query, info)
+    return await _rpsl_db_query_to_graphql_out(query, info)
 
 
-def resolve_rpsl_object_mnt_by_objs(rpsl_object, info: GraphQLResolveInfo):
+async def resolve_rpsl_object_mnt_by_objs(rpsl_object, info: GraphQLResolveInfo):
     """Resolve mntByObjs on RPSL objects"""
-    return _resolve_subquery(rpsl_object, info, ["mntner"], pk_field="mntBy")
+    return await _resolve_subquery(rpsl_object, info, ["mntner"], pk_field="mntBy")
 
 
-def resolve_rpsl_object_adminc_objs(rpsl_object, info: GraphQLResolveInfo):
+async def resolve_rpsl_object_adminc_objs(rpsl_object, info: GraphQLResolveInfo):
     """Resolve adminCObjs on RPSL objects"""
-    return _resolve_subquery(rpsl_object, info, ["role", "person"], pk_field="adminC")
+    return await _resolve_subquery(rpsl_object, info, ["role", "person"], pk_field="adminC")
 
 
-def resolve_rpsl_object_techc_objs(rpsl_object, info: GraphQLResolveInfo):
+async def resolve_rpsl_object_techc_objs(rpsl_object, info: GraphQLResolveInfo):
     """Resolve techCObjs on RPSL objects"""
-    return _resolve_subquery(rpsl_object, info, ["role", "person"], pk_field="techC")
+    return await _resolve_subquery(rpsl_object, info, ["role", "person"], pk_field="techC")
 
 
-def resolve_rpsl_object_members_by_ref_objs(rpsl_object, info: GraphQLResolveInfo):
+async def resolve_rpsl_object_members_by_ref_objs(rpsl_object, info: GraphQLResolveInfo):
     """Resolve mbrsByRefObjs on RPSL objects"""
-    return _resolve_subquery(rpsl_object, info, ["mntner"], pk_field="mbrsByRef")
+    return await _resolve_subquery(rpsl_object, info, ["mntner"], pk_field="mbrsByRef")
 
 
-def resolve_rpsl_object_member_of_objs(rpsl_object, info: GraphQLResolveInfo):
+async def resolve_rpsl_object_member_of_objs(rpsl_object, info: GraphQLResolveInfo):
     """Resolve memberOfObjs on RPSL objects"""
     object_klass = OBJECT_CLASS_MAPPING[rpsl_object["objectClass"]]
     sub_object_classes = object_klass.fields["member-of"].referring  # type: ignore
-    return _resolve_subquery(rpsl_object, info, sub_object_classes, pk_field="memberOf")
+    return await _resolve_subquery(rpsl_object, info, sub_object_classes, pk_field="memberOf")
 
 
-def resolve_rpsl_object_members_objs(rpsl_object, info: GraphQLResolveInfo):
+async def resolve_rpsl_object_members_objs(rpsl_object, info: GraphQLResolveInfo):
     """Resolve membersObjs on RPSL objects"""
     object_klass = OBJECT_CLASS_MAPPING[rpsl_object["objectClass"]]
     sub_object_classes = object_klass.fields["members"].referring  # type: ignore
@@ -155,10 +155,10 @@ def resolve_rpsl_object_members_objs(rpsl_object, info: GraphQLResolveInfo):
         sub_object_classes.remove("aut-num")
     if "inet-rtr" in sub_object_classes:
         sub_object_classes.remove("inet-rtr")
-    return _resolve_subquery(rpsl_object, info, sub_object_classes, "members", sticky_source=False)
+    return await _resolve_subquery(rpsl_object, info, sub_object_classes, "members", sticky_source=False)
 
 
-def _resolve_subquery(
+async def _resolve_subquery(
     rpsl_object, info: GraphQLResolveInfo, object_classes: List[str], pk_field: str, sticky_source=True
 ):
     """
@@ -177,10 +177,10 @@ def _resolve_subquery(
     query.object_classes(object_classes).rpsl_pks(pks)
     if sticky_source:
         query.sources([rpsl_object["source"]])
-    return _rpsl_db_query_to_graphql_out(query, info)
+    return await _rpsl_db_query_to_graphql_out(query, info)
 
 
-def resolve_rpsl_object_journal(rpsl_object, info: GraphQLResolveInfo):
+async def resolve_rpsl_object_journal(rpsl_object, info: GraphQLResolveInfo):
     """
     Resolve a journal subquery on an RPSL object.
     """
@@ -191,17 +191,19 @@ def resolve_rpsl_object_journal(rpsl_object, info: GraphQLResolveInfo):
 
     query = RPSLDatabaseJournalQuery()
     query.sources([rpsl_object["source"]]).rpsl_pk(rpsl_object["rpslPk"])
-    for row in database_handler.execute_query(query, refresh_on_error=True):
+    responses = []
+    for row in await database_handler.execute_query_async(query, refresh_on_error=True):
         response = {snake_to_camel_case(k): v for k, v in row.items()}
         response["operation"] = response["operation"].name
         if response["origin"]:
             response["origin"] = response["origin"].name
         if response["objectText"]:
             response["objectText"] = remove_auth_hashes(response["objectText"])
-        yield response
+        responses.append(response)
+    return responses
 
 
-def _rpsl_db_query_to_graphql_out(query: RPSLDatabaseQuery, info: GraphQLResolveInfo):
+async def _rpsl_db_query_to_graphql_out(query: RPSLDatabaseQuery, info: GraphQLResolveInfo):
     """
     Given an RPSL database query, execute it and clean up the output
     to be suitable to return to GraphQL.
@@ -218,7 +220,8 @@ def _rpsl_db_query_to_graphql_out(query: RPSLDatabaseQuery, info: GraphQLResolve
         else:
             info.context["sql_queries"].append(repr(query))
 
-    for row in database_handler.execute_query(query, refresh_on_error=True):
+    graphql_results = []
+    for row in await database_handler.execute_query_async(query, refresh_on_error=True):
         graphql_result = {snake_to_camel_case(k): v for k, v in row.items() if k != "parsed_data"}
         if "object_text" in row:
             graphql_result["objectText"] = remove_auth_hashes(row["object_text"])
@@ -235,7 +238,8 @@ def _rpsl_db_query_to_graphql_out(query: RPSLDatabaseQuery, info: GraphQLResolve
             if graphql_type == "String" and isinstance(value, list):
                 value = "\n".join(value)
             graphql_result[snake_to_camel_case(key)] = value
-        yield graphql_result
+        graphql_results.append(graphql_result)
+    return graphql_results
 
 
 @ariadne.convert_kwargs_to_snake_case
@@ -277,6 +281,7 @@ def resolve_as_set_prefixes(
     sources: Optional[List[str]] = None,
     ip_version: Optional[int] = None,
     exclude_sets: Optional[List[str]] = None,
+    aggregate: bool = False,
     sql_trace: bool = False,
 ):
     """Resolve an asSetPrefixes query"""
@@ -289,7 +294,11 @@ def resolve_as_set_prefixes(
     exclude_sets_set = {i.upper() for i in exclude_sets} if exclude_sets else set()
     query_resolver.set_query_sources(sources)
     for set_name in set_names_set:
-        prefixes = list(query_resolver.routes_for_as_set(set_name, ip_version, exclude_sets=exclude_sets_set))
+        prefixes = list(
+            query_resolver.routes_for_as_set(
+                set_name, ip_version, exclude_sets=exclude_sets_set, aggregate=aggregate
+            )
+        )
         yield dict(rpslPk=set_name, prefixes=prefixes)
     if sql_trace:
         info.context["sql_queries"] = query_resolver.retrieve_sql_trace()
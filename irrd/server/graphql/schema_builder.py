@@ -28,35 +28,37 @@ def build_executable_schema():
     This takes the schema from the schema generator, and attaches
     the resolvers for each field. It also sets up custom parsing
     for IP and ASN input fields.
+    Resolvers that query the database directly are async. Resolvers
+    that use the synchronous QueryResolver are run in a thread.
     """
     schema = SchemaGenerator()
 
     schema.rpsl_object_type.set_type_resolver(sta(resolve_rpsl_object_type, False))
     schema.rpsl_contact_union_type.set_type_resolver(sta(resolve_rpsl_object_type, False))
 
-    schema.query_type.set_field("rpslObjects", sta(resolve_rpsl_objects, False))
+    schema.query_type.set_field("rpslObjects", resolve_rpsl_objects)
     schema.query_type.set_field("databaseStatus", sta(resolve_database_status, False))
     schema.query_type.set_field("asnPrefixes", sta(resolve_asn_prefixes, False))
     schema.query_type.set_field("asSetPrefixes", sta(resolve_as_set_prefixes, False))
     schema.query_type.set_field("recursiveSetMembers", sta(resolve_recursive_set_members, False))
 
-    schema.rpsl_object_type.set_field("mntByObjs", sta(resolve_rpsl_object_mnt_by_objs, False))
-    schema.rpsl_object_type.set_field("journal", sta(resolve_rpsl_object_journal, False))
+    schema.rpsl_object_type.set_field("mntByObjs", resolve_rpsl_object_mnt_by_objs)
+    schema.rpsl_object_type.set_field("journal", resolve_rpsl_object_journal)
     for object_type in schema.object_types:
         if "adminCObjs" in schema.graphql_types[object_type.name]:
-            object_type.set_field("adminCObjs", sta(resolve_rpsl_object_adminc_objs, False))
+            object_type.set_field("adminCObjs", resolve_rpsl_object_adminc_objs)
     for object_type in schema.object_types:
         if "techCObjs" in schema.graphql_types[object_type.name]:
-            object_type.set_field("techCObjs", sta(resolve_rpsl_object_techc_objs, False))
+            object_type.set_field("techCObjs", resolve_rpsl_object_techc_objs)
     for object_type in schema.object_types:
         if "mbrsByRefObjs" in schema.graphql_types[object_type.name]:
-            object_type.set_field("mbrsByRefObjs", sta(resolve_rpsl_object_members_by_ref_objs, False))
+            object_type.set_field("mbrsByRefObjs", resolve_rpsl_object_members_by_ref_objs)
     for object_type in schema.object_types:
         if "memberOfObjs" in schema.graphql_types[object_type.name]:
-            object_type.set_field("memberOfObjs", sta(resolve_rpsl_object_member_of_objs, False))
+            object_type.set_field("memberOfObjs", resolve_rpsl_object_member_of_objs)
     for object_type in schema.object_types:
         if "membersObjs" in schema.graphql_types[object_type.name]:
-            object_type.set_field("membersObjs", sta(resolve_rpsl_object_members_objs, False))
+            object_type.set_field("membersObjs", resolve_rpsl_object_members_objs)
 
     @schema.asn_scalar_type.value_parser
     def parse_asn_scalar(value):
@@ -87,7 +87,11 @@ def prepare_resolver(monkeypatch):
             preloader=Mock(spec=Preloader),
         )
     )
-    app.state.database_handler.execute_query = lambda query, refresh_on_error: MOCK_RPSL_DB_RESULT
+
+    async def mock_execute_query_async(query, refresh_on_error):
+        return iter(MOCK_RPSL_DB_RESULT)
+
+    app.state.database_handler.execute_query_async = mock_execute_query_async
 
     info = Mock()
     info.context = {}
@@ -104,42 +108,40 @@ def prepare_resolver(monkeypatch):
 
 
 class TestGraphQLResolvers:
-    def test_resolve_rpsl_objects(self, prepare_resolver, config_override):
+    async def test_resolve_rpsl_objects(self, prepare_resolver, config_override):
         info, mock_database_query, mock_query_resolver = prepare_resolver
 
         with pytest.raises(ValueError):
-            resolvers.resolve_rpsl_objects(None, info)
+            await resolvers.resolve_rpsl_objects(None, info)
         with pytest.raises(ValueError):
-            resolvers.resolve_rpsl_objects(None, info, object_class="route", sql_trace=True)
+            await resolvers.resolve_rpsl_objects(None, info, object_class="route", sql_trace=True)
         with pytest.raises(ValueError):
-            resolvers.resolve_rpsl_objects(
+            await resolvers.resolve_rpsl_objects(
                 None, info, object_class="route", rpki_status=[RPKIStatus.not_found], sql_trace=True
             )
 
         # Should not raise ValueError
-        resolvers.resolve_rpsl_objects(
+        await resolvers.resolve_rpsl_objects(
             None, info, object_class="route", rpki_status=[RPKIStatus.invalid], sql_trace=True
         )
         mock_database_query.reset_mock()
 
-        result = list(
-            resolvers.resolve_rpsl_objects(
-                None,
-                info,
-                sql_trace=True,
-                rpsl_pk="pk",
-                object_class="route",
-                asn=[65550],
-                text_search="text",
-                rpki_status=[RPKIStatus.invalid],
-                scope_filter_status=[ScopeFilterStatus.out_scope_as],
-                route_preference_status=[RoutePreferenceStatus.suppressed],
-                ip_exact="192.0.2.1",
-                sources=["TEST1"],
-                mntBy="mnt-by",
-                unknownKwarg="ignored",
-                record_limit=2,
-            )
+        result = await resolvers.resolve_rpsl_objects(
+            None,
+            info,
+            sql_trace=True,
+            rpsl_pk="pk",
+            object_class="route",
+            asn=[65550],
+            text_search="text",
+            rpki_status=[RPKIStatus.invalid],
+            scope_filter_status=[ScopeFilterStatus.out_scope_as],
+            route_preference_status=[RoutePreferenceStatus.suppressed],
+            ip_exact="192.0.2.1",
+            sources=["TEST1"],
+            mntBy="mnt-by",
+            unknownKwarg="ignored",
+            record_limit=2,
         )
 
         assert result == EXPECTED_RPSL_GRAPHQL_OUTPUT
@@ -160,14 +162,13 @@ class TestGraphQLResolvers:
 
         mock_database_query.reset_mock()
         config_override({"sources_default": ["TEST1"]})
-        result = list(
-            resolvers.resolve_rpsl_objects(
-                None,
-                info,
-                sql_trace=True,
-                rpsl_pk="pk",
-            )
+        result = await resolvers.resolve_rpsl_objects(
+            None,
+            info,
+            sql_trace=True,
+            rpsl_pk="pk",
         )
+
         assert result == EXPECTED_RPSL_GRAPHQL_OUTPUT
         assert flatten_mock_calls(mock_database_query) == [
             ["rpsl_pks", ("pk",), {}],
@@ -177,7 +178,7 @@ class TestGraphQLResolvers:
             ["sources", (["TEST1"],), {}],
         ]
 
-    def test_strips_auth_attribute_hashes(self, prepare_resolver):
+    async def test_strips_auth_attribute_hashes(self, prepare_resolver):
         info, mock_database_query, mock_query_resolver = prepare_resolver
 
         rpsl_db_mntner_result = [
@@ -189,17 +190,17 @@ class TestGraphQLResolvers:
             }
         ]
 
-        info.context["request"].app.state.database_handler.execute_query = (
-            lambda query, refresh_on_error: rpsl_db_mntner_result
-        )
-        result = list(
-            resolvers.resolve_rpsl_objects(
-                None,
-                info,
-                sql_trace=True,
-                rpsl_pk="pk",
-            )
+        async def mock_execute_query_async(query, refresh_on_error):
+            return iter(rpsl_db_mntner_result)
+
+        info.context["request"].app.state.database_handler.execute_query_async = mock_execute_query_async
+        result = await resolvers.resolve_rpsl_objects(
+            None,
+            info,
+            sql_trace=True,
+            rpsl_pk="pk",
         )
+
         assert result == [
             {
                 "objectClass": "mntner",
@@ -207,7 +208,7 @@ class TestGraphQLResolvers:
             }
         ]
 
-    def test_resolve_rpsl_object_mnt_by_objs(self, prepare_resolver):
+    async def test_resolve_rpsl_object_mnt_by_objs(self, prepare_resolver):
         info, mock_database_query, mock_query_resolver = prepare_resolver
 
         mock_rpsl_object = {
@@ -215,7 +216,7 @@ class TestGraphQLResolvers:
             "mntBy": "mntBy",
             "source": "source",
         }
-        result = list(resolvers.resolve_rpsl_object_mnt_by_objs(mock_rpsl_object, info))
+        result = await resolvers.resolve_rpsl_object_mnt_by_objs(mock_rpsl_object, info)
 
         assert result == EXPECTED_RPSL_GRAPHQL_OUTPUT
         assert flatten_mock_calls(mock_database_query) == [
@@ -229,9 +230,9 @@ class TestGraphQLResolvers:
             "objectClass": "route",
             "source": "source",
         }
-        assert not list(resolvers.resolve_rpsl_object_mnt_by_objs(mock_rpsl_object, info))
+        assert not await resolvers.resolve_rpsl_object_mnt_by_objs(mock_rpsl_object, info)
 
-    def test_resolve_rpsl_object_adminc_objs(self, prepare_resolver):
+    async def test_resolve_rpsl_object_adminc_objs(self, prepare_resolver):
         info, mock_database_query, mock_query_resolver = prepare_resolver
 
         mock_rpsl_object = {
@@ -239,7 +240,7 @@ class TestGraphQLResolvers:
             "adminC": "adminC",
             "source": "source",
         }
-        result = list(resolvers.resolve_rpsl_object_adminc_objs(mock_rpsl_object, info))
+        result = await resolvers.resolve_rpsl_object_adminc_objs(mock_rpsl_object, info)
 
         assert result == EXPECTED_RPSL_GRAPHQL_OUTPUT
         assert flatten_mock_calls(mock_database_query) == [
@@ -248,7 +249,7 @@ class TestGraphQLResolvers:
             ["sources", (["source"],), {}],
         ]
 
-    def test_resolve_rpsl_object_techc_objs(self, prepare_resolver):
+    async def test_resolve_rpsl_object_techc_objs(self, prepare_resolver):
         info, mock_database_query, mock_query_resolver = prepare_resolver
 
         mock_rpsl_object = {
@@ -256,7 +257,7 @@ class TestGraphQLResolvers:
             "techC": "techC",
             "source": "source",
         }
-        result = list(resolvers.resolve_rpsl_object_techc_objs(mock_rpsl_object, info))
+        result = await resolvers.resolve_rpsl_object_techc_objs(mock_rpsl_object, info)
 
         assert result == EXPECTED_RPSL_GRAPHQL_OUTPUT
         assert flatten_mock_calls(mock_database_query) == [
@@ -265,7 +266,7 @@ class TestGraphQLResolvers:
             ["sources", (["source"],), {}],
         ]
 
-    def test_resolve_rpsl_object_members_by_ref_objs(self, prepare_resolver):
+    async def test_resolve_rpsl_object_members_by_ref_objs(self, prepare_resolver):
         info, mock_database_query, mock_query_resolver = prepare_resolver
 
         mock_rpsl_object = {
@@ -273,7 +274,7 @@ class TestGraphQLResolvers:
             "mbrsByRef": "mbrsByRef",
             "source": "source",
         }
-        result = list(resolvers.resolve_rpsl_object_members_by_ref_objs(mock_rpsl_object, info))
+        result = await resolvers.resolve_rpsl_object_members_by_ref_objs(mock_rpsl_object, info)
 
         assert result == EXPECTED_RPSL_GRAPHQL_OUTPUT
         assert flatten_mock_calls(mock_database_query) == [
@@ -282,7 +283,7 @@ class TestGraphQLResolvers:
             ["sources", (["source"],), {}],
         ]
 
-    def test_resolve_rpsl_object_member_of_objs(self, prepare_resolver):
+    async def test_resolve_rpsl_object_member_of_objs(self, prepare_resolver):
         info, mock_database_query, mock_query_resolver = prepare_resolver
 
         mock_rpsl_object = {
@@ -290,7 +291,7 @@ class TestGraphQLResolvers:
             "memberOf": "memberOf",
             "source": "source",
         }
-        result = list(resolvers.resolve_rpsl_object_member_of_objs(mock_rpsl_object, info))
+        result = await resolvers.resolve_rpsl_object_member_of_objs(mock_rpsl_object, info)
 
         assert result == EXPECTED_RPSL_GRAPHQL_OUTPUT
         assert flatten_mock_calls(mock_database_query) == [
@@ -299,7 +300,7 @@ class TestGraphQLResolvers:
             ["sources", (["source"],), {}],
         ]
 
-    def test_resolve_rpsl_object_members_objs(self, prepare_resolver):
+    async def test_resolve_rpsl_object_members_objs(self, prepare_resolver):
         info, mock_database_query, mock_query_resolver = prepare_resolver
 
         mock_rpsl_object = {
@@ -307,7 +308,7 @@ class TestGraphQLResolvers:
             "members": "members",
             "source": "source",
         }
-        result = list(resolvers.resolve_rpsl_object_members_objs(mock_rpsl_object, info))
+        result = await resolvers.resolve_rpsl_object_members_objs(mock_rpsl_object, info)
 
         assert result == EXPECTED_RPSL_GRAPHQL_OUTPUT
         assert flatten_mock_calls(mock_database_query) == [
@@ -321,7 +322,7 @@ class TestGraphQLResolvers:
             "members": "members",
             "source": "source",
         }
-        result = list(resolvers.resolve_rpsl_object_members_objs(mock_rpsl_object, info))
+        result = await resolvers.resolve_rpsl_object_members_objs(mock_rpsl_object, info)
 
         assert result == EXPECTED_RPSL_GRAPHQL_OUTPUT
         assert flatten_mock_calls(mock_database_query) == [
@@ -329,7 +330,7 @@ class TestGraphQLResolvers:
             ["rpsl_pks", (["members"],), {}],
         ]
 
-    def test_resolve_rpsl_object_journal(self, prepare_resolver, monkeypatch, config_override):
+    async def test_resolve_rpsl_object_journal(self, prepare_resolver, monkeypatch, config_override):
         info, mock_database_query, mock_query_resolver = prepare_resolver
 
         mock_journal_query = Mock(spec=RPSLDatabaseJournalQuery)
@@ -342,7 +343,7 @@ class TestGraphQLResolvers:
             "source": "source",
         }
         with pytest.raises(GraphQLError):
-            next(resolvers.resolve_rpsl_object_journal(mock_rpsl_object, info))
+            await resolvers.resolve_rpsl_object_journal(mock_rpsl_object, info)
 
         config_override(
             {
@@ -350,7 +351,7 @@ class TestGraphQLResolvers:
                 "sources": {"source": {"nrtm_access_list": "localhost"}},
             }
         )
-        result = list(resolvers.resolve_rpsl_object_journal(mock_rpsl_object, info))
+        result = await resolvers.resolve_rpsl_object_journal(mock_rpsl_object, info)
         assert len(result) == 1
         assert result[0]["origin"] == "auth_change"
         assert "CRYPT-PW DummyValue  # Filtered for security" in result[0]["objectText"]
@@ -393,8 +394,8 @@ class TestGraphQLResolvers:
 
     def test_resolve_as_set_prefixes(self, prepare_resolver):
         info, mock_database_query, mock_query_resolver = prepare_resolver
-        mock_query_resolver.routes_for_as_set = lambda set_name, ip_version, exclude_sets: [
-            f"prefix-{set_name}"
+        mock_query_resolver.routes_for_as_set = lambda set_name, ip_version, exclude_sets, aggregate: [
+            f"prefix-{set_name}-{aggregate}"
         ]
 
         result = list(
@@ -403,13 +404,14 @@ class TestGraphQLResolvers:
                 info,
                 set_names=["as-A", "AS-B"],
                 ip_version=4,
+                aggregate=True,
                 sql_trace=True,
             )
         )
         assert sorted(result, key=str) == sorted(
             [
-                {"rpslPk": "AS-A", "prefixes": ["prefix-AS-A"]},
-                {"rpslPk": "AS-B", "prefixes": ["prefix-AS-B"]},
+                {"rpslPk": "AS-A", "prefixes": ["prefix-AS-A-True"]},
+                {"rpslPk": "AS-B", "prefixes": ["prefix-AS-B-True"]},
             ],
             key=str,
         )
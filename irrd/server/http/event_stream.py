@@ -9,6 +9,7 @@ from typing import Any, Callable, List, Literal, Optional
 
 import pydantic
 import ujson
+from asgiref.sync import sync_to_async
 from starlette.endpoints import HTTPEndpoint, WebSocketEndpoint
 from starlette.requests import Request
 from starlette.responses import PlainTextResponse, Response, StreamingResponse
@@ -86,7 +87,8 @@ class EventStreamInitialDownloadGenerator:
                 f"event stream {self.host}: received request for initial download, "
                 f"copying data to temporary file {temp_csv.name}"
             )
-            postgres_copy.copy_to(
+            # COPY is not supported on asynchronous connections
+            await sync_to_async(postgres_copy.copy_to)(
                 source=query.finalise_statement(),
                 dest=temp_csv,
                 engine_or_conn=self.dh._connection,
@@ -222,7 +224,9 @@ class AsyncEventStreamFollower:
         stream_client = await AsyncEventStreamRedisClient.create()
         self = cls(host, database_handler, stream_client, callback)
 
-        journal_stats = next(self.database_handler.execute_query(RPSLDatabaseJournalStatisticsQuery()))
+        journal_stats = next(
+            await self.database_handler.execute_query_async(RPSLDatabaseJournalStatisticsQuery())
+        )
         max_serial_global = journal_stats["max_serial_global"]
 
         if after_global_serial is not None:
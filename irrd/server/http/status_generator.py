@@ -7,7 +7,12 @@ from beautifultable import BeautifulTable
 from irrd import __version__
 from irrd.conf import get_setting
 from irrd.conf.defaults import DEFAULT_SOURCE_NRTM_PORT
-from irrd.storage.database_handler import DatabaseHandler, is_serial_synchronised
+from irrd.storage import get_engine_pool_status
+from irrd.storage.database_handler import (
+    DatabaseHandler,
+    compiled_statement_cache,
+    is_serial_synchronised,
+)
 from irrd.storage.queries import DatabaseStatusQuery, RPSLDatabaseObjectStatisticsQuery
 from irrd.utils.whois_client import whois_query_source_status
 
@@ -39,10 +44,33 @@ class StatusGenerator:
         Generate the header of the report, containing basic info like version
         and time until the next mirror update.
         """
-        return textwrap.dedent(f"""
+        header = textwrap.dedent(f"""
         IRRD version {__version__}
         Listening on {get_setting('server.whois.interface')} port {get_setting('server.whois.port')}
         """).lstrip()
+        pool_status = get_engine_pool_status()
+        if pool_status:
+            # The pool is per process, so this only reflects the HTTP worker handling this request
+            header += (
+                f"Database connection pool of this worker: {pool_status['checked_out']} in use, "
+                f"{pool_status['checked_in']} idle, {pool_status['overflow']} overflow, "
+                f"{pool_status['connections_created']} connections created, "
+                f"{pool_status['checkouts']} checkouts\n"
+            )
+            async_pool_status = pool_status["async_pool"]
+            header += (
+                f"Asynchronous database connection pool of this worker: {async_pool_status['checked_out']} in"
+                f" use, {async_pool_status['checked_in']} idle, {async_pool_status['waiting']} waiting,"
+                f" {async_pool_status['connections_created']} connections created,"
+                f" {async_pool_status['checkouts']} checkouts, {async_pool_status['failed_pings']} failed"
+                " pings\n"
+            )
+        cache_statistics = compiled_statement_cache.statistics()
+        header += (
+            f"Compiled statement cache of this worker: {cache_statistics['hits']} hits, "
+            f"{cache_statistics['misses']} misses, {cache_statistics['size']} statements\n"
+        )
+        return header
 
     def _generate_statistics_table(self) -> str:
         """
@@ -40,6 +40,30 @@ class TestStatusGenerator:
                 raise socket.timeout()
 
         monkeypatch.setattr("irrd.server.http.status_generator.whois_query_source_status", mock_whois_query)
+        monkeypatch.setattr(
+            "irrd.server.http.status_generator.compiled_statement_cache",
+            Mock(statistics=lambda: {"hits": 10, "misses": 2, "size": 2}),
+        )
+        monkeypatch.setattr(
+            "irrd.server.http.status_generator.get_engine_pool_status",
+            lambda: {
+                "size": 50,
+                "checked_in": 3,
+                "checked_out": 1,
+                "overflow": -46,
+                "connections_created": 4,
+                "checkouts": 12,
+                "async_pool": {
+                    "size": 50,
+                    "checked_in": 2,
+                    "checked_out": 5,
+                    "waiting": 0,
+                    "connections_created": 7,
+                    "checkouts": 30,
+                    "failed_pings": 1,
+                },
+            },
+        )
 
         config_override(
             {
@@ -136,6 +160,9 @@ class TestStatusGenerator:
         expected_report = textwrap.dedent(f"""
             IRRD version {__version__}
             Listening on ::0 port {get_setting('server.whois.port')}
+            Database connection pool of this worker: 1 in use, 3 idle, -46 overflow, 4 connections created, 12 checkouts
+            Asynchronous database connection pool of this worker: 5 in use, 2 idle, 0 waiting, 7 connections created, 30 checkouts, 1 failed pings
+            Compiled statement cache of this worker: 10 hits, 2 misses, 2 statements
             
             
             -----------------------------------------------------------------------
@@ -3,6 +3,7 @@ from collections import OrderedDict
 from enum import Enum
 from typing import Any, Dict, List, Optional, Set, Tuple
 
+import ujson
 from IPy import IP
 from pytz import timezone
 
@@ -40,13 +41,19 @@ class QueryResolver:
 
     Some aspects like setting sources retain state, so a single instance
     should not be shared across unrelated query sessions.
+
+    If stream_results is set, RPSL object searches that may return many
+    objects are streamed from the database, rather than fetched at once.
+    The caller must then consume each response before running another query.
     """
 
     lookup_field_names = lookup_field_names()
     database_handler: DatabaseHandler
     _current_set_root_object_class: Optional[str]
 
-    def __init__(self, preloader: Preloader, database_handler: DatabaseHandler) -> None:
+    def __init__(
+        self, preloader: Preloader, database_handler: DatabaseHandler, stream_results: bool = False
+    ) -> None:
         self.all_valid_sources = list(get_setting("sources", {}).keys())
         self.sources_default = list(get_setting("sources_default", []))
         self.sources: List[str] = self.sources_default if self.sources_default else self.all_valid_sources
@@ -60,7 +67,9 @@ class QueryResolver:
         self.user_agent: Optional[str] = None
         self.preloader = preloader
         self.database_handler = database_handler
+        self.stream_results = stream_results
         self.sql_queries: List[str] = []
+        self.sql_query_count = 0
         self.sql_trace = False
 
     def set_query_sources(self, sources: Optional[List[str]]) -> None:
@@ -91,7 +100,7 @@ class QueryResolver:
 
     def rpsl_text_search(self, value: str) -> RPSLDatabaseResponse:
         query = self._prepare_query(ordered_by_sources=False).text_search(value)
-        return self._execute_query(query)
+        return self._execute_query(query, stream_results=self.stream_results)
 
     def route_search(self, address: IP, lookup_type: RouteLookupType):
         """Route(6) object search for an address, supporting exact/less/more specific."""
@@ -103,7 +112,7 @@ class QueryResolver:
             RouteLookupType.MORE_SPECIFIC_WITHOUT_EXACT: query.ip_more_specific,
         }
         query = lookup_queries[lookup_type](address)
-        return self._execute_query(query)
+        return self._execute_query(query, stream_results=self.stream_results)
 
     def rpsl_attribute_search(self, attribute: str, value: str) -> RPSLDatabaseResponse:
         """
@@ -119,28 +128,49 @@ class QueryResolver:
             )
             raise InvalidQueryException(msg)
         query = self._prepare_query(ordered_by_sources=False).lookup_attr(attribute, value)
-        return self._execute_query(query)
+        return self._execute_query(query, stream_results=self.stream_results)
 
-    def routes_for_origin(self, origin: str, ip_version: Optional[int] = None) -> Set[str]:
+    def routes_for_origin(self, origin: str, ip_version: Optional[int] = None) -> List[str]:
         """
-        Resolve all route(6)s prefixes for an origin, returning a set
-        of all prefixes. Origin must be in 'ASxxx' format.
+        Resolve all route(6)s prefixes for an origin, returning a sorted list
+        of all unique prefixes. Origin must be in 'ASxxx' format.
         """
         prefixes = self.preloader.routes_for_origins([origin], self.sources, ip_version=ip_version)
         return prefixes
 
     def routes_for_as_set(
-        self, set_name: str, ip_version: Optional[int] = None, exclude_sets: Optional[Set[str]] = None
-    ) -> Set[str]:
+        self,
+        set_name: str,
+        ip_version: Optional[int] = None,
+        exclude_sets: Optional[Set[str]] = None,
+        aggregate: bool = False,
+    ) -> List[str]:
         """
         Find all originating prefixes for all members of an AS-set. May be restricted
-        to IPv4 or IPv6. Returns a set of all prefixes.
+        to IPv4 or IPv6. Returns a sorted list of all unique prefixes.
+        If aggregate is set, adjacent and covered prefixes are merged.
         """
         self._current_set_root_object_class = "as-set"
         self._current_excluded_sets = exclude_sets if exclude_sets else set()
         self._current_set_maximum_depth = 0
-        members = self._recursive_set_resolve({set_name})
-        return self.preloader.routes_for_origins(members, self.sources, ip_version=ip_version)
+
+        if self._set_graph_usable():
+            members = self._recursive_set_resolve({set_name})
+        else:
+            # The set members cache only covers what the set graph can not:
+            # queries with non-default filters, or before the graph is loaded.
+            cache_key = self._set_members_cache_key("as-set", set_name)
+            cache_generation = self.preloader.set_members_cache_generation()
+            members = self.preloader.get_cached_set_members(cache_key, cache_generation)
+            if members is None:
+                members = self._recursive_set_resolve({set_name})
+                self.preloader.store_cached_set_members(
+                    cache_key, cache_generation, members, route_dependent=False
+                )
+
+        return self.preloader.routes_for_origins(
+            members, self.sources, ip_version=ip_version, aggregate=aggregate
+        )
 
     def members_for_set_per_source(
         self, parameter: str, exclude_sets: Optional[Set[str]] = None, depth=0, recursive=False
@@ -184,11 +214,33 @@ class QueryResolver:
         self._current_set_root_object_class = None
         self._current_excluded_sets = exclude_sets if exclude_sets else set()
         self._current_set_maximum_depth = depth
-        if not recursive:
-            members, leaf_members = self._find_set_members({parameter}, limit_source=root_source)
-            members.update(leaf_members)
+        sql_query_count_start = self.sql_query_count
+
+        if self._set_graph_usable():
+            members = self._resolve_members_for_set(parameter, recursive, root_source)
         else:
-            members = self._recursive_set_resolve({parameter}, root_source=root_source)
+            # See routes_for_as_set() - the set members cache is only used
+            # when the set graph is not.
+            cache_key = self._set_members_cache_key(
+                "recursive" if recursive else "direct", parameter, root_source=root_source, depth=depth
+            )
+            cache_generation = self.preloader.set_members_cache_generation()
+            members = self.preloader.get_cached_set_members(cache_key, cache_generation)
+            if members is None:
+                members = self._resolve_members_for_set(parameter, recursive, root_source)
+                # Route-sets can include route(6) objects through mbrs-by-ref,
+                # and prefixes from the preload store for AS members.
+                self.preloader.store_cached_set_members(
+                    cache_key,
+                    cache_generation,
+                    members,
+                    route_dependent=self._current_set_root_object_class == "route-set",
+                )
+        logger.debug(
+            f"Resolved members of set {parameter} (recursive: {recursive}) with "
+            f"{self.sql_query_count - sql_query_count_start} SQL queries"
+        )
+
         if parameter in members:
             members.remove(parameter)
 
@@ -208,6 +260,50 @@ class QueryResolver:
 
         return sorted(members)
 
+    def _resolve_members_for_set(
+        self, parameter: str, recursive: bool, root_source: Optional[str] = None
+    ) -> Set[str]:
+        if not recursive:
+            members, leaf_members = self._find_set_members({parameter}, limit_source=root_source)
+            members.update(leaf_members)
+            return members
+        return self._recursive_set_resolve({parameter}, root_source=root_source)
+
+    def _set_graph_usable(self) -> bool:
+        """
+        Whether sets can be resolved from the in-memory set membership graph.
+        The graph only contains objects visible with the default filters.
+        """
+        default_filters = (
+            (self.rpki_invalid_filter_enabled or not self.rpki_aware)
+            and self.out_scope_filter_enabled
+            and self.route_preference_filter_enabled
+        )
+        return default_filters and not self.object_class_filter and self.preloader.set_graph_loaded()
+
+    def _set_members_cache_key(
+        self, resolve_type: str, set_name: str, root_source: Optional[str] = None, depth: int = 0
+    ) -> str:
+        """
+        Key for the set members cache, which includes all state of this
+        resolver that may affect the result of resolving set_name.
+        The cache is only used if _set_graph_usable() is False, as
+        resolving from the set graph needs no cache.
+        """
+        return ujson.encode(
+            [
+                resolve_type,
+                set_name,
+                root_source,
+                depth,
+                self.sources,
+                sorted(self._current_excluded_sets),
+                self.rpki_invalid_filter_enabled,
+                self.out_scope_filter_enabled,
+                self.route_preference_filter_enabled,
+            ]
+        )
+
     def _recursive_set_resolve(
         self, members: Set[str], sets_seen=None, root_source: Optional[str] = None
     ) -> Set[str]:
@@ -285,18 +381,26 @@ class QueryResolver:
           names for which no further data could be found - for
           example references to non-existent other sets
         """
-        members: Set[str] = set()
-        sets_already_resolved: Set[str] = set()
-
-        columns = ["parsed_data", "rpsl_pk", "source", "object_class"]
-        query = self._prepare_query(column_names=columns)
-
         object_classes = ["as-set", "route-set"]
         # Per RFC 2622 5.3, route-sets can refer to as-sets,
         # but as-sets can only refer to other as-sets.
         if self._current_set_root_object_class == "as-set":
             object_classes = [self._current_set_root_object_class]
 
+        if self._set_graph_usable():
+            members, leaf_members, root_object_class = self.preloader.find_set_members(
+                set_names, self.sources, object_classes, limit_source
+            )
+            if not self._current_set_root_object_class:
+                self._current_set_root_object_class = root_object_class
+            return members, leaf_members
+
+        members: Set[str] = set()
+        sets_already_resolved: Set[str] = set()
+
+        columns = ["parsed_data", "rpsl_pk", "source", "object_class"]
+        query = self._prepare_query(column_names=columns)
+
         query = query.object_classes(object_classes).rpsl_pks(set_names)
         if limit_source:
             query = query.sources([limit_source])
@@ -313,6 +417,10 @@ class QueryResolver:
         if not self._current_set_root_object_class:
             self._current_set_root_object_class = query_result[0]["object_class"]
 
+        # Sets with mbrs-by-ref, per object class of the objects that may refer
+        # to them, with the maintainers permitted in mbrs-by-ref, or None for ANY.
+        mbrs_by_ref_sets: Dict[Tuple[str, ...], Dict[str, Optional[Set[str]]]] = {}
+
         for result in query_result:
             rpsl_pk = result["rpsl_pk"]
 
@@ -334,25 +442,55 @@ class QueryResolver:
             if not rpsl_pk or not object_class or not mbrs_by_ref:
                 continue
 
-            # If mbrs-by-ref is set, find any objects with member-of pointing to the route/as-set
-            # under query, and include a maintainer listed in mbrs-by-ref, unless mbrs-by-ref
-            # is set to ANY.
-            query_object_class = ["route", "route6"] if object_class == "route-set" else ["aut-num"]
-            query = self._prepare_query(column_names=columns).object_classes(query_object_class)
-            query = query.lookup_attrs_in(["member-of"], [rpsl_pk])
-
-            if "ANY" not in [m.strip().upper() for m in mbrs_by_ref]:
-                query = query.lookup_attrs_in(["mnt-by"], mbrs_by_ref)
-
-            referring_objects = self._execute_query(query)
+            referring_object_classes = ("route", "route6") if object_class == "route-set" else ("aut-num",)
+            mbrs_by_ref_maintainers = {m.strip().upper() for m in mbrs_by_ref}
+            mbrs_by_ref_sets.setdefault(referring_object_classes, {})[rpsl_pk.upper()] = (
+                None if "ANY" in mbrs_by_ref_maintainers else mbrs_by_ref_maintainers
+            )
 
-            for result in referring_objects:
-                member_object_class = result["object_class"]
-                members.add(result["parsed_data"][member_object_class])
+        # If mbrs-by-ref is set, find any objects with member-of pointing to the route/as-set
+        # under query, and include a maintainer listed in mbrs-by-ref, unless mbrs-by-ref
+        # is set to ANY. This is done with one query for all sets resolved in this
+        # call, per referring object class, and the maintainers are checked per set.
+        for referring_object_classes, set_maintainers in mbrs_by_ref_sets.items():
+            members.update(self._find_mbrs_by_ref_members(list(referring_object_classes), set_maintainers))
 
         leaf_members = set_names - sets_already_resolved
         return members, leaf_members
 
+    def _find_mbrs_by_ref_members(
+        self, object_classes: List[str], set_maintainers: Dict[str, Optional[Set[str]]]
+    ) -> Set[str]:
+        """
+        Find the members included in sets by mbrs-by-ref, in a single query.
+        set_maintainers contains the set names as keys, and the maintainers
+        permitted by mbrs-by-ref as values, or None if any maintainer is permitted.
+        """
+        members: Set[str] = set()
+        query = self._prepare_query(column_names=["parsed_data", "object_class"])
+        query = query.object_classes(object_classes).lookup_attrs_in(["member-of"], list(set_maintainers))
+        all_maintainers = set()
+        for maintainers in set_maintainers.values():
+            if maintainers is None:
+                break
+            all_maintainers.update(maintainers)
+        else:
+            # No sets with ANY, so the maintainers can be filtered in the query.
+            query = query.lookup_attrs_in(["mnt-by"], sorted(all_maintainers))
+
+        for result in self._execute_query(query):
+            object_data = result["parsed_data"]
+            mnt_by = {m.upper() for m in object_data.get("mnt-by", [])}
+            for set_name in object_data.get("member-of", []):
+                try:
+                    maintainers = set_maintainers[set_name.strip().upper()]
+                except KeyError:
+                    continue
+                if maintainers is None or not maintainers.isdisjoint(mnt_by):
+                    members.add(object_data[result["object_class"]])
+                    break
+        return members
+
     def database_status(
         self, sources: Optional[List[str]] = None
     ) -> "OrderedDict[str, OrderedDict[str, Any]]":
@@ -423,7 +561,10 @@ class QueryResolver:
         self.object_class_filter = []
         return query
 
-    def _execute_query(self, query) -> RPSLDatabaseResponse:
+    def _execute_query(self, query, stream_results=False) -> RPSLDatabaseResponse:
+        self.sql_query_count += 1
         if self.sql_trace:
             self.sql_queries.append(repr(query))
-        return self.database_handler.execute_query(query, refresh_on_error=True)
+        return self.database_handler.execute_query(
+            query, refresh_on_error=True, stream_results=stream_results
+        )
@@ -59,6 +59,9 @@ def prepare_resolver(monkeypatch, config_override):
         lambda columns=None, ordered_by_sources=True: mock_database_query,
     )
     mock_preloader = Mock(spec=Preloader)
+    mock_preloader.set_members_cache_generation = Mock(return_value=(1, 1))
+    mock_preloader.get_cached_set_members = Mock(return_value=None)
+    mock_preloader.set_graph_loaded = Mock(return_value=False)
 
     resolver = QueryResolver(mock_preloader, mock_database_handler)
     resolver.out_scope_filter_enabled = False
@@ -109,7 +112,9 @@ def prepare_resolver(monkeypatch, config_override):
             "source": "TEST2",
         },
     ]
-    mock_database_handler.execute_query = lambda query, refresh_on_error=False: mock_query_result
+    mock_database_handler.execute_query = (
+        lambda query, refresh_on_error=False, stream_results=False: mock_query_result
+    )
 
     yield mock_database_query, mock_database_handler, mock_preloader, mock_query_result, resolver
 
@@ -207,6 +212,24 @@ class TestQueryResolver:
             ["text_search", ("query",), {}],
         ]
 
+    def test_stream_results(self, prepare_resolver):
+        mock_dq, mock_dh, mock_preloader, mock_query_result, resolver = prepare_resolver
+        stream_results_calls = []
+
+        def mock_execute_query(query, refresh_on_error=False, stream_results=False):
+            stream_results_calls.append(stream_results)
+            return mock_query_result
+
+        mock_dh.execute_query = mock_execute_query
+        resolver.stream_results = True
+
+        resolver.key_lookup("route", "192.0.2.0/25")
+        resolver.rpsl_text_search("query")
+        resolver.route_search(IP("192.0.2.0/25"), RouteLookupType.EXACT)
+        resolver.rpsl_attribute_search("mnt-by", "MNT-TEST")
+        # Only the searches that may return many objects are streamed
+        assert stream_results_calls == [False, True, True, True]
+
     def test_route_search_exact(self, prepare_resolver):
         mock_dq, mock_dh, mock_preloader, mock_query_result, resolver = prepare_resolver
 
@@ -346,7 +369,7 @@ class TestQueryResolver:
             ["lookup_attr", ("mnt-by", "MNT-TEST"), {}],
         ]
 
-        mock_dh.execute_query = lambda query, refresh_on_error=False: []
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: []
         with pytest.raises(InvalidQueryException):
             resolver.rpsl_attribute_search("invalid-attr", "MNT-TEST")
 
@@ -375,9 +398,13 @@ class TestQueryResolver:
         )
 
         mock_preloader.routes_for_origins = Mock(return_value=[])
-        result = resolver.routes_for_as_set("AS65547", 4)
+        result = resolver.routes_for_as_set("AS65547", 4, aggregate=True)
         assert flatten_mock_calls(mock_preloader.routes_for_origins) == [
-            ["", ({"AS65547", "AS65548"}, resolver.all_valid_sources), {"ip_version": 4}],
+            [
+                "",
+                ({"AS65547", "AS65548"}, resolver.all_valid_sources),
+                {"ip_version": 4, "aggregate": True},
+            ],
         ]
         assert not result
 
@@ -387,7 +414,11 @@ class TestQueryResolver:
         assert resolver._current_set_root_object_class == "as-set"
         assert result == {"192.0.2.0/25", "192.0.2.128/25"}
         assert flatten_mock_calls(mock_preloader.routes_for_origins) == [
-            ["", ({"AS65547", "AS65548"}, resolver.all_valid_sources), {"ip_version": None}],
+            [
+                "",
+                ({"AS65547", "AS65548"}, resolver.all_valid_sources),
+                {"ip_version": None, "aggregate": False},
+            ],
         ]
 
         assert not mock_dq.mock_calls
@@ -440,7 +471,9 @@ class TestQueryResolver:
                 "source": "TEST2",
             },
         ]
-        mock_dh.execute_query = lambda query, refresh_on_error=False: iter(mock_query_result1)
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: iter(
+            mock_query_result1
+        )
 
         result = resolver.members_for_set("AS-FIRSTLEVEL", recursive=False)
         assert result == ["AS-2nd-UNKNOWN", "AS-SECONDLEVEL", "AS65547"]
@@ -454,7 +487,9 @@ class TestQueryResolver:
         mock_query_iterator = iter(
             [mock_query_result1, mock_query_result2, mock_query_result3, [], mock_query_result1, []]
         )
-        mock_dh.execute_query = lambda query, refresh_on_error=False: iter(next(mock_query_iterator))
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: iter(
+            next(mock_query_iterator)
+        )
 
         result = resolver.members_for_set("AS-FIRSTLEVEL", recursive=True)
         assert result == ["AS65544", "AS65545", "AS65547"]
@@ -478,7 +513,7 @@ class TestQueryResolver:
         assert result == ["AS-2nd-UNKNOWN", "AS-SECONDLEVEL", "AS65547"]
         mock_dq.reset_mock()
 
-        mock_dh.execute_query = lambda query, refresh_on_error=False: iter([])
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: iter([])
         result = resolver.members_for_set("AS-NOTEXIST", recursive=True)
         assert not result
         assert flatten_mock_calls(mock_dq) == [
@@ -488,7 +523,7 @@ class TestQueryResolver:
         ]
         mock_dq.reset_mock()
 
-        mock_dh.execute_query = lambda query, refresh_on_error=False: iter([])
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: iter([])
         result = resolver.members_for_set("AS-NOTEXIST", recursive=True, root_source="ROOT")
         assert not result
         assert flatten_mock_calls(mock_dq) == [
@@ -535,7 +570,9 @@ class TestQueryResolver:
             },
         ]
         mock_query_iterator = iter([mock_query_result1, mock_query_result2, mock_query_result3, []])
-        mock_dh.execute_query = lambda query, refresh_on_error=False: iter(next(mock_query_iterator))
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: iter(
+            next(mock_query_iterator)
+        )
         mock_preloader.routes_for_origins = Mock(return_value=["192.0.2.128/25"])
 
         result = resolver.members_for_set("RS-FIRSTLEVEL", recursive=True)
@@ -551,6 +588,76 @@ class TestQueryResolver:
             ["object_classes", (["as-set", "route-set"],), {}],
             ["rpsl_pks", ({"AS-REFERRED"},), {}],
         ]
+        assert flatten_mock_calls(mock_preloader.store_cached_set_members) == [
+            [
+                "",
+                (
+                    resolver._set_members_cache_key("recursive", "RS-FIRSTLEVEL"),
+                    (1, 1),
+                    {"192.0.2.0/26^32", "192.0.2.0/25", "192.0.2.128/25"},
+                ),
+                {"route_dependent": True},
+            ]
+        ]
+
+    def test_set_members_cached(self, prepare_resolver):
+        mock_dq, mock_dh, mock_preloader, mock_query_result, resolver = prepare_resolver
+        mock_preloader.get_cached_set_members = Mock(return_value={"AS-FOO", "AS65547"})
+        mock_preloader.routes_for_origins = Mock(return_value=["192.0.2.0/25"])
+
+        result = resolver.members_for_set("AS-FOO", recursive=True, depth=2)
+        assert result == ["AS65547"]
+        assert flatten_mock_calls(mock_preloader.get_cached_set_members) == [
+            ["", (resolver._set_members_cache_key("recursive", "AS-FOO", depth=2), (1, 1)), {}],
+        ]
+
+        result = resolver.routes_for_as_set("AS-FOO", exclude_sets={"AS-BAR"})
+        assert result == ["192.0.2.0/25"]
+        assert (
+            resolver._set_members_cache_key("as-set", "AS-FOO")
+            == '["as-set","AS-FOO",null,0,["TEST1","TEST2"],["AS-BAR"],false,false,false]'
+        )
+        assert not mock_dq.mock_calls
+        assert not mock_preloader.store_cached_set_members.mock_calls
+
+    def test_set_members_from_set_graph(self, prepare_resolver):
+        mock_dq, mock_dh, mock_preloader, mock_query_result, resolver = prepare_resolver
+        resolver.out_scope_filter_enabled = True
+        resolver.route_preference_filter_enabled = True
+        mock_preloader.set_graph_loaded = Mock(return_value=True)
+        set_graph_results = iter(
+            [
+                ({"AS-SECOND", "AS65547"}, set(), "as-set"),
+                ({"AS65548"}, {"AS-UNKNOWN"}, "as-set"),
+            ]
+        )
+        mock_preloader.find_set_members = Mock(side_effect=lambda *args: next(set_graph_results))
+
+        result = resolver.members_for_set("AS-FIRST", recursive=True)
+        assert result == ["AS65547", "AS65548"]
+        assert flatten_mock_calls(mock_preloader.find_set_members) == [
+            ["", ({"AS-FIRST"}, ["TEST1", "TEST2"], ["as-set", "route-set"], None), {}],
+            ["", ({"AS-SECOND"}, ["TEST1", "TEST2"], ["as-set"], None), {}],
+        ]
+        assert not mock_dq.mock_calls
+
+        mock_preloader.find_set_members = Mock(return_value=({"AS65547"}, set(), "as-set"))
+        mock_preloader.routes_for_origins = Mock(return_value=["192.0.2.0/25"])
+        assert resolver.routes_for_as_set("AS-FIRST") == ["192.0.2.0/25"]
+        assert not mock_dq.mock_calls
+
+        # The set members cache is only used when the set graph is not
+        assert not mock_preloader.set_members_cache_generation.mock_calls
+        assert not mock_preloader.get_cached_set_members.mock_calls
+        assert not mock_preloader.store_cached_set_members.mock_calls
+
+        # The set graph only contains objects visible with the default filters
+        resolver.disable_out_of_scope_filter()
+        mock_preloader.find_set_members = Mock()
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: iter([])
+        assert resolver.members_for_set("AS-FIRST", recursive=True) == []
+        assert not mock_preloader.find_set_members.mock_calls
+        assert mock_preloader.get_cached_set_members.mock_calls
 
     def test_as_route_set_mbrs_by_ref(self, prepare_resolver):
         mock_dq, mock_dh, mock_preloader, mock_query_result, resolver = prepare_resolver
@@ -577,7 +684,7 @@ class TestQueryResolver:
                 "rpsl_pk": "192.0.2.0/24,AS65544",
                 "parsed_data": {
                     "route": "192.0.2.0/24",
-                    "member-of": "rrs-test",
+                    "member-of": ["rrs-test"],
                     "mnt-by": ["FOO", "MNT-TEST"],
                 },
                 "object_text": "text",
@@ -586,7 +693,9 @@ class TestQueryResolver:
             },
         ]
         mock_query_iterator = iter([mock_query_result1, mock_query_result2, [], [], []])
-        mock_dh.execute_query = lambda query, refresh_on_error=False: iter(next(mock_query_iterator))
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: iter(
+            next(mock_query_iterator)
+        )
 
         result = resolver.members_for_set("RRS-TEST", recursive=True)
         assert result == ["192.0.2.0/24", "192.0.2.0/32", "2001:db8::/32"]
@@ -615,6 +724,69 @@ class TestQueryResolver:
             ["lookup_attrs_in", (["member-of"], ["RRS-TEST"]), {}],
         ]
 
+    def test_as_set_mbrs_by_ref_batched(self, prepare_resolver):
+        mock_dq, mock_dh, mock_preloader, mock_query_result, resolver = prepare_resolver
+
+        mock_query_result1 = [
+            {
+                "rpsl_pk": "AS-FIRST",
+                "parsed_data": {"as-set": "AS-FIRST", "members": ["AS-SECOND", "AS-THIRD"]},
+                "object_class": "as-set",
+                "source": "TEST1",
+            },
+        ]
+        mock_query_result2 = [
+            {
+                "rpsl_pk": "AS-SECOND",
+                "parsed_data": {"as-set": "AS-SECOND", "mbrs-by-ref": ["MNT-SECOND"]},
+                "object_class": "as-set",
+                "source": "TEST1",
+            },
+            {
+                "rpsl_pk": "AS-THIRD",
+                "parsed_data": {"as-set": "AS-THIRD", "mbrs-by-ref": ["MNT-THIRD"]},
+                "object_class": "as-set",
+                "source": "TEST1",
+            },
+        ]
+        # One query returns the referring objects for both sets in this level.
+        mock_query_result3 = [
+            {
+                "parsed_data": {"aut-num": "AS65537", "member-of": ["AS-SECOND"], "mnt-by": ["MNT-SECOND"]},
+                "object_class": "aut-num",
+            },
+            {
+                # Maintainer is only permitted for AS-THIRD
+                "parsed_data": {"aut-num": "AS65538", "member-of": ["AS-SECOND"], "mnt-by": ["MNT-THIRD"]},
+                "object_class": "aut-num",
+            },
+            {
+                "parsed_data": {
+                    "aut-num": "AS65539",
+                    "member-of": ["AS-SECOND", "as-third"],
+                    "mnt-by": ["MNT-THIRD"],
+                },
+                "object_class": "aut-num",
+            },
+        ]
+        mock_query_iterator = iter([mock_query_result1, mock_query_result2, mock_query_result3])
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: iter(
+            next(mock_query_iterator)
+        )
+
+        mock_dq.reset_mock()
+        result = resolver.members_for_set("AS-FIRST", recursive=True)
+        assert result == ["AS65537", "AS65539"]
+        assert flatten_mock_calls(mock_dq)[-4:] == [
+            ["sources", (["TEST1", "TEST2"],), {}],
+            ["object_classes", (["aut-num"],), {}],
+            ["lookup_attrs_in", (["member-of"], ["AS-SECOND", "AS-THIRD"]), {}],
+            ["lookup_attrs_in", (["mnt-by"], ["MNT-SECOND", "MNT-THIRD"]), {}],
+        ]
+        # One query for each level, plus one for the mbrs-by-ref references
+        # of all sets in the second level
+        assert resolver.sql_query_count == 3
+
     def test_route_set_compatibility_ipv4_only_route_set_members(self, prepare_resolver, config_override):
         mock_dq, mock_dh, mock_preloader, mock_query_result, resolver = prepare_resolver
 
@@ -632,7 +804,7 @@ class TestQueryResolver:
                 "source": "TEST1",
             },
         ]
-        mock_dh.execute_query = lambda query, refresh_on_error=False: mock_query_result
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: mock_query_result
 
         result = resolver.members_for_set("RS-TEST", recursive=False)
         assert result == ["192.0.2.0/32", "192.0.2.1/32", "2001:db8::/32", "RS-OTHER"]
@@ -695,7 +867,9 @@ class TestQueryResolver:
             ]
         )
 
-        mock_dh.execute_query = lambda query, refresh_on_error=False: next(mock_query_result)
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: next(
+            mock_query_result
+        )
 
         result = resolver.members_for_set_per_source("AS-TEST", recursive=True)
         assert result == {"TEST1": ["AS65547", "AS65548"], "TEST2": ["AS65549"]}
@@ -757,7 +931,7 @@ class TestQueryResolver:
                 "updated": datetime.datetime(2020, 1, 1, tzinfo=timezone("UTC")),
             },
         ]
-        mock_dh.execute_query = lambda query, refresh_on_error=False: mock_query_result
+        mock_dh.execute_query = lambda query, refresh_on_error=False, stream_results=False: mock_query_result
 
         result = resolver.database_status()
         expected_test1_result = (
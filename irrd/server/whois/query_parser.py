@@ -1,6 +1,6 @@
 import logging
 import re
-from typing import Optional
+from typing import Iterator, List, Optional, Union
 
 import ujson
 from IPy import IP
@@ -23,13 +23,18 @@ from irrd.utils.validators import ValidationError, parse_as_number
 
 from ..access_check import is_client_permitted
 from .query_response import (
+    StreamedResult,
     WhoisQueryResponse,
     WhoisQueryResponseMode,
     WhoisQueryResponseType,
+    strip_chunks,
 )
 
 logger = logging.getLogger(__name__)
 
+# Number of items per chunk when joining lists for a StreamedResult
+JOIN_CHUNK_ITEMS = 10000
+
 
 class WhoisQueryParser:
     """
@@ -42,11 +47,21 @@ class WhoisQueryParser:
     Some query flags, particularly -k/!! and -s/!s retain state across queries,
     so a single instance of this object should be created per session, with
     handle_query() being called for each individual query.
+
+    If stream_results is set, large results, like RPSL objects or prefix lists,
+    are returned as a StreamedResult rather than a string, so that the
+    response can be generated while sending it.
     """
 
     def __init__(
-        self, client_ip: str, client_str: str, preloader: Preloader, database_handler: DatabaseHandler
+        self,
+        client_ip: str,
+        client_str: str,
+        preloader: Preloader,
+        database_handler: DatabaseHandler,
+        stream_results: bool = False,
     ) -> None:
+        self.stream_results = stream_results
         self.multiple_command_mode = False
         self.timeout = SOCKET_DEFAULT_TIMEOUT
         self.key_fields_only = False
@@ -56,6 +71,7 @@ class WhoisQueryParser:
         self.query_resolver = QueryResolver(
             preloader=preloader,
             database_handler=database_handler,
+            stream_results=stream_results,
         )
 
     def handle_query(self, query: str) -> WhoisQueryResponse:
@@ -208,15 +224,15 @@ class WhoisQueryParser:
         else:
             raise InvalidQueryException(f"Invalid value for timeout: {timeout}")
 
-    def handle_irrd_routes_for_origin_v4(self, origin: str) -> str:
+    def handle_irrd_routes_for_origin_v4(self, origin: str) -> Union[str, StreamedResult]:
         """!g query - find all originating IPv4 prefixes from an origin, e.g. !gAS65537"""
         return self._routes_for_origin(origin, 4)
 
-    def handle_irrd_routes_for_origin_v6(self, origin: str) -> str:
+    def handle_irrd_routes_for_origin_v6(self, origin: str) -> Union[str, StreamedResult]:
         """!6 query - find all originating IPv6 prefixes from an origin, e.g. !6as65537"""
         return self._routes_for_origin(origin, 6)
 
-    def _routes_for_origin(self, origin: str, ip_version: Optional[int] = None) -> str:
+    def _routes_for_origin(self, origin: str, ip_version: Optional[int] = None) -> Union[str, StreamedResult]:
         """
         Resolve all route(6)s prefixes for an origin, returning a space-separated list
         of all originating prefixes, not including duplicates.
@@ -227,12 +243,18 @@ class WhoisQueryParser:
             raise InvalidQueryException(str(ve))
 
         prefixes = self.query_resolver.routes_for_origin(origin_formatted, ip_version)
-        return " ".join(prefixes)
+        return self._join_query_output(prefixes)
 
-    def handle_irrd_routes_for_as_set(self, set_name: str) -> str:
+    def handle_irrd_routes_for_as_set(self, set_name: str) -> Union[str, StreamedResult]:
         """
         !a query - find all originating prefixes for all members of an AS-set, e.g. !a4AS-FOO or !a6AS-FOO
+        Appending ,a aggregates the prefixes, e.g. !a4AS-FOO,a
         """
+        aggregate = False
+        if set_name.lower().endswith(",a"):
+            aggregate = True
+            set_name = set_name[:-2]
+
         ip_version: Optional[int] = None
         if set_name.startswith("4"):
             set_name = set_name[1:]
@@ -244,10 +266,10 @@ class WhoisQueryParser:
         if not set_name:
             raise InvalidQueryException("Missing required set name for A query")
 
-        prefixes = self.query_resolver.routes_for_as_set(set_name, ip_version)
-        return " ".join(prefixes)
+        prefixes = self.query_resolver.routes_for_as_set(set_name, ip_version, aggregate=aggregate)
+        return self._join_query_output(prefixes)
 
-    def handle_irrd_set_members(self, parameter: str) -> str:
+    def handle_irrd_set_members(self, parameter: str) -> Union[str, StreamedResult]:
         """
         !i query - find all members of an as-set or route-set, possibly recursively.
         e.g. !iAS-FOO for non-recursive, !iAS-FOO,1 for recursive
@@ -258,7 +280,7 @@ class WhoisQueryParser:
             parameter = parameter[:-2]
 
         members = self.query_resolver.members_for_set(parameter, recursive=recursive)
-        return " ".join(members)
+        return self._join_query_output(members)
 
     def handle_irrd_database_serial_range(self, parameter: str) -> str:
         """
@@ -431,7 +453,7 @@ class WhoisQueryParser:
             remove_auth_hashes=remove_auth_hashes,
         )
 
-    def handle_ripe_route_search(self, command: str, parameter: str) -> str:
+    def handle_ripe_route_search(self, command: str, parameter: str) -> Union[str, StreamedResult]:
         """
         -l/L/M/x query - route search for:
            -x 192.0.2.0/2 returns all exact matching objects
@@ -474,7 +496,7 @@ class WhoisQueryParser:
         """-K paramater - only return primary key and members fields"""
         self.key_fields_only = True
 
-    def handle_ripe_text_search(self, value: str) -> str:
+    def handle_ripe_text_search(self, value: str) -> Union[str, StreamedResult]:
         result = self.query_resolver.rpsl_text_search(value)
         return self._flatten_query_output(result)
 
@@ -525,7 +547,7 @@ class WhoisQueryParser:
         except NRTMGeneratorException as nge:
             raise InvalidQueryException(str(nge))
 
-    def handle_inverse_attr_search(self, attribute: str, value: str) -> str:
+    def handle_inverse_attr_search(self, attribute: str, value: str) -> Union[str, StreamedResult]:
         """
         -i/!o query - inverse search for attribute values
         e.g. `-i mnt-by FOO` finds all objects where (one of the) maintainer(s) is FOO,
@@ -534,28 +556,46 @@ class WhoisQueryParser:
         result = self.query_resolver.rpsl_attribute_search(attribute, value)
         return self._flatten_query_output(result)
 
-    def _flatten_query_output(self, query_response: RPSLDatabaseResponse) -> str:
+    def _join_query_output(self, items: List[str]) -> Union[str, StreamedResult]:
+        """
+        Join a list of items, like prefixes, into a space-separated string,
+        or a StreamedResult if stream_results is set.
+        """
+        if not self.stream_results:
+            return " ".join(items)
+
+        def chunks() -> Iterator[str]:
+            for start in range(0, len(items), JOIN_CHUNK_ITEMS):
+                separator = " " if start else ""
+                yield separator + " ".join(items[start : start + JOIN_CHUNK_ITEMS])
+
+        return StreamedResult(chunks())
+
+    def _flatten_query_output(self, query_response: RPSLDatabaseResponse) -> Union[str, StreamedResult]:
         """
         Flatten an RPSL database response into a string with object text
-        for easy passing to a WhoisQueryResponse.
+        for easy passing to a WhoisQueryResponse, or a StreamedResult
+        if stream_results is set.
         """
         if self.key_fields_only:
-            result = self._filter_key_fields(query_response)
-        else:
-            result = ""
-            for obj in query_response:
-                result += obj["object_text"]
-                if (
-                    self.query_resolver.rpki_aware
-                    and obj["source"] != RPKI_IRR_PSEUDO_SOURCE
-                    and obj["object_class"] in RPKI_RELEVANT_OBJECT_CLASSES
-                ):
-                    comment = ""
-                    if obj["rpki_status"] == RPKIStatus.not_found:
-                        comment = " # No ROAs found, or RPKI validation not enabled for source"
-                    result += f'rpki-ov-state:  {obj["rpki_status"].name}{comment}\n'
-                result += "\n"
-        return result.strip("\n\r")
+            return self._filter_key_fields(query_response).strip("\n\r")
+        if self.stream_results:
+            return StreamedResult(strip_chunks(self._object_texts(query_response)))
+        return "".join(self._object_texts(query_response)).strip("\n\r")
+
+    def _object_texts(self, query_response: RPSLDatabaseResponse) -> Iterator[str]:
+        for obj in query_response:
+            result = obj["object_text"]
+            if (
+                self.query_resolver.rpki_aware
+                and obj["source"] != RPKI_IRR_PSEUDO_SOURCE
+                and obj["object_class"] in RPKI_RELEVANT_OBJECT_CLASSES
+            ):
+                comment = ""
+                if obj["rpki_status"] == RPKIStatus.not_found:
+                    comment = " # No ROAs found, or RPKI validation not enabled for source"
+                result += f'rpki-ov-state:  {obj["rpki_status"].name}{comment}\n'
+            yield result + "\n"
 
     def _filter_key_fields(self, query_response) -> str:
         results: OrderedSet[str] = OrderedSet()
@@ -1,8 +1,16 @@
+import tempfile
 from enum import Enum
-from typing import Optional
+from typing import Iterable, Iterator, Optional, Union
 
 from irrd.utils.text import remove_auth_hashes
 
+# Responses are generated in chunks of at least this many characters,
+# except for the last chunk.
+RESPONSE_CHUNK_SIZE = 64 * 1024
+# Maximum size of a streamed IRRD-style result kept in memory while
+# determining its length, before it is spilled to a temporary file.
+RESPONSE_SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
 
 class WhoisQueryResponseType(Enum):
     """
@@ -28,23 +36,83 @@ class WhoisQueryResponseMode(Enum):
     RIPE = "ripe"
 
 
+class StreamedResult:
+    """
+    A query result that is produced as chunks of text, so that large results
+    do not need to be kept in memory completely. The chunks can only be
+    iterated once. A StreamedResult is true if it has any non-empty chunk,
+    which is determined by retrieving the first chunk.
+    """
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        self._chunks = iter(chunks)
+        self._first_chunk: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        if self._first_chunk is None:
+            self._first_chunk = next((chunk for chunk in self._chunks if chunk), "")
+        return bool(self._first_chunk)
+
+    def __iter__(self) -> Iterator[str]:
+        if self and self._first_chunk:
+            yield self._first_chunk
+        yield from self._chunks
+
+
+def strip_chunks(chunks: Iterable[str], characters: str = "\n\r") -> Iterator[str]:
+    """
+    Strip characters from the start and end of the text in chunks,
+    like str.strip() on the joined chunks.
+    """
+    started = False
+    pending = ""
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip(characters)
+            if not chunk:
+                continue
+            started = True
+        stripped = chunk.rstrip(characters)
+        if stripped:
+            yield pending + stripped
+            pending = chunk[len(stripped) :]
+        else:
+            pending += chunk
+
+
+def combine_chunks(chunks: Iterable[str], chunk_size: int = RESPONSE_CHUNK_SIZE) -> Iterator[str]:
+    """Combine small chunks into chunks of at least chunk_size."""
+    buffer = []
+    buffer_size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffer_size += len(chunk)
+        if buffer_size >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            buffer_size = 0
+    if buffer_size:
+        yield "".join(buffer)
+
+
 class WhoisQueryResponse:
     """
     Container for all data for a response to a query.
 
     Based on the response_type and mode, can render a string of the complete
-    response to send back to the user.
+    response to send back to the user, or render it in chunks, which is
+    more efficient for a StreamedResult.
     """
 
     response_type: WhoisQueryResponseType = WhoisQueryResponseType.SUCCESS
     mode: WhoisQueryResponseMode = WhoisQueryResponseMode.RIPE
-    result: Optional[str] = None
+    result: Union[str, StreamedResult, None] = None
 
     def __init__(
         self,
         response_type: WhoisQueryResponseType,
         mode: WhoisQueryResponseMode,
-        result: Optional[str],
+        result: Union[str, StreamedResult, None],
         remove_auth_hashes=True,
     ) -> None:
         self.response_type = response_type
@@ -52,7 +120,46 @@ class WhoisQueryResponse:
         self.result = result
         self.remove_auth_hashes = remove_auth_hashes
 
+    def generate_response_chunks(self) -> Iterator[str]:
+        """
+        Generate the response in chunks. For a StreamedResult with a
+        success response, the result is read from the chunks while sending.
+        """
+        if isinstance(self.result, StreamedResult) and self.response_type == WhoisQueryResponseType.SUCCESS:
+            self.clean_response()
+            if self.result:
+                if self.mode == WhoisQueryResponseMode.IRRD:
+                    yield from self._generate_response_chunks_irrd(self.result)
+                else:
+                    yield from combine_chunks(self.result)
+                    yield "\n\n\n"
+                return
+        yield self.generate_response()
+
+    def _generate_response_chunks_irrd(self, result: StreamedResult) -> Iterator[str]:
+        """
+        IRRD-style responses start with the length of the result. Therefore,
+        the result is first written to a temporary file, which is kept in
+        memory if it is small, while determining the length.
+        """
+        with tempfile.SpooledTemporaryFile(
+            max_size=RESPONSE_SPOOL_MAX_SIZE, mode="w+", encoding="utf-8", errors="surrogateescape"
+        ) as spool:
+            result_len = 1
+            for chunk in result:
+                spool.write(chunk)
+                result_len += len(chunk)
+            spool.seek(0)
+
+            yield f"A{result_len}\n"
+            yield from iter(lambda: spool.read(RESPONSE_CHUNK_SIZE), "")
+            yield "\nC\n"
+
     def generate_response(self) -> str:
+        if isinstance(self.result, StreamedResult):
+            if self.response_type == WhoisQueryResponseType.SUCCESS and self.result:
+                return "".join(self.generate_response_chunks())
+            self.result = "".join(self.result)
         self.clean_response()
 
         if self.mode == WhoisQueryResponseMode.IRRD:
@@ -71,7 +178,10 @@ class WhoisQueryResponse:
 
     def clean_response(self):
         if self.remove_auth_hashes:
-            self.result = remove_auth_hashes(self.result)
+            if isinstance(self.result, StreamedResult):
+                self.result = StreamedResult(remove_auth_hashes(chunk) for chunk in self.result)
+            else:
+                self.result = remove_auth_hashes(self.result)
 
     def _generate_response_irrd(self) -> Optional[str]:
         if self.response_type == WhoisQueryResponseType.SUCCESS:
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import math
 import multiprocessing as mp
 import os
 import signal
@@ -6,6 +8,8 @@ import socket
 import socketserver
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 
 from IPy import IP
 from setproctitle import setproctitle
@@ -15,6 +19,11 @@ from irrd import ENV_MAIN_PROCESS_PID
 from irrd.conf import get_setting
 from irrd.server.access_check import is_client_permitted
 from irrd.server.whois.query_parser import WhoisQueryParser
+from irrd.server.whois.query_response import (
+    WhoisQueryResponse,
+    WhoisQueryResponseMode,
+    WhoisQueryResponseType,
+)
 from irrd.storage.database_handler import DatabaseHandler
 from irrd.storage.preload import Preloader
 from irrd.utils.process_support import memory_trim
@@ -22,6 +31,16 @@ from irrd.utils.process_support import memory_trim
 logger = logging.getLogger(__name__)
 mp.allow_connection_pickling()
 
+# Number of threads in each async whois worker that run queries
+WHOIS_ASYNC_QUERY_THREADS = 4
+# Maximum number of response chunks generated ahead of sending them
+# in the async whois worker, per connection
+WHOIS_ASYNC_RESPONSE_QUEUE_SIZE = 16
+# Seconds after which sending a response chunk to a client is abandoned
+WHOIS_ASYNC_WRITE_TIMEOUT = 60
+# Maximum length of a query line in the async whois worker
+WHOIS_ASYNC_QUERY_LINE_LIMIT = 1024 * 1024
+
 
 # Covered by integration tests
 def start_whois_server(uid, gid):  # pragma: no cover
@@ -63,6 +82,10 @@ class WhoisTCPServer(socketserver.TCPServer):  # pragma: no cover
     Whenever a client is connected, the connection is pushed onto a queue,
     from which a worker picks it up. The workers are responsible for the
     connection from then on.
+
+    By default, there is one WhoisWorker per permitted connection.
+    If server.whois.async_workers is set, that number of WhoisAsyncWorker
+    processes is started instead, which each handle many connections.
     """
 
     allow_reuse_address = True
@@ -76,10 +99,19 @@ class WhoisTCPServer(socketserver.TCPServer):  # pragma: no cover
 
         self.connection_queue = mp.Queue()
         self.workers = []
-        for i in range(int(get_setting("server.whois.max_connections"))):
-            worker = WhoisWorker(self.connection_queue)
-            worker.start()
-            self.workers.append(worker)
+        max_connections = int(get_setting("server.whois.max_connections"))
+        async_workers = int(get_setting("server.whois.async_workers", 0))
+        if async_workers:
+            max_connections_per_worker = math.ceil(max_connections / async_workers)
+            for i in range(async_workers):
+                worker = WhoisAsyncWorker(self.connection_queue, max_connections_per_worker)
+                worker.start()
+                self.workers.append(worker)
+        else:
+            for i in range(max_connections):
+                worker = WhoisWorker(self.connection_queue)
+                worker.start()
+                self.workers.append(worker)
 
     def process_request(self, request, client_address):
         """Push the client connection onto the queue for further handling."""
@@ -102,6 +134,43 @@ class WhoisTCPServer(socketserver.TCPServer):  # pragma: no cover
         return super().shutdown()
 
 
+def terminate_after_worker_init_failure(exc: Exception) -> None:
+    """
+    Terminate IRRd after a whois worker failed to initialise,
+    as the whois server can not function in that case.
+    """
+    logger.critical(
+        (
+            "Whois worker failed to initialise preloader or database, "
+            f"unable to start, terminating IRRd, traceback follows: {exc}"
+        ),
+        exc_info=exc,
+    )
+    main_pid = os.getenv(ENV_MAIN_PROCESS_PID)
+    if main_pid:  # pragma: no cover
+        os.kill(int(main_pid), signal.SIGTERM)
+    else:
+        logger.error("Failed to terminate IRRd, unable to find main process PID")
+
+
+def response_chunks_error(response: WhoisQueryResponse, query: str, exc: Exception) -> bytes:
+    """
+    Log an exception that occurred while generating the chunks of a
+    streamed response, and return the internal error response to send
+    instead, if none of the response was sent yet.
+    """
+    logger.error(f'An exception occurred while processing whois query "{query}": {exc}', exc_info=exc)
+    return (
+        WhoisQueryResponse(
+            response_type=WhoisQueryResponseType.ERROR_INTERNAL,
+            mode=response.mode,
+            result="An internal error occurred while processing this query.",
+        )
+        .generate_response()
+        .encode("utf-8")
+    )
+
+
 class WhoisWorker(mp.Process, socketserver.StreamRequestHandler):
     """
     A whois worker is a process that handles whois client connections,
@@ -130,18 +199,7 @@ class WhoisWorker(mp.Process, socketserver.StreamRequestHandler):
             self.preloader = Preloader()
             self.database_handler = DatabaseHandler(readonly=True)
         except Exception as e:
-            logger.critical(
-                (
-                    "Whois worker failed to initialise preloader or database, "
-                    f"unable to start, terminating IRRd, traceback follows: {e}"
-                ),
-                exc_info=e,
-            )
-            main_pid = os.getenv(ENV_MAIN_PROCESS_PID)
-            if main_pid:  # pragma: no cover
-                os.kill(int(main_pid), signal.SIGTERM)
-            else:
-                logger.error("Failed to terminate IRRd, unable to find main process PID")
+            terminate_after_worker_init_failure(e)
             return
 
         while True:
@@ -191,15 +249,17 @@ class WhoisWorker(mp.Process, socketserver.StreamRequestHandler):
             return
 
         self.query_parser = WhoisQueryParser(
-            client_ip, self.client_str, self.preloader, self.database_handler
+            client_ip, self.client_str, self.preloader, self.database_handler, stream_results=True
         )
 
         data = True
         while data:
-            timer = threading.Timer(self.query_parser.timeout, self.close_request)
-            timer.start()
-            data = self.rfile.readline()
-            timer.cancel()
+            try:
+                data = self.read_query_line()
+            except socket.timeout:
+                logger.debug(f"{self.client_str}: closed connection after timeout")
+                return
+            self.request.settimeout(None)
 
             query = data.decode("utf-8", errors="backslashreplace").strip()
             if not query:
@@ -210,6 +270,34 @@ class WhoisWorker(mp.Process, socketserver.StreamRequestHandler):
             if not self.handle_query(query):
                 return
 
+    def read_query_line(self) -> bytes:
+        """
+        Read the next query line, including the newline, if any.
+        Returns an empty bytes object if the client closed the connection.
+
+        The timeout applies to reading the entire line, rather than to
+        each read from the socket, so that a client that trickles in bytes
+        can not hold on to this worker. It is read from the query parser
+        for every line, as it may have been changed by the previous query.
+        Raises socket.timeout if the line was not complete in time.
+        """
+        deadline = time.monotonic() + self.query_parser.timeout
+        line = b""
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout()
+            self.request.settimeout(remaining)
+            # peek() reads from the socket at most once, and only if nothing is buffered
+            buffered = self.rfile.peek()
+            if not buffered:
+                return line
+            newline_index = buffered.find(b"\n")
+            if newline_index == -1:
+                line += self.rfile.read(len(buffered))
+            else:
+                return line + self.rfile.read(newline_index + 1)
+
     def handle_query(self, query: str) -> bool:
         """
         Handle an individual query.
@@ -222,16 +310,31 @@ class WhoisWorker(mp.Process, socketserver.StreamRequestHandler):
             return False
 
         response = self.query_parser.handle_query(query)
-        response_bytes = response.generate_response().encode("utf-8")
+        response_length = 0
         try:
-            self.wfile.write(response_bytes)
+            for chunk in response.generate_response_chunks():
+                chunk_bytes = chunk.encode("utf-8")
+                self.wfile.write(chunk_bytes)
+                response_length += len(chunk_bytes)
         except OSError:
             return False
+        except Exception as exc:
+            # Streamed results are read from the database while the response
+            # is sent. If part of the response was already sent, it can not
+            # be completed, and the connection is closed.
+            error_bytes = response_chunks_error(response, query, exc)
+            if response_length:
+                return False
+            try:
+                self.wfile.write(error_bytes)
+            except OSError:
+                return False
+            response_length = len(error_bytes)
 
         elapsed = time.perf_counter() - start_time
         logger.info(
             f"{self.client_str}: sent answer to query, elapsed {elapsed:.9f}s, "
-            f"{len(response_bytes)} bytes: {query}"
+            f"{response_length} bytes: {query}"
         )
 
         if not self.query_parser.multiple_command_mode:
@@ -244,3 +347,263 @@ class WhoisWorker(mp.Process, socketserver.StreamRequestHandler):
         Check whether a client is permitted.
         """
         return is_client_permitted(ip, "server.whois.access_list", default_deny=False)
+
+
+class ThreadLocalDatabaseHandler:
+    """
+    Proxy to a read-only DatabaseHandler, with a separate instance,
+    and therefore a separate database connection, for each thread.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        try:
+            database_handler = self._local.database_handler
+        except AttributeError:
+            database_handler = DatabaseHandler(readonly=True)
+            self._local.database_handler = database_handler
+        return getattr(database_handler, name)
+
+
+class WhoisAsyncWorker(mp.Process):
+    """
+    An async whois worker is a process that handles many whois client
+    connections at the same time, in an asyncio event loop. Connections
+    are retrieved from the same queue as used by WhoisWorker, up to
+    max_connections at a time.
+
+    Reading queries and writing responses happens in the event loop,
+    so an idle connection, e.g. a persistent connection of a route server,
+    only costs a file descriptor. Queries themselves are blocking and
+    run in a pool of threads, each with their own database connection.
+    A thread generates the response into a bounded queue, from which
+    the event loop sends it. A client that does not read its response
+    within WHOIS_ASYNC_WRITE_TIMEOUT is disconnected, which releases
+    the thread.
+    """
+
+    def __init__(self, connection_queue, max_connections: int, *args, **kwargs):
+        self.connection_queue = connection_queue
+        self.max_connections = max_connections
+        super().__init__(*args, **kwargs)
+
+    def run(self) -> None:
+        """
+        Async whois worker run loop.
+        This method does not return, except if it failed to initialise a preloader.
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        setproctitle("irrd-whois-async-worker")
+
+        try:
+            self.preloader = Preloader()
+            self.database_handler = ThreadLocalDatabaseHandler()
+        except Exception as e:
+            terminate_after_worker_init_failure(e)
+            return
+
+        self.query_executor = ThreadPoolExecutor(
+            max_workers=WHOIS_ASYNC_QUERY_THREADS, thread_name_prefix="irrd-whois-query"
+        )
+        asyncio.run(self.serve())
+
+    async def serve(self) -> None:  # pragma: no cover
+        """
+        Retrieve connections from the queue, while there are less
+        than max_connections connections open.
+        """
+        loop = asyncio.get_running_loop()
+        connection_slots = asyncio.Semaphore(self.max_connections)
+        connection_tasks = set()
+
+        def connection_done(task):
+            connection_tasks.discard(task)
+            connection_slots.release()
+
+        while True:
+            await connection_slots.acquire()
+            request, client_address = await loop.run_in_executor(None, self.connection_queue.get)
+            task = asyncio.create_task(self.handle_connection(request, client_address))
+            connection_tasks.add(task)
+            task.add_done_callback(connection_done)
+
+    async def handle_connection(self, request: socket.socket, client_address) -> None:
+        """
+        Handle an individual whois client connection.
+        When this method returns, the connection is closed.
+        """
+        client_ip = client_address[0]
+        client_str = client_ip + ":" + str(client_address[1])
+        try:
+            reader, writer = await asyncio.open_connection(sock=request, limit=WHOIS_ASYNC_QUERY_LINE_LIMIT)
+        except Exception as e:
+            request.close()
+            logger.error(f"Failed to handle whois connection, traceback follows: {e}", exc_info=e)
+            return
+
+        try:
+            if not is_client_permitted(client_ip, "server.whois.access_list", default_deny=False):
+                writer.write(b"%% Access denied")
+                await writer.drain()
+                return
+
+            query_parser = WhoisQueryParser(
+                client_ip, client_str, self.preloader, self.database_handler, stream_results=True
+            )
+            while True:
+                try:
+                    data, too_long = await asyncio.wait_for(self.read_line(reader), query_parser.timeout)
+                except asyncio.TimeoutError:
+                    logger.debug(f"{client_str}: closed connection after timeout")
+                    return
+                if not data:
+                    return
+
+                if too_long:
+                    logger.info(f"{client_str}: query exceeded the maximum length")
+                    mode = (
+                        WhoisQueryResponseMode.IRRD
+                        if data.lstrip().startswith(b"!")
+                        else WhoisQueryResponseMode.RIPE
+                    )
+                    error_response = WhoisQueryResponse(
+                        response_type=WhoisQueryResponseType.ERROR_USER,
+                        mode=mode,
+                        result=f"Query exceeds the maximum length of {WHOIS_ASYNC_QUERY_LINE_LIMIT} bytes",
+                    )
+                    writer.write(error_response.generate_response().encode("utf-8"))
+                    await writer.drain()
+                    if not query_parser.multiple_command_mode:
+                        return
+                    continue
+
+                query = data.decode("utf-8", errors="backslashreplace").strip()
+                if not query:
+                    continue
+
+                logger.debug(f"{client_str}: processing query: {query}")
+
+                if not await self.handle_query(query_parser, writer, query):
+                    return
+        except OSError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to handle whois connection, traceback follows: {e}", exc_info=e)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:  # pragma: no cover
+                pass
+
+    async def read_line(self, reader: asyncio.StreamReader) -> Tuple[bytes, bool]:
+        """
+        Read a line from reader. Returns the line, or b"" if the connection
+        was closed, and whether the line exceeded WHOIS_ASYNC_QUERY_LINE_LIMIT.
+        A line that is too long is discarded up to the next newline,
+        and only its start is returned.
+        """
+        start = None
+        while True:
+            try:
+                data = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as error:
+                data = error.partial
+            except asyncio.LimitOverrunError as error:
+                discarded = await reader.readexactly(error.consumed)
+                if start is None:
+                    start = discarded
+                continue
+            if start is None:
+                return data, False
+            return start, True
+
+    async def handle_query(
+        self, query_parser: WhoisQueryParser, writer: asyncio.StreamWriter, query: str
+    ) -> bool:
+        """
+        Handle an individual query, running the query itself in the query thread pool.
+        Returns False when the connection should be closed,
+        True when more queries should be read.
+        """
+        start_time = time.perf_counter()
+        if query.upper() == "!Q":
+            logger.debug(f"{query_parser.client_str}: closed connection per request")
+            return False
+
+        loop = asyncio.get_running_loop()
+        # Chunks are generated in the query thread, as generating a streamed
+        # result may be blocking, and written by the event loop. The queue
+        # limits how far the thread runs ahead of the client. None marks
+        # the end of the response.
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=WHOIS_ASYNC_RESPONSE_QUEUE_SIZE)
+        closed = threading.Event()
+
+        def put_chunk(chunk_bytes: Optional[bytes]) -> None:
+            asyncio.run_coroutine_threadsafe(chunks.put(chunk_bytes), loop).result()
+
+        def run_query() -> Optional[int]:
+            # Returns None if the connection should be closed, as in
+            # WhoisWorker.handle_query().
+            try:
+                response = query_parser.handle_query(query)
+                response_length = 0
+                try:
+                    for chunk in response.generate_response_chunks():
+                        if closed.is_set():
+                            return None
+                        chunk_bytes = chunk.encode("utf-8")
+                        put_chunk(chunk_bytes)
+                        response_length += len(chunk_bytes)
+                except Exception as exc:
+                    error_bytes = response_chunks_error(response, query, exc)
+                    if response_length:
+                        return None
+                    put_chunk(error_bytes)
+                    response_length = len(error_bytes)
+                return response_length
+            finally:
+                if not closed.is_set():
+                    put_chunk(None)
+
+        query_future = loop.run_in_executor(self.query_executor, run_query)
+        sent = False
+        try:
+            while True:
+                chunk_bytes = await chunks.get()
+                if chunk_bytes is None:
+                    break
+                writer.write(chunk_bytes)
+                # A stalled client releases the query thread after the timeout
+                await asyncio.wait_for(writer.drain(), WHOIS_ASYNC_WRITE_TIMEOUT)
+            sent = True
+        except (OSError, asyncio.TimeoutError):
+            logger.debug(f"{query_parser.client_str}: failed to send answer to query: {query}")
+            # Closing normally would wait for the unsent data to be sent
+            writer.transport.abort()
+        finally:
+            if not sent:
+                # Release the query thread, if it is waiting for room in the queue
+                closed.set()
+                while not chunks.empty():
+                    chunks.get_nowait()
+        if not sent:
+            await query_future
+            return False
+
+        response_length = await query_future
+        if response_length is None:
+            return False
+
+        elapsed = time.perf_counter() - start_time
+        logger.info(
+            f"{query_parser.client_str}: sent answer to query, elapsed {elapsed:.9f}s, "
+            f"{response_length} bytes: {query}"
+        )
+
+        if not query_parser.multiple_command_mode:
+            logger.debug(f"{query_parser.client_str}: auto-closed connection")
+            return False
+        return True
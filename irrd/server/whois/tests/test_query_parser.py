@@ -15,7 +15,11 @@ from irrd.storage.database_handler import DatabaseHandler
 from irrd.utils.test_utils import flatten_mock_calls
 
 from ..query_parser import WhoisQueryParser
-from ..query_response import WhoisQueryResponseMode, WhoisQueryResponseType
+from ..query_response import (
+    StreamedResult,
+    WhoisQueryResponseMode,
+    WhoisQueryResponseType,
+)
 
 # Note that these mock objects are not entirely valid RPSL objects,
 # as they are meant to test all the scenarios in the query parser.
@@ -115,7 +119,7 @@ def prepare_parser(monkeypatch, config_override):
     mock_query_resolver.rpki_aware = False
     monkeypatch.setattr(
         "irrd.server.whois.query_parser.QueryResolver",
-        lambda preloader, database_handler: mock_query_resolver,
+        lambda preloader, database_handler, stream_results=False: mock_query_resolver,
     )
 
     mock_dh = Mock(spec=DatabaseHandler)
@@ -539,6 +543,30 @@ class TestWhoisQueryParserIRRD:
         assert response.mode == WhoisQueryResponseMode.IRRD
         assert not response.result
 
+    def test_stream_results(self, prepare_parser):
+        mock_query_resolver, mock_dh, parser = prepare_parser
+        parser.stream_results = True
+
+        mock_query_resolver.routes_for_origin = Mock(return_value=["192.0.2.0/25", "192.0.2.128/25"])
+        response = parser.handle_query("!gas065547")
+        assert response.response_type == WhoisQueryResponseType.SUCCESS
+        assert isinstance(response.result, StreamedResult)
+        assert "".join(response.result) == "192.0.2.0/25 192.0.2.128/25"
+
+        mock_query_resolver.routes_for_origin = Mock(return_value=[])
+        response = parser.handle_query("!gas065547")
+        assert response.response_type == WhoisQueryResponseType.KEY_NOT_FOUND
+
+        mock_query_resolver.route_search = Mock(return_value=MOCK_DATABASE_RESPONSE)
+        response = parser.handle_query("!r192.0.2.0/25")
+        assert response.response_type == WhoisQueryResponseType.SUCCESS
+        assert isinstance(response.result, StreamedResult)
+        assert "".join(response.result) == MOCK_ROUTE_COMBINED
+
+        mock_query_resolver.route_search = Mock(return_value=[])
+        response = parser.handle_query("!r192.0.2.0/25")
+        assert response.response_type == WhoisQueryResponseType.KEY_NOT_FOUND
+
     def test_routes_for_origin_invalid(self, prepare_parser):
         mock_query_resolver, mock_dh, parser = prepare_parser
 
@@ -550,7 +578,7 @@ class TestWhoisQueryParserIRRD:
     def test_handle_irrd_routes_for_as_set(self, prepare_parser, monkeypatch):
         mock_query_resolver, mock_dh, parser = prepare_parser
 
-        for parameter in ["", "4", "6"]:
+        for parameter in ["", "4", "6", ",a", "4,a"]:
             response = parser.handle_query(f"!a{parameter}")
             assert response.response_type == WhoisQueryResponseType.ERROR_USER
             assert response.mode == WhoisQueryResponseMode.IRRD
@@ -562,21 +590,28 @@ class TestWhoisQueryParserIRRD:
         assert response.response_type == WhoisQueryResponseType.SUCCESS
         assert response.mode == WhoisQueryResponseMode.IRRD
         assert response.result == "192.0.2.0/25 192.0.2.128/25"
-        mock_query_resolver.routes_for_as_set.assert_called_once_with("AS-FOO", None)
+        mock_query_resolver.routes_for_as_set.assert_called_once_with("AS-FOO", None, aggregate=False)
         mock_query_resolver.routes_for_as_set.reset_mock()
 
         response = parser.handle_query("!a4AS-FOO")
         assert response.response_type == WhoisQueryResponseType.SUCCESS
         assert response.mode == WhoisQueryResponseMode.IRRD
         assert response.result == "192.0.2.0/25 192.0.2.128/25"
-        mock_query_resolver.routes_for_as_set.assert_called_once_with("AS-FOO", 4)
+        mock_query_resolver.routes_for_as_set.assert_called_once_with("AS-FOO", 4, aggregate=False)
         mock_query_resolver.routes_for_as_set.reset_mock()
 
         response = parser.handle_query("!a6AS-FOO")
         assert response.response_type == WhoisQueryResponseType.SUCCESS
         assert response.mode == WhoisQueryResponseMode.IRRD
         assert response.result == "192.0.2.0/25 192.0.2.128/25"
-        mock_query_resolver.routes_for_as_set.assert_called_once_with("AS-FOO", 6)
+        mock_query_resolver.routes_for_as_set.assert_called_once_with("AS-FOO", 6, aggregate=False)
+        mock_query_resolver.routes_for_as_set.reset_mock()
+
+        response = parser.handle_query("!a4AS-FOO,a")
+        assert response.response_type == WhoisQueryResponseType.SUCCESS
+        assert response.mode == WhoisQueryResponseMode.IRRD
+        assert response.result == "192.0.2.0/25 192.0.2.128/25"
+        mock_query_resolver.routes_for_as_set.assert_called_once_with("AS-FOO", 4, aggregate=True)
         mock_query_resolver.routes_for_as_set.reset_mock()
 
         mock_query_resolver.routes_for_as_set = Mock(return_value=[])
@@ -4,9 +4,12 @@ from irrd.conf import PASSWORD_HASH_DUMMY_VALUE
 from irrd.utils.rpsl_samples import SAMPLE_MNTNER
 
 from ..query_response import (
+    StreamedResult,
     WhoisQueryResponse,
     WhoisQueryResponseMode,
     WhoisQueryResponseType,
+    combine_chunks,
+    strip_chunks,
 )
 
 
@@ -105,3 +108,56 @@ class TestWhoisQueryResponse:
         ).generate_response()
         assert "CRYPT-Pw LEuuhsBJNFV0Q" in response
         assert "MD5-pw $1$fgW84Y9r$kKEn9MUq8PChNKpQhO6BM." in response
+
+    def test_streamed_response(self, monkeypatch):
+        def response_chunks(mode, response_type, chunks):
+            return list(
+                WhoisQueryResponse(
+                    mode=mode, response_type=response_type, result=StreamedResult(chunks)
+                ).generate_response_chunks()
+            )
+
+        chunks = response_chunks(
+            WhoisQueryResponseMode.IRRD, WhoisQueryResponseType.SUCCESS, ["", "te", "st"]
+        )
+        assert "".join(chunks) == "A5\ntest\nC\n"
+        assert chunks[0] == "A5\n"
+        response = WhoisQueryResponse(
+            mode=WhoisQueryResponseMode.IRRD,
+            response_type=WhoisQueryResponseType.SUCCESS,
+            result=StreamedResult(["te", "st"]),
+        ).generate_response()
+        assert response == "A5\ntest\nC\n"
+        chunks = response_chunks(WhoisQueryResponseMode.IRRD, WhoisQueryResponseType.SUCCESS, ["", ""])
+        assert chunks == ["C\n"]
+        chunks = response_chunks(WhoisQueryResponseMode.IRRD, WhoisQueryResponseType.KEY_NOT_FOUND, [])
+        assert chunks == ["D\n"]
+        chunks = response_chunks(WhoisQueryResponseMode.RIPE, WhoisQueryResponseType.SUCCESS, ["te", "st"])
+        assert "".join(chunks) == "test\n\n\n"
+        chunks = response_chunks(WhoisQueryResponseMode.RIPE, WhoisQueryResponseType.SUCCESS, [])
+        assert chunks == ["%  No entries found for the selected source(s).\n\n\n"]
+
+        # Large IRRD-style results are spilled to a temporary file
+        monkeypatch.setattr("irrd.server.whois.query_response.RESPONSE_SPOOL_MAX_SIZE", 10)
+        monkeypatch.setattr("irrd.server.whois.query_response.RESPONSE_CHUNK_SIZE", 10)
+        chunks = response_chunks(WhoisQueryResponseMode.IRRD, WhoisQueryResponseType.SUCCESS, ["x" * 15] * 2)
+        assert chunks == ["A31\n", "x" * 10, "x" * 10, "x" * 10, "\nC\n"]
+
+        response = WhoisQueryResponse(
+            mode=WhoisQueryResponseMode.RIPE,
+            response_type=WhoisQueryResponseType.SUCCESS,
+            result=StreamedResult([SAMPLE_MNTNER, SAMPLE_MNTNER]),
+        ).generate_response()
+        assert "CRYPT-Pw " + PASSWORD_HASH_DUMMY_VALUE in response
+        assert "CRYPT-Pw LEuuhsBJNFV0Q" not in response
+
+    def test_strip_chunks(self):
+        assert list(strip_chunks(["\n", "\ntest\n", "\n", "\n", "test\n\n", "\r\n"])) == [
+            "test",
+            "\n\n\ntest",
+        ]
+        assert list(strip_chunks(["\n", "\n"])) == []
+
+    def test_combine_chunks(self):
+        assert list(combine_chunks(["a", "b", "cd", "e"], chunk_size=2)) == ["ab", "cd", "e"]
+        assert list(combine_chunks([], chunk_size=2)) == []
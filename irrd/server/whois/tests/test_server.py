@@ -1,6 +1,7 @@
 import socket
 import time
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from io import BufferedReader, BytesIO, RawIOBase
 from queue import Queue
 from unittest.mock import Mock
 
@@ -8,7 +9,7 @@ import pytest
 
 from irrd.storage.preload import Preloader
 
-from ..server import WhoisWorker
+from ..server import WhoisAsyncWorker, WhoisWorker
 
 
 class MockSocket:
@@ -22,7 +23,7 @@ class MockSocket:
         self.timeout_set = None
 
     def makefile(self, mode, bufsize):
-        return self.wfile if "w" in mode else self.rfile
+        return self.wfile if "w" in mode else BufferedReader(self.rfile)
 
     def sendall(self, bytes):
         self.wfile.write(bytes)
@@ -37,6 +38,24 @@ class MockSocket:
         self.timeout_set = timeout
 
 
+class MockRawInput(RawIOBase):
+    """
+    Mock input for MockSocket.rfile, where each read from the socket
+    returns the next item from reads, or raises its exception.
+    """
+
+    def __init__(self, reads):
+        self.reads = reads
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = next(self.reads, b"")
+        buffer[: len(data)] = data
+        return len(data)
+
+
 @pytest.fixture()
 def create_worker(config_override, monkeypatch):
     mock_preloader = Mock(spec=Preloader)
@@ -54,6 +73,25 @@ def create_worker(config_override, monkeypatch):
     yield worker, request
 
 
+@pytest.fixture()
+def mock_failing_resolver(monkeypatch):
+    """
+    Mock the query resolver, so that the results of !o and -i queries
+    raise an exception after the first object, while streaming the results.
+    The first object is larger than a RIPE-style response chunk.
+    """
+
+    def rpsl_attribute_search(attribute, value):
+        yield {"object_text": "mntner: MNT-TEST\n" * 5000, "source": "TEST", "object_class": "mntner"}
+        raise Exception("expected")
+
+    mock_query_resolver = Mock(rpki_aware=False, rpsl_attribute_search=rpsl_attribute_search)
+    monkeypatch.setattr(
+        "irrd.server.whois.query_parser.QueryResolver",
+        lambda preloader, database_handler, stream_results=False: mock_query_resolver,
+    )
+
+
 class TestWhoisWorker:
     def test_whois_request_worker_no_access_list(self, create_worker):
         worker, request = create_worker
@@ -99,33 +137,54 @@ class TestWhoisWorker:
 
     def test_whois_request_worker_timeout(self, create_worker):
         worker, request = create_worker
-
-        request.rfile = Mock()
-        readline_call_count = 0
+        read_count = 0
 
         # This mock implementation simulates user behaviour that
         # should trigger a timeout.
         # First, !! is sent to prevent the connection from closing right away.
         # Then, !t1 is used to set a very short timeout.
-        # Third, readline() blocks for 2s, simulating a user not sending
-        # any query to IRRd, triggering the shutdown call by the timeout.
-        def mock_readline():
-            nonlocal readline_call_count
-            readline_call_count += 1
-            if readline_call_count == 1:
-                return b"!!\n"
-            if readline_call_count == 2:
-                return b"!t1\n"
-            if readline_call_count == 3:
-                time.sleep(2)
-                return b""
-
-        request.rfile.readline = mock_readline
+        # Third, the read raises a timeout, as the socket would when
+        # a user does not send any query to IRRd within the timeout.
+        def reads():
+            nonlocal read_count
+            read_count += 1
+            assert 29 < request.timeout_set <= 30
+            yield b"!!\n"
+            read_count += 1
+            yield b"!t1\n"
+            read_count += 1
+            assert 0 < request.timeout_set <= 1
+            raise socket.timeout()
+
+        request.rfile = MockRawInput(reads())
+        worker.run(keep_running=False)
 
-        request.rfile.seek(0)
+        assert read_count == 3
+        assert request.shutdown_called
+
+    def test_whois_request_worker_query_line_timeout(self, create_worker):
+        worker, request = create_worker
+        timeouts_set = []
+
+        # The client sends part of a query every 0.2 seconds, but never
+        # completes it. Every read is well within the timeout of 1 second,
+        # but the line as a whole is not.
+        def reads():
+            yield b"!!\n!t1\n!"
+            for _ in range(25):
+                timeouts_set.append(request.timeout_set)
+                time.sleep(0.2)
+                yield b"v"
+
+        request.rfile = MockRawInput(reads())
+        start_time = time.perf_counter()
         worker.run(keep_running=False)
 
+        assert 1 <= time.perf_counter() - start_time < 3
+        assert 3 <= len(timeouts_set) <= 6
+        assert timeouts_set == sorted(timeouts_set, reverse=True)
         request.wfile.seek(0)
+        assert b"IRRd -- version" not in request.wfile.read()
         assert request.shutdown_called
 
     def test_whois_request_worker_write_error(self, create_worker, caplog):
@@ -138,6 +197,43 @@ class TestWhoisWorker:
         request.sendall = Mock(side_effect=socket.error("expected"))
         worker.run(keep_running=False)
 
+    def test_whois_request_worker_streamed_result_exception(
+        self, create_worker, mock_failing_resolver, caplog
+    ):
+        worker, request = create_worker
+        request.rfile.write(b"!!\n!oMNT-TEST\n!v\n")
+        request.rfile.seek(0)
+        worker.run(keep_running=False)
+
+        # IRRD-style results are complete before they are sent,
+        # so the error is returned instead, and the session continues.
+        request.wfile.seek(0)
+        response = request.wfile.read()
+        assert response.startswith(b"F An internal error occurred while processing this query.\n")
+        assert b"MNT-TEST" not in response
+        assert b"IRRd -- version" in response
+        assert 'An exception occurred while processing whois query "!oMNT-TEST": expected' in caplog.text
+
+    def test_whois_request_worker_streamed_result_exception_partial(
+        self, create_worker, mock_failing_resolver, caplog
+    ):
+        worker, request = create_worker
+        request.rfile.write(b"-k\n-i mnt-by MNT-TEST\n!v\n")
+        request.rfile.seek(0)
+        worker.run(keep_running=False)
+
+        # Part of the RIPE-style result was already sent, so the
+        # connection is closed.
+        request.wfile.seek(0)
+        response = request.wfile.read()
+        assert b"MNT-TEST" in response
+        assert b"internal error" not in response
+        assert b"IRRd -- version" not in response
+        assert request.close_called
+        assert (
+            'An exception occurred while processing whois query "-i mnt-by MNT-TEST": expected' in caplog.text
+        )
+
     def test_whois_request_worker_access_list_permitted(self, config_override, create_worker):
         config_override(
             {
@@ -184,3 +280,147 @@ class TestWhoisWorker:
         assert worker.client_str == "192.0.2.1:99999"
         request.wfile.seek(0)
         assert request.wfile.read() == b"%% Access denied"
+
+
+@pytest.fixture()
+def create_async_worker(config_override, monkeypatch):
+    config_override(
+        {
+            "redis_url": "redis://invalid-host.example.com",  # Not actually used
+        }
+    )
+    worker = WhoisAsyncWorker(Queue(), max_connections=10)
+    worker.preloader = Mock(spec=Preloader)
+    worker.database_handler = Mock()
+    worker.query_executor = ThreadPoolExecutor(max_workers=1)
+    server_socket, client_socket = socket.socketpair()
+    yield worker, server_socket, client_socket
+    client_socket.close()
+    worker.query_executor.shutdown()
+
+
+def read_until_closed(client_socket) -> bytes:
+    client_socket.settimeout(5)
+    result = b""
+    while True:
+        data = client_socket.recv(1024)
+        if not data:
+            return result
+        result += data
+
+
+class TestWhoisAsyncWorker:
+    async def test_whois_async_worker(self, create_async_worker):
+        worker, server_socket, client_socket = create_async_worker
+        # Empty query in first line should be ignored.
+        client_socket.sendall(b" \n!!\n!v\r\n!q\n")
+        await worker.handle_connection(server_socket, ("192.0.2.1", 99999))
+
+        response = read_until_closed(client_socket)
+        assert response.count(b"IRRd -- version") == 1
+
+    async def test_whois_async_worker_auto_close(self, create_async_worker):
+        worker, server_socket, client_socket = create_async_worker
+        client_socket.sendall(b"!v\n!v\n")
+        await worker.handle_connection(server_socket, ("192.0.2.1", 99999))
+
+        response = read_until_closed(client_socket)
+        assert response.count(b"IRRd -- version") == 1
+
+    async def test_whois_async_worker_timeout(self, create_async_worker):
+        worker, server_socket, client_socket = create_async_worker
+        client_socket.sendall(b"!!\n!t1\n")
+        start_time = time.perf_counter()
+        await worker.handle_connection(server_socket, ("192.0.2.1", 99999))
+
+        assert 1 <= time.perf_counter() - start_time < 5
+        assert read_until_closed(client_socket) == b"C\n"
+
+    async def test_whois_async_worker_exception(self, create_async_worker, monkeypatch, caplog):
+        monkeypatch.setattr(
+            "irrd.server.whois.server.WhoisQueryParser", Mock(side_effect=Exception("expected"))
+        )
+        worker, server_socket, client_socket = create_async_worker
+        await worker.handle_connection(server_socket, ("192.0.2.1", 99999))
+
+        assert not read_until_closed(client_socket)
+        assert "Failed to handle whois connection" in caplog.text
+
+    async def test_whois_async_worker_streamed_result_exception(
+        self, create_async_worker, mock_failing_resolver, caplog
+    ):
+        worker, server_socket, client_socket = create_async_worker
+        client_socket.sendall(b"!!\n!oMNT-TEST\n!v\n!q\n")
+        await worker.handle_connection(server_socket, ("192.0.2.1", 99999))
+
+        response = read_until_closed(client_socket)
+        assert response.startswith(b"F An internal error occurred while processing this query.\n")
+        assert b"IRRd -- version" in response
+        assert 'An exception occurred while processing whois query "!oMNT-TEST": expected' in caplog.text
+
+        # Part of the RIPE-style result was already sent, so the
+        # connection is closed.
+        server_socket, client_socket = socket.socketpair()
+        client_socket.sendall(b"-k\n-i mnt-by MNT-TEST\n!v\n")
+        await worker.handle_connection(server_socket, ("192.0.2.1", 99999))
+
+        response = read_until_closed(client_socket)
+        client_socket.close()
+        assert b"MNT-TEST" in response
+        assert b"IRRd -- version" not in response
+
+    async def test_whois_async_worker_query_too_long(self, create_async_worker, monkeypatch):
+        monkeypatch.setattr("irrd.server.whois.server.WHOIS_ASYNC_QUERY_LINE_LIMIT", 100)
+        worker, server_socket, client_socket = create_async_worker
+        client_socket.sendall(b"!!\n!i" + b"A" * 500 + b"\n!v\n-i mnt-by " + b"A" * 500 + b"\n!q\n")
+        await worker.handle_connection(server_socket, ("192.0.2.1", 99999))
+
+        # The connection is kept open after a query that is too long,
+        # in multiple command mode
+        response = read_until_closed(client_socket)
+        assert response.startswith(b"F Query exceeds the maximum length of 100 bytes\n")
+        assert b"IRRd -- version" in response
+        assert response.endswith(b"%% ERROR: Query exceeds the maximum length of 100 bytes\n\n\n")
+
+    async def test_whois_async_worker_stalled_client(self, create_async_worker, monkeypatch):
+        monkeypatch.setattr("irrd.server.whois.server.WHOIS_ASYNC_WRITE_TIMEOUT", 0.5)
+        monkeypatch.setattr("irrd.server.whois.server.WHOIS_ASYNC_RESPONSE_QUEUE_SIZE", 1)
+
+        def rpsl_attribute_search(attribute, value):
+            for _ in range(500):
+                yield {"object_text": "mntner: MNT-TEST\n" * 5000, "source": "TEST", "object_class": "mntner"}
+
+        mock_query_resolver = Mock(rpki_aware=False, rpsl_attribute_search=rpsl_attribute_search)
+        monkeypatch.setattr(
+            "irrd.server.whois.query_parser.QueryResolver",
+            lambda preloader, database_handler, stream_results=False: mock_query_resolver,
+        )
+        worker, server_socket, client_socket = create_async_worker
+        # The client never reads the response
+        client_socket.sendall(b"-i mnt-by MNT-TEST\n")
+        start_time = time.perf_counter()
+        await worker.handle_connection(server_socket, ("192.0.2.1", 99999))
+        assert time.perf_counter() - start_time < 5
+
+        # The query thread was released
+        assert worker.query_executor.submit(lambda: True).result(timeout=1)
+
+    async def test_whois_async_worker_access_list_denied(self, config_override, create_async_worker):
+        config_override(
+            {
+                "redis_url": "redis://invalid-host.example.com",  # Not actually used
+                "server": {
+                    "whois": {
+                        "access_list": "test-access-list",
+                    },
+                },
+                "access_lists": {
+                    "test-access-list": ["192.0.2.128/25"],
+                },
+            }
+        )
+
+        worker, server_socket, client_socket = create_async_worker
+        await worker.handle_connection(server_socket, ("192.0.2.1", 99999))
+
+        assert read_until_closed(client_socket) == b"%% Access denied"
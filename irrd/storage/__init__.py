@@ -1,21 +1,33 @@
 import os
 import platform
+from typing import Any, Dict, Optional
 
 import sqlalchemy as sa
 import ujson
 
 from irrd.conf import get_setting
 
+DATABASE_POOL_SIZE = 50
+
 engine: sa.engine.Engine = None
+# Counters for the connection pool of this process, see get_engine_pool_status()
+pool_counters = {"connections_created": 0, "checkouts": 0}
 
 
 def get_engine():
+    """
+    Get the engine for this process. The engine keeps a pool of connections,
+    which are reused by all DatabaseHandler instances in this process.
+    Connections are checked with a ping before they are used, so that
+    connections that were closed, e.g. by a PostgreSQL restart, are replaced.
+    """
     global engine
     if engine:
         return engine
     engine = sa.create_engine(
         translate_url(get_setting("database_url")),
-        pool_size=50,
+        pool_size=DATABASE_POOL_SIZE,
+        pool_pre_ping=True,
         json_deserializer=ujson.loads,
     )
 
@@ -23,9 +35,11 @@ def get_engine():
     @sa.event.listens_for(engine, "connect")
     def connect(dbapi_connection, connection_record):
         connection_record.info["pid"] = os.getpid()
+        pool_counters["connections_created"] += 1
 
     @sa.event.listens_for(engine, "checkout")
     def checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_counters["checkouts"] += 1
         pid = os.getpid()
         if connection_record.info["pid"] != pid:  # pragma: no cover
             connection_record.connection = connection_proxy.connection = None
@@ -37,6 +51,29 @@ def get_engine():
     return engine
 
 
+def get_engine_pool_status() -> Optional[Dict[str, Any]]:
+    """
+    Get the status of the connection pool of this process,
+    or None if this process has not connected to the database.
+    The status of the pool of asynchronous connections is
+    included under the async_pool key.
+    """
+    # Imported here, as async_connection imports from this module
+    from .async_connection import async_connection_pool
+
+    if not engine:
+        return None
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        **pool_counters,
+        "async_pool": async_connection_pool.status(),
+    }
+
+
 def translate_url(url_str: str) -> sa.engine.url.URL:
     """Translate a url string to a SQLAlchemy URL object with the right driver"""
     url = sa.engine.url.make_url(url_str)
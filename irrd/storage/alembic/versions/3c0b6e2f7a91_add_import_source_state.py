@@ -0,0 +1,27 @@
+"""add_import_source_state
+
+Revision ID: 3c0b6e2f7a91
+Revises: c9f4d8e2a1b7
+Create Date: 2023-07-03 14:21:08.512394
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "3c0b6e2f7a91"
+down_revision = "c9f4d8e2a1b7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "database_status",
+        sa.Column("import_source_state", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("database_status", "import_source_state")
@@ -0,0 +1,32 @@
+"""add_nrtm4_state
+
+Revision ID: 8e2d5f1a9c34
+Revises: 3c0b6e2f7a91
+Create Date: 2023-07-10 09:42:51.804127
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "8e2d5f1a9c34"
+down_revision = "3c0b6e2f7a91"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "database_status",
+        sa.Column("nrtm4_server_state", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+    op.add_column(
+        "database_status",
+        sa.Column("nrtm4_client_state", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("database_status", "nrtm4_client_state")
+    op.drop_column("database_status", "nrtm4_server_state")
@@ -0,0 +1,124 @@
+"""partition_by_source
+
+Revision ID: c9f4d8e2a1b7
+Revises: 500027f85a55
+Create Date: 2023-06-12 11:04:27.381152
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c9f4d8e2a1b7"
+down_revision = "500027f85a55"
+branch_labels = None
+depends_on = None
+
+PARTITIONED_TABLES = ["rpsl_objects", "rpsl_database_journal"]
+UNIQUE_SERIAL_GLOBAL_INDEX = "ix_rpsl_database_journal_serial_global"
+AUTH_MNTNER_FKEY_OLD = "auth_mntner_rpsl_mntner_obj_id_fkey"
+AUTH_MNTNER_FKEY_NEW = "auth_mntner_rpsl_mntner_obj_id_source_fkey"
+
+
+def upgrade():
+    # rpsl_objects is partitioned by source, so foreign keys
+    # referring to it must include the source.
+    op.drop_constraint(AUTH_MNTNER_FKEY_OLD, "auth_mntner", type_="foreignkey")
+
+    for table_name in PARTITIONED_TABLES:
+        constraints, indexes = _table_constraints_indexes(table_name)
+        sources = [
+            row[0] for row in op.get_bind().execute(f"SELECT DISTINCT source FROM {table_name}").fetchall()
+        ]
+
+        op.execute(
+            f"CREATE TABLE {table_name}_partitioned (LIKE {table_name} INCLUDING DEFAULTS) "
+            "PARTITION BY LIST (source)"
+        )
+        op.execute(f"CREATE TABLE {table_name}_default PARTITION OF {table_name}_partitioned DEFAULT")
+        for source in sources:
+            partition_name = _source_partition_name(table_name, source)
+            op.execute(
+                f"CREATE TABLE {partition_name} PARTITION OF {table_name}_partitioned FOR VALUES IN"
+                f" ('{source}')"
+            )
+        op.execute(f"INSERT INTO {table_name}_partitioned SELECT * FROM {table_name}")
+        op.execute(f"DROP TABLE {table_name}")
+        op.execute(f"ALTER TABLE {table_name}_partitioned RENAME TO {table_name}")
+
+        # Unique constraints and indexes must include the partition key
+        for constraint_name, constraint_type, definition in constraints:
+            if constraint_type == "p":
+                definition = "PRIMARY KEY (pk, source)"
+            op.execute(f"ALTER TABLE {table_name} ADD CONSTRAINT {constraint_name} {definition}")
+        for index_name, definition in indexes:
+            if index_name == UNIQUE_SERIAL_GLOBAL_INDEX:
+                definition = definition.replace("CREATE UNIQUE INDEX", "CREATE INDEX")
+            op.execute(definition)
+
+    op.create_foreign_key(
+        AUTH_MNTNER_FKEY_NEW,
+        "auth_mntner",
+        "rpsl_objects",
+        ["rpsl_mntner_obj_id", "rpsl_mntner_source"],
+        ["pk", "source"],
+        ondelete="RESTRICT",
+    )
+
+
+def downgrade():
+    op.drop_constraint(AUTH_MNTNER_FKEY_NEW, "auth_mntner", type_="foreignkey")
+
+    for table_name in PARTITIONED_TABLES:
+        constraints, indexes = _table_constraints_indexes(table_name)
+
+        op.execute(f"CREATE TABLE {table_name}_unpartitioned (LIKE {table_name} INCLUDING DEFAULTS)")
+        op.execute(f"INSERT INTO {table_name}_unpartitioned SELECT * FROM {table_name}")
+        # Dropping the partitioned table also drops all partitions
+        op.execute(f"DROP TABLE {table_name}")
+        op.execute(f"ALTER TABLE {table_name}_unpartitioned RENAME TO {table_name}")
+
+        for constraint_name, constraint_type, definition in constraints:
+            if constraint_type == "p":
+                definition = "PRIMARY KEY (pk)"
+            op.execute(f"ALTER TABLE {table_name} ADD CONSTRAINT {constraint_name} {definition}")
+        for index_name, definition in indexes:
+            if index_name == UNIQUE_SERIAL_GLOBAL_INDEX:
+                definition = definition.replace("CREATE INDEX", "CREATE UNIQUE INDEX")
+            # Indexes on a partitioned table are created with ON ONLY
+            op.execute(definition.replace(" ON ONLY ", " ON "))
+
+    op.create_foreign_key(
+        AUTH_MNTNER_FKEY_OLD,
+        "auth_mntner",
+        "rpsl_objects",
+        ["rpsl_mntner_obj_id"],
+        ["pk"],
+        ondelete="RESTRICT",
+    )
+
+
+def _table_constraints_indexes(table_name):
+    """
+    Retrieve the primary key and unique constraints, as tuples of
+    name, type and definition, and all other indexes, as tuples of
+    name and definition, of a table.
+    """
+    connection = op.get_bind()
+    constraints = connection.execute(f"""
+        SELECT conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = '{table_name}'::regclass AND contype IN ('p', 'u')
+    """).fetchall()
+    constraint_names = {constraint[0] for constraint in constraints}
+    indexes = connection.execute(f"""
+        SELECT indexname, indexdef
+        FROM pg_indexes
+        WHERE tablename = '{table_name}'
+    """).fetchall()
+    indexes = [index for index in indexes if index[0] not in constraint_names]
+    return constraints, indexes
+
+
+def _source_partition_name(table_name, source):
+    # Must match irrd.storage.models.source_partition_name
+    return f"{table_name}_source_{source.lower().replace('-', '_')}"
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import sqlalchemy as sa
+import ujson
+
+from irrd.conf import get_setting
+
+from . import DATABASE_POOL_SIZE, get_engine, translate_url
+
+logger = logging.getLogger(__name__)
+
+"""
+Native asynchronous database access, using the asynchronous mode of psycopg2.
+Queries are sent without blocking, and the event loop is notified when
+the connection is ready, so that a single event loop can have many
+queries in progress at the same time.
+
+Asynchronous connections are always in autocommit mode, so they can only
+be used for read queries that do not need to be part of a transaction.
+Statements are compiled by SQLAlchemy, and results are converted by
+SQLAlchemy's result processors, so the results match those of
+DatabaseHandler.execute_query().
+"""
+
+
+async def wait_for_connection(connection) -> None:
+    """
+    Wait until an asynchronous psycopg2 connection is ready,
+    i.e. the connection was set up or the result of a query is available.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        state = connection.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            return
+        elif state == psycopg2.extensions.POLL_READ:
+            add_handler, remove_handler = loop.add_reader, loop.remove_reader
+        elif state == psycopg2.extensions.POLL_WRITE:
+            add_handler, remove_handler = loop.add_writer, loop.remove_writer
+        else:  # pragma: no cover
+            raise psycopg2.OperationalError(f"Unexpected poll state for asynchronous connection: {state}")
+
+        fd = connection.fileno()
+        ready = loop.create_future()
+        add_handler(fd, ready.set_result, None)
+        try:
+            await ready
+        finally:
+            remove_handler(fd)
+
+
+class AsyncConnectionPool:
+    """
+    A pool of asynchronous connections for the current process.
+    Connections are opened as needed, up to max_connections at the same time.
+    Further checkouts wait until a connection is returned, so that many
+    concurrent queries, e.g. from nested GraphQL resolvers, can not
+    exhaust the connections of the database server.
+    Up to max_connections idle connections are kept for reuse, and like
+    in the pool of the engine, they are checked with a ping before reuse,
+    so that connections closed by e.g. a PostgreSQL restart are replaced.
+    """
+
+    def __init__(self, max_connections=DATABASE_POOL_SIZE):
+        self.max_connections = max_connections
+        self._idle_connections: List[Any] = []
+        # The semaphore is created on first use, in the running event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.checked_out = 0
+        self.waiting = 0
+        self.counters = {"connections_created": 0, "checkouts": 0, "failed_pings": 0}
+
+    async def execute(self, statement: sa.sql.ClauseElement, refresh_on_error=False) -> List[Dict[str, Any]]:
+        """
+        Execute a SQLAlchemy statement on an asynchronous connection,
+        and return all rows as dicts.
+        If refresh_on_error is set, if any exception occurs, will retry
+        once on a new connection.
+        """
+        try:
+            return await self._execute(statement)
+        except Exception:
+            if not refresh_on_error:
+                raise
+            self.close()
+            return await self._execute(statement)
+
+    async def _execute(self, statement: sa.sql.ClauseElement) -> List[Dict[str, Any]]:
+        dialect = get_engine().dialect
+        compiled = statement.compile(dialect=dialect)
+        parameters = compiled.construct_params()
+        for key, processor in compiled._bind_processors.items():
+            if key in parameters:
+                parameters[key] = processor(parameters[key])
+
+        async with self._checkout() as connection:
+            cursor = connection.cursor()
+            cursor.execute(str(compiled), parameters)
+            await wait_for_connection(connection)
+            columns = [column[0] for column in cursor.description] if cursor.description else []
+            rows = cursor.fetchall() if cursor.description else []
+            cursor.close()
+
+        processors = [None] * len(columns)
+        if len(compiled._result_columns) == len(columns):
+            processors = [
+                type_._cached_result_processor(dialect, None) for _, _, _, type_ in compiled._result_columns
+            ]
+        return [
+            {
+                column: processor(value) if processor else value
+                for column, processor, value in zip(columns, processors, row)
+            }
+            for row in rows
+        ]
+
+    @asynccontextmanager
+    async def _checkout(self):
+        """
+        Check out a connection, waiting while max_connections are in use.
+        The connection is returned to the pool afterwards. If an exception
+        occurred, the state of the connection is unknown, e.g. a cancelled
+        query may still be running, so it is closed instead.
+        """
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+            self._semaphore_loop = loop
+        semaphore = self._semaphore
+
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.checked_out += 1
+        self.counters["checkouts"] += 1
+        connection = None
+        try:
+            connection = await self._idle_connection()
+            if not connection:
+                connection = await self._connect()
+                self.counters["connections_created"] += 1
+            yield connection
+        except BaseException:
+            if connection:
+                connection.close()
+            raise
+        else:
+            self._checkin(connection)
+        finally:
+            self.checked_out -= 1
+            semaphore.release()
+
+    async def _idle_connection(self):
+        """
+        Return an idle connection that responds to a ping, if any.
+        Connections that do not, are closed.
+        """
+        while self._idle_connections:
+            connection = self._idle_connections.pop()
+            if connection.closed:
+                continue
+            try:
+                cursor = connection.cursor()
+                cursor.execute("SELECT 1")
+                await wait_for_connection(connection)
+                cursor.close()
+                return connection
+            except psycopg2.Error as error:
+                logger.debug(f"Closing idle asynchronous database connection after failed ping: {error}")
+                self.counters["failed_pings"] += 1
+                connection.close()
+        return None
+
+    def _checkin(self, connection) -> None:
+        if len(self._idle_connections) < self.max_connections:
+            self._idle_connections.append(connection)
+        else:
+            connection.close()
+
+    async def _connect(self):
+        url = translate_url(get_setting("database_url"))
+        connection = psycopg2.connect(
+            **url.translate_connect_args(username="user", database="dbname"),
+            **url.query,
+            async_=True,
+        )
+        await wait_for_connection(connection)
+        # Matches the type handling of the SQLAlchemy engine
+        psycopg2.extras.register_default_jsonb(connection, loads=ujson.loads)
+        psycopg2.extras.register_uuid(None, connection)
+        return connection
+
+    def status(self) -> Dict[str, int]:
+        """
+        Get the status of this pool, in the same format as get_engine_pool_status(),
+        with the number of checkouts waiting for a connection.
+        """
+        return {
+            "size": self.max_connections,
+            "checked_in": len(self._idle_connections),
+            "checked_out": self.checked_out,
+            "waiting": self.waiting,
+            **self.counters,
+        }
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        for connection in self._idle_connections:
+            connection.close()
+        self._idle_connections = []
+
+
+async_connection_pool = AsyncConnectionPool()
@@ -1,11 +1,16 @@
+import csv
 import logging
+import threading
 from collections import defaultdict
 from datetime import datetime, timezone
+from enum import Enum
 from functools import lru_cache
 from io import StringIO
 from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
+import psycopg2
 import sqlalchemy as sa
+import ujson
 from asgiref.sync import sync_to_async
 from IPy import IP
 from sqlalchemy.dialects import postgresql as pg
@@ -20,6 +25,7 @@ from irrd.utils.misc import chunked_iterable
 from irrd.vendor import postgres_copy
 
 from . import get_engine
+from .async_connection import async_connection_pool
 from .event_stream import EventStreamPublisher
 from .models import (
     DatabaseOperation,
@@ -29,15 +35,18 @@ from .models import (
     RPSLDatabaseObject,
     RPSLDatabaseObjectSuspended,
     RPSLDatabaseStatus,
+    source_partition_name,
 )
-from .preload import Preloader
+from .preload import PRELOAD_RELEVANT_OBJECT_CLASSES, Preloader
 from .queries import (
     BaseRPSLObjectDatabaseQuery,
     DatabaseStatusQuery,
     ROADatabaseObjectQuery,
+    RPSLDatabaseJournalQuery,
     RPSLDatabaseJournalStatisticsQuery,
     RPSLDatabaseObjectStatisticsQuery,
 )
+from .set_graph import SET_GRAPH_OBJECT_CLASSES
 
 QueryType = Union[
     BaseRPSLObjectDatabaseQuery,
@@ -49,8 +58,20 @@ QueryType = Union[
 
 logger = logging.getLogger(__name__)
 MAX_RECORDS_BUFFER_BEFORE_INSERT = 15000
-ROUTEPREF_STATUS_UPDATE_CHUNK_SIZE = 5000
+JOURNAL_INSERT_CHUNK_SIZE = 5000
+# Rows fetched at a time from a server-side cursor, see DatabaseHandler.execute_query()
+STREAM_RESULTS_FETCH_SIZE = 10000
+COMPILED_STATEMENT_CACHE_SIZE = 1000
 RPSLDatabaseResponse = Iterator[Dict[str, Any]]
+# An object dict, its new status, and the journal operation to record, if any
+StatusUpdate = Tuple[Dict[str, Any], Enum, Optional[DatabaseOperation]]
+
+# Suffix of the staging table for full reloads of a source, which becomes
+# the new partition of the source, see start_rpsl_staging_load().
+RPSL_STAGING_TABLE_SUFFIX = "_staging"
+# Maximum time to wait for the lock to detach the partition of a source
+# at the end of a full reload, see DatabaseHandler._detach_source_partition().
+PARTITION_DETACH_LOCK_TIMEOUT = "10s"
 
 
 def object_is_visible(
@@ -67,6 +88,79 @@ def object_is_visible(
     )
 
 
+# Temporary table for updating the status of many objects at once,
+# see DatabaseHandler._update_status().
+status_update_table = sa.Table(
+    "rpsl_status_update",
+    sa.MetaData(),
+    sa.Column("ordering", sa.Integer),
+    sa.Column("rpsl_pk", sa.String),
+    sa.Column("source", sa.String),
+    sa.Column("object_class", sa.String),
+    sa.Column("status", sa.String),
+    sa.Column("journal_operation", sa.String),
+    prefixes=["TEMPORARY"],
+)
+
+
+class CompiledStatementCache:
+    """
+    Cache of compiled statements for query shapes, for the current process.
+
+    Queries that are used often, like key lookups, inverse attribute lookups
+    and prefix lookups, mostly have the same shape, and only differ in
+    the values of their bind parameters. For queries with a
+    statement_cache_key, the statement is compiled once per shape, and
+    later queries of the same shape execute the compiled statement with
+    their own parameter values, skipping compilation.
+    """
+
+    def __init__(self, max_size=COMPILED_STATEMENT_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Tuple, Tuple[Any, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def execute(self, connection: sa.engine.Connection, query: QueryType, statement: sa.sql.Select):
+        """
+        Execute the statement of a query, using a cached compiled statement
+        if one exists for the statement_cache_key of the query.
+        """
+        cache_key = (connection.dialect.name, query.statement_cache_key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry:
+            compiled, bind_names = entry
+        else:
+            compiled = statement.compile(dialect=connection.dialect)
+            if any(bind_param not in compiled.bind_names for bind_param in query.statement_bind_params):
+                # Should not occur - but if it does, the statement is not cacheable.
+                return connection.execute(statement)  # pragma: no cover
+            bind_names = [compiled.bind_names[bind_param] for bind_param in query.statement_bind_params]
+            with self._lock:
+                if len(self._entries) >= self.max_size:
+                    self._entries.clear()
+                self._entries[cache_key] = (compiled, bind_names)
+
+        parameters = {
+            name: bind_param.effective_value
+            for name, bind_param in zip(bind_names, query.statement_bind_params)
+        }
+        return connection.execute(compiled, parameters)
+
+    def statistics(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+compiled_statement_cache = CompiledStatementCache()
+
+
 class DatabaseHandler:
     """
     Interface for other parts of IRRD to talk to the database.
@@ -100,6 +194,7 @@ class DatabaseHandler:
         else:
             self.readonly = readonly
         self.journaling_enabled = not readonly
+        self.bulk_load_enabled = False
         self._connection = get_engine().connect()
         if self.readonly:
             self._connection.execution_options(isolation_level="AUTOCOMMIT")
@@ -140,6 +235,8 @@ class DatabaseHandler:
         self._rpsl_upsert_buffer = []
         self._roa_insert_buffer = []
         self._rpsl_guaranteed_no_existing = True
+        # A staging load ends on commit, or is discarded on rollback
+        self._rpsl_staging_source: Optional[str] = None
         if self.status_tracker:
             self.status_tracker.close()
         self.status_tracker = DatabaseStatusTracker(self, journaling_enabled=self.journaling_enabled)
@@ -152,11 +249,167 @@ class DatabaseHandler:
         self.journaling_enabled = True
         self.status_tracker.journaling_enabled = True
 
+    def enable_bulk_load(self):
+        """
+        Enable bulk loading, in which RPSL objects are written with COPY,
+        rather than INSERT .. ON CONFLICT DO UPDATE. This is intended for full
+        imports of a source after delete_all_rpsl_objects_with_journal(),
+        where conflicts with existing objects are rare.
+        If a buffer of objects does conflict with existing objects, e.g. when
+        an import file contains an object twice, that buffer is written
+        with the regular INSERT instead.
+        """
+        self.bulk_load_enabled = True
+
+    def start_rpsl_staging_load(self, source: str) -> None:
+        """
+        Start a full reload of all RPSL objects for a source.
+
+        All journal entries and the database status of the source are
+        deleted right away. All RPSL objects upserted after this are written
+        to a new staging table, with the same columns and indexes as
+        rpsl_objects. On commit(), the staging table replaces the partition
+        of the source in rpsl_objects, see _finish_rpsl_staging_load().
+        Until then, the existing objects remain untouched, so the import
+        does not hold locks on rpsl_objects while it runs.
+        The staging table is created in the current transaction, so it
+        is only visible to other connections after the commit, and
+        disappears on rollback.
+        Note that queries will not find the staged objects until commit().
+        """
+        self._check_write_permitted()
+        self.delete_all_rpsl_objects_with_journal(source, keep_objects=True)
+        table = RPSLDatabaseObject.__table__
+        staging_table_name = source_partition_name(table.name, source) + RPSL_STAGING_TABLE_SUFFIX
+        # The check constraint allows PostgreSQL to skip validating
+        # all rows when the table is attached as a partition.
+        self._connection.execute(
+            f"CREATE TABLE {staging_table_name} (LIKE {table.name} INCLUDING DEFAULTS INCLUDING INDEXES, "
+            f"CHECK (source = '{source}'))"
+        )
+        self._rpsl_staging_table = sa.Table(
+            staging_table_name,
+            sa.MetaData(),
+            *[sa.Column(column.name, column.type) for column in table.columns],
+        )
+        self._rpsl_staging_source = source
+
+    def _finish_rpsl_staging_load(self) -> None:
+        """
+        Replace the objects of the source being reloaded with the
+        objects from the staging table.
+
+        The staging table is attached as the new partition of the source,
+        after detaching and dropping the existing partition, so that the
+        staged objects are not written a second time. If the source does not
+        have its own partition yet, its objects are deleted from the default
+        partition instead. If the existing partition can not be detached
+        within PARTITION_DETACH_LOCK_TIMEOUT, the staged objects are copied
+        into the existing partition, as before partitioning.
+        If the source does not have its own partition in the journal yet,
+        it is created.
+        """
+        source = self._rpsl_staging_source
+        if not source:
+            return
+        self._flush_rpsl_object_writing_buffer()
+        self._rpsl_staging_source = None
+
+        table = RPSLDatabaseObject.__table__
+        staging_table = self._rpsl_staging_table
+        partition_name = source_partition_name(table.name, source)
+        if not self._table_exists(partition_name):
+            self._connection.execute(table.delete(table.c.source == source))
+            swap_partition = True
+        else:
+            swap_partition = self._detach_source_partition(table.name, source)
+
+        if swap_partition:
+            self._connection.execute(f"ALTER TABLE {staging_table.name} RENAME TO {partition_name}")
+            self._attach_source_partition(table.name, source)
+        else:
+            columns = [column.name for column in table.columns]
+            select = sa.select([staging_table.c[column] for column in columns])
+            self._connection.execute(table.delete(table.c.source == source))
+            self._connection.execute(table.insert().from_select(columns, select))
+            self._connection.execute(f"DROP TABLE {staging_table.name}")
+
+        # Journal entries for the source were deleted by start_rpsl_staging_load()
+        journal_table_name = RPSLDatabaseJournal.__tablename__
+        if not self._table_exists(source_partition_name(journal_table_name, source)):
+            self._create_source_partition(journal_table_name, source)
+
+        logger.info(f"Replaced all RPSL objects for {source} with the staged objects")
+
+    def _table_exists(self, table_name: str) -> bool:
+        result = self._connection.execute(sa.text("SELECT to_regclass(:table_name)"), table_name=table_name)
+        return result.scalar() is not None
+
+    def _create_source_partition(self, table_name: str, source: str, attach=True) -> None:
+        """
+        Create the partition for a source in a table that is partitioned by source.
+        The partition is attached, unless attach is False, in which case
+        _attach_source_partition() must be called later.
+        Source names are safe to use in statements, as their format
+        is restricted by the configuration validation.
+        """
+        partition_name = source_partition_name(table_name, source)
+        # The check constraint allows PostgreSQL to skip validating
+        # all rows when the partition is attached.
+        self._connection.execute(
+            f"CREATE TABLE {partition_name} "
+            f"(LIKE {table_name} INCLUDING DEFAULTS, CHECK (source = '{source}'))"
+        )
+        if attach:
+            self._attach_source_partition(table_name, source)
+
+    def _attach_source_partition(self, table_name: str, source: str) -> None:
+        partition_name = source_partition_name(table_name, source)
+        self._connection.execute(
+            f"ALTER TABLE {table_name} ATTACH PARTITION {partition_name} FOR VALUES IN ('{source}')"
+        )
+        logger.info(f"Attached partition {partition_name} for source {source}")
+
+    def _detach_source_partition(self, table_name: str, source: str) -> bool:
+        """
+        Detach and drop the partition for a source, in a savepoint.
+        Detaching takes an exclusive lock on the table until the commit,
+        which has to wait for all other transactions that used the table.
+        Rather than blocking all queries while waiting, this gives up after
+        PARTITION_DETACH_LOCK_TIMEOUT, and returns False, in which case
+        the partition is unchanged.
+        """
+        partition_name = source_partition_name(table_name, source)
+        savepoint = self._connection.begin_nested()
+        try:
+            self._connection.execute(f"SET LOCAL lock_timeout = '{PARTITION_DETACH_LOCK_TIMEOUT}'")
+            self._connection.execute(f"ALTER TABLE {table_name} DETACH PARTITION {partition_name}")
+            self._connection.execute(f"DROP TABLE {partition_name}")
+            self._connection.execute("SET LOCAL lock_timeout = DEFAULT")
+        except sa.exc.OperationalError as exc:
+            if not isinstance(exc.orig, psycopg2.errors.LockNotAvailable):
+                raise
+            savepoint.rollback()
+            logger.info(
+                f"Unable to detach partition {partition_name} within {PARTITION_DETACH_LOCK_TIMEOUT}, "
+                f"copying staged objects for {source} into the existing partition instead"
+            )
+            return False
+        savepoint.commit()
+        return True
+
+    def _rpsl_objects_table(self) -> sa.Table:
+        """Table that RPSL objects are currently written to."""
+        if self._rpsl_staging_source:
+            return self._rpsl_staging_table
+        return RPSLDatabaseObject.__table__
+
     def commit(self) -> None:
         """
         Commit any pending changes to the database and start a fresh transaction.
         """
         self._check_write_permitted()
+        self._finish_rpsl_staging_load()
         self._flush_rpsl_object_writing_buffer()
         self._flush_roa_writing_buffer()
         self.status_tracker.finalise_transaction()
@@ -190,44 +443,101 @@ class DatabaseHandler:
         if start_transaction:
             self._start_transaction()
 
-    @sync_to_async
-    def execute_query_async(
-        self, query: QueryType, flush_rpsl_buffer=True, refresh_on_error=False
+    async def execute_query_async(
+        self,
+        query: QueryType,
+        flush_rpsl_buffer=True,
+        refresh_on_error=False,
     ) -> RPSLDatabaseResponse:
-        return self.execute_query(query, flush_rpsl_buffer, refresh_on_error)  # pragma: no cover
+        """
+        Execute an RPSLDatabaseQuery without blocking the event loop.
+
+        For readonly instances, the query is executed on an asynchronous
+        connection, so that many queries can be in progress at the same time.
+        Other instances run the query in a thread on their own connection,
+        within the current transaction.
+        The entire result is retrieved before returning.
+        """
+        if self.readonly:
+            statement = query.finalise_statement()
+            rows = await async_connection_pool.execute(statement, refresh_on_error=refresh_on_error)
+        else:
+            rows = await sync_to_async(
+                lambda: list(self.execute_query(query, flush_rpsl_buffer, refresh_on_error))
+            )()
+        return iter(rows)
 
     def execute_query(
-        self, query: QueryType, flush_rpsl_buffer=True, refresh_on_error=False
+        self,
+        query: QueryType,
+        flush_rpsl_buffer=True,
+        refresh_on_error=False,
+        stream_results=False,
+        fetch_size=STREAM_RESULTS_FETCH_SIZE,
     ) -> RPSLDatabaseResponse:
         """
         Execute an RPSLDatabaseQuery within the current transaction.
         If flush_rpsl_buffer is set, the RPSL object buffer is flushed first.
         If refresh_on_error is set, if any exception occurs, will refresh
         the connection and retry.
+
+        If stream_results is set, the results are retrieved from a server-side
+        cursor, fetch_size rows at a time, rather than retrieving the entire
+        result at once. This keeps memory use bounded for queries with very
+        large results. Server-side cursors require a transaction, so for
+        readonly instances, which otherwise run in autocommit mode, the query
+        runs in a short transaction that is rolled back once the results are
+        consumed or the response is closed.
+
+        Queries with a statement_cache_key are executed through the
+        CompiledStatementCache, to skip compiling their statement.
         """
 
+        # The DBAPI connection on which a readonly transaction was started, if any
+        readonly_transaction_connection = None
+
         def execute_query():
+            nonlocal readonly_transaction_connection
             # To be able to query objects that were just created, flush the buffer.
             if not self.readonly and flush_rpsl_buffer:
                 self._flush_rpsl_object_writing_buffer()
+                if isinstance(query, (RPSLDatabaseJournalQuery, RPSLDatabaseJournalStatisticsQuery)):
+                    self.status_tracker.flush_journal_buffer()
             statement = query.finalise_statement()
+            if stream_results:
+                dbapi_connection = self._connection.connection.connection
+                # If autocommit is already off, an outer streamed query owns the transaction.
+                if self.readonly and dbapi_connection.autocommit:
+                    dbapi_connection.autocommit = False
+                    readonly_transaction_connection = dbapi_connection
+                return self._connection.execution_options(stream_results=True).execute(statement)
+            if query.statement_cache_key is not None:
+                return compiled_statement_cache.execute(self._connection, query, statement)
             return self._connection.execute(statement)
 
         try:
-            result = execute_query()
-        except Exception as exc:  # pragma: no cover
-            if refresh_on_error:
-                self.refresh_connection()
+            try:
                 result = execute_query()
-            else:
-                raise exc
-
-        result_partition = result.fetchmany()
-        while result_partition:
-            for row in result_partition:
-                yield dict(row)
-            result_partition = result.fetchmany()
-        result.close()
+            except Exception as exc:  # pragma: no cover
+                if refresh_on_error:
+                    self.refresh_connection()
+                    result = execute_query()
+                else:
+                    raise exc
+
+            size = fetch_size if stream_results else None
+            try:
+                result_partition = result.fetchmany(size)
+                while result_partition:
+                    for row in result_partition:
+                        yield dict(row)
+                    result_partition = result.fetchmany(size)
+            finally:
+                result.close()
+        finally:
+            if readonly_transaction_connection is not None:
+                readonly_transaction_connection.rollback()
+                readonly_transaction_connection.autocommit = True
 
     def execute_statement(self, statement):
         """Execute a raw SQLAlchemy statement, without flushing the upsert buffer."""
@@ -306,7 +616,13 @@ class DatabaseHandler:
         self._rpsl_upsert_buffer.append((object_dict, origin, source_serial))
 
         self._rpsl_pk_source_seen.add(rpsl_pk_source)
-        self.changed_objects_tracker.object_modified(rpsl_object.rpsl_object_class, rpsl_object.prefix)
+        self.changed_objects_tracker.object_modified(
+            rpsl_object.rpsl_object_class,
+            rpsl_object.prefix,
+            source=source,
+            asn_first=rpsl_object.asn_first,
+            rpsl_pk=rpsl_object.pk(),
+        )
 
         if len(self._rpsl_upsert_buffer) > MAX_RECORDS_BUFFER_BEFORE_INSERT:
             self._flush_rpsl_object_writing_buffer()
@@ -347,21 +663,8 @@ class DatabaseHandler:
         on RPKI status.
         """
         self._check_write_permitted()
-        table = RPSLDatabaseObject.__table__
-        if rpsl_objs_now_valid:
-            pks = {o["pk"] for o in rpsl_objs_now_valid}
-            stmt = table.update().where(table.c.pk.in_(pks)).values(rpki_status=RPKIStatus.valid)
-            self.execute_statement(stmt)
-        if rpsl_objs_now_invalid:
-            pks = {o["pk"] for o in rpsl_objs_now_invalid}
-            stmt = table.update().where(table.c.pk.in_(pks)).values(rpki_status=RPKIStatus.invalid)
-            self.execute_statement(stmt)
-        if rpsl_objs_now_not_found:
-            pks = {o["pk"] for o in rpsl_objs_now_not_found}
-            stmt = table.update().where(table.c.pk.in_(pks)).values(rpki_status=RPKIStatus.not_found)
-            self.execute_statement(stmt)
-
-        for rpsl_obj in rpsl_objs_now_valid + rpsl_objs_now_not_found:
+        updates: List[StatusUpdate] = []
+        for rpsl_obj in rpsl_objs_now_valid + rpsl_objs_now_not_found + rpsl_objs_now_invalid:
             visible_previously = object_is_visible(
                 rpki_status=rpsl_obj["old_status"],
                 scopefilter_status=rpsl_obj["scopefilter_status"],
@@ -372,35 +675,14 @@ class DatabaseHandler:
                 scopefilter_status=rpsl_obj["scopefilter_status"],
                 route_preference_status=rpsl_obj["route_preference_status"],
             )
-            if visible_now and not visible_previously:
-                self.status_tracker.record_operation_from_rpsl_dict(
-                    operation=DatabaseOperation.add_or_update,
-                    origin=JournalEntryOrigin.rpki_status,
-                    rpsl_obj=rpsl_obj,
-                )
-                self.changed_objects_tracker.object_modified_dict(
-                    rpsl_obj, origin=JournalEntryOrigin.rpki_status
+            updates.append(
+                (
+                    rpsl_obj,
+                    rpsl_obj["rpki_status"],
+                    self._visibility_operation(visible_previously, visible_now),
                 )
-        for rpsl_obj in rpsl_objs_now_invalid:
-            visible_previously = object_is_visible(
-                rpki_status=rpsl_obj["old_status"],
-                scopefilter_status=rpsl_obj["scopefilter_status"],
-                route_preference_status=rpsl_obj["route_preference_status"],
-            )
-            visible_now = object_is_visible(
-                rpki_status=rpsl_obj["rpki_status"],
-                scopefilter_status=rpsl_obj["scopefilter_status"],
-                route_preference_status=rpsl_obj["route_preference_status"],
             )
-            if not visible_now and visible_previously:
-                self.status_tracker.record_operation_from_rpsl_dict(
-                    operation=DatabaseOperation.delete,
-                    origin=JournalEntryOrigin.rpki_status,
-                    rpsl_obj=rpsl_obj,
-                )
-                self.changed_objects_tracker.object_modified_dict(
-                    rpsl_obj, origin=JournalEntryOrigin.rpki_status
-                )
+        self._update_status("rpki_status", JournalEntryOrigin.rpki_status, updates)
 
     def update_scopefilter_status(
         self,
@@ -417,33 +699,8 @@ class DatabaseHandler:
         on scopefilter status.
         """
         self._check_write_permitted()
-        table = RPSLDatabaseObject.__table__
-        if rpsl_objs_now_in_scope:
-            pks = {o["rpsl_pk"] for o in rpsl_objs_now_in_scope}
-            stmt = (
-                table.update()
-                .where(table.c.rpsl_pk.in_(pks))
-                .values(scopefilter_status=ScopeFilterStatus.in_scope)
-            )
-            self.execute_statement(stmt)
-        if rpsl_objs_now_out_scope_as:
-            pks = {o["rpsl_pk"] for o in rpsl_objs_now_out_scope_as}
-            stmt = (
-                table.update()
-                .where(table.c.rpsl_pk.in_(pks))
-                .values(scopefilter_status=ScopeFilterStatus.out_scope_as)
-            )
-            self.execute_statement(stmt)
-        if rpsl_objs_now_out_scope_prefix:
-            pks = {o["rpsl_pk"] for o in rpsl_objs_now_out_scope_prefix}
-            stmt = (
-                table.update()
-                .where(table.c.rpsl_pk.in_(pks))
-                .values(scopefilter_status=ScopeFilterStatus.out_scope_prefix)
-            )
-            self.execute_statement(stmt)
-
-        for rpsl_obj in rpsl_objs_now_in_scope:
+        updates: List[StatusUpdate] = []
+        for rpsl_obj in rpsl_objs_now_in_scope + rpsl_objs_now_out_scope_as + rpsl_objs_now_out_scope_prefix:
             visible_previously = object_is_visible(
                 scopefilter_status=rpsl_obj["old_status"],
                 rpki_status=rpsl_obj["rpki_status"],
@@ -454,36 +711,14 @@ class DatabaseHandler:
                 rpki_status=rpsl_obj["rpki_status"],
                 route_preference_status=rpsl_obj["route_preference_status"],
             )
-            if visible_now and not visible_previously:
-                self.status_tracker.record_operation_from_rpsl_dict(
-                    operation=DatabaseOperation.add_or_update,
-                    origin=JournalEntryOrigin.scope_filter,
-                    rpsl_obj=rpsl_obj,
-                )
-                self.changed_objects_tracker.object_modified_dict(
-                    rpsl_obj, origin=JournalEntryOrigin.scope_filter
+            updates.append(
+                (
+                    rpsl_obj,
+                    rpsl_obj["scopefilter_status"],
+                    self._visibility_operation(visible_previously, visible_now),
                 )
-
-        for rpsl_obj in rpsl_objs_now_out_scope_as + rpsl_objs_now_out_scope_prefix:
-            visible_previously = object_is_visible(
-                scopefilter_status=rpsl_obj["old_status"],
-                rpki_status=rpsl_obj["rpki_status"],
-                route_preference_status=rpsl_obj["route_preference_status"],
             )
-            visible_now = object_is_visible(
-                scopefilter_status=rpsl_obj["scopefilter_status"],
-                rpki_status=rpsl_obj["rpki_status"],
-                route_preference_status=rpsl_obj["route_preference_status"],
-            )
-            if not visible_now and visible_previously:
-                self.status_tracker.record_operation_from_rpsl_dict(
-                    operation=DatabaseOperation.delete,
-                    origin=JournalEntryOrigin.scope_filter,
-                    rpsl_obj=rpsl_obj,
-                )
-                self.changed_objects_tracker.object_modified_dict(
-                    rpsl_obj, origin=JournalEntryOrigin.scope_filter
-                )
+        self._update_status("scopefilter_status", JournalEntryOrigin.scope_filter, updates)
 
     def update_route_preference_status(
         self,
@@ -496,59 +731,90 @@ class DatabaseHandler:
         Required keys: pk, object_text, rpsl_pk, source, prefix,
         object_class, scopefilter_status, rpki_status.
         """
-        rpsl_objs_now_visible = list(rpsl_objs_now_visible)
-        rpsl_objs_now_suppressed = list(rpsl_objs_now_suppressed)
-
         self._check_write_permitted()
 
-        # Note that these loops are slightly simpler than for RPKI/scope filter,
+        # Note that this is slightly simpler than for RPKI/scope filter,
         # because route preference only has two statuses: visible or suppressed.
-        for rpsl_obj in rpsl_objs_now_visible:
-            if object_is_visible(
-                rpki_status=rpsl_obj["rpki_status"], scopefilter_status=rpsl_obj["scopefilter_status"]
-            ):
-                self.status_tracker.record_operation_from_rpsl_dict(
-                    operation=DatabaseOperation.add_or_update,
-                    origin=JournalEntryOrigin.route_preference,
-                    rpsl_obj=rpsl_obj,
-                )
-                self.changed_objects_tracker.object_modified_dict(
-                    rpsl_obj, origin=JournalEntryOrigin.route_preference
+        updates: List[StatusUpdate] = []
+        for status, operation, rpsl_objs in [
+            (RoutePreferenceStatus.visible, DatabaseOperation.add_or_update, rpsl_objs_now_visible),
+            (RoutePreferenceStatus.suppressed, DatabaseOperation.delete, rpsl_objs_now_suppressed),
+        ]:
+            for rpsl_obj in rpsl_objs:
+                visible = object_is_visible(
+                    rpki_status=rpsl_obj["rpki_status"], scopefilter_status=rpsl_obj["scopefilter_status"]
                 )
+                updates.append((rpsl_obj, status, operation if visible else None))
+        self._update_status("route_preference_status", JournalEntryOrigin.route_preference, updates)
+
+    @staticmethod
+    def _visibility_operation(visible_previously: bool, visible_now: bool) -> Optional[DatabaseOperation]:
+        """Journal operation for a change in visibility, if any."""
+        if visible_now and not visible_previously:
+            return DatabaseOperation.add_or_update
+        if not visible_now and visible_previously:
+            return DatabaseOperation.delete
+        return None
+
+    def _update_status(
+        self, column_name: str, origin: JournalEntryOrigin, updates: List[StatusUpdate]
+    ) -> None:
+        """
+        Update a status column of many RPSL objects, and record journal entries
+        for the objects that changed visibility.
+        Each update is a tuple of the object dict, which must have rpsl_pk,
+        source and object_class, the new status, and the journal operation
+        to record, if any.
 
-        for rpsl_obj in rpsl_objs_now_suppressed:
-            if object_is_visible(
-                rpki_status=rpsl_obj["rpki_status"], scopefilter_status=rpsl_obj["scopefilter_status"]
-            ):
-                self.status_tracker.record_operation_from_rpsl_dict(
-                    operation=DatabaseOperation.delete,
-                    origin=JournalEntryOrigin.route_preference,
-                    rpsl_obj=rpsl_obj,
-                )
-                self.changed_objects_tracker.object_modified_dict(
-                    rpsl_obj, origin=JournalEntryOrigin.route_preference
-                )
+        The updates are loaded into a temporary table with COPY. The objects
+        are then updated with a single UPDATE .. FROM, and the journal entries
+        created with INSERT .. SELECT, both from that table.
+        """
+        if not updates:
+            return
+
+        status_update_table.create(self._connection)
+        updates_csv = StringIO()
+        writer = csv.writer(updates_csv, lineterminator="\n")
+        for ordering, (rpsl_obj, status, operation) in enumerate(updates):
+            writer.writerow(
+                [
+                    ordering,
+                    rpsl_obj["rpsl_pk"],
+                    rpsl_obj["source"],
+                    rpsl_obj["object_class"],
+                    status.name,
+                    operation.name if operation else "",
+                ]
+            )
+            if operation:
+                self.changed_objects_tracker.object_modified_dict(rpsl_obj, origin=origin)
+        updates_csv.seek(0)
+        postgres_copy.copy_from(
+            updates_csv,
+            status_update_table,
+            self._connection,
+            columns=[column.name for column in status_update_table.columns],
+            format="csv",
+        )
 
         table = RPSLDatabaseObject.__table__
-        if rpsl_objs_now_visible:
-            for chunk in chunked_iterable(rpsl_objs_now_visible, ROUTEPREF_STATUS_UPDATE_CHUNK_SIZE):
-                pks = {o["pk"] for o in chunk}
-                stmt = (
-                    table.update()
-                    .where(table.c.pk.in_(pks))
-                    .values(route_preference_status=RoutePreferenceStatus.visible)
-                )
-                self.execute_statement(stmt)
-
-        if rpsl_objs_now_suppressed:
-            for chunk in chunked_iterable(rpsl_objs_now_suppressed, ROUTEPREF_STATUS_UPDATE_CHUNK_SIZE):
-                pks = {o["pk"] for o in chunk}
-                stmt = (
-                    table.update()
-                    .where(table.c.pk.in_(pks))
-                    .values(route_preference_status=RoutePreferenceStatus.suppressed)
+        stmt = (
+            table.update()
+            .where(
+                sa.and_(
+                    table.c.rpsl_pk == status_update_table.c.rpsl_pk,
+                    table.c.source == status_update_table.c.source,
+                    table.c.object_class == status_update_table.c.object_class,
                 )
-                self.execute_statement(stmt)
+            )
+            .values({column_name: sa.cast(status_update_table.c.status, table.c[column_name].type)})
+        )
+        self.execute_statement(stmt)
+
+        journal_sources = {rpsl_obj["source"] for rpsl_obj, _, operation in updates if operation}
+        self.status_tracker.record_operations_from_table(status_update_table, origin, journal_sources)
+        status_update_table.drop(self._connection)
 
     def delete_rpsl_object(
         self,
@@ -584,6 +850,7 @@ class DatabaseHandler:
             table.c.source,
             table.c.object_class,
             table.c.prefix,
+            table.c.asn_first,
             table.c.object_text,
         )
         results = self._connection.execute(stmt)
@@ -622,6 +889,7 @@ class DatabaseHandler:
             rpsl_table.c.rpsl_pk,
             rpsl_table.c.source,
             rpsl_table.c.prefix,
+            rpsl_table.c.asn_first,
             rpsl_table.c.object_class,
             rpsl_table.c.object_text,
             rpsl_table.c.parsed_data,
@@ -684,25 +952,29 @@ class DatabaseHandler:
 
         self._check_write_permitted()
 
-        rpsl_composite_key = ["rpsl_pk", "source", "object_class"]
-        stmt = pg.insert(RPSLDatabaseObject).values([x[0] for x in self._rpsl_upsert_buffer])
+        objects = [x[0] for x in self._rpsl_upsert_buffer]
+        if not self.bulk_load_enabled or not self._copy_rpsl_objects(objects):
+            rpsl_composite_key = ["rpsl_pk", "source", "object_class"]
+            stmt = pg.insert(self._rpsl_objects_table()).values(objects)
 
-        if not self._rpsl_guaranteed_no_existing:
-            columns_to_update = {
-                c.name: c for c in stmt.excluded if c.name not in rpsl_composite_key and c.name != "pk"
-            }
+            if not self._rpsl_guaranteed_no_existing:
+                columns_to_update = {
+                    c.name: c for c in stmt.excluded if c.name not in rpsl_composite_key and c.name != "pk"
+                }
 
-            stmt = stmt.on_conflict_do_update(
-                index_elements=rpsl_composite_key,
-                set_=columns_to_update,
-            )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=rpsl_composite_key,
+                    set_=columns_to_update,
+                )
 
-        try:
-            self._connection.execute(stmt)
-        except Exception as exc:  # pragma: no cover
-            self._transaction.rollback()
-            logger.error(f"Exception occurred while executing statement: {stmt}, rolling back", exc_info=exc)
-            raise
+            try:
+                self._connection.execute(stmt)
+            except Exception as exc:  # pragma: no cover
+                self._transaction.rollback()
+                logger.error(
+                    f"Exception occurred while executing statement: {stmt}, rolling back", exc_info=exc
+                )
+                raise
 
         for obj, origin, source_serial in self._rpsl_upsert_buffer:
             # Suppressed objects through RPKI, scope filter or status should
@@ -727,6 +999,39 @@ class DatabaseHandler:
         self._rpsl_pk_source_seen = set()
         self._rpsl_upsert_buffer = []
 
+    def _copy_rpsl_objects(self, objects: List[Dict[str, Any]]) -> bool:
+        """
+        Write RPSL objects to the database with COPY, in a savepoint.
+        Returns False if any object conflicts with an existing object,
+        in which case no objects are written.
+        """
+        objects_per_columns: Dict[Tuple[str, ...], List[Dict[str, Any]]] = defaultdict(list)
+        for obj in objects:
+            # Some objects may have a forced created value
+            objects_per_columns[tuple(obj.keys())].append(obj)
+
+        savepoint = self._connection.begin_nested()
+        try:
+            for columns, columns_objects in objects_per_columns.items():
+                objects_csv = StringIO()
+                # Empty unquoted values are read as NULL, which is safe as
+                # the non-nullable text columns are never empty.
+                writer = csv.writer(objects_csv, lineterminator="\n")
+                for obj in columns_objects:
+                    writer.writerow([_copy_value(obj[column]) for column in columns])
+                objects_csv.seek(0)
+                postgres_copy.copy_from(
+                    objects_csv, self._rpsl_objects_table(), self._connection, columns=columns, format="csv"
+                )
+        except psycopg2.IntegrityError:
+            savepoint.rollback()
+            logger.debug(
+                f"Conflicting objects in bulk load of {len(objects)} objects, using regular insert instead"
+            )
+            return False
+        savepoint.commit()
+        return True
+
     def _flush_roa_writing_buffer(self):
         """
         Flush the current ROA buffer to the database.
@@ -760,18 +1065,23 @@ class DatabaseHandler:
         stmt = table.delete(sa.and_(table.c.source == source, table.c.timestamp < timestamp))
         self._connection.execute(stmt)
 
-    def delete_all_rpsl_objects_with_journal(self, source, journal_guaranteed_empty=False):
+    def delete_all_rpsl_objects_with_journal(
+        self, source, journal_guaranteed_empty=False, keep_objects=False
+    ):
         """
         Delete all RPSL objects for a source from the database,
         all journal entries and the database status.
         This is intended for cases where a full re-import is done.
         Note that no journal records are kept of this change itself.
+        If keep_objects is set, only the journal entries and status are deleted.
         """
         self._check_write_permitted()
         self._flush_rpsl_object_writing_buffer()
-        table = RPSLDatabaseObject.__table__
-        stmt = table.delete(table.c.source == source)
-        self._connection.execute(stmt)
+        self.status_tracker.flush_journal_buffer()
+        if not keep_objects:
+            table = RPSLDatabaseObject.__table__
+            stmt = table.delete(table.c.source == source)
+            self._connection.execute(stmt)
         if not journal_guaranteed_empty:
             table = RPSLDatabaseJournal.__table__
             stmt = table.delete(table.c.source == source)
@@ -809,6 +1119,9 @@ class DatabaseHandler:
                 synchronised_serials=synchronised_serials,
                 serial_oldest_seen=None,
                 serial_newest_seen=None,
+                import_source_state=None,
+                nrtm4_server_state=None,
+                nrtm4_client_state=None,
             )
         )
         self._connection.execute(stmt)
@@ -831,6 +1144,28 @@ class DatabaseHandler:
         self._check_write_permitted()
         self.status_tracker.record_serial_seen(source, serial)
 
+    def record_import_source_state(self, source: str, state: Dict[str, Any]) -> None:
+        """
+        Record the state of the import_source files of a source,
+        after they were imported.
+        """
+        self._check_write_permitted()
+        self.status_tracker.record_import_source_state(source, state)
+
+    def record_nrtm4_server_state(self, source: str, state: Dict[str, Any]) -> None:
+        """
+        Record the state of the NRTMv4 files published for a source.
+        """
+        self._check_write_permitted()
+        self.status_tracker.record_nrtm4_server_state(source, state)
+
+    def record_nrtm4_client_state(self, source: str, state: Dict[str, Any]) -> None:
+        """
+        Record the NRTMv4 session and version that a source was mirrored to.
+        """
+        self._check_write_permitted()
+        self.status_tracker.record_nrtm4_client_state(source, state)
+
     def record_mirror_error(self, source: str, error: str) -> None:
         """
         Record an error seen in a mirrored database.
@@ -879,6 +1214,15 @@ class DatabaseHandler:
         return True
 
 
+def _copy_value(value: Any) -> Any:
+    """Convert a value from an RPSL object dict for use in COPY in CSV format."""
+    if isinstance(value, dict):
+        return ujson.dumps(value)
+    if isinstance(value, Enum):
+        return value.name
+    return value
+
+
 class DatabaseStatusTracker:
     """
     Keep track of the status of sources, and their journal, if enabled.
@@ -887,6 +1231,8 @@ class DatabaseStatusTracker:
     reset() after committing.
 
     If journaling is enabled, a new entry in the journal will be made.
+    Journal entries are buffered, and written in bulk when the buffer is
+    full, when the journal is queried, or when finalising the transaction.
     If a journal entry was made, a record is kept in
     memory with all serials encountered/created for this source.
 
@@ -900,6 +1246,12 @@ class DatabaseStatusTracker:
     _newest_mirror_serials: Dict[str, int]
     _mirroring_error: Dict[str, str]
     _exported_serials: Dict[str, int]
+    _import_source_states: Dict[str, Dict[str, Any]]
+    _nrtm4_server_states: Dict[str, Dict[str, Any]]
+    _nrtm4_client_states: Dict[str, Dict[str, Any]]
+    # The journal insert buffer is a list of dicts with column names and their values.
+    # The serial_nrtm is None if it should be assigned when the buffer is flushed.
+    _journal_insert_buffer: List[Dict[str, Any]]
     _journal_table_locked = False
 
     c_journal = RPSLDatabaseJournal.__table__.c
@@ -941,6 +1293,27 @@ class DatabaseStatusTracker:
         self._sources_seen.add(source)
         self._exported_serials[source] = serial
 
+    def record_import_source_state(self, source: str, state: Dict[str, Any]) -> None:
+        """
+        Record the state of the import_source files of a source.
+        """
+        self._sources_seen.add(source)
+        self._import_source_states[source] = state
+
+    def record_nrtm4_server_state(self, source: str, state: Dict[str, Any]) -> None:
+        """
+        Record the state of the NRTMv4 files published for a source.
+        """
+        self._sources_seen.add(source)
+        self._nrtm4_server_states[source] = state
+
+    def record_nrtm4_client_state(self, source: str, state: Dict[str, Any]) -> None:
+        """
+        Record the NRTMv4 session and version that a source was mirrored to.
+        """
+        self._sources_seen.add(source)
+        self._nrtm4_client_states[source] = state
+
     def record_operation_from_rpsl_dict(
         self, operation: DatabaseOperation, rpsl_obj: Dict[str, Any], origin: JournalEntryOrigin
     ) -> None:
@@ -975,48 +1348,137 @@ class DatabaseStatusTracker:
         and the database.SOURCE.keep_journal is set.
         The source will always be added to _sources_seen.
 
-        Note that this method locks the journal table for writing to ensure a
-        gapless set of NRTM serials.
+        The entry is buffered, see flush_journal_buffer().
         """
         self._sources_seen.add(source)
         if self.journaling_enabled and get_setting(f"sources.{source}.keep_journal"):
-            serial_nrtm: Union[int, sa.sql.expression.Select]
-            journal_tablename = RPSLDatabaseJournal.__tablename__
+            self._journal_insert_buffer.append(
+                {
+                    "rpsl_pk": rpsl_pk,
+                    "source": source,
+                    "operation": operation,
+                    "object_class": object_class,
+                    "object_text": object_text,
+                    "serial_nrtm": source_serial if self._is_serial_synchronised(source) else None,
+                    "origin": origin,
+                    "timestamp": datetime.now(timezone.utc),
+                }
+            )
+            if len(self._journal_insert_buffer) > MAX_RECORDS_BUFFER_BEFORE_INSERT:
+                self.flush_journal_buffer()
 
-            # Locking this table is one of the few ways to guarantee serial_global in order (#685)
-            if not self._journal_table_locked:
-                self.database_handler.execute_statement(f"LOCK TABLE {journal_tablename} IN EXCLUSIVE MODE")
-                self._journal_table_locked = True
+    def flush_journal_buffer(self) -> None:
+        """
+        Write all buffered journal entries to the database.
 
-            if self._is_serial_synchronised(source):
-                serial_nrtm = source_serial
-            else:
-                if source in self._new_serials_per_source and self._new_serials_per_source[source]:
-                    serial_nrtm = max(self._new_serials_per_source[source]) + 1
-                else:
-                    serial_nrtm = sa.select([sa.text("COALESCE(MAX(serial_nrtm), 0) + 1")])
-                    serial_nrtm = serial_nrtm.where(RPSLDatabaseJournal.__table__.c.source == source)
-                    serial_nrtm = serial_nrtm.as_scalar()
-
-            timestamp = datetime.now(timezone.utc)
-
-            stmt = (
-                RPSLDatabaseJournal.__table__.insert()
-                .values(
-                    rpsl_pk=rpsl_pk,
-                    source=source,
-                    operation=operation,
-                    object_class=object_class,
-                    object_text=object_text,
-                    serial_nrtm=serial_nrtm,
-                    origin=origin,
-                    timestamp=timestamp,
+        This locks the journal table for writing to ensure a gapless set
+        of NRTM serials. As the lock is held until the end of the transaction,
+        the entries are only written as late as possible. Serials for sources
+        that are not synchronised are assigned here, with at most one
+        query per source for the current highest serial.
+        """
+        if not self._journal_insert_buffer:
+            return
+
+        self._lock_journal_table()
+        next_serials: Dict[str, int] = {}
+        for entry in self._journal_insert_buffer:
+            source = entry["source"]
+            if entry["serial_nrtm"] is None:
+                if source not in next_serials:
+                    next_serials[source] = self._next_serial_nrtm(source)
+                entry["serial_nrtm"] = next_serials[source]
+                next_serials[source] += 1
+            self._new_serials_per_source[source].add(entry["serial_nrtm"])
+
+        for entries in chunked_iterable(self._journal_insert_buffer, JOURNAL_INSERT_CHUNK_SIZE):
+            self.database_handler.execute_statement(
+                RPSLDatabaseJournal.__table__.insert().values(list(entries))
+            )
+        self._journal_insert_buffer = []
+
+    def record_operations_from_table(
+        self, operations_table: sa.Table, origin: JournalEntryOrigin, sources: Set[str]
+    ) -> None:
+        """
+        Make records in the journal for the operations in a (temporary) table,
+        with one INSERT .. SELECT per source. The table must have ordering,
+        rpsl_pk, source, object_class and journal_operation columns.
+        Rows without journal_operation are skipped. The object text is
+        taken from the current object in rpsl_objects.
+
+        The same conditions as for record_operation() apply.
+        Buffered journal entries are written first, to keep serials in order.
+        """
+        self._sources_seen.update(sources)
+        if not self.journaling_enabled:
+            return
+        self.flush_journal_buffer()
+
+        objects = RPSLDatabaseObject.__table__
+        journal = RPSLDatabaseJournal.__table__
+        for source in sorted(sources):
+            if not get_setting(f"sources.{source}.keep_journal"):
+                continue
+            self._lock_journal_table()
+            first_serial = self._next_serial_nrtm(source)
+            row_number = sa.func.row_number().over(order_by=operations_table.c.ordering)
+            select = (
+                sa.select(
+                    [
+                        objects.c.rpsl_pk,
+                        objects.c.source,
+                        objects.c.object_class,
+                        objects.c.object_text,
+                        sa.cast(operations_table.c.journal_operation, journal.c.operation.type),
+                        row_number + first_serial - 1,
+                        sa.literal(origin, journal.c.origin.type),
+                        sa.literal(datetime.now(timezone.utc), journal.c.timestamp.type),
+                    ]
                 )
-                .returning(self.c_journal.serial_nrtm)
+                .where(
+                    sa.and_(
+                        objects.c.rpsl_pk == operations_table.c.rpsl_pk,
+                        objects.c.source == operations_table.c.source,
+                        objects.c.object_class == operations_table.c.object_class,
+                        operations_table.c.source == source,
+                        operations_table.c.journal_operation.isnot(None),
+                    )
+                )
+                .order_by(operations_table.c.ordering)
             )
-            insert_result = self.database_handler.execute_statement(stmt).fetchone()
+            columns = [
+                "rpsl_pk",
+                "source",
+                "object_class",
+                "object_text",
+                "operation",
+                "serial_nrtm",
+                "origin",
+                "timestamp",
+            ]
+            stmt = journal.insert().from_select(columns, select).returning(journal.c.serial_nrtm)
+            for row in self.database_handler.execute_statement(stmt):
+                self._new_serials_per_source[source].add(row["serial_nrtm"])
 
-            self._new_serials_per_source[source].add(insert_result["serial_nrtm"])
+    def _lock_journal_table(self) -> None:
+        # Locking this table is one of the few ways to guarantee serial_global in order (#685)
+        if not self._journal_table_locked:
+            journal_tablename = RPSLDatabaseJournal.__tablename__
+            self.database_handler.execute_statement(f"LOCK TABLE {journal_tablename} IN EXCLUSIVE MODE")
+            self._journal_table_locked = True
+
+    def _next_serial_nrtm(self, source: str) -> int:
+        """
+        Determine the next NRTM serial for a source that is not synchronised.
+        Must only be called while holding the lock on the journal table.
+        """
+        if self._new_serials_per_source[source]:
+            return max(self._new_serials_per_source[source]) + 1
+        query = sa.select([sa.func.coalesce(sa.func.max(self.c_journal.serial_nrtm), 0)]).where(
+            self.c_journal.source == source
+        )
+        return self.database_handler.execute_statement(query).scalar() + 1
 
     def finalise_transaction(self):
         """
@@ -1025,96 +1487,138 @@ class DatabaseStatusTracker:
         - If new serials were recorded for a source, update the database
           serial stats in the status object.
         - Update the latest source errors.
-        """
-        for source in self._sources_seen:
-            stmt = pg.insert(RPSLDatabaseStatus).values(
-                source=source,
-                force_reload=False,
-                synchronised_serials=self._is_serial_synchronised(source),
-                updated=datetime.now(timezone.utc),
+
+        The journal serial ranges of all sources with new serials are
+        retrieved in one query, and all changes are written in one upsert,
+        so that the number of statements does not grow with the number
+        of sources.
+        """
+        self.flush_journal_buffer()
+        sources = sorted(
+            self._sources_seen.union(
+                self._new_serials_per_source.keys(),
+                self._mirroring_error.keys(),
+                self._newest_mirror_serials.keys(),
+                self._exported_serials.keys(),
+                self._import_source_states.keys(),
+                self._nrtm4_server_states.keys(),
+                self._nrtm4_client_states.keys(),
             )
-            stmt = stmt.on_conflict_do_update(
-                index_elements=["source"],
-                set_={
+        )
+        if not sources:
+            return
+        journal_ranges = self._journal_serial_ranges(
+            [source for source, serials in self._new_serials_per_source.items() if serials]
+        )
+
+        now = datetime.now(timezone.utc)
+        values = []
+        for source in sources:
+            serials = self._new_serials_per_source.get(source)
+            serial_oldest_journal, serial_newest_journal = journal_ranges.get(source, (None, None))
+            error = self._mirroring_error.get(source)
+            values.append(
+                {
+                    "source": source,
                     "force_reload": False,
                     "synchronised_serials": self._is_serial_synchronised(source),
-                },
-            )
-            self.database_handler.execute_statement(stmt)
-
-        for source, serials in self._new_serials_per_source.items():
-            serial_oldest_journal_q = sa.select([sa.func.min(self.c_journal.serial_nrtm)]).where(
-                self.c_journal.source == source
+                    "serial_oldest_seen": (
+                        self._least(serial_oldest_journal, min(serials)) if serials else None
+                    ),
+                    "serial_newest_seen": (
+                        self._greatest(serial_newest_journal, max(serials)) if serials else None
+                    ),
+                    "serial_oldest_journal": serial_oldest_journal,
+                    "serial_newest_journal": serial_newest_journal,
+                    "serial_newest_mirror": self._newest_mirror_serials.get(source),
+                    "serial_last_export": self._exported_serials.get(source),
+                    "import_source_state": self._import_source_states.get(source),
+                    "nrtm4_server_state": self._nrtm4_server_states.get(source),
+                    "nrtm4_client_state": self._nrtm4_client_states.get(source),
+                    "last_error": error,
+                    "last_error_timestamp": now if error else None,
+                    "updated": now,
+                }
             )
-            result = self.database_handler.execute_statement(serial_oldest_journal_q)
-            serial_oldest_journal = next(result)[0]
 
-            serial_newest_journal_q = sa.select([sa.func.max(self.c_journal.serial_nrtm)]).where(
-                self.c_journal.source == source
-            )
-            result = self.database_handler.execute_statement(serial_newest_journal_q)
-            serial_newest_journal = next(result)[0]
+        # All status changes are applied in a single upsert. Values that are
+        # NULL in the new row were not changed in this transaction, so the
+        # existing values are kept. LEAST() and GREATEST() ignore NULLs.
+        # The journal range is updated whenever there are new serials,
+        # even if there are no journal entries for the source.
+        # As before, exports do not change the updated timestamp.
+        stmt = pg.insert(RPSLDatabaseStatus).values(values)
+        existing = self.c_status
+        new = stmt.excluded
+        serials_seen = new.serial_newest_seen.isnot(None)
+        changed = sa.or_(
+            serials_seen,
+            new.serial_newest_mirror.isnot(None),
+            new.import_source_state.isnot(None),
+            new.nrtm4_server_state.isnot(None),
+            new.nrtm4_client_state.isnot(None),
+            new.last_error.isnot(None),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["source"],
+            set_={
+                "force_reload": False,
+                "synchronised_serials": new.synchronised_serials,
+                "serial_oldest_seen": sa.func.least(existing.serial_oldest_seen, new.serial_oldest_seen),
+                "serial_newest_seen": sa.func.greatest(existing.serial_newest_seen, new.serial_newest_seen),
+                "serial_oldest_journal": sa.case(
+                    [(serials_seen, new.serial_oldest_journal)], else_=existing.serial_oldest_journal
+                ),
+                "serial_newest_journal": sa.case(
+                    [(serials_seen, new.serial_newest_journal)], else_=existing.serial_newest_journal
+                ),
+                "serial_newest_mirror": sa.func.coalesce(
+                    new.serial_newest_mirror, existing.serial_newest_mirror
+                ),
+                "serial_last_export": sa.func.coalesce(new.serial_last_export, existing.serial_last_export),
+                "import_source_state": sa.func.coalesce(
+                    new.import_source_state, existing.import_source_state
+                ),
+                "nrtm4_server_state": sa.func.coalesce(new.nrtm4_server_state, existing.nrtm4_server_state),
+                "nrtm4_client_state": sa.func.coalesce(new.nrtm4_client_state, existing.nrtm4_client_state),
+                "last_error": sa.func.coalesce(new.last_error, existing.last_error),
+                "last_error_timestamp": sa.func.coalesce(
+                    new.last_error_timestamp, existing.last_error_timestamp
+                ),
+                "updated": sa.case([(changed, new.updated)], else_=existing.updated),
+            },
+        )
+        self.database_handler.execute_statement(stmt)
 
-            serial_oldest_seen = sa.select(
+    def _journal_serial_ranges(self, sources: List[str]) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+        """
+        Retrieve the oldest and newest NRTM serial in the journal
+        for each of the sources, in a single query.
+        """
+        if not sources:
+            return {}
+        query = (
+            sa.select(
                 [
-                    sa.func.least(
-                        sa.func.min(self.c_status.serial_oldest_seen), serial_oldest_journal, min(serials)
-                    )
+                    self.c_journal.source,
+                    sa.func.min(self.c_journal.serial_nrtm),
+                    sa.func.max(self.c_journal.serial_nrtm),
                 ]
-            ).where(self.c_status.source == source)
-            serial_newest_seen = sa.select(
-                [
-                    sa.func.greatest(
-                        sa.func.max(self.c_status.serial_newest_seen), serial_newest_journal, max(serials)
-                    ),
-                ]
-            ).where(self.c_status.source == source)
-
-            stmt = (
-                RPSLDatabaseStatus.__table__.update()
-                .where(self.c_status.source == source)
-                .values(
-                    serial_oldest_seen=serial_oldest_seen,
-                    serial_newest_seen=serial_newest_seen,
-                    serial_oldest_journal=serial_oldest_journal,
-                    serial_newest_journal=serial_newest_journal,
-                    updated=datetime.now(timezone.utc),
-                )
-            )
-            self.database_handler.execute_statement(stmt)
-
-        for source, error in self._mirroring_error.items():
-            stmt = (
-                RPSLDatabaseStatus.__table__.update()
-                .where(self.c_status.source == source)
-                .values(
-                    last_error=error,
-                    last_error_timestamp=datetime.now(timezone.utc),
-                    updated=datetime.now(timezone.utc),
-                )
             )
-            self.database_handler.execute_statement(stmt)
-
-        for source, serial in self._newest_mirror_serials.items():
-            stmt = (
-                RPSLDatabaseStatus.__table__.update()
-                .where(self.c_status.source == source)
-                .values(
-                    serial_newest_mirror=serial,
-                    updated=datetime.now(timezone.utc),
-                )
-            )
-            self.database_handler.execute_statement(stmt)
-
-        for source, serial in self._exported_serials.items():
-            stmt = (
-                RPSLDatabaseStatus.__table__.update()
-                .where(self.c_status.source == source)
-                .values(
-                    serial_last_export=serial,
-                )
-            )
-            self.database_handler.execute_statement(stmt)
+            .where(self.c_journal.source.in_(sources))
+            .group_by(self.c_journal.source)
+        )
+        result = self.database_handler.execute_statement(query)
+        return {source: (serial_oldest, serial_newest) for source, serial_oldest, serial_newest in result}
+
+    @staticmethod
+    def _least(*values: Optional[int]) -> Optional[int]:
+        # Like LEAST() in PostgreSQL, NULLs are ignored
+        return min((value for value in values if value is not None), default=None)
+
+    @staticmethod
+    def _greatest(*values: Optional[int]) -> Optional[int]:
+        return max((value for value in values if value is not None), default=None)
 
     def publish_event_stream(self):
         """
@@ -1135,11 +1639,15 @@ class DatabaseStatusTracker:
 
     def reset(self):
         self._journal_table_locked = False
+        self._journal_insert_buffer = []
         self._new_serials_per_source = defaultdict(set)
         self._sources_seen = set()
         self._newest_mirror_serials = dict()
         self._mirroring_error = dict()
         self._exported_serials = dict()
+        self._import_source_states = dict()
+        self._nrtm4_server_states = dict()
+        self._nrtm4_client_states = dict()
         self._is_serial_synchronised.cache_clear()
 
 
@@ -1159,16 +1667,42 @@ class SessionChangedObjectsTracker:
         self.reset()
 
     def object_modified_dict(self, rpsl_obj: Dict[str, str], origin: Optional[JournalEntryOrigin] = None):
-        try:
-            prefix = rpsl_obj["prefix"]
-        except (KeyError, AttributeError):
-            prefix = None
-        self.object_modified(rpsl_obj["object_class"], prefix, origin)
+        def get_optional(key: str):
+            try:
+                return rpsl_obj[key]
+            except (KeyError, AttributeError):
+                return None
+
+        self.object_modified(
+            rpsl_obj["object_class"],
+            get_optional("prefix"),
+            origin,
+            source=get_optional("source"),
+            asn_first=get_optional("asn_first"),
+            rpsl_pk=get_optional("rpsl_pk"),
+        )
 
     def object_modified(
-        self, object_class: str, prefix: Optional[IP], origin: Optional[JournalEntryOrigin] = None
+        self,
+        object_class: str,
+        prefix: Optional[IP],
+        origin: Optional[JournalEntryOrigin] = None,
+        source: Optional[str] = None,
+        asn_first: Optional[int] = None,
+        rpsl_pk: Optional[str] = None,
     ):
         self._object_classes.add(object_class)
+        if object_class in PRELOAD_RELEVANT_OBJECT_CLASSES:
+            # If the origin is not known, the preload store is fully reloaded.
+            if source and asn_first is not None:
+                self._preload_changed_origins.add((source, f"AS{asn_first}"))
+            else:
+                self._preload_full_reload = True
+        if object_class in SET_GRAPH_OBJECT_CLASSES:
+            if source and rpsl_pk:
+                self._preload_changed_set_graph_objects.add((source, object_class, rpsl_pk))
+            else:
+                self._preload_full_reload = True
         if all(
             [
                 prefix,
@@ -1180,6 +1714,7 @@ class SessionChangedObjectsTracker:
 
     def all_object_classes_updated(self):
         self._object_classes.update(OBJECT_CLASS_MAPPING.keys())
+        self._preload_full_reload = True
 
     def pre_commit(self):
         """
@@ -1199,13 +1734,24 @@ class SessionChangedObjectsTracker:
 
     def commit(self):
         if self._object_classes:
-            self.preloader.signal_reload(self._object_classes)
+            self.preloader.invalidate_set_members_cache(self._object_classes)
+            if self._preload_full_reload:
+                self.preloader.signal_reload(self._object_classes)
+            else:
+                self.preloader.signal_reload(
+                    self._object_classes,
+                    changed_origins=self._preload_changed_origins,
+                    changed_set_graph_objects=self._preload_changed_set_graph_objects,
+                )
 
         self.reset()
 
     def reset(self):
         self._object_classes = set()
         self._prefixes_for_routepref = set()
+        self._preload_changed_origins: Set[Tuple[str, str]] = set()
+        self._preload_changed_set_graph_objects: Set[Tuple[str, str, str]] = set()
+        self._preload_full_reload = False
 
 
 def is_serial_synchronised(database_handler: DatabaseHandler, source: str, settings_only=False) -> bool:
@@ -48,6 +48,32 @@ class AuthoritativeChangeOrigin(enum.Enum):
 Base = declarative_base()
 
 
+def source_partition_name(table_name: str, source: str) -> str:
+    """
+    Name of the partition of a table that is partitioned by source.
+    Sources without their own partition are kept in the default partition.
+    """
+    return f"{table_name}_source_{source.lower().replace('-', '_')}"
+
+
+def default_partition_name(table_name: str) -> str:
+    return f"{table_name}_default"
+
+
+def create_default_partition(table: sa.Table) -> None:
+    """
+    Create the default partition for a table partitioned by source,
+    right after creating the table. Normally this is done by the
+    migrations, but the tests create tables from the models.
+    """
+    partition_name = default_partition_name(table.name)
+    sa.event.listen(
+        table,
+        "after_create",
+        sa.DDL(f"CREATE TABLE {partition_name} PARTITION OF {table.name} DEFAULT"),
+    )
+
+
 class RPSLDatabaseObject(Base):  # type: ignore
     """
     SQLAlchemy ORM object for RPSL database objects.
@@ -62,7 +88,8 @@ class RPSLDatabaseObject(Base):  # type: ignore
     # in alembic: op.execute('create EXTENSION if not EXISTS 'pgcrypto';')
     pk = sa.Column(pg.UUID(as_uuid=True), server_default=sa.text("gen_random_uuid()"), primary_key=True)
     rpsl_pk = sa.Column(sa.String, index=True, nullable=False)
-    source = sa.Column(sa.String, index=True, nullable=False)
+    # This table is partitioned by source, which must therefore be in the primary key
+    source = sa.Column(sa.String, index=True, nullable=False, primary_key=True)
 
     object_class = sa.Column(sa.String, nullable=False, index=True)
     parsed_data = sa.Column(pg.JSONB, nullable=False)
@@ -116,12 +143,15 @@ class RPSLDatabaseObject(Base):  # type: ignore
             index_name = "ix_rpsl_objects_parsed_data_" + name.replace("-", "_")
             index_on = sa.text(f"(parsed_data->'{name}')")
             args.append(sa.Index(index_name, index_on, postgresql_using="gin"))
-        return tuple(args)
+        return tuple(args) + ({"postgresql_partition_by": "LIST (source)"},)
 
     def __repr__(self):
         return f"<{self.rpsl_pk}/{self.source}/{self.pk}>"
 
 
+create_default_partition(RPSLDatabaseObject.__table__)
+
+
 class RPSLDatabaseJournal(Base):  # type: ignore
     """
     SQLAlchemy ORM object for change history of RPSL database objects.
@@ -142,12 +172,14 @@ class RPSLDatabaseJournal(Base):  # type: ignore
         serial_global_seq,
         server_default=serial_global_seq.next_value(),
         nullable=False,
+        # Unique indexes must include the partition key, but
+        # the sequence guarantees uniqueness already.
         index=True,
-        unique=True,
     )
 
     rpsl_pk = sa.Column(sa.String, index=True, nullable=False)
-    source = sa.Column(sa.String, index=True, nullable=False)
+    # This table is partitioned by source, which must therefore be in the primary key
+    source = sa.Column(sa.String, index=True, nullable=False, primary_key=True)
     origin = sa.Column(
         sa.Enum(JournalEntryOrigin),
         nullable=False,
@@ -172,12 +204,16 @@ class RPSLDatabaseJournal(Base):  # type: ignore
             sa.UniqueConstraint(
                 "serial_nrtm", "source", name="rpsl_objects_history_serial_nrtm_source_unique"
             ),
+            {"postgresql_partition_by": "LIST (source)"},
         )
 
     def __repr__(self):
         return f"<{self.source}/{self.serial}/{self.operation}/{self.rpsl_pk}>"
 
 
+create_default_partition(RPSLDatabaseJournal.__table__)
+
+
 class RPSLDatabaseObjectSuspended(Base):  # type: ignore
     """
     SQLAlchemy ORM object for suspended RPSL objects (#577)
@@ -227,6 +263,15 @@ class RPSLDatabaseStatus(Base):  # type: ignore
 
     force_reload = sa.Column(sa.Boolean(), default=False, nullable=False)
     synchronised_serials = sa.Column(sa.Boolean(), default=True, nullable=False)
+    # The serial, and ETag, Last-Modified, size or hash of the files
+    # of the last import from import_source, to detect changes.
+    # JSON columns store None as SQL NULL, which the status upsert
+    # in DatabaseStatusTracker treats as unchanged.
+    import_source_state = sa.Column(pg.JSONB(none_as_null=True))
+    # The session, version and files of the NRTMv4 files published
+    # for this source, and the session and version mirrored as NRTMv4 client
+    nrtm4_server_state = sa.Column(pg.JSONB(none_as_null=True))
+    nrtm4_client_state = sa.Column(pg.JSONB(none_as_null=True))
 
     last_error = sa.Column(sa.Text)
     last_error_timestamp = sa.Column(sa.DateTime(timezone=True))
@@ -442,7 +487,6 @@ class AuthMntner(Base):  # type: ignore
     rpsl_mntner_pk = sa.Column(sa.String, index=True, nullable=False)
     rpsl_mntner_obj_id = sa.Column(
         pg.UUID,
-        sa.ForeignKey("rpsl_objects.pk", ondelete="RESTRICT"),
         index=True,
         unique=True,
         nullable=False,
@@ -471,6 +515,13 @@ class AuthMntner(Base):  # type: ignore
                 "rpsl_mntner_source",
                 name="auth_mntner_rpsl_mntner_obj_id_source_unique",
             ),
+            # rpsl_objects is partitioned by source, so the source is part of its primary key
+            sa.ForeignKeyConstraint(
+                ["rpsl_mntner_obj_id", "rpsl_mntner_source"],
+                ["rpsl_objects.pk", "rpsl_objects.source"],
+                name="auth_mntner_rpsl_mntner_obj_id_source_fkey",
+                ondelete="RESTRICT",
+            ),
         ]
         return tuple(args)
 
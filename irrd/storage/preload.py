@@ -1,13 +1,15 @@
 import logging
+import os
 import random
 import signal
 import sys
 import threading
 import time
 from collections import defaultdict
-from typing import Dict, List, Optional, Set, Union
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import redis
+import ujson
 from setproctitle import setproctitle
 
 from irrd.conf import get_setting
@@ -16,16 +18,52 @@ from irrd.rpki.status import RPKIStatus
 from irrd.scopefilter.status import ScopeFilterStatus
 from irrd.utils.process_support import ExceptionLoggingProcess
 
+from .preload_file import (
+    PreloadStoreEntries,
+    PreloadStoreFile,
+    PreloadStoreFileError,
+    encode_prefixes,
+    merge_prefixes,
+    preload_store_overlay_path,
+    preload_store_path,
+    write_preload_store_file,
+)
 from .queries import RPSLDatabaseQuery
+from .set_graph import (
+    SET_GRAPH_MEMBER_OF_OBJECT_CLASSES,
+    SET_GRAPH_OBJECT_CLASSES,
+    SET_GRAPH_SET_OBJECT_CLASSES,
+    SetGraphKey,
+    SetMembershipGraph,
+    set_graph_entry,
+)
 
 SENTINEL_HASH_CREATED = b"SENTINEL_HASH_CREATED"
 REDIS_ORIGIN_ROUTE4_STORE_KEY = b"irrd-preload-origin-route4"
 REDIS_ORIGIN_ROUTE6_STORE_KEY = b"irrd-preload-origin-route6"
+REDIS_SET_GRAPH_STORE_KEY = b"irrd-preload-set-graph"
 REDIS_PRELOAD_RELOAD_CHANNEL = "irrd-preload-reload-channel"
 REDIS_PRELOAD_COMPLETE_CHANNEL = "irrd-preload-complete-channel"
+REDIS_PRELOAD_DELTA_MESSAGE_PREFIX = "delta:"
 REDIS_ORIGIN_LIST_SEPARATOR = ","
 REDIS_KEY_ORIGIN_SOURCE_SEPARATOR = "_"
+REDIS_SET_GRAPH_KEY_PREFIX = "set:"
 MAX_MEMORY_LIFETIME = 60
+# Deltas larger than this are handled as a full reload, as a full
+# reload is cheaper than a query with a very large set of origins.
+MAX_DELTA_ORIGINS = 5000
+MAX_DELTA_SET_GRAPH_OBJECTS = 5000
+# The preload store overlay file is merged into the base file once it
+# has more entries than this, see PreloadStoreManager._write_store_file()
+MAX_STORE_FILE_OVERLAY_ENTRIES = 20000
+PRELOAD_RELEVANT_OBJECT_CLASSES = {"route", "route6"}
+# The set members cache is kept in Redis hashes per generation, which
+# is increased when relevant objects change. Stale hashes expire.
+REDIS_SET_MEMBERS_CACHE_PREFIX = "irrd-set-members-cache-"
+REDIS_SET_MEMBERS_CACHE_SETS_GENERATION_KEY = "irrd-set-members-cache-generation-sets"
+REDIS_SET_MEMBERS_CACHE_ROUTES_GENERATION_KEY = "irrd-set-members-cache-generation-routes"
+SET_MEMBERS_CACHE_TTL = 3600
+SET_MEMBERS_RELEVANT_OBJECT_CLASSES = {"as-set", "route-set", "aut-num"}
 
 logger = logging.getLogger(__name__)
 
@@ -37,16 +75,80 @@ large data sets, this can improve performance.
 """
 
 
+def preload_store_key(source: str, origin: str) -> str:
+    """
+    Key for the origin/source combination in the Redis preload hashes.
+    """
+    return source + REDIS_KEY_ORIGIN_SOURCE_SEPARATOR + origin
+
+
+def split_preload_store_key(key: str) -> Tuple[str, int]:
+    """
+    Split a key generated by preload_store_key() into the source and AS number.
+    """
+    source, origin = key.split(REDIS_KEY_ORIGIN_SOURCE_SEPARATOR)
+    return source, int(origin[2:])
+
+
+def set_graph_key(source: str, object_class: str, rpsl_pk: str) -> str:
+    """
+    Key for an object in the Redis set graph hash. These keys
+    can be combined with preload_store_key() keys in a delta message.
+    """
+    return REDIS_SET_GRAPH_KEY_PREFIX + REDIS_KEY_ORIGIN_SOURCE_SEPARATOR.join(
+        [source, object_class, rpsl_pk]
+    )
+
+
+def is_set_graph_key(key: str) -> bool:
+    return key.startswith(REDIS_SET_GRAPH_KEY_PREFIX)
+
+
+def split_set_graph_key(key: str) -> SetGraphKey:
+    """
+    Split a key generated by set_graph_key() into the source, object class and RPSL PK.
+    """
+    source, object_class, rpsl_pk = key[len(REDIS_SET_GRAPH_KEY_PREFIX) :].split(
+        REDIS_KEY_ORIGIN_SOURCE_SEPARATOR, 2
+    )
+    return source, object_class, rpsl_pk
+
+
+def build_delta_message(keys: Iterable[str]) -> str:
+    """
+    Build a pubsub message for a delta update of a set of
+    preload store keys, as generated by preload_store_key()
+    or set_graph_key().
+    """
+    return REDIS_PRELOAD_DELTA_MESSAGE_PREFIX + REDIS_ORIGIN_LIST_SEPARATOR.join(sorted(keys))
+
+
+def parse_delta_message(message: Union[bytes, str, None]) -> Optional[Set[str]]:
+    """
+    Parse a pubsub message. Returns the set of preload store keys
+    for delta messages, or None if a full reload is meant.
+    """
+    if isinstance(message, bytes):
+        message = message.decode("ascii")
+    if not message or not message.startswith(REDIS_PRELOAD_DELTA_MESSAGE_PREFIX):
+        return None
+    keys = message[len(REDIS_PRELOAD_DELTA_MESSAGE_PREFIX) :]
+    return set(keys.split(REDIS_ORIGIN_LIST_SEPARATOR)) if keys else set()
+
+
 class PersistentPubSubWorkerThread(redis.client.PubSubWorkerThread):  # type: ignore
     """
     This is a variation of PubSubWorkerThread which persists after an error.
     Rather than terminate, the thread will attempt to reconnect periodically
     until the connection is re-established.
+    As delta updates may have been missed while disconnected, the callback
+    is called for a full reload after reconnecting.
     """
 
     def __init__(self, callback, *args, **kwargs):
         self.callback = callback
         self.should_resubscribe = True
+        self.should_reload = False
         super().__init__(*args, **kwargs)
 
     def run(self):
@@ -56,11 +158,15 @@ class PersistentPubSubWorkerThread(redis.client.PubSubWorkerThread):  # type: ig
                 if self.should_resubscribe:
                     self.pubsub.subscribe(**{REDIS_PRELOAD_COMPLETE_CHANNEL: self.callback})
                     self.should_resubscribe = False
+                if self.should_reload:  # pragma: no cover
+                    self.callback()
+                    self.should_reload = False
                 self.pubsub.get_message(ignore_subscribe_messages=True, timeout=self.sleep_time)
             except redis.ConnectionError as rce:  # pragma: no cover
                 logger.error(f"Failed redis pubsub connection, attempting reconnect and reload in 5s: {rce}")
                 time.sleep(5)
                 self.should_resubscribe = True
+                self.should_reload = True
             except Exception as exc:  # pragma: no cover
                 logger.error(
                     (
@@ -71,6 +177,7 @@ class PersistentPubSubWorkerThread(redis.client.PubSubWorkerThread):  # type: ig
                 )
                 time.sleep(5)
                 self.should_resubscribe = True
+                self.should_reload = True
         self.pubsub.close()  # pragma: no cover
 
 
@@ -83,6 +190,8 @@ class Preloader:
     """
 
     _memory_loaded = False
+    _store_file: Optional[PreloadStoreFile] = None
+    _set_graph: Optional[SetMembershipGraph] = None
 
     def __init__(self, enable_queries=True):
         """
@@ -90,9 +199,12 @@ class Preloader:
         If this instance is only used for signalling that the store needs to be
         updated, set enable_queries=False.
         Otherwise, this method starts a background thread that keeps an in-memory store,
-        which is automatically updated.
+        which is automatically updated. If preload_store_dir is set, the in-memory
+        store is a memory-mapped file shared by all processes on this host,
+        otherwise a local copy loaded from Redis.
         """
         self._redis_conn = redis.Redis.from_url(get_setting("redis_url"))
+        self._store_file_dir = get_setting("preload_store_dir")
         if enable_queries:
             self._pubsub = self._redis_conn.pubsub()
             self._pubsub_thread = PersistentPubSubWorkerThread(
@@ -105,7 +217,12 @@ class Preloader:
                 # from Redis right away instead of waiting for a signal.
                 self._load_routes_into_memory()
 
-    def signal_reload(self, object_classes_changed: Optional[Set[str]] = None) -> None:
+    def signal_reload(
+        self,
+        object_classes_changed: Optional[Set[str]] = None,
+        changed_origins: Optional[Set[Tuple[str, str]]] = None,
+        changed_set_graph_objects: Optional[Set[SetGraphKey]] = None,
+    ) -> None:
         """
         Perform a (re)load.
         Should be called after changes to the DB have been committed.
@@ -115,20 +232,124 @@ class Preloader:
 
         If object_classes_changed is provided, a reload is only performed
         if those classes are relevant to the data in the preload store.
+        If changed_origins and changed_set_graph_objects are provided, only
+        the entries for those are reloaded, rather than the full store.
+        changed_origins is a set of (source, origin) tuples, with origins
+        in the same format as for routes_for_origins(), e.g. AS65537.
+        changed_set_graph_objects is a set of (source, object class, RPSL PK)
+        tuples, for objects of classes in SET_GRAPH_OBJECT_CLASSES.
         """
-        relevant_object_classes = {"route", "route6"}
-        if object_classes_changed is None or object_classes_changed.intersection(relevant_object_classes):
+        if object_classes_changed is not None and not object_classes_changed.intersection(
+            PRELOAD_RELEVANT_OBJECT_CLASSES | SET_GRAPH_OBJECT_CLASSES
+        ):
+            return
+        if (
+            changed_origins is not None
+            and changed_set_graph_objects is not None
+            and (changed_origins or changed_set_graph_objects)
+            and len(changed_origins) <= MAX_DELTA_ORIGINS
+            and len(changed_set_graph_objects) <= MAX_DELTA_SET_GRAPH_OBJECTS
+        ):
+            keys = [preload_store_key(source, origin) for source, origin in changed_origins]
+            keys += [set_graph_key(*key) for key in changed_set_graph_objects]
+            self._redis_conn.publish(REDIS_PRELOAD_RELOAD_CHANNEL, build_delta_message(keys))
+        else:
             self._redis_conn.publish(REDIS_PRELOAD_RELOAD_CHANNEL, "reload")
 
+    def invalidate_set_members_cache(self, object_classes_changed: Set[str]) -> None:
+        """
+        Invalidate cached set members after changes to the DB have been committed.
+        Changes to as-sets, route-sets and aut-nums invalidate all entries,
+        changes to route(6) objects only the entries that depend on them.
+        """
+        pipeline = self._redis_conn.pipeline(transaction=False)
+        if object_classes_changed.intersection(SET_MEMBERS_RELEVANT_OBJECT_CLASSES):
+            pipeline.incr(REDIS_SET_MEMBERS_CACHE_SETS_GENERATION_KEY)
+        if object_classes_changed.intersection(PRELOAD_RELEVANT_OBJECT_CLASSES):
+            pipeline.incr(REDIS_SET_MEMBERS_CACHE_ROUTES_GENERATION_KEY)
+        if len(pipeline):
+            pipeline.execute()
+
+    def set_members_cache_generation(self) -> Optional[Tuple[int, int]]:
+        """
+        Retrieve the current generation of the set members cache, to be
+        passed to get/store_cached_set_members(). The generation must be
+        retrieved before resolving sets from the DB, so that a result
+        is never stored as part of a newer generation.
+        Returns None if the cache is unavailable.
+        """
+        try:
+            sets_generation, routes_generation = self._redis_conn.mget(
+                [REDIS_SET_MEMBERS_CACHE_SETS_GENERATION_KEY, REDIS_SET_MEMBERS_CACHE_ROUTES_GENERATION_KEY]
+            )
+        except redis.RedisError as re:
+            logger.error(f"Failed to retrieve set members cache generation: {re}")
+            return None
+        return int(sets_generation or 0), int(routes_generation or 0)
+
+    def get_cached_set_members(self, key: str, generation: Optional[Tuple[int, int]]) -> Optional[Set[str]]:
+        """
+        Retrieve cached set members for key, in the given generation.
+        Returns None if there is no valid cache entry.
+        """
+        if generation is None:
+            return None
+        sets_generation, routes_generation = generation
+        try:
+            value = self._redis_conn.hget(f"{REDIS_SET_MEMBERS_CACHE_PREFIX}{sets_generation}", key)
+        except redis.RedisError as re:
+            logger.error(f"Failed to retrieve cached set members: {re}")
+            return None
+        if value is None:
+            return None
+        entry = ujson.decode(value)
+        if entry["routes_generation"] is not None and entry["routes_generation"] != routes_generation:
+            return None
+        return set(entry["members"])
+
+    def store_cached_set_members(
+        self,
+        key: str,
+        generation: Optional[Tuple[int, int]],
+        members: Iterable[str],
+        route_dependent: bool,
+    ) -> None:
+        """
+        Store set members for key in the cache, in the given generation.
+        If route_dependent is set, the entry is also invalidated by
+        changes to route(6) objects.
+        """
+        if generation is None:
+            return
+        sets_generation, routes_generation = generation
+        entry = {
+            "members": sorted(members),
+            "routes_generation": routes_generation if route_dependent else None,
+        }
+        cache_key = f"{REDIS_SET_MEMBERS_CACHE_PREFIX}{sets_generation}"
+        try:
+            pipeline = self._redis_conn.pipeline(transaction=False)
+            pipeline.hset(cache_key, key, ujson.encode(entry))
+            pipeline.expire(cache_key, SET_MEMBERS_CACHE_TTL)
+            pipeline.execute()
+        except redis.RedisError as re:
+            logger.error(f"Failed to store cached set members: {re}")
+
     def routes_for_origins(
-        self, origins: Union[List[str], Set[str]], sources: List[str], ip_version: Optional[int] = None
-    ) -> Set[str]:
+        self,
+        origins: Union[List[str], Set[str]],
+        sources: List[str],
+        ip_version: Optional[int] = None,
+        aggregate: bool = False,
+    ) -> List[str]:
         """
         Retrieve all prefixes (in str format) originating from the provided origins,
         from the given sources.
 
-        Prefixes are guaranteed to be unique. ip_version can be set to 4 or 6
-        to restrict responses to IPv4 or IPv6 prefixes. Blocks until the first
+        Prefixes are guaranteed to be unique, and are sorted, with IPv4
+        before IPv6. ip_version can be set to 4 or 6
+        to restrict responses to IPv4 or IPv6 prefixes. If aggregate is set,
+        adjacent and covered prefixes are merged. Blocks until the first
         store has been built.
         Origins must be strings in a cleaned format, e.g. AS65537, but not
         AS065537 or as65537.
@@ -136,41 +357,82 @@ class Preloader:
         """
         while not self._memory_loaded:
             time.sleep(1)  # pragma: no cover
-        logger.critical(
-            f"preload requested routes for {origins=} {sources=} {ip_version=}:"
-            f" {self._origin_route4_store=} {self._origin_route6_store=}"
-        )
         if ip_version and ip_version not in [4, 6]:
             raise ValueError(f"Invalid IP version: {ip_version}")
         if not origins or not sources:
-            return set()
+            return []
+
+        store_file = self._store_file
+        if store_file:
+            return store_file.routes_for_origins(origins, sources, ip_version, aggregate)
 
-        prefix_sets: Set[str] = set()
+        # Delta updates modify the per-source dicts in place,
+        # so lookups must not assume an origin remains present.
+        data4 = []
+        data6 = []
         for source in sources:
             for origin in origins:
-                if (
-                    (not ip_version or ip_version == 4)
-                    and source in self._origin_route4_store
-                    and origin in self._origin_route4_store[source]
-                ):
-                    prefix_sets.update(
-                        self._origin_route4_store[source][origin].split(REDIS_ORIGIN_LIST_SEPARATOR)
-                    )
-                if (
-                    (not ip_version or ip_version == 6)
-                    and source in self._origin_route6_store
-                    and origin in self._origin_route6_store[source]
-                ):
-                    prefix_sets.update(
-                        self._origin_route6_store[source][origin].split(REDIS_ORIGIN_LIST_SEPARATOR)
-                    )
-
-        return prefix_sets
+                if not ip_version or ip_version == 4:
+                    routes = self._origin_route4_store.get(source, {}).get(origin)
+                    if routes:
+                        data4.append(routes)
+                if not ip_version or ip_version == 6:
+                    routes = self._origin_route6_store.get(source, {}).get(origin)
+                    if routes:
+                        data6.append(routes)
+
+        return merge_prefixes(data4, 4, aggregate) + merge_prefixes(data6, 6, aggregate)
+
+    def set_graph_loaded(self) -> bool:
+        return self._set_graph is not None
+
+    def find_set_members(
+        self,
+        set_names: Set[str],
+        sources: List[str],
+        object_classes: List[str],
+        limit_source: Optional[str] = None,
+    ) -> Tuple[Set[str], Set[str], Optional[str]]:
+        """
+        Find all members of a number of as-sets or route-sets, from the
+        in-memory set membership graph. See SetMembershipGraph.find_set_members().
+        Must only be called if set_graph_loaded() is True.
+        """
+        assert self._set_graph
+        return self._set_graph.find_set_members(set_names, sources, object_classes, limit_source)
 
     def _load_routes_into_memory(self, redis_message=None):
         """
         Update the in-memory store. This is called whenever a
         message is sent to REDIS_PRELOAD_COMPLETE_CHANNEL.
+
+        If the message is a delta, and the store was loaded before,
+        only the keys in the delta are updated.
+        If the store file is used, the new file is mapped instead,
+        regardless of the type of message. The set membership graph
+        is always loaded from Redis.
+        """
+        delta_keys = parse_delta_message(redis_message["data"]) if redis_message else None
+        set_graph_delta_keys = None
+        if delta_keys is not None:
+            set_graph_delta_keys = {key for key in delta_keys if is_set_graph_key(key)}
+            delta_keys -= set_graph_delta_keys
+
+        if self._store_file_dir:
+            self._load_store_file()
+        elif delta_keys is not None and self._memory_loaded:
+            self._load_delta_into_memory(delta_keys)
+        else:
+            self._load_full_into_memory()
+
+        if set_graph_delta_keys is not None and self._set_graph is not None:
+            self._load_set_graph_delta_into_memory(set_graph_delta_keys)
+        else:
+            self._load_set_graph_into_memory()
+
+    def _load_full_into_memory(self) -> None:
+        """
+        Load the entire store from Redis into memory.
         """
         while not self._redis_conn.exists(REDIS_ORIGIN_ROUTE4_STORE_KEY):
             time.sleep(1)  # pragma: no cover
@@ -182,23 +444,98 @@ class Preloader:
         new_origin_route4_store = dict()
         new_origin_route6_store = dict()
 
-        def _load(redis_key, target):
+        # Prefixes are encoded on load, so that queries do not need to parse them.
+        def _load(redis_key, target, ip_version):
             for key, routes in self._redis_conn.hgetall(redis_key).items():
                 if key == SENTINEL_HASH_CREATED:
                     continue
                 source, origin = key.decode("ascii").split(REDIS_KEY_ORIGIN_SOURCE_SEPARATOR)
                 if source not in target:
                     target[source] = dict()
-                target[source][origin] = routes.decode("ascii")
+                target[source][origin] = self._encode_redis_routes(routes, ip_version)
 
-        _load(REDIS_ORIGIN_ROUTE4_STORE_KEY, new_origin_route4_store)
-        _load(REDIS_ORIGIN_ROUTE6_STORE_KEY, new_origin_route6_store)
+        _load(REDIS_ORIGIN_ROUTE4_STORE_KEY, new_origin_route4_store, 4)
+        _load(REDIS_ORIGIN_ROUTE6_STORE_KEY, new_origin_route6_store, 6)
 
         self._origin_route4_store = new_origin_route4_store
         self._origin_route6_store = new_origin_route6_store
 
         self._memory_loaded = True
 
+    def _load_set_graph_into_memory(self) -> None:
+        """
+        Load the entire set membership graph from Redis into memory.
+        The graph is always written in the same transaction as the
+        route store, so it exists once the route store exists.
+        """
+        while not self._redis_conn.exists(REDIS_SET_GRAPH_STORE_KEY):
+            time.sleep(1)  # pragma: no cover
+
+        new_set_graph = SetMembershipGraph()
+        for key, entry in self._redis_conn.hgetall(REDIS_SET_GRAPH_STORE_KEY).items():
+            if key == SENTINEL_HASH_CREATED:
+                continue
+            new_set_graph.update(split_set_graph_key(key.decode("utf-8")), ujson.decode(entry))
+        self._set_graph = new_set_graph
+
+    def _load_set_graph_delta_into_memory(self, delta_keys: Set[str]) -> None:
+        """
+        Update the in-memory set membership graph for specific keys only.
+        Keys that no longer exist in Redis are removed.
+        """
+        assert self._set_graph
+        keys = sorted(delta_keys)
+        if not keys:
+            return
+        entries = self._redis_conn.hmget(REDIS_SET_GRAPH_STORE_KEY, keys)
+        for key, entry in zip(keys, entries):
+            self._set_graph.update(split_set_graph_key(key), ujson.decode(entry) if entry else None)
+        logger.debug(f"Updated {len(keys)} keys in in-memory set membership graph from delta")
+
+    def _load_store_file(self) -> None:
+        """
+        Map the current store file and its overlay. The previous mappings
+        are unmapped once running queries no longer reference them.
+        After a delta, only the overlay file is new, so the pages of
+        the base file remain in the page cache.
+        """
+        path = preload_store_path(self._store_file_dir)
+        while not os.path.exists(path):
+            time.sleep(1)  # pragma: no cover
+        self._store_file = PreloadStoreFile(path, preload_store_overlay_path(self._store_file_dir))
+        self._memory_loaded = True
+        logger.debug(
+            f"Mapped preload store file {path} generation {self._store_file.generation}, "
+            f"overlay {'present' if self._store_file.overlay else 'not present'}"
+        )
+
+    def _load_delta_into_memory(self, delta_keys: Set[str]) -> None:
+        """
+        Update the in-memory store for specific keys only.
+        Keys that no longer exist in Redis are removed.
+        """
+        keys = sorted(delta_keys)
+        if not keys:
+            return
+        routes4 = self._redis_conn.hmget(REDIS_ORIGIN_ROUTE4_STORE_KEY, keys)
+        routes6 = self._redis_conn.hmget(REDIS_ORIGIN_ROUTE6_STORE_KEY, keys)
+
+        for key, key_routes4, key_routes6 in zip(keys, routes4, routes6):
+            source, origin = key.split(REDIS_KEY_ORIGIN_SOURCE_SEPARATOR)
+            for target, routes, ip_version in [
+                (self._origin_route4_store, key_routes4, 4),
+                (self._origin_route6_store, key_routes6, 6),
+            ]:
+                if routes is None:
+                    target.get(source, {}).pop(origin, None)
+                else:
+                    target.setdefault(source, {})[origin] = self._encode_redis_routes(routes, ip_version)
+        logger.debug(f"Updated {len(keys)} keys in in-memory preload store from delta")
+
+    @staticmethod
+    def _encode_redis_routes(routes: bytes, ip_version: int) -> bytes:
+        return encode_prefixes(routes.decode("ascii").split(REDIS_ORIGIN_LIST_SEPARATOR), ip_version)
+
 
 class PreloadStoreManager(ExceptionLoggingProcess):
     """
@@ -211,6 +548,10 @@ class PreloadStoreManager(ExceptionLoggingProcess):
         super().__init__(*args, **kwargs)
         self._target = self.main
         self._redis_conn = redis.Redis.from_url(get_setting("redis_url"))
+        self._store_file_dir = get_setting("preload_store_dir")
+        self._pending_lock = threading.Lock()
+        self._pending_full_reload = False
+        self._pending_delta_keys: Set[str] = set()
 
     def main(self):
         """
@@ -241,8 +582,12 @@ class PreloadStoreManager(ExceptionLoggingProcess):
                 self._pubsub.subscribe(REDIS_PRELOAD_RELOAD_CHANNEL)
                 for item in self._pubsub.listen():
                     if item["type"] == "message":
-                        logger.debug("Reload requested through redis channel")
-                        self.perform_reload()
+                        delta_keys = parse_delta_message(item["data"])
+                        logger.debug(
+                            "Reload requested through redis channel, "
+                            f"{'full' if delta_keys is None else len(delta_keys)} keys"
+                        )
+                        self.perform_reload(delta_keys)
                         if self.terminate:
                             return
             except redis.ConnectionError as rce:  # pragma: no cover
@@ -255,14 +600,26 @@ class PreloadStoreManager(ExceptionLoggingProcess):
         queries are being answered with outdated data.
         """
         try:
-            self._redis_conn.delete(REDIS_ORIGIN_ROUTE4_STORE_KEY, REDIS_ORIGIN_ROUTE6_STORE_KEY)
+            self._redis_conn.delete(
+                REDIS_ORIGIN_ROUTE4_STORE_KEY, REDIS_ORIGIN_ROUTE6_STORE_KEY, REDIS_SET_GRAPH_STORE_KEY
+            )
         except redis.ConnectionError as rce:  # pragma: no cover
             logger.error(
                 "Failed to empty preload store due to redis connection error, "
                 f"queries may have outdated results until full reload is completed (max 30s): {rce}"
             )
+        if self._store_file_dir:
+            self._remove_file(preload_store_path(self._store_file_dir))
+            self._remove_file(preload_store_overlay_path(self._store_file_dir))
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
 
-    def perform_reload(self) -> None:
+    def perform_reload(self, delta_keys: Optional[Set[str]] = None) -> None:
         """
         Perform a (re)load.
         Should be called after changes to the DB have been committed.
@@ -271,11 +628,20 @@ class PreloadStoreManager(ExceptionLoggingProcess):
         already running, the new thread will start after the current one
         is done, due to locking.
 
-        If a current thread is running, and a next thread is already
-        running as well (waiting for a lock) no action is taken. The
-        change that prompted this reload call will already be processed
-        by the thread that is currently waiting.
+        If delta_keys is set, only those keys (see preload_store_key())
+        are reloaded, otherwise the entire store is reloaded.
+        Pending reloads are merged and picked up by the thread when it
+        acquires the lock, so if a current thread is running, and a next
+        thread is already running as well (waiting for a lock) no action
+        is taken. The change that prompted this reload call will already
+        be processed by the thread that is currently waiting.
         """
+        with self._pending_lock:
+            if delta_keys is None:
+                self._pending_full_reload = True
+            else:
+                self._pending_delta_keys.update(delta_keys)
+
         self._remove_dead_threads()
         if len(self._threads) > 1:
             # Another thread is already scheduled to follow the current one
@@ -284,13 +650,36 @@ class PreloadStoreManager(ExceptionLoggingProcess):
         thread.start()
         self._threads.append(thread)
 
-    def update_route_store(self, new_origin_route4_store, new_origin_route6_store) -> bool:
+    def take_pending_reload(self) -> Tuple[bool, Set[str]]:
+        """
+        Retrieve and reset the pending reload work.
+        Returns a tuple of whether a full reload is needed,
+        and otherwise, the set of keys to reload.
+        """
+        with self._pending_lock:
+            full_reload, delta_keys = self._pending_full_reload, self._pending_delta_keys
+            self._pending_full_reload = False
+            self._pending_delta_keys = set()
+        if full_reload:
+            return True, set()
+        return False, delta_keys
+
+    def update_route_store(
+        self, new_origin_route4_store, new_origin_route6_store, new_set_graph_store=None
+    ) -> bool:
         """
-        Store the new route information in redis. Returns True on success, False on failure.
+        Store the new route information and set membership graph in redis.
+        new_set_graph_store is a dict with set_graph_key() keys and
+        entries from set_graph_entry() as values.
+        Returns True on success, False on failure.
         """
+        if new_set_graph_store is None:
+            new_set_graph_store = {}
         try:
             pipeline = self._redis_conn.pipeline(transaction=True)
-            pipeline.delete(REDIS_ORIGIN_ROUTE4_STORE_KEY, REDIS_ORIGIN_ROUTE6_STORE_KEY)
+            pipeline.delete(
+                REDIS_ORIGIN_ROUTE4_STORE_KEY, REDIS_ORIGIN_ROUTE6_STORE_KEY, REDIS_SET_GRAPH_STORE_KEY
+            )
             # The redis store can't store sets, only strings
             origin_route4_str_dict = {
                 k: REDIS_ORIGIN_LIST_SEPARATOR.join(v) for k, v in new_origin_route4_store.items()
@@ -302,10 +691,16 @@ class PreloadStoreManager(ExceptionLoggingProcess):
             # in order not to block queries.
             origin_route4_str_dict[SENTINEL_HASH_CREATED] = "1"
             origin_route6_str_dict[SENTINEL_HASH_CREATED] = "1"
+            set_graph_str_dict = {k: ujson.encode(v) for k, v in new_set_graph_store.items()}
+            set_graph_str_dict[SENTINEL_HASH_CREATED] = "1"
             pipeline.hset(REDIS_ORIGIN_ROUTE4_STORE_KEY, mapping=origin_route4_str_dict)
             pipeline.hset(REDIS_ORIGIN_ROUTE6_STORE_KEY, mapping=origin_route6_str_dict)
+            pipeline.hset(REDIS_SET_GRAPH_STORE_KEY, mapping=set_graph_str_dict)
             pipeline.execute()
 
+            if self._store_file_dir:
+                self._write_store_file(new_origin_route4_store, new_origin_route6_store)
+
             self._redis_conn.publish(REDIS_PRELOAD_COMPLETE_CHANNEL, "complete")
             return True
 
@@ -318,6 +713,135 @@ class PreloadStoreManager(ExceptionLoggingProcess):
             self.perform_reload()
             return False
 
+    def update_route_store_delta(
+        self, new_origin_route4_store, new_origin_route6_store, delta_keys, new_set_graph_store=None
+    ) -> bool:
+        """
+        Store updated route information and set membership graph entries
+        in redis, for the keys in delta_keys only. delta_keys may contain
+        both preload_store_key() and set_graph_key() keys.
+        Keys in delta_keys that are not in the new stores are removed.
+        Returns True on success, False on failure.
+        """
+        if new_set_graph_store is None:
+            new_set_graph_store = {}
+        set_graph_delta_keys = {key for key in delta_keys if is_set_graph_key(key)}
+        route_delta_keys = delta_keys - set_graph_delta_keys
+        try:
+            pipeline = self._redis_conn.pipeline(transaction=True)
+            for redis_key, new_store, store_delta_keys, encode in [
+                (
+                    REDIS_ORIGIN_ROUTE4_STORE_KEY,
+                    new_origin_route4_store,
+                    route_delta_keys,
+                    REDIS_ORIGIN_LIST_SEPARATOR.join,
+                ),
+                (
+                    REDIS_ORIGIN_ROUTE6_STORE_KEY,
+                    new_origin_route6_store,
+                    route_delta_keys,
+                    REDIS_ORIGIN_LIST_SEPARATOR.join,
+                ),
+                (REDIS_SET_GRAPH_STORE_KEY, new_set_graph_store, set_graph_delta_keys, ujson.encode),
+            ]:
+                removed_keys = [key for key in store_delta_keys if key not in new_store]
+                if removed_keys:
+                    pipeline.hdel(redis_key, *removed_keys)
+                if new_store:
+                    pipeline.hset(redis_key, mapping={k: encode(v) for k, v in new_store.items()})
+            pipeline.execute()
+
+            if (
+                self._store_file_dir
+                and route_delta_keys
+                and not self._write_store_file(
+                    new_origin_route4_store, new_origin_route6_store, route_delta_keys
+                )
+            ):
+                self.perform_reload()
+                return False
+
+            self._redis_conn.publish(REDIS_PRELOAD_COMPLETE_CHANNEL, build_delta_message(delta_keys))
+            return True
+
+        except redis.ConnectionError as rce:  # pragma: no cover
+            # As the delta is lost, the entire store needs reloading.
+            logger.error(
+                "Failed to update preload store due to redis connection error, "
+                f"attempting new full reload in 5s: {rce}"
+            )
+            time.sleep(5)
+            self.perform_reload()
+            return False
+
+    def _write_store_file(
+        self, new_origin_route4_store, new_origin_route6_store, delta_keys: Optional[Set[str]] = None
+    ) -> bool:
+        """
+        Write the new stores to the store file.
+
+        Without delta_keys, a new base file is written with the new stores,
+        and the overlay file is removed.
+        If delta_keys is set, the new stores only contain data for those keys.
+        Rewriting the base file for each delta would cost time and I/O
+        in proportion to the entire store, and make all workers map a new
+        file. Instead, the entries for these keys are added to the overlay
+        file, which contains all changes since the base file was written.
+        A delta therefore costs time and I/O in proportion to the number of
+        keys changed since the base file was written. Once the overlay has
+        more than MAX_STORE_FILE_OVERLAY_ENTRIES entries, it is merged into
+        a new base file, which costs one rewrite of the entire store.
+
+        Returns False if a delta could not be applied as there is no valid
+        current store file, True otherwise.
+        """
+        path = preload_store_path(self._store_file_dir)
+        overlay_path = preload_store_overlay_path(self._store_file_dir)
+        current_file = None
+        try:
+            current_file = PreloadStoreFile(path, overlay_path)
+        except (OSError, PreloadStoreFileError) as exc:
+            if delta_keys is not None:
+                logger.error(f"Unable to apply delta to preload store file, scheduling full reload: {exc}")
+                return False
+
+        new_entries: PreloadStoreEntries = {}
+        for key in set(new_origin_route4_store.keys()).union(new_origin_route6_store.keys()):
+            new_entries[split_preload_store_key(key)] = (
+                encode_prefixes(new_origin_route4_store.get(key, set()), 4),
+                encode_prefixes(new_origin_route6_store.get(key, set()), 6),
+            )
+
+        if current_file and delta_keys is not None:
+            overlay_entries = dict(current_file.overlay.iter_entries()) if current_file.overlay else {}
+            # Removed keys are kept as empty entries, to hide them in the base file
+            for key in delta_keys:
+                overlay_entries[split_preload_store_key(key)] = (b"", b"")
+            overlay_entries.update(new_entries)
+
+            if len(overlay_entries) <= MAX_STORE_FILE_OVERLAY_ENTRIES:
+                write_preload_store_file(
+                    overlay_path, overlay_entries, current_file.generation, keep_empty=True
+                )
+                logger.debug(
+                    f"Wrote preload store overlay file {overlay_path} for generation "
+                    f"{current_file.generation} with {len(overlay_entries)} entries"
+                )
+                return True
+
+            new_entries = dict(current_file.iter_entries())
+            new_entries.update(overlay_entries)
+
+        generation = current_file.generation + 1 if current_file else 1
+        write_preload_store_file(path, new_entries, generation)
+        # The overlay no longer applies to the new generation,
+        # but is removed to free the space.
+        self._remove_file(overlay_path)
+        logger.debug(
+            f"Wrote preload store file {path} generation {generation} with {len(new_entries)} entries"
+        )
+        return True
+
     def _remove_dead_threads(self) -> None:
         """
         Remove dead threads from self.threads(),
@@ -352,7 +876,11 @@ class PreloadUpdater(threading.Thread):
         """
         self.reload_lock.acquire()
         try:
-            self.update(mock_database_handler)
+            full_reload, delta_keys = self.preloader.take_pending_reload()
+            if full_reload:
+                self.update(mock_database_handler)
+            elif delta_keys:
+                self.update_delta(delta_keys, mock_database_handler)
         except Exception as exc:
             logger.critical(
                 f"Updating preload store failed, retrying in 5s, traceback follows: {exc}", exc_info=exc
@@ -374,27 +902,116 @@ class PreloadUpdater(threading.Thread):
         """
         logger.debug(f"Starting preload store update from thread {self}")
 
-        new_origin_route4_store: Dict[str, set] = defaultdict(set)
-        new_origin_route6_store: Dict[str, set] = defaultdict(set)
+        new_origin_route4_store, new_origin_route6_store = self._load_from_database(
+            self._build_query(), mock_database_handler
+        )
+        new_set_graph_store = self._load_set_graph_from_database(
+            self._build_set_graph_queries(), mock_database_handler
+        )
 
-        if not mock_database_handler:  # pragma: no cover
-            from .database_handler import DatabaseHandler
+        if self.preloader.update_route_store(
+            new_origin_route4_store, new_origin_route6_store, new_set_graph_store
+        ):
+            logger.info(f"Completed updating preload store from thread {self}")
 
-            dh = DatabaseHandler(readonly=True)
-        else:
-            dh = mock_database_handler
+    def update_delta(self, delta_keys: Set[str], mock_database_handler=None) -> None:
+        """
+        Update the store for a set of keys only, i.e. only for
+        specific origins in specific sources, and specific objects
+        in the set membership graph.
+        """
+        logger.debug(f"Starting preload store delta update for {len(delta_keys)} keys from thread {self}")
+
+        set_graph_delta_keys = {key for key in delta_keys if is_set_graph_key(key)}
+        route_delta_keys = delta_keys - set_graph_delta_keys
+
+        new_origin_route4_store: Dict[str, set] = {}
+        new_origin_route6_store: Dict[str, set] = {}
+        if route_delta_keys:
+            sources = set()
+            asns = set()
+            for key in route_delta_keys:
+                source, asn = split_preload_store_key(key)
+                sources.add(source)
+                asns.add(asn)
+
+            q = self._build_query().sources(sorted(sources)).asns_first(sorted(asns))
+            new_origin_route4_store, new_origin_route6_store = self._load_from_database(
+                q, mock_database_handler, route_delta_keys
+            )
 
+        new_set_graph_store: Dict[str, Dict[str, Any]] = {}
+        if set_graph_delta_keys:
+            split_keys = [split_set_graph_key(key) for key in set_graph_delta_keys]
+            q = self._apply_status_filters(self._build_set_graph_query())
+            q = q.sources(sorted({source for source, _, _ in split_keys}))
+            q = q.object_classes(sorted({object_class for _, object_class, _ in split_keys}))
+            q = q.rpsl_pks(sorted({rpsl_pk for _, _, rpsl_pk in split_keys}))
+            new_set_graph_store = self._load_set_graph_from_database(
+                [q], mock_database_handler, set_graph_delta_keys
+            )
+
+        if self.preloader.update_route_store_delta(
+            new_origin_route4_store, new_origin_route6_store, delta_keys, new_set_graph_store
+        ):
+            logger.info(
+                f"Completed delta update of {len(delta_keys)} keys in preload store from thread {self}"
+            )
+
+    def _build_query(self) -> RPSLDatabaseQuery:
+        """
+        Build the query for all objects relevant to the preload store.
+        """
         q = RPSLDatabaseQuery(
             column_names=["ip_version", "ip_first", "prefix_length", "asn_first", "source"],
             enable_ordering=False,
         )
-        q = q.object_classes(["route", "route6"]).rpki_status([RPKIStatus.not_found, RPKIStatus.valid])
+        q = q.object_classes(["route", "route6"])
+        return self._apply_status_filters(q)
+
+    def _build_set_graph_query(self) -> RPSLDatabaseQuery:
+        return RPSLDatabaseQuery(
+            column_names=["rpsl_pk", "source", "object_class", "parsed_data"],
+            enable_ordering=False,
+        )
+
+    def _build_set_graph_queries(self) -> List[RPSLDatabaseQuery]:
+        """
+        Build the queries for all objects relevant to the set membership graph:
+        all sets, and all objects that may be included in sets by member-of.
+        """
+        q_sets = self._build_set_graph_query().object_classes(sorted(SET_GRAPH_SET_OBJECT_CLASSES))
+        q_member_of = self._build_set_graph_query().object_classes(sorted(SET_GRAPH_MEMBER_OF_OBJECT_CLASSES))
+        q_member_of = q_member_of.lookup_attr_present("member-of")
+        return [self._apply_status_filters(q_sets), self._apply_status_filters(q_member_of)]
+
+    def _apply_status_filters(self, q: RPSLDatabaseQuery) -> RPSLDatabaseQuery:
+        """
+        Restrict a query to objects that are visible by default,
+        i.e. with the RPKI, scope filter and route preference filters enabled.
+        """
+        q = q.rpki_status([RPKIStatus.not_found, RPKIStatus.valid])
         q = q.scopefilter_status([ScopeFilterStatus.in_scope])
         q = q.route_preference_status([RoutePreferenceStatus.visible])
+        return q
 
-        for result in dh.execute_query(q):
+    def _load_from_database(
+        self, query: RPSLDatabaseQuery, mock_database_handler=None, limit_keys: Optional[Set[str]] = None
+    ) -> Tuple[Dict[str, set], Dict[str, set]]:
+        """
+        Run the query and build the per source/origin stores.
+        If limit_keys is set, only those keys are included.
+        """
+        new_origin_route4_store: Dict[str, set] = defaultdict(set)
+        new_origin_route6_store: Dict[str, set] = defaultdict(set)
+
+        dh = self._database_handler(mock_database_handler)
+
+        for result in dh.execute_query(query):
             prefix = result["ip_first"]
-            key = result["source"] + REDIS_KEY_ORIGIN_SOURCE_SEPARATOR + "AS" + str(result["asn_first"])
+            key = preload_store_key(result["source"], "AS" + str(result["asn_first"]))
+            if limit_keys is not None and key not in limit_keys:
+                continue
             length = result["prefix_length"]
 
             if result["ip_version"] == 4:
@@ -403,6 +1020,37 @@ class PreloadUpdater(threading.Thread):
                 new_origin_route6_store[key].add(f"{prefix}/{length}")
 
         dh.close()
+        return new_origin_route4_store, new_origin_route6_store
 
-        if self.preloader.update_route_store(new_origin_route4_store, new_origin_route6_store):
-            logger.info(f"Completed updating preload store from thread {self}")
+    def _load_set_graph_from_database(
+        self,
+        queries: List[RPSLDatabaseQuery],
+        mock_database_handler=None,
+        limit_keys: Optional[Set[str]] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Run the queries and build the set membership graph store,
+        with set_graph_key() keys and set_graph_entry() values.
+        If limit_keys is set, only those keys are included.
+        """
+        new_set_graph_store = {}
+
+        dh = self._database_handler(mock_database_handler)
+        for query in queries:
+            for result in dh.execute_query(query):
+                key = set_graph_key(result["source"], result["object_class"], result["rpsl_pk"])
+                if limit_keys is not None and key not in limit_keys:
+                    continue
+                entry = set_graph_entry(result["object_class"], result["parsed_data"])
+                if entry:
+                    new_set_graph_store[key] = entry
+
+        dh.close()
+        return new_set_graph_store
+
+    def _database_handler(self, mock_database_handler=None):
+        if not mock_database_handler:  # pragma: no cover
+            from .database_handler import DatabaseHandler
+
+            return DatabaseHandler(readonly=True)
+        return mock_database_handler
@@ -0,0 +1,354 @@
+import heapq
+import mmap
+import os
+import socket
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+"""
+The preload store file is a read-only, memory-mapped version of the
+preload store. It is written by the PreloadStoreManager, and mapped by
+all query workers on the same host, so that they share a single copy
+of the data through the page cache, rather than each holding their
+own copy in Python objects.
+
+A new version of the file is always written to a temporary file,
+and then renamed over the current file. Workers that still have the
+old file mapped keep using it until they open the new file, as
+the old data remains available until it is unmapped.
+
+Delta updates are written to a separate overlay file in the same format,
+with the changes since the base file was written. Entries in the overlay
+take precedence over the base file, including empty entries, which hide
+removed entries. The generation in the overlay header is that of the base
+file it applies to, so that an overlay is ignored once the base file
+has been replaced.
+
+The layout is:
+- A header with the magic value, format version, generation and
+  number of sources.
+- For each source, the length of the name, the name, and the offset
+  and number of entries in its index.
+- For each source, an index of entries sorted by origin ASN, with the
+  offset and length of the IPv4 and IPv6 prefix data.
+- The prefix data.
+All integers are little endian, except in the prefix data.
+
+The prefix data for an origin and address family is a sorted array
+of unique fixed size records: the network address in network byte
+order, followed by one byte for the prefix length. Byte order of the
+records is therefore the same as numeric order. This allows combining
+the prefixes of many origins with a k-way merge, in sorted order
+and without duplicates, without parsing any strings.
+"""
+
+PRELOAD_STORE_FILENAME = "irrd-preload-store.bin"
+PRELOAD_STORE_OVERLAY_FILENAME = "irrd-preload-store-overlay.bin"
+PRELOAD_STORE_MAGIC = b"IRRDPRLD"
+PRELOAD_STORE_FORMAT_VERSION = 2
+
+HEADER = struct.Struct("<8sIQI")
+SOURCE_NAME_LENGTH = struct.Struct("<H")
+SOURCE_INDEX = struct.Struct("<QI")
+INDEX_ENTRY = struct.Struct("<IQIQI")
+
+# An entry in the store: raw prefix data for IPv4 and IPv6.
+PreloadStoreEntries = Dict[Tuple[str, int], Tuple[bytes, bytes]]
+
+
+class PreloadStoreFileError(ValueError):
+    pass
+
+
+def preload_store_path(directory: str) -> str:
+    return os.path.join(directory, PRELOAD_STORE_FILENAME)
+
+
+def preload_store_overlay_path(directory: str) -> str:
+    return os.path.join(directory, PRELOAD_STORE_OVERLAY_FILENAME)
+
+
+ADDRESS_FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+# Size of the network address plus one byte for the prefix length
+PREFIX_RECORD_SIZES = {4: 5, 6: 17}
+
+
+def encode_prefixes(prefixes: Iterable[str], ip_version: int) -> bytes:
+    """
+    Encode prefixes in str format, e.g. 192.0.2.0/24, of one address
+    family for storage, as a sorted array of unique prefix records.
+    """
+    address_family = ADDRESS_FAMILIES[ip_version]
+    records = set()
+    for prefix in prefixes:
+        address, length = prefix.split("/")
+        records.add(socket.inet_pton(address_family, address) + bytes([int(length)]))
+    return b"".join(sorted(records))
+
+
+def _iter_records(data: bytes, record_size: int) -> Iterator[bytes]:
+    return (data[offset : offset + record_size] for offset in range(0, len(data), record_size))
+
+
+def merge_prefixes(data_items: List[bytes], ip_version: int, aggregate: bool = False) -> List[str]:
+    """
+    Merge any number of prefix arrays created by encode_prefixes(), of the
+    same address family. Returns a sorted list of unique prefixes in str format.
+    If aggregate is set, adjacent and covered prefixes are merged into
+    the smallest set of prefixes covering the same address space.
+    """
+    address_family = ADDRESS_FAMILIES[ip_version]
+    record_size = PREFIX_RECORD_SIZES[ip_version]
+    data_items = [data for data in data_items if data]
+    if not data_items:
+        return []
+
+    if len(data_items) == 1:
+        # Each array is already sorted and unique
+        records: Iterable[bytes] = _iter_records(data_items[0], record_size)
+    else:
+        records = heapq.merge(*[_iter_records(data, record_size) for data in data_items])
+
+    if aggregate:
+        return _aggregate_records(records, ip_version)
+
+    result = []
+    previous_record = None
+    for record in records:
+        if record == previous_record:
+            continue
+        previous_record = record
+        result.append(f"{socket.inet_ntop(address_family, record[:-1])}/{record[-1]}")
+    return result
+
+
+def _aggregate_records(records: Iterable[bytes], ip_version: int) -> List[str]:
+    """
+    Aggregate sorted prefix records in a single pass. Each record is
+    converted to an integer range, which is merged with the previous
+    range if they overlap or are adjacent. Each merged range is then
+    split into the largest aligned prefixes that it consists of.
+    """
+    address_family = ADDRESS_FAMILIES[ip_version]
+    address_length = PREFIX_RECORD_SIZES[ip_version] - 1
+    max_length = address_length * 8
+
+    result: List[str] = []
+
+    def append_range(first: int, last: int) -> None:
+        while first <= last:
+            # The largest prefix that starts at first is limited by
+            # the alignment of first, and by the remaining range size.
+            size_bits = (first & -first).bit_length() - 1 if first else max_length
+            while first + (1 << size_bits) - 1 > last:
+                size_bits -= 1
+            address = socket.inet_ntop(address_family, first.to_bytes(address_length, "big"))
+            result.append(f"{address}/{max_length - size_bits}")
+            first += 1 << size_bits
+
+    range_first: Optional[int] = None
+    range_last = 0
+    for record in records:
+        first = int.from_bytes(record[:-1], "big")
+        last = first + (1 << (max_length - record[-1])) - 1
+        if range_first is not None and first <= range_last + 1:
+            range_last = max(range_last, last)
+            continue
+        if range_first is not None:
+            append_range(range_first, range_last)
+        range_first, range_last = first, last
+    if range_first is not None:
+        append_range(range_first, range_last)
+    return result
+
+
+def write_preload_store_file(
+    path: str, entries: PreloadStoreEntries, generation: int, keep_empty: bool = False
+) -> None:
+    """
+    Write a new preload store file to path, replacing any existing file atomically.
+    entries is a dict with (source, asn) tuples as keys, and a tuple
+    of encoded IPv4 and IPv6 prefix data as values.
+    Entries without prefixes are skipped, unless keep_empty is set,
+    which is used for overlay files.
+    """
+    entries_per_source: Dict[str, List[Tuple[int, bytes, bytes]]] = {}
+    for (source, asn), (data4, data6) in entries.items():
+        if data4 or data6 or keep_empty:
+            entries_per_source.setdefault(source, []).append((asn, data4, data6))
+
+    sources = sorted(entries_per_source.keys())
+    encoded_sources = [source.encode("ascii") for source in sources]
+
+    source_table_size = sum(
+        SOURCE_NAME_LENGTH.size + len(name) + SOURCE_INDEX.size for name in encoded_sources
+    )
+    index_offset = HEADER.size + source_table_size
+    data_offset = index_offset + INDEX_ENTRY.size * sum(len(e) for e in entries_per_source.values())
+
+    source_table = bytearray()
+    index = bytearray()
+    data: List[bytes] = []
+    for source, encoded_source in zip(sources, encoded_sources):
+        source_entries = sorted(entries_per_source[source])
+        source_table += SOURCE_NAME_LENGTH.pack(len(encoded_source)) + encoded_source
+        source_table += SOURCE_INDEX.pack(index_offset + len(index), len(source_entries))
+        for asn, data4, data6 in source_entries:
+            offset4 = data_offset
+            offset6 = offset4 + len(data4)
+            data_offset = offset6 + len(data6)
+            index += INDEX_ENTRY.pack(asn, offset4, len(data4), offset6, len(data6))
+            data += [data4, data6]
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(HEADER.pack(PRELOAD_STORE_MAGIC, PRELOAD_STORE_FORMAT_VERSION, generation, len(sources)))
+        fh.write(source_table)
+        fh.write(index)
+        for item in data:
+            fh.write(item)
+    os.replace(tmp_path, path)
+
+
+class PreloadStoreFile:
+    """
+    Read access to a memory-mapped preload store file.
+    Lookups read directly from the mapped file. The mapping remains
+    valid when the file is replaced, so an instance can safely
+    be used until it is no longer referenced.
+
+    If overlay_path is set, and the overlay file exists and applies to
+    this generation of the file, lookups use the overlay entries where
+    present. The overlay is opened first: the base file is always written
+    before an overlay that applies to it, so if the base file is replaced
+    in between, the overlay does not match, and the new base file
+    already contains its changes.
+    """
+
+    overlay: Optional["PreloadStoreFile"] = None
+
+    def __init__(self, path: str, overlay_path: Optional[str] = None):
+        overlay = None
+        if overlay_path:
+            try:
+                overlay = PreloadStoreFile(overlay_path)
+            except FileNotFoundError:
+                pass
+
+        with open(path, "rb") as fh:
+            try:
+                self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise PreloadStoreFileError(f"Preload store file {path} is empty")
+
+        try:
+            magic, format_version, self.generation, source_count = HEADER.unpack_from(self._mmap, 0)
+        except struct.error:
+            raise PreloadStoreFileError(f"Preload store file {path} is truncated")
+        if magic != PRELOAD_STORE_MAGIC or format_version != PRELOAD_STORE_FORMAT_VERSION:
+            raise PreloadStoreFileError(
+                f"Preload store file {path} has unknown magic {magic!r} or format version {format_version}"
+            )
+
+        # The source table is small, and therefore parsed right away.
+        self._sources: Dict[str, Tuple[int, int]] = {}
+        offset = HEADER.size
+        for _ in range(source_count):
+            (name_length,) = SOURCE_NAME_LENGTH.unpack_from(self._mmap, offset)
+            offset += SOURCE_NAME_LENGTH.size
+            name = self._mmap[offset : offset + name_length].decode("ascii")
+            offset += name_length
+            self._sources[name] = SOURCE_INDEX.unpack_from(self._mmap, offset)
+            offset += SOURCE_INDEX.size
+
+        if overlay and overlay.generation == self.generation:
+            self.overlay = overlay
+
+    def _find_entry(self, source: str, asn: int) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Find the data offsets and lengths for an origin in a source,
+        by a binary search in the index of that source.
+        """
+        try:
+            index_offset, entry_count = self._sources[source]
+        except KeyError:
+            return None
+        low, high = 0, entry_count
+        while low < high:
+            middle = (low + high) // 2
+            entry = INDEX_ENTRY.unpack_from(self._mmap, index_offset + middle * INDEX_ENTRY.size)
+            if entry[0] < asn:
+                low = middle + 1
+            elif entry[0] > asn:
+                high = middle
+            else:
+                return entry[1:]
+        return None
+
+    def _find_entry_data(self, source: str, asn: int) -> Optional[Tuple[mmap.mmap, int, int, int, int]]:
+        """
+        Find the mapped file, data offsets and lengths for an origin in a source,
+        from the overlay if it has an entry, otherwise from this file.
+        """
+        if self.overlay:
+            entry = self.overlay._find_entry(source, asn)
+            if entry:
+                return (self.overlay._mmap, *entry)
+        entry = self._find_entry(source, asn)
+        if entry:
+            return (self._mmap, *entry)
+        return None
+
+    def routes_for_origins(
+        self,
+        origins: Union[List[str], Set[str]],
+        sources: List[str],
+        ip_version: Optional[int] = None,
+        aggregate: bool = False,
+    ) -> List[str]:
+        """
+        Retrieve all prefixes originating from the provided origins, from the
+        given sources. See Preloader.routes_for_origins() for details.
+        """
+        data4, data6 = self.prefix_data_for_origins(origins, sources, ip_version)
+        return merge_prefixes(data4, 4, aggregate) + merge_prefixes(data6, 6, aggregate)
+
+    def prefix_data_for_origins(
+        self, origins: Union[List[str], Set[str]], sources: List[str], ip_version: Optional[int] = None
+    ) -> Tuple[List[bytes], List[bytes]]:
+        """
+        Retrieve the encoded IPv4 and IPv6 prefix data for all provided
+        origins in the given sources, to be merged with merge_prefixes().
+        """
+        data4 = []
+        data6 = []
+        for origin in origins:
+            try:
+                asn = int(origin[2:])
+            except ValueError:
+                continue
+            for source in sources:
+                entry = self._find_entry_data(source, asn)
+                if not entry:
+                    continue
+                mapped_file, offset4, length4, offset6, length6 = entry
+                if length4 and (not ip_version or ip_version == 4):
+                    data4.append(mapped_file[offset4 : offset4 + length4])
+                if length6 and (not ip_version or ip_version == 6):
+                    data6.append(mapped_file[offset6 : offset6 + length6])
+        return data4, data6
+
+    def iter_entries(self) -> Iterator[Tuple[Tuple[str, int], Tuple[bytes, bytes]]]:
+        """
+        Iterate over all entries in this file, in the same format
+        as used for write_preload_store_file(). The overlay is not included.
+        """
+        for source, (index_offset, entry_count) in self._sources.items():
+            for entry_number in range(entry_count):
+                asn, offset4, length4, offset6, length6 = INDEX_ENTRY.unpack_from(
+                    self._mmap, index_offset + entry_number * INDEX_ENTRY.size
+                )
+                yield (source, asn), (
+                    self._mmap[offset4 : offset4 + length4],
+                    self._mmap[offset6 : offset6 + length6],
+                )
@@ -1,11 +1,11 @@
 import logging
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 import sqlalchemy as sa
 import sqlalchemy.dialects.postgresql as pg
 from IPy import IP
-from sqlalchemy.sql import ColumnCollection, Select
+from sqlalchemy.sql import ColumnCollection, Select, visitors
 
 from irrd.conf import get_setting
 from irrd.routepref.status import RoutePreferenceStatus
@@ -25,6 +25,11 @@ logger = logging.getLogger(__name__)
 
 
 class BaseDatabaseQuery:
+    # Describes the shape of the statement, i.e. everything except the values
+    # of its bind parameters, or None if the statement can not be cached.
+    # See DatabaseHandler.execute_query() and CompiledStatementCache.
+    statement_cache_key: Optional[Tuple] = None
+
     def __init__(self):  # pragma: no cover
         self.statement = sa.select([1])
 
@@ -55,14 +60,17 @@ class BaseRPSLObjectDatabaseQuery(BaseDatabaseQuery):
         self._ordered_by_sources = ordered_by_sources
         self._enable_ordering = enable_ordering
         self._set_object_classes = []
+        # Bind parameters of the statement, in the order in which the filters
+        # were applied, for statements with a statement_cache_key
+        self.statement_bind_params = []
 
     def pk(self, pk: str):
         """Filter on an exact object PK (UUID)."""
-        return self._filter(self.columns.pk == pk)
+        return self._filter(self.columns.pk == pk, ("pk",))
 
     def pks(self, pks: List[str]):
         """Filter on exact object PKs (UUID)."""
-        return self._filter(self.columns.pk.in_(pks))
+        return self._filter(self.columns.pk.in_(pks), ("pks", len(pks)))
 
     def rpsl_pk(self, rpsl_pk: str):
         """Filter on an exact RPSL PK (e.g. 192.0.2.0/24AS65537)."""
@@ -71,7 +79,7 @@ class BaseRPSLObjectDatabaseQuery(BaseDatabaseQuery):
     def rpsl_pks(self, rpsl_pks: List[str]):
         """Filter on an exact RPSL PK (e.g. 192.0.2.0/24,AS65537) - will match any PK in the list."""
         rpsl_pks = [p.upper().strip() for p in rpsl_pks]
-        return self._filter(self.columns.rpsl_pk.in_(rpsl_pks))
+        return self._filter(self.columns.rpsl_pk.in_(rpsl_pks), ("rpsl_pks", len(rpsl_pks)))
 
     def sources(self, sources: List[str]):
         """
@@ -79,11 +87,14 @@ class BaseRPSLObjectDatabaseQuery(BaseDatabaseQuery):
 
         Sources list must be an iterable. Will match objects from any
         of the mentioned sources. Order is used for sorting of results.
+        As rpsl_objects is partitioned by source, this filter also limits
+        the partitions that PostgreSQL needs to scan.
         """
         sources = [s.upper().strip() for s in sources]
         self._sources_list = sources
         fltr = self.columns.source.in_(self._sources_list)
-        return self._filter(fltr)
+        # The sources are part of the key, as they also determine the ordering
+        return self._filter(fltr, ("sources", tuple(sources)))
 
     def object_classes(self, object_classes: List[str]):
         """
@@ -94,7 +105,7 @@ class BaseRPSLObjectDatabaseQuery(BaseDatabaseQuery):
         """
         self._set_object_classes = object_classes
         fltr = self.columns.object_class.in_(object_classes)
-        return self._filter(fltr)
+        return self._filter(fltr, ("object_classes", len(object_classes)))
 
     def first_only(self):
         """Only return the first match."""
@@ -103,6 +114,8 @@ class BaseRPSLObjectDatabaseQuery(BaseDatabaseQuery):
     def limit(self, record_limit: int):
         """Limit the response to a certain number of rows"""
         self.statement = self.statement.limit(record_limit)
+        # The limit is not a bind parameter that can be replaced, so its value is part of the key
+        self._add_statement_cache_key(("limit", record_limit))
         return self
 
     def finalise_statement(self) -> Select:
@@ -135,11 +148,28 @@ class BaseRPSLObjectDatabaseQuery(BaseDatabaseQuery):
             self.statement = self.statement.order_by(*order_by)
         return self.statement
 
-    def _filter(self, fltr):
+    def _filter(self, fltr, cache_key: Optional[Tuple] = None):
+        """
+        Apply a filter to the statement. The cache_key must describe the
+        shape of the filter, i.e. everything except the values of its
+        bind parameters. Filters without a cache_key make the statement
+        uncacheable.
+        """
         self._check_query_frozen()
         self.statement = self.statement.where(fltr)
+        self._add_statement_cache_key(cache_key, fltr)
         return self
 
+    def _add_statement_cache_key(self, cache_key: Optional[Tuple], clause=None) -> None:
+        if self.statement_cache_key is None:
+            return
+        if cache_key is None:
+            self.statement_cache_key = None
+            return
+        self.statement_cache_key += (cache_key,)
+        if clause is not None:
+            visitors.traverse(clause, {}, {"bindparam": self.statement_bind_params.append})
+
     def _check_query_frozen(self) -> None:
         if self._query_frozen:
             raise ValueError("This query was frozen - no more filters can be applied.")
@@ -184,6 +214,12 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
             columns = [self.columns.get(name) for name in column_names]
         self.statement = sa.select(columns)
         self._lookup_attr_counter = 0
+        self.statement_cache_key = (
+            self.__class__.__name__,
+            tuple(column_names) if column_names is not None else None,
+            self._ordered_by_sources,
+            self._enable_ordering,
+        )
 
     def lookup_attr(self, attr_name: str, attr_value: str):
         """
@@ -206,20 +242,38 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
         self._check_query_frozen()
 
         value_filters = []
-        statement_params = {}
         for attr_name in attr_names:
             for attr_value in attr_values:
                 counter = self._lookup_attr_counter
                 self._lookup_attr_counter += 1
                 value_filters.append(
-                    sa.text(f"parsed_data->:lookup_attr_name{counter} ? :lookup_attr_value{counter}")
+                    sa.text(
+                        f"parsed_data->:lookup_attr_name{counter} ? :lookup_attr_value{counter}"
+                    ).bindparams(
+                        **{
+                            f"lookup_attr_name{counter}": attr_name,
+                            f"lookup_attr_value{counter}": attr_value.upper(),
+                        }
+                    )
                 )
-                statement_params[f"lookup_attr_name{counter}"] = attr_name
-                statement_params[f"lookup_attr_value{counter}"] = attr_value.upper()
         fltr = sa.or_(*value_filters)
-        self.statement = self.statement.where(fltr).params(**statement_params)
+        return self._filter(fltr, ("lookup_attrs_in", len(attr_names), len(attr_values)))
 
-        return self
+    def lookup_attr_present(self, attr_name: str):
+        """
+        Filter on objects that have any value for a lookup attribute, e.g. member-of.
+        """
+        attr_name = attr_name.lower()
+        if attr_name not in self.lookup_field_names:
+            raise ValueError(f"Invalid lookup attribute: {attr_name}")
+        self._check_query_frozen()
+
+        counter = self._lookup_attr_counter
+        self._lookup_attr_counter += 1
+        fltr = sa.text(f"parsed_data ? :lookup_attr_name{counter}").bindparams(
+            **{f"lookup_attr_name{counter}": attr_name}
+        )
+        return self._filter(fltr, ("lookup_attr_present",))
 
     def ip_exact(self, ip: IP):
         """
@@ -233,11 +287,12 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
             self.columns.ip_last == str(ip.broadcast()),
             self.columns.ip_version == ip.version(),
         )
-        return self._filter(fltr)
+        return self._filter(fltr, ("ip_exact",))
 
     def ip_less_specific(self, ip: IP):
         """Filter any less specifics or exact matches of a prefix."""
-        if self._prefix_query_permitted():
+        prefix_query_permitted = self._prefix_query_permitted()
+        if prefix_query_permitted:
             pg_prefix = sa.cast(str(ip), pg.CIDR)
             fltr = self.columns.prefix.op(">>=")(pg_prefix)
         else:
@@ -246,7 +301,7 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
                 self.columns.ip_last >= str(ip.broadcast()),
                 self.columns.ip_version == ip.version(),
             )
-        return self._filter(fltr)
+        return self._filter(fltr, ("ip_less_specific", prefix_query_permitted))
 
     def ip_less_specific_one_level(self, ip: IP):
         """
@@ -269,6 +324,7 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
             ),
         )
         self.statement = self.statement.where(fltr)
+        self._add_statement_cache_key(("ip_less_specific_one_level",), fltr)
 
         size_subquery = self.statement.with_only_columns([self.columns.ip_size])
         size_subquery = size_subquery.order_by(self.columns.ip_size.asc())
@@ -284,7 +340,8 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
         Note that this only finds full more specifics: objects for which their
         IP range is fully encompassed by the ip parameter.
         """
-        if self._prefix_query_permitted():
+        prefix_query_permitted = self._prefix_query_permitted()
+        if prefix_query_permitted:
             pg_prefix = sa.cast(str(ip), pg.CIDR)
             fltr = self.columns.prefix.op("<<")(pg_prefix)
         else:
@@ -300,7 +357,7 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
                     )
                 ),
             )
-        return self._filter(fltr)
+        return self._filter(fltr, ("ip_more_specific", prefix_query_permitted))
 
     def ip_any(self, ip: IP):
         """
@@ -309,7 +366,8 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
         Note that this only finds full more specifics: objects for which their
         IP range is fully encompassed by the ip parameter - not partial overlaps.
         """
-        if self._prefix_query_permitted():
+        prefix_query_permitted = self._prefix_query_permitted()
+        if prefix_query_permitted:
             pg_prefix = sa.cast(str(ip), pg.CIDR)
             fltr = sa.or_(
                 self.columns.prefix.op(">>=")(pg_prefix),
@@ -331,14 +389,14 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
                 ),
                 self.columns.ip_version == ip.version(),
             )
-        return self._filter(fltr)
+        return self._filter(fltr, ("ip_any", prefix_query_permitted))
 
     def asn(self, asn: int):
         """
         Filter for exact matches on an ASN.
         """
         fltr = sa.and_(self.columns.asn_first == asn, self.columns.asn_last == asn)
-        return self._filter(fltr)
+        return self._filter(fltr, ("asn",))
 
     def asns_first(self, asns: List[int]):
         """
@@ -346,7 +404,7 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
         This is useful when also restricting object class to 'route' for instance.
         """
         fltr = self.columns.asn_first.in_(asns)
-        return self._filter(fltr)
+        return self._filter(fltr, ("asns_first", len(asns)))
 
     def asn_less_specific(self, asn: int):
         """
@@ -356,28 +414,28 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
         encompassing it - including route, route6, aut-num and as-block.
         """
         fltr = sa.and_(self.columns.asn_first <= asn, self.columns.asn_last >= asn)
-        return self._filter(fltr)
+        return self._filter(fltr, ("asn_less_specific",))
 
     def rpki_status(self, status: List[RPKIStatus]):
         """
         Filter for RPSL objects with a specific RPKI validation status.
         """
         fltr = self.columns.rpki_status.in_(status)
-        return self._filter(fltr)
+        return self._filter(fltr, ("rpki_status", len(status)))
 
     def scopefilter_status(self, status: List[ScopeFilterStatus]):
         """
         Filter for RPSL objects with a specific scope filter status.
         """
         fltr = self.columns.scopefilter_status.in_(status)
-        return self._filter(fltr)
+        return self._filter(fltr, ("scopefilter_status", len(status)))
 
     def route_preference_status(self, status: List[RoutePreferenceStatus]):
         """
         Filter for RPSL objects with a specific route preference filter status.
         """
         fltr = self.columns.route_preference_status.in_(status)
-        return self._filter(fltr)
+        return self._filter(fltr, ("route_preference_status", len(status)))
 
     def text_search(self, value: str, extract_asn_ip=True):
         """
@@ -423,6 +481,7 @@ class RPSLDatabaseQuery(BaseRPSLObjectDatabaseQuery):
         self.statement = self.statement.where(fltr).params(
             **{f"lookup_attr_text_search{counter}": "%" + value + "%"}
         )
+        self._add_statement_cache_key(None)
         return self
 
     def _prefix_query_permitted(self):
@@ -543,6 +602,9 @@ class DatabaseStatusQuery(BaseDatabaseQuery):
                 self.columns.serial_newest_mirror,
                 self.columns.force_reload,
                 self.columns.synchronised_serials,
+                self.columns.import_source_state,
+                self.columns.nrtm4_server_state,
+                self.columns.nrtm4_client_state,
                 self.columns.last_error,
                 self.columns.last_error_timestamp,
                 self.columns.created,
@@ -0,0 +1,169 @@
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+"""
+The set membership graph is an in-memory representation of the members
+of all as-sets and route-sets, and of all member-of references from
+aut-num and route(6) objects, which are included in sets through
+mbrs-by-ref. It allows resolving sets without querying the database.
+
+The graph is built by the PreloadUpdater, and loaded by each query
+worker through the Preloader, in the same way as the prefixes
+per origin.
+"""
+
+SET_GRAPH_SET_OBJECT_CLASSES = {"as-set", "route-set"}
+SET_GRAPH_MEMBER_OF_OBJECT_CLASSES = {"aut-num", "route", "route6"}
+SET_GRAPH_OBJECT_CLASSES = SET_GRAPH_SET_OBJECT_CLASSES | SET_GRAPH_MEMBER_OF_OBJECT_CLASSES
+
+# A key for an object in the graph: source, object class and RPSL PK.
+SetGraphKey = Tuple[str, str, str]
+
+
+def set_graph_entry(object_class: str, parsed_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Build the graph entry for an object from its parsed data.
+    Returns None if the object is not relevant to the graph, e.g.
+    an aut-num without member-of.
+    """
+    if object_class in SET_GRAPH_SET_OBJECT_CLASSES:
+        members: List[str] = []
+        for members_attr in ["members", "mp-members"]:
+            members += parsed_data.get(members_attr, [])
+        return {
+            "members": members,
+            "mbrs-by-ref": parsed_data.get("mbrs-by-ref", []),
+        }
+    if object_class in SET_GRAPH_MEMBER_OF_OBJECT_CLASSES and parsed_data.get("member-of"):
+        return {
+            "member": parsed_data[object_class],
+            "member-of": parsed_data["member-of"],
+            "mnt-by": parsed_data.get("mnt-by", []),
+        }
+    return None
+
+
+class SetMembershipGraph:
+    """
+    In-memory graph of set members and member-of references.
+
+    Updates may run while other threads resolve sets. Therefore, updates
+    never modify a dict that a reader may be iterating over, but replace
+    it with an updated copy.
+    """
+
+    def __init__(self) -> None:
+        # Per source, per set name: the object class, members and mbrs-by-ref
+        self._sets: Dict[str, Dict[str, Tuple[str, FrozenSet[str], FrozenSet[str]]]] = {}
+        # Per referring object: the member value, and the sets it refers to
+        self._member_of: Dict[SetGraphKey, Tuple[str, FrozenSet[str]]] = {}
+        # Per set name, per referring object: the member value and mnt-by
+        self._member_of_index: Dict[str, Dict[SetGraphKey, Tuple[str, FrozenSet[str]]]] = {}
+
+    def update(self, key: SetGraphKey, entry: Optional[Dict[str, Any]]) -> None:
+        """
+        Add, update or remove (if entry is None) an object in the graph.
+        Entries are created with set_graph_entry().
+        """
+        source, object_class, rpsl_pk = key
+        if object_class in SET_GRAPH_SET_OBJECT_CLASSES:
+            source_sets = dict(self._sets.get(source, {}))
+            existing = source_sets.get(rpsl_pk)
+            if entry is None:
+                if existing and existing[0] == object_class:
+                    del source_sets[rpsl_pk]
+            else:
+                source_sets[rpsl_pk] = (
+                    object_class,
+                    frozenset(entry["members"]),
+                    frozenset(m.strip().upper() for m in entry["mbrs-by-ref"]),
+                )
+            self._sets[source] = source_sets
+            return
+
+        existing_member_of = self._member_of.pop(key, None)
+        if existing_member_of:
+            for set_name in existing_member_of[1]:
+                index = dict(self._member_of_index.get(set_name, {}))
+                index.pop(key, None)
+                if index:
+                    self._member_of_index[set_name] = index
+                else:
+                    self._member_of_index.pop(set_name, None)
+        if entry is None:
+            return
+
+        member_of = frozenset(s.upper() for s in entry["member-of"])
+        mnt_by = frozenset(m.upper() for m in entry["mnt-by"])
+        self._member_of[key] = (entry["member"], member_of)
+        for set_name in member_of:
+            index = dict(self._member_of_index.get(set_name, {}))
+            index[key] = (entry["member"], mnt_by)
+            self._member_of_index[set_name] = index
+
+    def find_set_members(
+        self,
+        set_names: Iterable[str],
+        sources: List[str],
+        object_classes: Iterable[str],
+        limit_source: Optional[str] = None,
+    ) -> Tuple[Set[str], Set[str], Optional[str]]:
+        """
+        Find all members of a number of sets, from the given sources.
+        This is the in-memory equivalent of QueryResolver._find_set_members(),
+        including its prioritisation: if a set exists in multiple sources,
+        only the one from the first source in sources is used.
+        If limit_source is set, sets are only looked for in that source.
+
+        Returns a tuple of the members found, the leaf members, i.e.
+        names for which no set was found, and the object class of
+        the first set found, or None if no sets were found.
+        """
+        set_names = set(set_names)
+        object_classes = set(object_classes)
+        members: Set[str] = set()
+        sets_already_resolved: Set[str] = set()
+        first_object_class = None
+
+        set_sources = [source for source in sources if not limit_source or source == limit_source]
+        for source in set_sources:
+            source_sets = self._sets.get(source, {})
+            for set_name in sorted(set_names):
+                rpsl_pk = set_name.upper().strip()
+                if rpsl_pk in sets_already_resolved:
+                    continue
+                try:
+                    object_class, set_members, mbrs_by_ref = source_sets[rpsl_pk]
+                except KeyError:
+                    continue
+                if object_class not in object_classes:
+                    continue
+                sets_already_resolved.add(rpsl_pk)
+                if not first_object_class:
+                    first_object_class = object_class
+                members.update(set_members)
+
+                if mbrs_by_ref:
+                    members.update(self._mbrs_by_ref_members(rpsl_pk, object_class, mbrs_by_ref, sources))
+
+        if not sets_already_resolved:
+            return set(), set_names, None
+        return members, set_names - sets_already_resolved, first_object_class
+
+    def _mbrs_by_ref_members(
+        self, set_name: str, object_class: str, mbrs_by_ref: FrozenSet[str], sources: List[str]
+    ) -> Set[str]:
+        """
+        Find the members included in a set by member-of references
+        from objects in sources, permitted by mbrs-by-ref.
+        """
+        member_object_classes = ["route", "route6"] if object_class == "route-set" else ["aut-num"]
+        any_maintainer = "ANY" in mbrs_by_ref
+        members = set()
+        for (source, member_object_class, _), (member, mnt_by) in self._member_of_index.get(
+            set_name, {}
+        ).items():
+            if source not in sources or member_object_class not in member_object_classes:
+                continue
+            if any_maintainer or not mbrs_by_ref.isdisjoint(mnt_by):
+                members.add(member)
+        return members
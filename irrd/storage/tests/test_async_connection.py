@@ -0,0 +1,173 @@
+import asyncio
+import socket
+from unittest.mock import Mock
+
+import psycopg2.extensions
+import pytest
+from sqlalchemy.dialects.postgresql import psycopg2 as pg_psycopg2
+
+from irrd.rpki.status import RPKIStatus
+
+from ..async_connection import AsyncConnectionPool, wait_for_connection
+from ..models import DatabaseOperation
+from ..queries import RPSLDatabaseJournalQuery, RPSLDatabaseQuery
+
+
+class MockAsyncConnection:
+    def __init__(self, description=None, rows=None, poll_states=None, fail=False):
+        self.poll_states = poll_states or []
+        self.description = description
+        self.rows = rows
+        self.fail = fail
+        self.executed = []
+        self.closed = False
+
+    def poll(self):
+        if self.poll_states:
+            return self.poll_states.pop(0)
+        return psycopg2.extensions.POLL_OK
+
+    def cursor(self):
+        cursor = Mock(description=self.description)
+        cursor.fetchall = lambda: self.rows
+
+        def execute(statement, parameters=None):
+            if self.fail:
+                raise psycopg2.OperationalError("connection lost")
+            self.executed.append((statement, parameters))
+
+        cursor.execute = execute
+        return cursor
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture()
+def mock_pool(monkeypatch):
+    monkeypatch.setattr(
+        "irrd.storage.async_connection.get_engine", lambda: Mock(dialect=pg_psycopg2.dialect())
+    )
+    pool = AsyncConnectionPool()
+    connections = []
+
+    async def mock_connect():
+        return connections.pop(0)
+
+    monkeypatch.setattr(pool, "_connect", mock_connect)
+    yield pool, connections
+
+
+class TestWaitForConnection:
+    async def test_wait_for_read(self):
+        sock_read, sock_write = socket.socketpair()
+        connection = MockAsyncConnection(
+            poll_states=[psycopg2.extensions.POLL_WRITE, psycopg2.extensions.POLL_READ]
+        )
+        connection.fileno = sock_read.fileno
+        sock_write.send(b"ready")
+        await wait_for_connection(connection)
+        assert not connection.poll_states
+        sock_read.close()
+        sock_write.close()
+
+
+class TestAsyncConnectionPool:
+    async def test_execute(self, mock_pool):
+        pool, connections = mock_pool
+        connection = MockAsyncConnection(
+            description=[("rpsl_pk",), ("operation",)],
+            rows=[("TEST-MNT", "add_or_update")],
+        )
+        connections.append(connection)
+
+        query = RPSLDatabaseJournalQuery(column_names=["rpsl_pk", "operation"])
+        query.rpsl_pk("TEST-MNT")
+        result = await pool.execute(query.finalise_statement())
+        assert result == [{"rpsl_pk": "TEST-MNT", "operation": DatabaseOperation.add_or_update}]
+
+        query = RPSLDatabaseQuery(column_names=["rpsl_pk", "rpki_status"]).rpki_status([RPKIStatus.valid])
+        connection.description = [("rpsl_pk",), ("rpki_status",)]
+        connection.rows = [("TEST-MNT", "valid")]
+        result = await pool.execute(query.finalise_statement())
+        assert result == [{"rpsl_pk": "TEST-MNT", "rpki_status": RPKIStatus.valid}]
+        # The connection is reused after a ping, and parameters are converted for psycopg2
+        assert len(connection.executed) == 3
+        assert connection.executed[1] == ("SELECT 1", None)
+        statement, parameters = connection.executed[2]
+        assert "rpsl_objects.rpki_status IN (%(rpki_status_1)s)" in statement
+        assert parameters["rpki_status_1"] == "valid"
+        assert not connection.closed
+
+    async def test_execute_error(self, mock_pool):
+        pool, connections = mock_pool
+        failing_connection = MockAsyncConnection(fail=True)
+        connections.append(failing_connection)
+
+        statement = RPSLDatabaseQuery().finalise_statement()
+        with pytest.raises(psycopg2.OperationalError):
+            await pool.execute(statement)
+        assert failing_connection.closed
+
+        failing_connection = MockAsyncConnection(fail=True)
+        connection = MockAsyncConnection(description=[("rpsl_pk",)], rows=[("TEST-MNT",)])
+        connections.extend([failing_connection, connection])
+        result = await pool.execute(RPSLDatabaseQuery(column_names=["rpsl_pk"]).finalise_statement(), True)
+        assert result == [{"rpsl_pk": "TEST-MNT"}]
+        assert failing_connection.closed
+        assert not connection.closed
+
+    async def test_failed_ping(self, mock_pool):
+        pool, connections = mock_pool
+        connection = MockAsyncConnection(description=[("rpsl_pk",)], rows=[("TEST-MNT",)])
+        new_connection = MockAsyncConnection(description=[("rpsl_pk",)], rows=[("TEST-MNT",)])
+        connections.extend([connection, new_connection])
+        statement = RPSLDatabaseQuery(column_names=["rpsl_pk"]).finalise_statement()
+
+        await pool.execute(statement)
+        # The idle connection was closed by the server in the mean time
+        connection.fail = True
+        assert await pool.execute(statement) == [{"rpsl_pk": "TEST-MNT"}]
+        assert connection.closed
+        assert not new_connection.closed
+        assert pool.status() == {
+            "size": 50,
+            "checked_in": 1,
+            "checked_out": 0,
+            "waiting": 0,
+            "connections_created": 2,
+            "checkouts": 2,
+            "failed_pings": 1,
+        }
+
+    async def test_max_connections(self, mock_pool, monkeypatch):
+        pool, connections = mock_pool
+        pool.max_connections = 2
+        connections.extend(
+            [MockAsyncConnection(description=[("rpsl_pk",)], rows=[("TEST-MNT",)]) for _ in range(2)]
+        )
+        release = asyncio.Event()
+        max_checked_out = 0
+
+        async def mock_wait_for_connection(connection):
+            # Query results are only ready once the test releases them
+            nonlocal max_checked_out
+            max_checked_out = max(max_checked_out, pool.checked_out)
+            await release.wait()
+
+        monkeypatch.setattr("irrd.storage.async_connection.wait_for_connection", mock_wait_for_connection)
+        statement = RPSLDatabaseQuery(column_names=["rpsl_pk"]).finalise_statement()
+        tasks = [asyncio.create_task(pool.execute(statement)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert pool.checked_out == 2
+        assert pool.waiting == 3
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert results == [[{"rpsl_pk": "TEST-MNT"}]] * 5
+        assert max_checked_out == 2
+        status = pool.status()
+        assert status["connections_created"] == 2
+        assert status["checkouts"] == 5
+        assert status["checked_in"] == 2
+        assert status["waiting"] == 0
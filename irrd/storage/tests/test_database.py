@@ -5,13 +5,19 @@ from unittest.mock import Mock
 import pytest
 from IPy import IP
 from pytest import raises
+from sqlalchemy.dialects import postgresql
 
 from irrd.routepref.status import RoutePreferenceStatus
 from irrd.rpki.status import RPKIStatus
 from irrd.scopefilter.status import ScopeFilterStatus
 from irrd.utils.test_utils import flatten_mock_calls
 
-from ..database_handler import DatabaseHandler
+from ..database_handler import (
+    CompiledStatementCache,
+    DatabaseHandler,
+    DatabaseStatusTracker,
+    status_update_table,
+)
 from ..models import DatabaseOperation, JournalEntryOrigin
 from ..preload import Preloader
 from ..queries import (
@@ -403,6 +409,9 @@ class TestDatabaseHandlerLive:
                 "last_error": None,
                 "force_reload": True,
                 "synchronised_serials": True,
+                "import_source_state": None,
+                "nrtm4_server_state": None,
+                "nrtm4_client_state": None,
             },
         ]
         assert status_test[0]["created"]
@@ -427,6 +436,9 @@ class TestDatabaseHandlerLive:
                 "last_error": "error",
                 "force_reload": False,
                 "synchronised_serials": True,
+                "import_source_state": None,
+                "nrtm4_server_state": None,
+                "nrtm4_client_state": None,
             },
         ]
         assert status_test2[0]["created"]
@@ -445,6 +457,27 @@ class TestDatabaseHandlerLive:
         self.dh.close()
 
         assert flatten_mock_calls(self.dh.changed_objects_tracker.preloader.signal_reload) == [
+            [
+                "",
+                ({"route"},),
+                {
+                    "changed_origins": {("TEST", "AS65537"), ("TEST2", "AS65537")},
+                    "changed_set_graph_objects": {
+                        ("TEST", "route", "192.0.2.0/24,AS65537"),
+                        ("TEST2", "route", "2001:db8::/64,AS65537"),
+                    },
+                },
+            ],
+            [
+                "",
+                ({"route"},),
+                {
+                    "changed_origins": {("TEST2", "AS65537")},
+                    "changed_set_graph_objects": {("TEST2", "route", "2001:db8::/64,AS65537")},
+                },
+            ],
+        ]
+        assert flatten_mock_calls(self.dh.changed_objects_tracker.preloader.invalidate_set_members_cache) == [
             ["", ({"route"},), {}],
             ["", ({"route"},), {}],
         ]
@@ -490,6 +523,9 @@ class TestDatabaseHandlerLive:
                 "last_error": None,
                 "force_reload": False,
                 "synchronised_serials": False,
+                "import_source_state": None,
+                "nrtm4_server_state": None,
+                "nrtm4_client_state": None,
             },
         ]
 
@@ -500,6 +536,190 @@ class TestDatabaseHandlerLive:
 
         self.dh.close()
 
+    def test_status_state_kept(self, irrd_db_mock_preload):
+        self.dh = DatabaseHandler()
+        import_source_state = {"serial": 42, "files": {"file:///tmp/test.db": {"sha256": "abc"}}}
+        self.dh.record_import_source_state("TEST", import_source_state)
+        self.dh.commit()
+        status = list(self.dh.execute_query(DatabaseStatusQuery().source("TEST")))[0]
+        assert status["import_source_state"] == import_source_state
+        updated = status["updated"]
+
+        # An unrelated change to the status keeps the state, and the updated timestamp
+        self.dh.record_serial_exported("TEST", 42)
+        self.dh.commit()
+        status = list(self.dh.execute_query(DatabaseStatusQuery().source("TEST")))[0]
+        assert status["serial_last_export"] == 42
+        assert status["import_source_state"] == import_source_state
+        assert status["updated"] == updated
+
+        self.dh.record_mirror_error("TEST", "error")
+        self.dh.commit()
+        status = list(self.dh.execute_query(DatabaseStatusQuery().source("TEST")))[0]
+        assert status["import_source_state"] == import_source_state
+        assert status["updated"] > updated
+
+        self.dh.close()
+
+    def test_status_nrtm4_state_kept(self, monkeypatch, irrd_db_mock_preload):
+        monkeypatch.setenv("IRRD_SOURCES_TEST_KEEP_JOURNAL", "1")
+        self.dh = DatabaseHandler()
+        nrtm4_server_state = {"session_id": "ca128382-78d9-41d1-8927-1ecef15275be", "version": 3}
+        nrtm4_client_state = {"session_id": "ca128382-78d9-41d1-8927-1ecef15275be", "version": 2}
+        self.dh.record_nrtm4_server_state("TEST", nrtm4_server_state)
+        self.dh.record_nrtm4_client_state("TEST", nrtm4_client_state)
+        self.dh.commit()
+
+        # Unrelated commits for the source keep the session and version
+        self.dh.record_serial_seen("TEST", 42)
+        self.dh.commit()
+        self.dh.record_mirror_error("TEST", "error")
+        self.dh.record_serial_exported("TEST", 42)
+        self.dh.commit()
+        status = list(self.dh.execute_query(DatabaseStatusQuery().source("TEST")))[0]
+        assert status["serial_newest_seen"] == 42
+        assert status["last_error"] == "error"
+        assert status["nrtm4_server_state"] == nrtm4_server_state
+        assert status["nrtm4_client_state"] == nrtm4_client_state
+
+        self.dh.close()
+
+    def test_bulk_load(self, irrd_db_mock_preload):
+        def route_object(object_text):
+            return Mock(
+                pk=lambda: "192.0.2.0/24,AS65537",
+                rpsl_object_class="route",
+                parsed_data={"mnt-by": ["MNT-TEST"], "source": "TEST", "descr": ['"quoted",\n']},
+                render_rpsl_text=lambda last_modified: object_text,
+                ip_version=lambda: 4,
+                ip_first=IP("192.0.2.0"),
+                ip_last=IP("192.0.2.255"),
+                prefix=IP("192.0.2.0/24"),
+                prefix_length=24,
+                asn_first=65537,
+                asn_last=65537,
+                rpki_status=RPKIStatus.invalid,
+                scopefilter_status=ScopeFilterStatus.in_scope,
+                route_preference_status=RoutePreferenceStatus.visible,
+            )
+
+        self.dh = DatabaseHandler()
+        self.dh.disable_journaling()
+        self.dh.enable_bulk_load()
+        self.dh.upsert_rpsl_object(route_object("object-text"), JournalEntryOrigin.mirror)
+        self.dh.commit()
+
+        result = list(self.dh.execute_query(RPSLDatabaseQuery()))
+        assert len(result) == 1
+        assert result[0]["object_text"] == "object-text"
+        assert result[0]["parsed_data"]["descr"] == ['"quoted",\n']
+        assert result[0]["ip_first"] == "192.0.2.0"
+        assert result[0]["prefix"] == "192.0.2.0/24"
+        assert result[0]["asn_first"] == 65537
+        assert result[0]["rpki_status"] == RPKIStatus.invalid
+        assert result[0]["created"]
+
+        # A conflicting object is written with a regular upsert instead
+        self.dh.upsert_rpsl_object(route_object("object-text-updated"), JournalEntryOrigin.mirror)
+        self.dh.commit()
+        result = list(self.dh.execute_query(RPSLDatabaseQuery()))
+        assert len(result) == 1
+        assert result[0]["object_text"] == "object-text-updated"
+
+        self.dh.close()
+
+    def test_staging_load(self, irrd_db_mock_preload, monkeypatch):
+        def route_object(source, prefix):
+            return Mock(
+                pk=lambda: f"{prefix},AS65537",
+                rpsl_object_class="route",
+                parsed_data={"mnt-by": ["MNT-TEST"], "source": source},
+                render_rpsl_text=lambda last_modified: f"route: {prefix}",
+                ip_version=lambda: 4,
+                ip_first=None,
+                ip_last=None,
+                prefix=None,
+                prefix_length=None,
+                asn_first=65537,
+                asn_last=65537,
+                rpki_status=RPKIStatus.not_found,
+                scopefilter_status=ScopeFilterStatus.in_scope,
+                route_preference_status=RoutePreferenceStatus.visible,
+            )
+
+        self.dh = DatabaseHandler()
+        self.dh.upsert_rpsl_object(route_object("TEST", "192.0.2.0/24"), JournalEntryOrigin.mirror)
+        self.dh.upsert_rpsl_object(route_object("TEST2", "192.0.2.0/24"), JournalEntryOrigin.mirror)
+        self.dh.record_serial_newest_mirror("TEST", 42)
+        self.dh.commit()
+
+        self.dh.start_rpsl_staging_load("TEST")
+        self.dh.disable_journaling()
+        self.dh.upsert_rpsl_object(route_object("TEST", "198.51.100.0/24"), JournalEntryOrigin.mirror)
+        self.dh.upsert_rpsl_object(route_object("TEST", "198.51.100.0/24"), JournalEntryOrigin.mirror)
+        # Staged objects are not visible until commit
+        result = list(self.dh.execute_query(RPSLDatabaseQuery().sources(["TEST"])))
+        assert [r["rpsl_pk"] for r in result] == ["192.0.2.0/24,AS65537"]
+        assert not list(self.dh.execute_query(DatabaseStatusQuery().sources(["TEST"])))
+        self.dh.commit()
+
+        result = list(self.dh.execute_query(RPSLDatabaseQuery().sources(["TEST"])))
+        assert [r["rpsl_pk"] for r in result] == ["198.51.100.0/24,AS65537"]
+        assert result[0]["object_text"] == "route: 198.51.100.0/24"
+        assert result[0]["created"]
+        result = list(self.dh.execute_query(RPSLDatabaseQuery().sources(["TEST2"])))
+        assert [r["rpsl_pk"] for r in result] == ["192.0.2.0/24,AS65537"]
+        # The objects of TEST were moved to a new partition, TEST2 remains in the default partition
+        assert self.dh._table_exists("rpsl_objects_source_test")
+        assert self.dh._table_exists("rpsl_database_journal_source_test")
+        assert not self.dh._table_exists("rpsl_objects_source_test2")
+        partition_rows = self.dh.execute_statement("SELECT rpsl_pk FROM rpsl_objects_source_test")
+        assert [row[0] for row in partition_rows] == ["198.51.100.0/24,AS65537"]
+        assert not self.dh._table_exists("rpsl_objects_source_test_staging")
+
+        # The existing partition is replaced by the staging table
+        self.dh.start_rpsl_staging_load("TEST")
+        self.dh.upsert_rpsl_object(route_object("TEST", "203.0.113.0/24"), JournalEntryOrigin.mirror)
+        self.dh.commit()
+        result = list(self.dh.execute_query(RPSLDatabaseQuery().sources(["TEST"])))
+        assert [r["rpsl_pk"] for r in result] == ["203.0.113.0/24,AS65537"]
+        assert not self.dh._table_exists("rpsl_objects_source_test_staging")
+
+        # A rolled back staging load leaves the existing objects untouched
+        self.dh.start_rpsl_staging_load("TEST")
+        self.dh.upsert_rpsl_object(route_object("TEST", "192.0.2.0/24"), JournalEntryOrigin.mirror)
+        self.dh.rollback()
+        self.dh.commit()
+        result = list(self.dh.execute_query(RPSLDatabaseQuery().sources(["TEST"])))
+        assert [r["rpsl_pk"] for r in result] == ["203.0.113.0/24,AS65537"]
+        assert not self.dh._table_exists("rpsl_objects_source_test_staging")
+
+        # If the partition can not be detached, the staged objects are copied
+        monkeypatch.setattr(self.dh, "_detach_source_partition", lambda table_name, source: False)
+        self.dh.start_rpsl_staging_load("TEST")
+        self.dh.upsert_rpsl_object(route_object("TEST", "198.51.100.0/24"), JournalEntryOrigin.mirror)
+        self.dh.commit()
+        result = list(self.dh.execute_query(RPSLDatabaseQuery().sources(["TEST"])))
+        assert [r["rpsl_pk"] for r in result] == ["198.51.100.0/24,AS65537"]
+        assert not self.dh._table_exists("rpsl_objects_source_test_staging")
+
+        self.dh.close()
+
+    def test_execute_query_stream_results(self, irrd_db_mock_preload, database_handler_with_route):
+        dh = database_handler_with_route
+        dh.commit()
+        result = list(dh.execute_query(RPSLDatabaseQuery(), stream_results=True, fetch_size=1))
+        assert [row["rpsl_pk"] for row in result] == ["192.0.2.0/24,AS65537"]
+
+        readonly_dh = DatabaseHandler(readonly=True)
+        result = list(readonly_dh.execute_query(RPSLDatabaseQuery(), stream_results=True, fetch_size=1))
+        assert [row["rpsl_pk"] for row in result] == ["192.0.2.0/24,AS65537"]
+        # The readonly connection is back in autocommit mode afterwards
+        assert readonly_dh._connection.connection.connection.autocommit
+        result = list(readonly_dh.execute_query(RPSLDatabaseQuery()))
+        assert [row["rpsl_pk"] for row in result] == ["192.0.2.0/24,AS65537"]
+        readonly_dh.close()
+
     def test_roa_handling_and_query(self, irrd_db_mock_preload):
         self.dh = DatabaseHandler()
         self.dh.insert_roa_object(
@@ -890,6 +1110,7 @@ class TestRPSLDatabaseQueryLive:
         self._assert_match(RPSLDatabaseQuery().sources(["TEST", "X"]))
         self._assert_match(RPSLDatabaseQuery().object_classes(["route"]))
         self._assert_match(RPSLDatabaseQuery().lookup_attr("mnt-by", "MNT-test"))  # intentional case mismatch
+        self._assert_match(RPSLDatabaseQuery().lookup_attr_present("mnt-by"))
         self._assert_match(RPSLDatabaseQuery().ip_exact(IP("192.0.2.0/24")))
         self._assert_match(RPSLDatabaseQuery().asn(65537))
         self._assert_match(RPSLDatabaseQuery().asns_first([65538, 65537]))
@@ -938,6 +1159,7 @@ class TestRPSLDatabaseQueryLive:
         self._assert_no_match(RPSLDatabaseQuery().sources(["TEST3"]))
         self._assert_no_match(RPSLDatabaseQuery().object_classes(["route6"]))
         self._assert_no_match(RPSLDatabaseQuery().lookup_attr("mnt-by", "MNT-NOTEXIST"))
+        self._assert_no_match(RPSLDatabaseQuery().lookup_attr_present("member-of"))
         self._assert_no_match(RPSLDatabaseQuery().ip_exact(IP("192.0.2.0/25")))
         self._assert_no_match(RPSLDatabaseQuery().asn(23455))
         self._assert_no_match(RPSLDatabaseQuery().asns_first([65538, 65539]))
@@ -1161,3 +1383,259 @@ class TestRPSLDatabaseQueryLive:
         __tracebackhide__ = True
         result = list(self.dh.execute_query(query))
         assert not len(result), f"Failed query: {query}: unexpected output: {result}"
+
+
+class TestDatabaseStatusTracker:
+    def test_journal_entries_buffered(self, monkeypatch, config_override):
+        config_override({"sources": {"TEST": {"keep_journal": True}, "TEST2": {"keep_journal": True}}})
+        monkeypatch.setattr(
+            "irrd.storage.database_handler.is_serial_synchronised",
+            lambda database_handler, source: source == "TEST2",
+        )
+        monkeypatch.setattr("irrd.storage.database_handler.EventStreamPublisher", Mock)
+        mock_dh = Mock()
+        mock_dh.execute_statement.return_value.scalar.return_value = 41
+        tracker = DatabaseStatusTracker(mock_dh)
+
+        for rpsl_pk in ["PK1", "PK2"]:
+            tracker.record_operation(
+                operation=DatabaseOperation.add_or_update,
+                rpsl_pk=rpsl_pk,
+                source="TEST",
+                object_class="route",
+                object_text="text",
+                origin=JournalEntryOrigin.mirror,
+                source_serial=None,
+            )
+        tracker.record_operation(
+            operation=DatabaseOperation.delete,
+            rpsl_pk="PK3",
+            source="TEST2",
+            object_class="route",
+            object_text="text",
+            origin=JournalEntryOrigin.mirror,
+            source_serial=100,
+        )
+        assert not mock_dh.execute_statement.mock_calls
+
+        tracker.flush_journal_buffer()
+        statements = self._statements(mock_dh)
+        assert statements[0] == "LOCK TABLE rpsl_database_journal IN EXCLUSIVE MODE"
+        # One query for the highest serial of TEST, and one insert for all entries
+        assert "max(rpsl_database_journal.serial_nrtm)" in statements[1]
+        assert statements[2].startswith("INSERT INTO rpsl_database_journal")
+        assert len(statements) == 3
+        assert tracker._new_serials_per_source == {"TEST": {42, 43}, "TEST2": {100}}
+
+        # Serials continue from the previous flush, and the table is only locked once
+        mock_dh.reset_mock()
+        tracker.record_operation(
+            operation=DatabaseOperation.delete,
+            rpsl_pk="PK1",
+            source="TEST",
+            object_class="route",
+            object_text="text",
+            origin=JournalEntryOrigin.mirror,
+            source_serial=None,
+        )
+        tracker.flush_journal_buffer()
+        statements = self._statements(mock_dh)
+        assert len(statements) == 1
+        assert tracker._new_serials_per_source["TEST"] == {42, 43, 44}
+
+    def test_record_operations_from_table(self, monkeypatch, config_override):
+        config_override({"sources": {"TEST": {"keep_journal": True}, "TEST2": {}}})
+        monkeypatch.setattr("irrd.storage.database_handler.EventStreamPublisher", Mock)
+        mock_dh = Mock()
+        mock_dh.execute_statement.return_value.scalar.return_value = 41
+        mock_dh.execute_statement.return_value.__iter__ = lambda self: iter(
+            [{"serial_nrtm": 42}, {"serial_nrtm": 43}]
+        )
+        tracker = DatabaseStatusTracker(mock_dh)
+
+        tracker.record_operations_from_table(
+            status_update_table, JournalEntryOrigin.rpki_status, {"TEST", "TEST2"}
+        )
+        statements = self._statements(mock_dh)
+        assert statements[0] == "LOCK TABLE rpsl_database_journal IN EXCLUSIVE MODE"
+        assert "max(rpsl_database_journal.serial_nrtm)" in statements[1]
+        assert statements[2].startswith("INSERT INTO rpsl_database_journal")
+        assert "FROM rpsl_objects, rpsl_status_update" in statements[2]
+        # No journal is kept for TEST2
+        assert len(statements) == 3
+        assert tracker._new_serials_per_source == {"TEST": {42, 43}}
+        assert tracker._sources_seen == {"TEST", "TEST2"}
+
+        mock_dh.reset_mock()
+        tracker.journaling_enabled = False
+        tracker.record_operations_from_table(status_update_table, JournalEntryOrigin.rpki_status, {"TEST"})
+        assert not mock_dh.execute_statement.mock_calls
+
+    def test_finalise_transaction(self, monkeypatch):
+        monkeypatch.setattr(
+            "irrd.storage.database_handler.is_serial_synchronised", lambda database_handler, source: True
+        )
+        monkeypatch.setattr("irrd.storage.database_handler.EventStreamPublisher", Mock)
+        mock_dh = Mock()
+        mock_dh.execute_statement.return_value = [("TEST", 40, 43)]
+        tracker = DatabaseStatusTracker(mock_dh)
+
+        tracker.record_serial_seen("TEST", 42)
+        tracker.record_serial_seen("TEST", 43)
+        tracker.record_serial_newest_mirror("TEST", 43)
+        tracker.record_mirror_error("TEST2", "error")
+        tracker.record_serial_exported("TEST3", 10)
+        tracker.record_import_source_state("TEST3", {"serial": 10})
+        tracker.record_nrtm4_server_state("TEST3", {"version": 2})
+        tracker.record_nrtm4_client_state("TEST2", {"version": 3})
+        tracker.finalise_transaction()
+
+        # One query for the journal ranges, one upsert for all sources
+        statements = self._statements(mock_dh)
+        assert len(statements) == 2
+        assert "GROUP BY rpsl_database_journal.source" in statements[0]
+        assert statements[1].startswith("INSERT INTO database_status")
+        assert "ON CONFLICT (source) DO UPDATE" in statements[1]
+        # Exports do not change the updated timestamp
+        updated_case = statements[1].split("updated = ")[1]
+        assert "excluded.serial_newest_mirror IS NOT NULL" in updated_case
+        assert "excluded.serial_last_export" not in updated_case
+
+        # Untouched state is written as SQL NULL, not JSON null,
+        # so that the existing state is kept
+        compiled = mock_dh.execute_statement.mock_calls[1][1][0].compile(dialect=postgresql.dialect())
+        for column in ["import_source_state", "nrtm4_server_state", "nrtm4_client_state"]:
+            bind = compiled.binds[f"{column}_m0"]
+            assert bind.type.bind_processor(postgresql.psycopg2.dialect())(bind.value) is None
+
+        values = mock_dh.execute_statement.mock_calls[1][1][0].parameters
+        assert [value["source"] for value in values] == ["TEST", "TEST2", "TEST3"]
+        assert values[0]["serial_oldest_seen"] == 40
+        assert values[0]["serial_newest_seen"] == 43
+        assert values[0]["serial_oldest_journal"] == 40
+        assert values[0]["serial_newest_journal"] == 43
+        assert values[0]["serial_newest_mirror"] == 43
+        assert values[0]["last_error"] is None
+        assert values[1]["serial_newest_seen"] is None
+        assert values[1]["last_error"] == "error"
+        assert values[1]["last_error_timestamp"]
+        assert values[2]["serial_last_export"] == 10
+        assert values[2]["import_source_state"] == {"serial": 10}
+        assert values[0]["import_source_state"] is None
+        assert values[2]["nrtm4_server_state"] == {"version": 2}
+        assert values[1]["nrtm4_client_state"] == {"version": 3}
+        assert values[0]["nrtm4_client_state"] is None
+
+        mock_dh.reset_mock()
+        tracker.reset()
+        tracker.finalise_transaction()
+        assert not mock_dh.execute_statement.mock_calls
+
+    def _statements(self, mock_dh):
+        statements = []
+        for call in mock_dh.execute_statement.mock_calls:
+            if call[1]:
+                statement = call[1][0]
+                if not isinstance(statement, str):
+                    statement = str(statement.compile(dialect=postgresql.dialect()))
+                statements.append(statement)
+        return statements
+
+
+class TestDatabaseHandlerStreamResults:
+    def test_readonly_stream_results(self, monkeypatch):
+        mock_connection = Mock()
+        mock_engine = Mock()
+        mock_engine.connect = Mock(return_value=mock_connection)
+        monkeypatch.setattr("irrd.storage.database_handler.get_engine", lambda: mock_engine)
+        dbapi_connection = mock_connection.connection.connection
+        dbapi_connection.autocommit = True
+        autocommit_on_execute = []
+
+        def mock_execute(statement):
+            autocommit_on_execute.append(dbapi_connection.autocommit)
+            return mock_result
+
+        mock_result = Mock()
+        mock_result.fetchmany = Mock(side_effect=[[{"rpsl_pk": "A"}], [{"rpsl_pk": "B"}], []])
+        mock_connection.execution_options = Mock(return_value=Mock(execute=mock_execute))
+
+        dh = DatabaseHandler(readonly=True)
+        result = list(dh.execute_query(RPSLDatabaseQuery(), stream_results=True, fetch_size=1))
+        assert result == [{"rpsl_pk": "A"}, {"rpsl_pk": "B"}]
+        # Executed on a server-side cursor in a transaction, fetching in batches
+        assert mock_connection.execution_options.mock_calls[-1][2] == {"stream_results": True}
+        assert autocommit_on_execute == [False]
+        assert [call[1] for call in mock_result.fetchmany.mock_calls] == [(1,), (1,), (1,)]
+        assert mock_result.close.call_count == 1
+        assert dbapi_connection.rollback.call_count == 1
+        assert dbapi_connection.autocommit
+
+        # A response that is not fully consumed still ends the transaction
+        mock_result.fetchmany = Mock(side_effect=[[{"rpsl_pk": "A"}], [{"rpsl_pk": "B"}], []])
+        response = dh.execute_query(RPSLDatabaseQuery(), stream_results=True, fetch_size=1)
+        assert next(response) == {"rpsl_pk": "A"}
+        assert not dbapi_connection.autocommit
+        response.close()
+        assert mock_result.close.call_count == 2
+        assert dbapi_connection.rollback.call_count == 2
+        assert dbapi_connection.autocommit
+
+
+class TestCompiledStatementCache:
+    def test_execute(self):
+        dialect = postgresql.psycopg2.dialect()
+        mock_connection = Mock(dialect=dialect)
+        cache = CompiledStatementCache()
+
+        def key_lookup_query(source, rpsl_pk):
+            return (
+                RPSLDatabaseQuery()
+                .sources([source])
+                .object_classes(["aut-num"])
+                .rpki_status([RPKIStatus.not_found, RPKIStatus.valid])
+                .rpsl_pk(rpsl_pk)
+                .lookup_attr("mnt-by", rpsl_pk)
+                .ip_less_specific_one_level(IP("192.0.2.0/24"))
+                .first_only()
+            )
+
+        def assert_executed_as(query):
+            statement = query.finalise_statement()
+            cache.execute(mock_connection, query, statement)
+            compiled, parameters = mock_connection.execute.mock_calls[-1][1]
+            expected = statement.compile(dialect=dialect)
+            assert str(compiled) == str(expected)
+            assert compiled.construct_params(parameters) == expected.construct_params()
+
+        assert_executed_as(key_lookup_query("TEST", "AS65537"))
+        assert cache.statistics() == {"hits": 0, "misses": 1, "size": 1}
+        assert_executed_as(key_lookup_query("TEST", "AS65538"))
+        assert cache.statistics() == {"hits": 1, "misses": 1, "size": 1}
+        # Sources are part of the shape
+        assert_executed_as(key_lookup_query("TEST2", "AS65538"))
+        assert cache.statistics() == {"hits": 1, "misses": 2, "size": 2}
+
+        cache.max_size = 2
+        assert_executed_as(RPSLDatabaseQuery().ip_exact(IP("192.0.2.0/24")))
+        assert cache.statistics() == {"hits": 1, "misses": 3, "size": 1}
+
+    def test_statement_cache_key(self):
+        query = RPSLDatabaseQuery(column_names=["rpsl_pk"]).rpsl_pks(["A", "B"]).asn(65537)
+        assert query.statement_cache_key == (
+            "RPSLDatabaseQuery",
+            ("rpsl_pk",),
+            True,
+            True,
+            ("rpsl_pks", 2),
+            ("asn",),
+        )
+        assert (
+            query.statement_cache_key
+            != RPSLDatabaseQuery(column_names=["rpsl_pk"]).rpsl_pks(["A"]).asn(1).statement_cache_key
+        )
+        assert query.statement_cache_key != RPSLDatabaseQuery().first_only().statement_cache_key
+
+        assert RPSLDatabaseQuery().text_search("text").statement_cache_key is None
+        assert RPSLDatabaseJournalQuery().rpsl_pk("A").statement_cache_key is None
+        assert DatabaseStatusQuery().statement_cache_key is None
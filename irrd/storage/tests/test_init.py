@@ -0,0 +1,31 @@
+from unittest.mock import Mock
+
+from .. import get_engine_pool_status
+
+
+class TestGetEnginePoolStatus:
+    def test_no_engine(self, monkeypatch):
+        monkeypatch.setattr("irrd.storage.engine", None)
+        assert get_engine_pool_status() is None
+
+    def test_pool_status(self, monkeypatch):
+        mock_engine = Mock()
+        mock_engine.pool.size = lambda: 50
+        mock_engine.pool.checkedin = lambda: 3
+        mock_engine.pool.checkedout = lambda: 1
+        mock_engine.pool.overflow = lambda: -46
+        monkeypatch.setattr("irrd.storage.engine", mock_engine)
+        monkeypatch.setattr("irrd.storage.pool_counters", {"connections_created": 4, "checkouts": 12})
+        monkeypatch.setattr(
+            "irrd.storage.async_connection.async_connection_pool.status", lambda: {"checked_out": 2}
+        )
+
+        assert get_engine_pool_status() == {
+            "size": 50,
+            "checked_in": 3,
+            "checked_out": 1,
+            "overflow": -46,
+            "connections_created": 4,
+            "checkouts": 12,
+            "async_pool": {"checked_out": 2},
+        }
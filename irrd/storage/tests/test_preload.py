@@ -15,14 +15,23 @@ from ..preload import (
     Preloader,
     PreloadStoreManager,
     PreloadUpdater,
+    build_delta_message,
+    is_set_graph_key,
+    parse_delta_message,
+    set_graph_key,
+    split_set_graph_key,
 )
 from ..queries import RPSLDatabaseQuery
 
 # Use different stores in tests
 TEST_REDIS_ORIGIN_ROUTE4_STORE_KEY = "TEST-irrd-preload-origin-route4"
 TEST_REDIS_ORIGIN_ROUTE6_STORE_KEY = "TEST-irrd-preload-origin-route6"
+TEST_REDIS_SET_GRAPH_STORE_KEY = "TEST-irrd-preload-set-graph"
 TEST_REDIS_PRELOAD_RELOAD_CHANNEL = "TEST-irrd-preload-reload-channel"
 TEST_REDIS_PRELOAD_COMPLETE_CHANNEL = "TEST-irrd-preload-complete-channel"
+TEST_REDIS_SET_MEMBERS_CACHE_PREFIX = "TEST-irrd-set-members-cache-"
+TEST_REDIS_SET_MEMBERS_CACHE_SETS_GENERATION_KEY = "TEST-irrd-set-members-cache-generation-sets"
+TEST_REDIS_SET_MEMBERS_CACHE_ROUTES_GENERATION_KEY = "TEST-irrd-set-members-cache-generation-routes"
 
 
 @pytest.fixture()
@@ -40,12 +49,24 @@ def mock_redis_keys(monkeypatch, config_override):
     monkeypatch.setattr(
         "irrd.storage.preload.REDIS_ORIGIN_ROUTE6_STORE_KEY", TEST_REDIS_ORIGIN_ROUTE6_STORE_KEY
     )
+    monkeypatch.setattr("irrd.storage.preload.REDIS_SET_GRAPH_STORE_KEY", TEST_REDIS_SET_GRAPH_STORE_KEY)
     monkeypatch.setattr(
         "irrd.storage.preload.REDIS_PRELOAD_RELOAD_CHANNEL", TEST_REDIS_PRELOAD_RELOAD_CHANNEL
     )
     monkeypatch.setattr(
         "irrd.storage.preload.REDIS_PRELOAD_COMPLETE_CHANNEL", TEST_REDIS_PRELOAD_COMPLETE_CHANNEL
     )
+    monkeypatch.setattr(
+        "irrd.storage.preload.REDIS_SET_MEMBERS_CACHE_PREFIX", TEST_REDIS_SET_MEMBERS_CACHE_PREFIX
+    )
+    monkeypatch.setattr(
+        "irrd.storage.preload.REDIS_SET_MEMBERS_CACHE_SETS_GENERATION_KEY",
+        TEST_REDIS_SET_MEMBERS_CACHE_SETS_GENERATION_KEY,
+    )
+    monkeypatch.setattr(
+        "irrd.storage.preload.REDIS_SET_MEMBERS_CACHE_ROUTES_GENERATION_KEY",
+        TEST_REDIS_SET_MEMBERS_CACHE_ROUTES_GENERATION_KEY,
+    )
 
 
 class TestPreloading:
@@ -115,42 +136,95 @@ class TestPreloading:
             {
                 f"TEST2{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547": {"2001:db8::/32"},
             },
+            {
+                set_graph_key("TEST1", "as-set", "AS-TEST"): {"members": ["AS65546"], "mbrs-by-ref": ["ANY"]},
+                set_graph_key("TEST2", "aut-num", "AS65547"): {
+                    "member": "AS65547",
+                    "member-of": ["AS-TEST"],
+                    "mnt-by": ["MNT-TEST"],
+                },
+            },
         )
         time.sleep(1)
 
         sources = ["TEST1", "TEST2"]
-        assert preloader.routes_for_origins([], sources) == set()
-        assert preloader.routes_for_origins(["AS65545"], sources) == set()
-        assert preloader.routes_for_origins(["AS65546"], []) == set()
-        assert preloader.routes_for_origins(["AS65546"], sources, 4) == {"192.0.2.0/25"}
-        assert preloader.routes_for_origins(["AS65547"], sources, 4) == {"192.0.2.128/25", "198.51.100.0/25"}
-        assert preloader.routes_for_origins(["AS65546"], sources, 6) == set()
-        assert preloader.routes_for_origins(["AS65547"], sources, 6) == {"2001:db8::/32"}
-        assert preloader.routes_for_origins(["AS65546"], sources) == {"192.0.2.0/25"}
-        assert preloader.routes_for_origins(["AS65547"], sources) == {
+        assert preloader.routes_for_origins([], sources) == []
+        assert preloader.routes_for_origins(["AS65545"], sources) == []
+        assert preloader.routes_for_origins(["AS65546"], []) == []
+        assert preloader.routes_for_origins(["AS65546"], sources, 4) == ["192.0.2.0/25"]
+        assert preloader.routes_for_origins(["AS65547"], sources, 4) == ["192.0.2.128/25", "198.51.100.0/25"]
+        assert preloader.routes_for_origins(["AS65546"], sources, 6) == []
+        assert preloader.routes_for_origins(["AS65547"], sources, 6) == ["2001:db8::/32"]
+        assert preloader.routes_for_origins(["AS65546"], sources) == ["192.0.2.0/25"]
+        assert preloader.routes_for_origins(["AS65547"], sources) == [
             "192.0.2.128/25",
             "198.51.100.0/25",
             "2001:db8::/32",
-        }
-        assert preloader.routes_for_origins(["AS65547", "AS65546"], sources, 4) == {
+        ]
+        assert preloader.routes_for_origins(["AS65547", "AS65546"], sources, 4) == [
             "192.0.2.0/25",
             "192.0.2.128/25",
             "198.51.100.0/25",
-        }
+        ]
 
-        assert preloader.routes_for_origins(["AS65547", "AS65546"], ["TEST1"]) == {
+        assert preloader.routes_for_origins(["AS65547", "AS65546"], ["TEST1"]) == [
             "192.0.2.128/25",
             "198.51.100.0/25",
-        }
-        assert preloader.routes_for_origins(["AS65547", "AS65546"], ["TEST2"]) == {
+        ]
+        assert preloader.routes_for_origins(["AS65547", "AS65546"], ["TEST2"]) == [
             "192.0.2.0/25",
             "2001:db8::/32",
-        }
+        ]
+
+        assert preloader.set_graph_loaded()
+        assert preloader.find_set_members({"AS-TEST"}, sources, ["as-set"]) == (
+            {"AS65546", "AS65547"},
+            set(),
+            "as-set",
+        )
+
+        preload_manager.update_route_store_delta(
+            {f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547": {"192.0.2.128/25"}},
+            {},
+            {
+                f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547",
+                f"TEST2{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65546",
+                set_graph_key("TEST2", "aut-num", "AS65547"),
+            },
+        )
+        time.sleep(1)
+
+        assert preloader.routes_for_origins(["AS65546"], sources) == []
+        assert preloader.routes_for_origins(["AS65547"], sources) == ["192.0.2.128/25", "2001:db8::/32"]
+        assert preloader.find_set_members({"AS-TEST"}, sources, ["as-set"]) == ({"AS65546"}, set(), "as-set")
 
         with pytest.raises(ValueError) as ve:
             preloader.routes_for_origins(["AS65547"], [], 2)
         assert "Invalid IP version: 2" in str(ve.value)
 
+    def test_set_members_cache(self, mock_redis_keys):
+        preloader = Preloader(enable_queries=False)
+
+        generation = preloader.set_members_cache_generation()
+        assert preloader.get_cached_set_members("key-as-set", generation) is None
+        preloader.store_cached_set_members("key-as-set", generation, {"AS65537"}, route_dependent=False)
+        preloader.store_cached_set_members("key-route-set", generation, {"AS65537"}, route_dependent=True)
+        assert preloader.get_cached_set_members("key-as-set", generation) == {"AS65537"}
+        assert preloader.get_cached_set_members("key-route-set", generation) == {"AS65537"}
+        assert preloader.get_cached_set_members("key-as-set", None) is None
+
+        preloader.invalidate_set_members_cache({"person"})
+        assert preloader.set_members_cache_generation() == generation
+
+        preloader.invalidate_set_members_cache({"route"})
+        generation = preloader.set_members_cache_generation()
+        assert preloader.get_cached_set_members("key-as-set", generation) == {"AS65537"}
+        assert preloader.get_cached_set_members("key-route-set", generation) is None
+
+        preloader.invalidate_set_members_cache({"aut-num"})
+        generation = preloader.set_members_cache_generation()
+        assert preloader.get_cached_set_members("key-as-set", generation) is None
+
 
 class TestPreloadUpdater:
     def test_preload_updater(self, monkeypatch):
@@ -162,6 +236,7 @@ class TestPreloadUpdater:
         )
         mock_reload_lock = Mock()
         mock_preload_obj = Mock()
+        mock_preload_obj.take_pending_reload = Mock(return_value=(True, set()))
 
         mock_query_result = [
             {
@@ -193,7 +268,24 @@ class TestPreloadUpdater:
                 "source": "TEST2",
             },
         ]
-        mock_database_handler.execute_query = lambda query: mock_query_result
+        mock_set_query_result = [
+            {
+                "rpsl_pk": "AS-TEST",
+                "source": "TEST1",
+                "object_class": "as-set",
+                "parsed_data": {"as-set": "AS-TEST", "members": ["AS65547"], "mbrs-by-ref": ["ANY"]},
+            },
+        ]
+        mock_member_of_query_result = [
+            {
+                "rpsl_pk": "AS65546",
+                "source": "TEST1",
+                "object_class": "aut-num",
+                "parsed_data": {"aut-num": "AS65546", "member-of": ["AS-TEST"], "mnt-by": ["MNT-TEST"]},
+            },
+        ]
+        mock_query_results = iter([mock_query_result, mock_set_query_result, mock_member_of_query_result])
+        mock_database_handler.execute_query = lambda query: next(mock_query_results)
         PreloadUpdater(mock_preload_obj, mock_reload_lock).run(mock_database_handler)
 
         assert flatten_mock_calls(mock_reload_lock) == [["acquire", (), {}], ["release", (), {}]]
@@ -202,9 +294,19 @@ class TestPreloadUpdater:
             ["rpki_status", ([RPKIStatus.not_found, RPKIStatus.valid],), {}],
             ["scopefilter_status", ([ScopeFilterStatus.in_scope],), {}],
             ["route_preference_status", ([RoutePreferenceStatus.visible],), {}],
+            ["object_classes", (["as-set", "route-set"],), {}],
+            ["object_classes", (["aut-num", "route", "route6"],), {}],
+            ["lookup_attr_present", ("member-of",), {}],
+            ["rpki_status", ([RPKIStatus.not_found, RPKIStatus.valid],), {}],
+            ["scopefilter_status", ([ScopeFilterStatus.in_scope],), {}],
+            ["route_preference_status", ([RoutePreferenceStatus.visible],), {}],
+            ["rpki_status", ([RPKIStatus.not_found, RPKIStatus.valid],), {}],
+            ["scopefilter_status", ([ScopeFilterStatus.in_scope],), {}],
+            ["route_preference_status", ([RoutePreferenceStatus.visible],), {}],
         ]
 
         assert flatten_mock_calls(mock_preload_obj) == [
+            ["take_pending_reload", (), {}],
             [
                 "update_route_store",
                 (
@@ -216,11 +318,138 @@ class TestPreloadUpdater:
                         },
                     },
                     {f"TEST2{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547": {"2001:db8::/32"}},
+                    {
+                        set_graph_key("TEST1", "as-set", "AS-TEST"): {
+                            "members": ["AS65547"],
+                            "mbrs-by-ref": ["ANY"],
+                        },
+                        set_graph_key("TEST1", "aut-num", "AS65546"): {
+                            "member": "AS65546",
+                            "member-of": ["AS-TEST"],
+                            "mnt-by": ["MNT-TEST"],
+                        },
+                    },
                 ),
                 {},
-            ]
+            ],
         ]
 
+    def test_preload_updater_delta(self, monkeypatch):
+        mock_database_handler = Mock(spec=DatabaseHandler)
+        mock_database_query = Mock(spec=RPSLDatabaseQuery)
+        mock_database_query.sources = Mock(return_value=mock_database_query)
+        mock_database_query.asns_first = Mock(return_value=mock_database_query)
+        mock_database_query.object_classes = Mock(return_value=mock_database_query)
+        mock_database_query.rpsl_pks = Mock(return_value=mock_database_query)
+        mock_database_query.rpki_status = Mock(return_value=mock_database_query)
+        mock_database_query.scopefilter_status = Mock(return_value=mock_database_query)
+        mock_database_query.route_preference_status = Mock(return_value=mock_database_query)
+        monkeypatch.setattr(
+            "irrd.storage.preload.RPSLDatabaseQuery",
+            lambda column_names, enable_ordering: mock_database_query,
+        )
+        mock_reload_lock = Mock()
+        mock_preload_obj = Mock()
+        delta_keys = {
+            f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547",
+            f"TEST2{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65546",
+            set_graph_key("TEST1", "as-set", "AS-TEST"),
+            set_graph_key("TEST1", "aut-num", "AS65546"),
+        }
+        mock_preload_obj.take_pending_reload = Mock(return_value=(False, delta_keys))
+
+        mock_query_result = [
+            {
+                "ip_version": 4,
+                "ip_first": "192.0.2.128",
+                "prefix_length": 25,
+                "asn_first": 65547,
+                "source": "TEST1",
+            },
+            {
+                # Not in the delta keys, should be ignored
+                "ip_version": 4,
+                "ip_first": "192.0.2.0",
+                "prefix_length": 25,
+                "asn_first": 65546,
+                "source": "TEST1",
+            },
+        ]
+        mock_set_query_result = [
+            {
+                # The aut-num no longer has member-of, and is therefore removed
+                "rpsl_pk": "AS65546",
+                "source": "TEST1",
+                "object_class": "aut-num",
+                "parsed_data": {"aut-num": "AS65546", "mnt-by": ["MNT-TEST"]},
+            },
+            {
+                "rpsl_pk": "AS-TEST",
+                "source": "TEST1",
+                "object_class": "as-set",
+                "parsed_data": {"as-set": "AS-TEST", "members": ["AS65547"]},
+            },
+            {
+                # Not in the delta keys, should be ignored
+                "rpsl_pk": "AS-TEST",
+                "source": "TEST2",
+                "object_class": "as-set",
+                "parsed_data": {"as-set": "AS-TEST", "members": ["AS65548"]},
+            },
+        ]
+        mock_query_results = iter([mock_query_result, mock_set_query_result])
+        mock_database_handler.execute_query = lambda query: next(mock_query_results)
+        PreloadUpdater(mock_preload_obj, mock_reload_lock).run(mock_database_handler)
+
+        assert flatten_mock_calls(mock_reload_lock) == [["acquire", (), {}], ["release", (), {}]]
+        assert flatten_mock_calls(mock_database_query) == [
+            ["object_classes", (["route", "route6"],), {}],
+            ["rpki_status", ([RPKIStatus.not_found, RPKIStatus.valid],), {}],
+            ["scopefilter_status", ([ScopeFilterStatus.in_scope],), {}],
+            ["route_preference_status", ([RoutePreferenceStatus.visible],), {}],
+            ["sources", (["TEST1", "TEST2"],), {}],
+            ["asns_first", ([65546, 65547],), {}],
+            ["rpki_status", ([RPKIStatus.not_found, RPKIStatus.valid],), {}],
+            ["scopefilter_status", ([ScopeFilterStatus.in_scope],), {}],
+            ["route_preference_status", ([RoutePreferenceStatus.visible],), {}],
+            ["sources", (["TEST1"],), {}],
+            ["object_classes", (["as-set", "aut-num"],), {}],
+            ["rpsl_pks", (["AS-TEST", "AS65546"],), {}],
+        ]
+        assert flatten_mock_calls(mock_preload_obj) == [
+            ["take_pending_reload", (), {}],
+            [
+                "update_route_store_delta",
+                (
+                    {f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547": {"192.0.2.128/25"}},
+                    {},
+                    delta_keys,
+                    {
+                        set_graph_key("TEST1", "as-set", "AS-TEST"): {
+                            "members": ["AS65547"],
+                            "mbrs-by-ref": [],
+                        }
+                    },
+                ),
+                {},
+            ],
+        ]
+
+    def test_delta_message(self):
+        assert parse_delta_message(b"reload") is None
+        assert parse_delta_message(None) is None
+        assert parse_delta_message(build_delta_message([])) == set()
+        message = build_delta_message(["TEST_AS65547", "TEST_AS65546"])
+        assert message == "delta:TEST_AS65546,TEST_AS65547"
+        assert parse_delta_message(message.encode("ascii")) == {"TEST_AS65546", "TEST_AS65547"}
+
+    def test_set_graph_key(self):
+        key = set_graph_key("TEST", "as-set", "AS65537:AS-TEST_1")
+        assert key == "set:TEST_as-set_AS65537:AS-TEST_1"
+        assert is_set_graph_key(key)
+        assert not is_set_graph_key("TEST_AS65537")
+        assert split_set_graph_key(key) == ("TEST", "as-set", "AS65537:AS-TEST_1")
+
     def test_preload_updater_failure(self, caplog):
         mock_database_handler = Mock()
         mock_reload_lock = Mock()
@@ -0,0 +1,244 @@
+import pytest
+
+from ..preload import REDIS_KEY_ORIGIN_SOURCE_SEPARATOR, Preloader, PreloadStoreManager
+from ..preload_file import (
+    PreloadStoreFile,
+    PreloadStoreFileError,
+    encode_prefixes,
+    merge_prefixes,
+    preload_store_overlay_path,
+    preload_store_path,
+    write_preload_store_file,
+)
+
+
+class TestPreloadStoreFile:
+    def test_write_read(self, tmpdir):
+        path = str(tmpdir / "store.bin")
+        entries = {
+            ("TEST2", 65546): (encode_prefixes({"192.0.2.0/25"}, 4), b""),
+            ("TEST1", 65547): (encode_prefixes({"192.0.2.128/25", "198.51.100.0/25"}, 4), b""),
+            ("TEST2", 65547): (b"", encode_prefixes({"2001:db8::/32"}, 6)),
+            ("TEST1", 65545): (b"", b""),
+        }
+        for asn in range(1, 100):
+            entries[("TEST1", asn * 1000000)] = (encode_prefixes({f"10.{asn}.0.0/16"}, 4), b"")
+        write_preload_store_file(path, entries, generation=42)
+
+        store = PreloadStoreFile(path)
+        assert store.generation == 42
+        sources = ["TEST1", "TEST2"]
+        assert store.routes_for_origins(["AS65545"], sources) == []
+        assert store.routes_for_origins(["AS65546"], sources, 4) == ["192.0.2.0/25"]
+        assert store.routes_for_origins(["AS65546"], sources, 6) == []
+        assert store.routes_for_origins(["AS65547"], sources) == [
+            "192.0.2.128/25",
+            "198.51.100.0/25",
+            "2001:db8::/32",
+        ]
+        assert store.routes_for_origins(["AS65547", "AS65546"], ["TEST2"]) == [
+            "192.0.2.0/25",
+            "2001:db8::/32",
+        ]
+        assert store.routes_for_origins(["AS65547"], ["TEST3"]) == []
+        assert store.routes_for_origins(["AS99000000", "AS5000000"], sources) == [
+            "10.5.0.0/16",
+            "10.99.0.0/16",
+        ]
+
+        read_entries = dict(store.iter_entries())
+        assert len(read_entries) == 102
+        assert read_entries[("TEST2", 65547)] == (b"", encode_prefixes(["2001:db8::/32"], 6))
+
+        # Replacing the file does not affect the existing mapping
+        write_preload_store_file(path, {}, generation=43)
+        assert store.routes_for_origins(["AS65546"], sources) == ["192.0.2.0/25"]
+        new_store = PreloadStoreFile(path)
+        assert new_store.generation == 43
+        assert new_store.routes_for_origins(["AS65546"], sources) == []
+
+    def test_overlay(self, tmpdir):
+        path = str(tmpdir / "store.bin")
+        overlay_path = str(tmpdir / "overlay.bin")
+        sources = ["TEST1"]
+        write_preload_store_file(
+            path,
+            {
+                ("TEST1", 65546): (encode_prefixes({"192.0.2.0/25"}, 4), b""),
+                ("TEST1", 65547): (encode_prefixes({"192.0.2.128/25"}, 4), b""),
+            },
+            generation=42,
+        )
+        # A missing overlay file is ignored
+        assert PreloadStoreFile(path, overlay_path).overlay is None
+
+        write_preload_store_file(
+            overlay_path,
+            {
+                ("TEST1", 65546): (b"", b""),
+                ("TEST1", 65548): (b"", encode_prefixes({"2001:db8::/32"}, 6)),
+            },
+            generation=42,
+            keep_empty=True,
+        )
+        store = PreloadStoreFile(path, overlay_path)
+        assert store.overlay
+        assert store.routes_for_origins(["AS65546"], sources) == []
+        assert store.routes_for_origins(["AS65547", "AS65548"], sources) == [
+            "192.0.2.128/25",
+            "2001:db8::/32",
+        ]
+        assert len(dict(store.iter_entries())) == 2
+        assert len(dict(store.overlay.iter_entries())) == 2
+
+        # An overlay for another generation of the base file is ignored
+        write_preload_store_file(path, {("TEST1", 65546): (encode_prefixes({"192.0.2.0/25"}, 4), b"")}, 43)
+        store = PreloadStoreFile(path, overlay_path)
+        assert store.overlay is None
+        assert store.routes_for_origins(["AS65546", "AS65548"], sources) == ["192.0.2.0/25"]
+
+    def test_encode_merge_prefixes(self):
+        data_a = encode_prefixes(["192.0.2.0/24", "10.0.0.0/8", "192.0.2.0/25", "10.0.0.0/8"], 4)
+        assert len(data_a) == 3 * 5
+        data_b = encode_prefixes(["192.0.2.0/25", "9.0.0.0/8", "198.51.100.0/24"], 4)
+        data_c = encode_prefixes(["10.0.0.0/8"], 4)
+
+        assert merge_prefixes([], 4) == []
+        assert merge_prefixes([data_a], 4) == ["10.0.0.0/8", "192.0.2.0/24", "192.0.2.0/25"]
+        assert merge_prefixes([data_a, b"", data_b, data_c], 4) == [
+            "9.0.0.0/8",
+            "10.0.0.0/8",
+            "192.0.2.0/24",
+            "192.0.2.0/25",
+            "198.51.100.0/24",
+        ]
+
+        data6_a = encode_prefixes(["2001:db8::/48", "2001:db8::/32"], 6)
+        data6_b = encode_prefixes(["2001:db8:ffff::/48", "2001:db8::/32", "::/0"], 6)
+        assert merge_prefixes([data6_a, data6_b], 6) == [
+            "::/0",
+            "2001:db8::/32",
+            "2001:db8::/48",
+            "2001:db8:ffff::/48",
+        ]
+
+    def test_merge_prefixes_aggregate(self):
+        data_a = encode_prefixes(["192.0.2.0/25", "192.0.2.64/26", "10.0.0.0/8", "198.51.100.0/25"], 4)
+        data_b = encode_prefixes(["192.0.2.128/25", "11.0.0.0/8", "198.51.100.128/26"], 4)
+        assert merge_prefixes([], 4, aggregate=True) == []
+        assert merge_prefixes([data_a, data_b], 4, aggregate=True) == [
+            "10.0.0.0/7",
+            "192.0.2.0/24",
+            "198.51.100.0/25",
+            "198.51.100.128/26",
+        ]
+        # 9.0.0.0/8 and 10.0.0.0/8 are adjacent, but not aligned as a /7
+        data_c = encode_prefixes(["9.0.0.0/8", "10.0.0.0/8", "11.0.0.0/8"], 4)
+        assert merge_prefixes([data_c], 4, aggregate=True) == ["9.0.0.0/8", "10.0.0.0/7"]
+        data_d = encode_prefixes(["0.0.0.0/1", "128.0.0.0/1", "192.0.2.1/32"], 4)
+        assert merge_prefixes([data_d], 4, aggregate=True) == ["0.0.0.0/0"]
+
+        data6 = encode_prefixes(
+            ["2001:db8::/33", "2001:db8:8000::/33", "2001:db8:1::/48", "2001:db9::/48"], 6
+        )
+        assert merge_prefixes([data6], 6, aggregate=True) == ["2001:db8::/32", "2001:db9::/48"]
+
+    def test_invalid_file(self, tmpdir):
+        path = str(tmpdir / "store.bin")
+        with open(path, "wb"):
+            pass
+        with pytest.raises(PreloadStoreFileError):
+            PreloadStoreFile(path)
+
+        with open(path, "wb") as fh:
+            fh.write(b"invalid")
+        with pytest.raises(PreloadStoreFileError):
+            PreloadStoreFile(path)
+
+        with open(path, "wb") as fh:
+            fh.write(b"x" * 100)
+        with pytest.raises(PreloadStoreFileError) as pe:
+            PreloadStoreFile(path)
+        assert "unknown magic" in str(pe.value)
+
+
+class TestPreloadStoreManagerFile:
+    def test_write_full_and_delta(self, tmpdir, config_override):
+        config_override({"preload_store_dir": str(tmpdir), "redis_url": "redis://localhost:1"})
+        preload_manager = PreloadStoreManager()
+        path = preload_store_path(str(tmpdir))
+
+        # A delta can not be applied without a current file
+        assert not preload_manager._write_store_file(
+            {}, {}, {f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65546"}
+        )
+
+        assert preload_manager._write_store_file(
+            {
+                f"TEST2{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65546": {"192.0.2.0/25"},
+                f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547": {"192.0.2.128/25", "198.51.100.0/25"},
+            },
+            {
+                f"TEST2{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547": {"2001:db8::/32"},
+            },
+        )
+        assert PreloadStoreFile(path).generation == 1
+
+        assert preload_manager._write_store_file(
+            {f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547": {"192.0.2.128/25"}},
+            {},
+            {
+                f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65547",
+                f"TEST2{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65546",
+            },
+        )
+
+        # The delta is written to the overlay, the base file is unchanged
+        preloader = Preloader(enable_queries=False)
+        preloader._load_store_file()
+        assert preloader._store_file.generation == 1
+        assert len(dict(preloader._store_file.overlay.iter_entries())) == 2
+        sources = ["TEST1", "TEST2"]
+        assert preloader.routes_for_origins(["AS65546"], sources) == []
+        assert preloader.routes_for_origins(["AS65547"], sources) == ["192.0.2.128/25", "2001:db8::/32"]
+        assert preloader.routes_for_origins(["AS65547"], sources, 6) == ["2001:db8::/32"]
+
+        # The overlay accumulates all changes since the base file was written
+        assert preload_manager._write_store_file(
+            {f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65548": {"203.0.113.0/24"}},
+            {},
+            {f"TEST1{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65548"},
+        )
+        preloader._load_store_file()
+        assert preloader._store_file.generation == 1
+        assert len(dict(preloader._store_file.overlay.iter_entries())) == 3
+        assert preloader.routes_for_origins(["AS65546", "AS65548"], sources) == ["203.0.113.0/24"]
+
+        preload_manager._clear_existing_data()
+        assert not tmpdir.listdir()
+
+    def test_compact_overlay(self, tmpdir, config_override, monkeypatch):
+        config_override({"preload_store_dir": str(tmpdir), "redis_url": "redis://localhost:1"})
+        monkeypatch.setattr("irrd.storage.preload.MAX_STORE_FILE_OVERLAY_ENTRIES", 2)
+        preload_manager = PreloadStoreManager()
+        path = preload_store_path(str(tmpdir))
+        overlay_path = preload_store_overlay_path(str(tmpdir))
+
+        assert preload_manager._write_store_file(
+            {f"TEST{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65546": {"192.0.2.0/25"}}, {}
+        )
+        for asn in [65547, 65548]:
+            key = f"TEST{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS{asn}"
+            assert preload_manager._write_store_file({key: {"192.0.2.128/25"}}, {}, {key})
+        assert PreloadStoreFile(path).generation == 1
+        assert len(dict(PreloadStoreFile(overlay_path).iter_entries())) == 2
+
+        # The third entry in the overlay merges it into a new base file
+        key = f"TEST{REDIS_KEY_ORIGIN_SOURCE_SEPARATOR}AS65546"
+        assert preload_manager._write_store_file({}, {}, {key})
+        store = PreloadStoreFile(path, overlay_path)
+        assert store.generation == 2
+        assert store.overlay is None
+        assert not tmpdir.join("irrd-preload-store-overlay.bin").exists()
+        assert len(dict(store.iter_entries())) == 2
+        assert store.routes_for_origins(["AS65546", "AS65547", "AS65548"], ["TEST"]) == ["192.0.2.128/25"]
@@ -0,0 +1,100 @@
+from ..set_graph import SetMembershipGraph, set_graph_entry
+
+
+class TestSetMembershipGraph:
+    def test_set_graph_entry(self):
+        assert set_graph_entry(
+            "route-set",
+            {"route-set": "RS-TEST", "members": ["192.0.2.0/24"], "mp-members": ["2001:db8::/32"]},
+        ) == {"members": ["192.0.2.0/24", "2001:db8::/32"], "mbrs-by-ref": []}
+        assert set_graph_entry(
+            "aut-num", {"aut-num": "AS65537", "member-of": ["AS-TEST"], "mnt-by": ["MNT-TEST"]}
+        ) == {"member": "AS65537", "member-of": ["AS-TEST"], "mnt-by": ["MNT-TEST"]}
+        assert set_graph_entry("aut-num", {"aut-num": "AS65537", "mnt-by": ["MNT-TEST"]}) is None
+        assert set_graph_entry("person", {"person": "Test"}) is None
+
+    def test_find_set_members(self):
+        graph = SetMembershipGraph()
+        graph.update(
+            ("TEST1", "as-set", "AS-FIRST"),
+            {"members": ["AS65537", "AS-SECOND"], "mbrs-by-ref": ["MNT-TEST"]},
+        )
+        graph.update(("TEST2", "as-set", "AS-FIRST"), {"members": ["AS65538"], "mbrs-by-ref": []})
+        graph.update(("TEST2", "as-set", "AS-SECOND"), {"members": ["AS65539"], "mbrs-by-ref": ["ANY"]})
+        graph.update(
+            ("TEST1", "aut-num", "AS65540"),
+            {"member": "AS65540", "member-of": ["AS-FIRST", "AS-SECOND"], "mnt-by": ["MNT-TEST"]},
+        )
+        graph.update(
+            ("TEST2", "aut-num", "AS65541"),
+            {"member": "AS65541", "member-of": ["AS-FIRST", "as-second"], "mnt-by": ["MNT-OTHER"]},
+        )
+        graph.update(
+            ("TEST1", "route", "192.0.2.0/24AS65540"),
+            {"member": "192.0.2.0/24", "member-of": ["AS-FIRST"], "mnt-by": ["MNT-TEST"]},
+        )
+
+        sources = ["TEST1", "TEST2"]
+        assert graph.find_set_members({"AS-FIRST"}, sources, ["as-set"]) == (
+            {"AS65537", "AS-SECOND", "AS65540"},
+            set(),
+            "as-set",
+        )
+        # Sources are prioritised in order
+        assert graph.find_set_members({"AS-FIRST"}, ["TEST2", "TEST1"], ["as-set"]) == (
+            {"AS65538"},
+            set(),
+            "as-set",
+        )
+        assert graph.find_set_members({"AS-FIRST"}, sources, ["as-set"], limit_source="TEST2") == (
+            {"AS65538"},
+            set(),
+            "as-set",
+        )
+        assert graph.find_set_members({"AS-SECOND", "AS-UNKNOWN"}, sources, ["as-set"]) == (
+            {"AS65539", "AS65540", "AS65541"},
+            {"AS-UNKNOWN"},
+            "as-set",
+        )
+        # mbrs-by-ref references are limited to the given sources
+        assert graph.find_set_members({"AS-SECOND"}, ["TEST2"], ["as-set"]) == (
+            {"AS65539", "AS65541"},
+            set(),
+            "as-set",
+        )
+        assert graph.find_set_members({"AS-FIRST"}, sources, ["route-set"]) == (set(), {"AS-FIRST"}, None)
+        assert graph.find_set_members({"AS-UNKNOWN"}, sources, ["as-set"]) == (set(), {"AS-UNKNOWN"}, None)
+
+        graph.update(("TEST1", "aut-num", "AS65540"), None)
+        graph.update(("TEST2", "as-set", "AS-SECOND"), {"members": ["AS65542"], "mbrs-by-ref": []})
+        graph.update(("TEST1", "as-set", "AS-FIRST"), None)
+        assert graph.find_set_members({"AS-FIRST", "AS-SECOND"}, sources, ["as-set"]) == (
+            {"AS65538", "AS65542"},
+            set(),
+            "as-set",
+        )
+
+    def test_find_route_set_members(self):
+        graph = SetMembershipGraph()
+        graph.update(
+            ("TEST1", "route-set", "RS-TEST"),
+            {"members": ["192.0.2.0/25", "AS-TEST"], "mbrs-by-ref": ["MNT-TEST"]},
+        )
+        graph.update(
+            ("TEST1", "route", "192.0.2.128/25AS65537"),
+            {"member": "192.0.2.128/25", "member-of": ["RS-TEST"], "mnt-by": ["mnt-test"]},
+        )
+        graph.update(
+            ("TEST1", "route6", "2001:db8::/32AS65537"),
+            {"member": "2001:db8::/32", "member-of": ["RS-TEST"], "mnt-by": ["MNT-OTHER"]},
+        )
+        # Only route(6) objects can be included in a route-set by mbrs-by-ref
+        graph.update(
+            ("TEST1", "aut-num", "AS65537"),
+            {"member": "AS65537", "member-of": ["RS-TEST"], "mnt-by": ["MNT-TEST"]},
+        )
+        assert graph.find_set_members({"RS-TEST"}, ["TEST1"], ["as-set", "route-set"]) == (
+            {"192.0.2.0/25", "AS-TEST", "192.0.2.128/25"},
+            set(),
+            "route-set",
+        )
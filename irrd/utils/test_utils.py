@@ -86,12 +86,20 @@ class MockDatabaseHandler(metaclass=Singleton):
         self.serial_nrtm = 0
 
     async def execute_query_async(
-        self, query: QueryType, flush_rpsl_buffer=True, refresh_on_error=False
+        self,
+        query: QueryType,
+        flush_rpsl_buffer=True,
+        refresh_on_error=False,
     ) -> RPSLDatabaseResponse:
         return self.execute_query(query, flush_rpsl_buffer, refresh_on_error)
 
     def execute_query(
-        self, query: QueryType, flush_rpsl_buffer=True, refresh_on_error=False
+        self,
+        query: QueryType,
+        flush_rpsl_buffer=True,
+        refresh_on_error=False,
+        stream_results=False,
+        fetch_size=None,
     ) -> RPSLDatabaseResponse:
         self.serial_nrtm += 1
         self.serial_global += 2
@@ -10,6 +10,7 @@ from ..whois_client import (
     whois_query,
     whois_query_irrd,
     whois_query_source_status,
+    whois_query_stream,
 )
 
 
@@ -77,6 +78,40 @@ class TestWhoisQuery:
         assert self.recv_calls == 3
 
 
+class TestWhoisQueryStream:
+    def test_query_end_line(self, monkeypatch):
+        mock_socket = Mock()
+        monkeypatch.setattr(
+            "irrd.utils.whois_client.socket.create_connection", lambda address, timeout: mock_socket
+        )
+        responses = [b"%START\n\nADD", b" 1\n\n", b"%END TEST\n", b"not read"]
+        mock_socket.recv = lambda bytes: responses.pop(0)
+
+        lines = whois_query_stream("192.0.2.1", 43, "query", ["\n%END TEST\n"])
+        assert next(lines) == "%START\n"
+        # Lines are yielded as they are received, the end is not read yet
+        assert len(responses) == 3
+        assert list(lines) == ["\n", "ADD 1\n", "\n", "%END TEST\n"]
+        assert responses == [b"not read"]
+        assert flatten_mock_calls(mock_socket) == [["sendall", (b"query\n",), {}], ["close", (), {}]]
+
+    def test_query_timeout(self, monkeypatch):
+        mock_socket = Mock()
+        monkeypatch.setattr(
+            "irrd.utils.whois_client.socket.create_connection", lambda address, timeout: mock_socket
+        )
+        responses = [b"line 1\nline", b" 2"]
+
+        def mock_socket_recv(bytes) -> bytes:
+            if not responses:
+                raise socket.timeout
+            return responses.pop(0)
+
+        mock_socket.recv = mock_socket_recv
+        assert list(whois_query_stream("192.0.2.1", 43, "query")) == ["line 1\n", "line 2"]
+        assert flatten_mock_calls(mock_socket) == [["sendall", (b"query\n",), {}], ["close", (), {}]]
+
+
 class TestWhoisQueryIRRD:
     recv_calls = 0
 
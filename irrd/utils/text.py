@@ -1,5 +1,5 @@
 import re
-from typing import Iterator, List, Optional, Set, TextIO, Union
+from typing import Iterable, Iterator, List, Optional, Set, Union
 
 from irrd.conf import PASSWORD_HASH_DUMMY_VALUE
 from irrd.rpsl.auth import PASSWORD_HASHERS_ALL
@@ -44,7 +44,7 @@ def splitline_unicodesafe(input: str) -> Iterator[str]:
         yield line.strip("\r")
 
 
-def split_paragraphs_rpsl(input: Union[str, TextIO], strip_comments=True) -> Iterator[str]:
+def split_paragraphs_rpsl(input: Union[str, Iterable[str]], strip_comments=True) -> Iterator[str]:
     """
     Split an input into paragraphs, and return an iterator of the paragraphs.
 
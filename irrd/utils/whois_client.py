@@ -1,6 +1,6 @@
 import logging
 import socket
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +41,44 @@ def whois_query(host: str, port: int, query: str, end_markings: Optional[List[st
     return buffer.decode("utf-8", errors="backslashreplace")
 
 
+def whois_query_stream(
+    host: str, port: int, query: str, end_markings: Optional[List[str]] = None
+) -> Iterator[str]:
+    """
+    Perform a query on a whois server, like whois_query(), but yield
+    each line of the response, including the newline, as soon as it
+    has been received, rather than the complete response.
+
+    End markings must start at the beginning of a line, and can not
+    span multiple lines. The line with the end marking is the last line yielded.
+    """
+    query = query.strip() + "\n"
+    logger.debug(f"Running streaming whois query {query.strip()} on {host} port {port}")
+
+    s = socket.create_connection((host, port), timeout=5)
+    try:
+        s.sendall(query.encode("utf-8"))
+        buffer = b""
+        while True:
+            try:
+                data = s.recv(1024 * 1024)
+            except socket.timeout:
+                break
+            if not data:
+                break
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line_bytes in lines:
+                line = line_bytes.decode("utf-8", errors="backslashreplace") + "\n"
+                yield line
+                if end_markings and any(end_marking in "\n" + line for end_marking in end_markings):
+                    return
+        if buffer:
+            yield buffer.decode("utf-8", errors="backslashreplace")
+    finally:
+        s.close()
+
+
 def whois_query_irrd(host: str, port: int, query: str) -> Optional[str]:
     """
     Perform a whois query, expecting an IRRD-style output format.